@@ -1,5 +1,92 @@
+from typing import Optional
+
 from dataclasses import dataclass
 
+
+@dataclass
+class CanvasConfig:
+    url: str
+    token: str
+    # maximum number of requests in flight, also the connection pool size
+    concurrency: str = "4"
+    timeout: str = "30"
+    max_retries: str = "5"
+    # start backing off once X-Rate-Limit-Remaining drops below this value
+    rate_limit_floor: str = "100"
+    backoff: str = "1.0"
+    # adjust the requests in flight to the rate limit headers: start at
+    # concurrency or async_concurrency, back off to min_concurrency at most
+    adaptive_concurrency: str = "true"
+    min_concurrency: str = "1"
+    # requests in flight at once for asyncio commands, which need no thread
+    # per request
+    async_concurrency: str = "100"
+    # ids per request of batched lookups, ex: a course's users by id
+    lookup_batch_size: str = "100"
+    # lookup results memoized per run, least recently used evicted first
+    lookup_cache_size: str = "10000"
+    # auto, orjson, msgspec or json. auto picks the fastest one installed
+    json_decoder: str = "auto"
+
+
+@dataclass
+class CacheConfig:
+    enabled: str = "true"
+    directory: str = "~/.cache/bat"
+    # seconds an entry may go without being revalidated by the server
+    ttl: str = "3600"
+    # bytes, least recently used entries are evicted past this size
+    max_size: str = "536870912"
+
+
+@dataclass
+class ReportConfig:
+    # sync points and merged rows of incremental reports
+    state_db: str = "~/.local/share/bat/state.sqlite"
+    # jsonl, csv, parquet or arrow
+    output_format: str = "jsonl"
+    # rows per csv file when writing to a path, 0 for a single file
+    chunk_rows: str = "1000000"
+    # rows per parquet row group / arrow record batch
+    row_group_size: str = "65536"
+    # sync courses in parallel shards over this many workers, 1 to not fan out
+    workers: str = "1"
+    # process, or thread for I/O bound syncs
+    executor: str = "process"
+    # times a failed shard is retried, from its first course not synced
+    shard_retries: str = "2"
+    # rest, or bulk to sync reports that have one from a Canvas account
+    # report export, which requires an account
+    source: str = "rest"
+    # account of --account when not given, ex: each environment's own for
+    # bat batch
+    account_id: Optional[str] = None
+    # seconds between polls of an account report, grows up to 30s
+    poll_interval: str = "2.0"
+    poll_timeout: str = "3600"
+    # typed tables of the synced reports, for bat sync and SQL reports
+    mirror_db: str = "~/.local/share/bat/mirror.sqlite"
+    # days the mirror keeps a course not synced since, 0 to keep it forever
+    mirror_retention_days: str = "30"
+
+
+@dataclass
+class DaemonConfig:
+    # YAML file of the jobs bat daemon runs on a schedule
+    schedule: str = "~/.config/bat/schedule.yaml"
+    # unix socket of bat daemon, for ad-hoc runs and status
+    socket: str = "~/.local/share/bat/daemon.sock"
+    # runs waiting at most, scheduled runs are skipped past it and ad-hoc
+    # runs refused
+    queue_size: str = "100"
+    # runs at once
+    job_workers: str = "2"
+
+
 @dataclass
 class GlobalConfig:
-    opt1: str
\ No newline at end of file
+    opt1: str
+    canvas: CanvasConfig
+    cache: CacheConfig
+    report: ReportConfig
+    daemon: DaemonConfig
@@ -0,0 +1,303 @@
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from dataclasses import dataclass, fields
+from itertools import islice
+
+import numpy as np
+
+from .lib.timings import span
+
+
+Record = Dict[str, Any]
+
+# percent-of-points boundaries of the F, D, C, B and A score buckets
+GRADE_EDGES = (60.0, 70.0, 80.0, 90.0)
+GRADE_BUCKETS = ("grade_f", "grade_d", "grade_c", "grade_b", "grade_a")
+PERCENTILES = (10, 25, 50, 75, 90)
+
+GROUPINGS: Dict[str, Tuple[str, ...]] = {
+    "course": ("course_id",),
+    "assignment": ("course_id", "assignment_id"),
+    "section": ("course_id", "section_id", "assignment_id"),
+}
+
+
+@dataclass
+class SubmissionColumns:
+    """Submissions as parallel NumPy arrays, one entry per submission.
+
+    Ungraded scores are NaN, an unknown section or points possible is -1
+    and NaN respectively.
+    """
+
+    course_id: np.ndarray
+    section_id: np.ndarray
+    assignment_id: np.ndarray
+    user_id: np.ndarray
+    score: np.ndarray
+    points_possible: np.ndarray
+    late: np.ndarray
+    missing: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.score)
+
+    @classmethod
+    def from_records(
+        cls,
+        records: Iterable[Record],
+        points_possible: Optional[Mapping[Tuple[int, int], float]] = None,
+        sections: Optional[Mapping[Tuple[int, int], int]] = None,
+        chunk_size: int = 65536,
+    ) -> "SubmissionColumns":
+        """Load submission records, streamed in chunks of `chunk_size`.
+
+        `points_possible` maps (course_id, assignment_id), and `sections`
+        maps (course_id, user_id) to a section id. Only one chunk of the
+        records is held as Python objects at a time, each is converted
+        column by column.
+        """
+        points_possible = points_possible or {}
+        sections = sections or {}
+        names = [f.name for f in fields(cls)]
+        chunks: Dict[str, List[np.ndarray]] = {name: [] for name in names}
+        nan = float("nan")
+
+        records = iter(records)
+        while chunk := list(islice(records, chunk_size)):
+            n = len(chunk)
+            course = np.fromiter(
+                (int(r["course_id"]) for r in chunk), np.int64, n
+            )
+            assignment = np.fromiter(
+                (r["assignment_id"] for r in chunk), np.int64, n
+            )
+            user = np.fromiter((r["user_id"] for r in chunk), np.int64, n)
+            pairs = list(zip(course.tolist(), assignment.tolist()))
+            members = list(zip(course.tolist(), user.tolist()))
+            columns = dict(
+                course_id=course,
+                section_id=np.fromiter(
+                    (sections.get(m, -1) for m in members), np.int64, n
+                ),
+                assignment_id=assignment,
+                user_id=user,
+                # None becomes NaN
+                score=np.array(
+                    [r.get("score") for r in chunk], dtype=np.float64
+                ),
+                points_possible=np.fromiter(
+                    (points_possible.get(p, nan) for p in pairs),
+                    np.float64,
+                    n,
+                ),
+                late=np.fromiter(
+                    (bool(r.get("late")) for r in chunk), bool, n
+                ),
+                missing=np.fromiter(
+                    (bool(r.get("missing")) for r in chunk), bool, n
+                ),
+            )
+            for name in names:
+                chunks[name].append(columns[name])
+
+        empty = dict(
+            course_id=np.int64,
+            section_id=np.int64,
+            assignment_id=np.int64,
+            user_id=np.int64,
+            score=np.float64,
+            points_possible=np.float64,
+            late=bool,
+            missing=bool,
+        )
+        return cls(
+            **{
+                name: (
+                    np.concatenate(chunks[name])
+                    if chunks[name]
+                    else np.empty(0, dtype=empty[name])
+                )
+                for name in names
+            }
+        )
+
+
+def grade_stats(
+    columns: SubmissionColumns,
+    by: Sequence[str] = GROUPINGS["assignment"],
+    percentiles: Sequence[float] = PERCENTILES,
+) -> Dict[str, np.ndarray]:
+    """Per-group score statistics, computed in vectorized passes.
+
+    Returns one array per output column, ordered by the group keys:
+    the keys themselves, `count`, `graded`, `mean`, `min`, `max`,
+    a `p<N>` column per percentile, `missing_rate`, `late_rate`, and the
+    number of graded submissions in each of the GRADE_BUCKETS.
+    """
+    if not len(columns):
+        return {name: np.empty(0) for name in stats_columns(by, percentiles)}
+
+    keys = [getattr(columns, key) for key in by]
+    first, group = _group_index(keys)
+    groups = len(first)
+
+    score = columns.score
+    graded = ~np.isnan(score)
+    count = np.bincount(group, minlength=groups)
+    graded_count = np.bincount(group, weights=graded, minlength=groups)
+    total = np.bincount(
+        group, weights=np.where(graded, score, 0.0), minlength=groups
+    )
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / graded_count
+
+    # graded scores sorted within their group, ungraded ones last
+    order = np.lexsort((score, ~graded, group))
+    starts = np.concatenate(([0], np.cumsum(count)[:-1]))
+    sorted_score = score[order]
+    graded_n = graded_count.astype(np.int64)
+    has_scores = graded_n > 0
+    last = starts + np.maximum(graded_n - 1, 0)
+
+    ret: Dict[str, np.ndarray] = {
+        key: values[first] for key, values in zip(by, keys)
+    }
+    ret["count"] = count
+    ret["graded"] = graded_n
+    ret["mean"] = mean
+    ret["min"] = np.where(has_scores, sorted_score[starts], np.nan)
+    ret["max"] = np.where(has_scores, sorted_score[last], np.nan)
+    for p in percentiles:
+        # linear interpolation between the closest ranks, like np.percentile
+        position = (graded_n - 1).clip(min=0) * (p / 100.0)
+        low = np.floor(position).astype(np.int64)
+        high = np.ceil(position).astype(np.int64)
+        frac = position - low
+        value = sorted_score[starts + low] * (1 - frac)
+        value += sorted_score[starts + high] * frac
+        ret[f"p{p:g}"] = np.where(has_scores, value, np.nan)
+
+    ret["missing_rate"] = (
+        np.bincount(group, weights=columns.missing, minlength=groups) / count
+    )
+    ret["late_rate"] = (
+        np.bincount(group, weights=columns.late, minlength=groups) / count
+    )
+
+    # bucket by percent of points possible, by raw score when unknown
+    points = columns.points_possible
+    usable = (points > 0) & ~np.isnan(points)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        percent = np.where(usable, score / points * 100.0, score)
+    bucket = np.digitize(percent, GRADE_EDGES)
+    buckets = len(GRADE_EDGES) + 1
+    distribution = np.bincount(
+        group[graded] * buckets + bucket[graded],
+        minlength=groups * buckets,
+    ).reshape(groups, buckets)
+    for i, name in enumerate(GRADE_BUCKETS):
+        ret[name] = distribution[:, i]
+
+    return ret
+
+
+def _group_index(keys: Sequence[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Number the distinct key tuples in sorted order.
+
+    Returns the index of the first row of each group, and the group number
+    of every row. Each key column is factorized on its own and the codes
+    combined, much faster than np.unique over the rows of a 2D array.
+    """
+    code = np.zeros(len(keys[0]), dtype=np.int64)
+    for values in keys:
+        distinct, inverse = np.unique(values, return_inverse=True)
+        # re-factorize as we go, so the combined code can never overflow
+        _, code = np.unique(
+            code * len(distinct) + inverse.reshape(-1), return_inverse=True
+        )
+        code = code.reshape(-1)
+    _, first, group = np.unique(code, return_index=True, return_inverse=True)
+    return first, group.reshape(-1)
+
+
+def stats_columns(
+    by: Sequence[str] = GROUPINGS["assignment"],
+    percentiles: Sequence[float] = PERCENTILES,
+) -> List[str]:
+    return [
+        *by,
+        "count",
+        "graded",
+        "mean",
+        "min",
+        "max",
+        *(f"p{p:g}" for p in percentiles),
+        "missing_rate",
+        "late_rate",
+        *GRADE_BUCKETS,
+    ]
+
+
+def stats_rows(stats: Mapping[str, np.ndarray]) -> Iterator[Record]:
+    """grade_stats output as report rows, NaN becomes None"""
+    names = list(stats)
+    for values in zip(*(stats[name].tolist() for name in names)):
+        yield {
+            name: None if value != value else value
+            for name, value in zip(names, values)
+        }
+
+
+class GradeReport:
+    """Grade statistics per course, section or assignment.
+
+    Derived from the rows synced by the submissions, enrollments and
+    assignments reports.
+    """
+
+    name = "grades"
+    sources = ("submissions", "enrollments", "assignments")
+
+    def __init__(self, group_by: str = "assignment"):
+        self.by = GROUPINGS[group_by]
+        self.columns = stats_columns(self.by)
+        counts = {*self.by, "count", "graded", *GRADE_BUCKETS}
+        self.types = {
+            column: "float64"
+            for column in self.columns
+            if column not in counts
+        }
+
+    def load(self, state, course_ids: Sequence[str]) -> SubmissionColumns:
+        points_possible = {
+            (int(a["course_id"]), int(a["id"])): a.get("points_possible")
+            for a in state.records("assignments", course_ids)
+            if a.get("points_possible") is not None
+        }
+        sections = {}
+        for e in state.records("enrollments", course_ids):
+            if e.get("course_section_id") is not None:
+                key = (int(e["course_id"]), int(e["user_id"]))
+                sections.setdefault(key, int(e["course_section_id"]))
+        return SubmissionColumns.from_records(
+            state.records("submissions", course_ids),
+            points_possible=points_possible,
+            sections=sections,
+        )
+
+    def rows(self, state, course_ids: Sequence[str]) -> Iterator[Record]:
+        with span("aggregate"):
+            columns = self.load(state, course_ids)
+            stats = grade_stats(columns, by=self.by)
+        return stats_rows(stats)
@@ -1,36 +1,132 @@
-from typing import Optional, Sequence
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
 import logging
-from argparse import ArgumentParser, Namespace
+from argparse import (
+    REMAINDER,
+    ArgumentParser,
+    ArgumentTypeError,
+    Namespace,
+)
+from collections.abc import Awaitable
+from importlib import import_module
 from sys import exit
 
-from .logconf import set_default_logging
+from .logconf import (
+    JSON_FORMAT,
+    log_context,
+    set_default_logging,
+    stop_queue_logging,
+)
 
-from .lib import hello_world
-from .conf import conf_cli
+from .lib import PROFILERS, hello_world, timed
 
 
 log = logging.getLogger("root")
 
 
+# Sub-commands from other modules, imported only when the command runs:
+#   name: (module, parser factory, help)
+COMMANDS: Dict[str, Tuple[str, str, str]] = {
+    "conf": ("bat.conf", "conf_cli", "configuration management cli"),
+    "cache": (
+        "bat.lib.cache",
+        "cache_cli",
+        "Canvas response cache management",
+    ),
+    "export": (
+        "bat.lib.paginate",
+        "export_cli",
+        "stream a Canvas collection to stdout as JSON lines",
+    ),
+    "report": ("bat.report.cli", "report_cli", "incremental Canvas reports"),
+    "sync": (
+        "bat.report.cli",
+        "sync_cli",
+        "mirror Canvas reports into a local database",
+    ),
+    "batch": (
+        "bat.report.batch",
+        "batch_cli",
+        "run reports across every environment of the config file",
+    ),
+    "daemon": (
+        "bat.daemon",
+        "daemon_cli",
+        "run commands on schedules from a long running process",
+    ),
+    "logs": ("bat.logs", "logs_cli", "summarize JSON log files"),
+}
+
+
 def BATCLI(ARGS: Optional[Sequence[str]] = None):
-    p = argparser()
+    p = argparser(load=[selected_command(ARGS)])
     # Execute
     # get only the first command in args
     args: Namespace = p.parse_args(ARGS)
     Commands.setup_logging(args)
     log.debug(f"BATCLI: {args=}")
+    code = 0
     try:
         log.debug(f"BATCLI: exec {args.func=}")
-        args.func(args)
+        with log_context(command=args.command):
+            if args.timings:
+                from .lib.timings import start_timings
+
+                start_timings()
+            if args.profile:
+                from .lib.timings import profiled
+
+                profiled(
+                    lambda: run_command(args), args.profile, args.profiler
+                )
+            else:
+                run_command(args)
     except Exception as err:
         log.exception(err)
         p.print_help()
-        exit(1)
-    exit(0)
+        code = 1
+    finally:
+        if args.timings:
+            from .lib.timings import stop_timings
+
+            stop_timings()
+        # write out any records still queued before exiting
+        stop_queue_logging()
+    exit(code)
+
+
+def run_command(args: Namespace):
+    """Call the command, on a new event loop if it is a coroutine function"""
+    with timed("command"):
+        result = args.func(args)
+        if isinstance(result, Awaitable):
+            import asyncio
+
+            return asyncio.run(result)
+        return result
+
 
+def selected_command(ARGS: Optional[Sequence[str]] = None) -> Optional[str]:
+    """The sub-command named in ARGS, found without importing any of them"""
+    return argparser(load=()).parse_known_args(ARGS)[0].command
 
-def argparser() -> ArgumentParser:
+
+def argparser(load: Optional[Iterable[str]] = None) -> ArgumentParser:
+    """The bat argument parser.
+
+    Only the COMMANDS in `load`, all of them by default, import their
+    module to build their arguments. The others accept any arguments,
+    enough to list them in the help and find the one selected.
+    """
+    load = set(COMMANDS if load is None else load)
     p = ArgumentParser(
         description="Utility for executing various bat tasks",
         usage="bat [<args>] <command>",
@@ -52,6 +148,66 @@ def argparser() -> ArgumentParser:
         dest="loglevel",
         const=logging.DEBUG,
     )
+    p.add_argument(
+        "--log-json",
+        dest="log_json",
+        action="store_true",
+        help="log JSON lines, with the endpoint, status and latency of"
+        " each request at DEBUG, see bat logs summarize",
+    )
+    p.add_argument(
+        "--log-queue",
+        dest="log_queue",
+        action="store_true",
+        help="log through a queue written by a background thread,"
+        " so that logging never waits on stderr",
+    )
+    p.add_argument(
+        "--log-file",
+        dest="log_file",
+        default=None,
+        help="also log to this file, rotated at 10MB. implies --log-queue",
+    )
+    p.add_argument(
+        "--log-limit",
+        dest="log_limit",
+        action="append",
+        type=logger_rate,
+        metavar="LOGGER=N",
+        help="log at most N records per second from LOGGER and its"
+        " children, warnings excepted. implies --log-queue",
+    )
+    p.add_argument(
+        "--log-sample",
+        dest="log_sample",
+        action="append",
+        type=logger_rate,
+        metavar="LOGGER=F",
+        help="log a fraction F of the records from LOGGER and its"
+        " children, warnings excepted. implies --log-queue",
+    )
+    p.add_argument(
+        "--timings",
+        action="store_true",
+        help="print the time spent per stage of the command to stderr:"
+        " config, http, parse, store, aggregate and write",
+    )
+    p.add_argument(
+        "--profile",
+        nargs="?",
+        const="bat.prof",
+        default=None,
+        metavar="PATH",
+        help="profile the command, and save the profile to PATH."
+        " default=bat.prof",
+    )
+    p.add_argument(
+        "--profiler",
+        choices=PROFILERS,
+        default="cprofile",
+        help="cprofile writes pstats, sampling (pyinstrument) writes"
+        " speedscope JSON for a flamegraph. default=cprofile",
+    )
     p.add_argument(
         "-c",
         "--conf",
@@ -86,16 +242,30 @@ def argparser() -> ArgumentParser:
     hello.set_defaults(func=Commands.hello)
 
     # Add a subparser from a module
-    commands.add_parser(
-        "conf",
-        help="configuration management cli",
-        add_help=False,
-        parents=[conf_cli()],
-    )
+    for name, (module, factory, help) in COMMANDS.items():
+        if name in load:
+            parser: Callable[[], ArgumentParser] = getattr(
+                import_module(module), factory
+            )
+            commands.add_parser(
+                name, help=help, add_help=False, parents=[parser()]
+            )
+        else:
+            lazy = commands.add_parser(name, help=help, add_help=False)
+            lazy.add_argument("command_args", nargs=REMAINDER)
 
     return p
 
 
+def logger_rate(value: str) -> Tuple[str, float]:
+    """Parse a LOGGER=RATE argument"""
+    name, _, rate = value.partition("=")
+    try:
+        return name, float(rate)
+    except ValueError:
+        raise ArgumentTypeError(f"expected LOGGER=NUMBER, got {value!r}")
+
+
 def get_help(parser):
     def help(_: Namespace):
         parser.print_help()
@@ -111,10 +281,22 @@ class Commands:
 
     @staticmethod
     def setup_logging(args: Namespace):
+        options: Dict[str, Any] = {}
+        if getattr(args, "log_json", False):
+            options["log_format"] = JSON_FORMAT
+        if getattr(args, "log_queue", False):
+            options["queue"] = True
+        if log_file := getattr(args, "log_file", None):
+            options["log_file"] = log_file
+        if limits := getattr(args, "log_limit", None):
+            options["limits"] = dict(limits)
+        if samples := getattr(args, "log_sample", None):
+            options["samples"] = dict(samples)
+
         if args.loglevel:
-            set_default_logging(log_level=args.loglevel)
+            set_default_logging(log_level=args.loglevel, **options)
         else:
-            set_default_logging(log_level="ERROR")
+            set_default_logging(log_level="ERROR", **options)
 
     @staticmethod
     def raise_exception(_: Namespace):
@@ -1,24 +1,28 @@
-from typing import Optional
+from typing import Any, Dict, Hashable, Iterator, Optional, Tuple
 
+import os
+import threading
 from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from collections import OrderedDict
 from textwrap import dedent
 from logging import getLogger
 
 from batconf.manager import Configuration, ConfigProtocol
-from batconf.source import SourceList
+from batconf.source import SourceInterface, SourceList
 from batconf.sources.args import CliArgsConfig, Namespace
 from batconf.sources.env import EnvConfig
-from batconf.sources.file import FileConfig
+from batconf.sources.file import FileConfig, load_config_file
 from batconf.sources.dataclass import DataclassConfig
 
 from . import GlobalConfig
+from .lib import timed
 
 
 def get_config(
     # Known issue: https://github.com/python/mypy/issues/4536
     config_class: ConfigProtocol = GlobalConfig,  # type: ignore
     cli_args: Namespace = None,
-    config_file: FileConfig = None,
+    config_file: SourceInterface = None,
     config_file_name: str = None,
     config_env: str = None,
 ) -> Configuration:
@@ -40,6 +44,236 @@ def get_config(
     return Configuration(source_list, config_class)
 
 
+class DictConfig(SourceInterface):
+    """A config source over nested dicts, ex: an environment of a config
+    file already read, see environments. Looked up as FileConfig is."""
+
+    def __init__(self, data: Dict[str, Any]):
+        self.data = data
+
+    def get(self, key: str, module: Optional[str] = None) -> Optional[str]:
+        path = (module.split(".") if module else []) + key.split(".")
+        conf: Any = self.data
+        for k in path:
+            if not isinstance(conf, dict):
+                return None
+            if not (conf := conf.get(k)):
+                return conf
+        return conf
+
+
+def environments(config_file_name: str = None) -> Dict[str, DictConfig]:
+    """Each environment of the config file, to pass get_config as its
+    config_file. The file is read once, however many there are."""
+    with timed("config"):
+        config = load_config_file(config_file_name)
+    return {
+        name: DictConfig(data)
+        for name, data in config.items()
+        if name != "default" and isinstance(data, dict)
+    }
+
+
+class ResolvedConfig:
+    """An immutable snapshot of a resolved configuration.
+
+    Read like a Configuration, ex: cfg.canvas.url, or by its flattened
+    key, cfg["canvas.url"]. Every value is resolved once, lookups are a
+    dict access instead of a walk down the source list. Snapshots share
+    nothing mutable, so threads may share them, and pickle as their flat
+    dict of values, ex: to send to worker processes.
+    """
+
+    def __init__(self, values: Dict[str, Any], prefix: str = ""):
+        # values and sections are plain instance attributes, found without
+        # falling back to __getattr__
+        attrs: Dict[str, Any] = {"_values": values, "_prefix": prefix}
+        for key, value in values.items():
+            if not key.startswith(prefix):
+                continue
+            name, dot, _ = key[len(prefix) :].partition(".")
+            if dot and name not in attrs:
+                attrs[name] = ResolvedConfig(values, f"{prefix}{name}.")
+            elif not dot and not isinstance(value, _Missing):
+                attrs[name] = value
+        self.__dict__.update(attrs)
+
+    @classmethod
+    def resolve(
+        cls, cfg: Configuration, config_class: ConfigProtocol = GlobalConfig
+    ) -> "ResolvedConfig":
+        """Snapshot every value of `cfg`, from the fields of config_class"""
+        return cls(dict(_resolve(cfg, config_class, "")))
+
+    def __getattr__(self, name: str) -> Any:
+        # only missing and unknown values get here
+        return self[f"{self._prefix}{name}"]
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            value = self._values[key]
+        except KeyError:
+            raise AttributeError(f"no configuration value {key}") from None
+        if isinstance(value, _Missing):
+            raise AttributeError(
+                f"required configuration value not found: {key}"
+            )
+        return value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except AttributeError:
+            return default
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        """The flattened (key, value) pairs, missing values are left out"""
+        for key, value in self._values.items():
+            if key.startswith(self._prefix):
+                if not isinstance(value, _Missing):
+                    yield key, value
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError("ResolvedConfig is immutable")
+
+    def __reduce__(self):
+        return ResolvedConfig, (self._values, self._prefix)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({dict(self.items())!r})"
+
+
+class _Missing:
+    """Stands in for a required value no source provides"""
+
+    def __reduce__(self):
+        return _Missing, ()
+
+
+def _resolve(
+    cfg: Configuration, config_class: ConfigProtocol, prefix: str
+) -> Iterator[Tuple[str, Any]]:
+    for field in config_class.__dataclass_fields__.values():
+        if isinstance(field.type, ConfigProtocol):
+            yield from _resolve(
+                getattr(cfg, field.name), field.type, f"{prefix}{field.name}."
+            )
+            continue
+        try:
+            yield f"{prefix}{field.name}", getattr(cfg, field.name)
+        except AttributeError:
+            yield f"{prefix}{field.name}", _Missing()
+
+
+# resolved snapshots, least recently used first
+_resolved: "OrderedDict[Hashable, ResolvedConfig]" = OrderedDict()
+_resolved_lock = threading.Lock()
+RESOLVED_CACHE_SIZE = 16
+
+
+def resolved_config(
+    config_class: ConfigProtocol = GlobalConfig,  # type: ignore
+    cli_args: Namespace = None,
+    config_file_name: str = None,
+    config_env: str = None,
+) -> ResolvedConfig:
+    """get_config, resolved into a memoized ResolvedConfig snapshot.
+
+    Snapshots are cached by config class, config file path and mtime,
+    config environment, BAT_ environment variables, and the cli_args
+    that name a configuration key. Editing the config file or any of
+    these makes the next call resolve a new snapshot.
+    """
+    with timed("config"):
+        key = _snapshot_key(
+            config_class, cli_args, config_file_name, config_env
+        )
+        with _resolved_lock:
+            if (snapshot := _resolved.get(key)) is not None:
+                _resolved.move_to_end(key)
+                return snapshot
+
+        cfg = get_config(
+            config_class=config_class,
+            cli_args=cli_args,
+            config_file_name=config_file_name,
+            config_env=config_env,
+        )
+        snapshot = ResolvedConfig.resolve(cfg, config_class)
+        with _resolved_lock:
+            _resolved[key] = snapshot
+            while len(_resolved) > RESOLVED_CACHE_SIZE:
+                _resolved.popitem(last=False)
+        return snapshot
+
+
+def clear_resolved_config():
+    with _resolved_lock:
+        _resolved.clear()
+
+
+def _snapshot_key(
+    config_class: ConfigProtocol,
+    cli_args: Optional[Namespace],
+    config_file_name: Optional[str],
+    config_env: Optional[str],
+) -> Hashable:
+    # the file FileConfig reads
+    path = (
+        config_file_name
+        or os.environ.get("BAT_CONFIG_FILE")
+        or os.path.join(os.getcwd(), "config.yaml")
+    )
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime = None
+
+    env = tuple(
+        sorted((k, v) for k, v in os.environ.items() if k.startswith("BAT_"))
+    )
+
+    args: Tuple = ()
+    if cli_args is not None:
+        # CliArgsConfig matches args to the last part of each key
+        names = {key.rsplit(".", 1)[-1] for key in _leaf_keys(config_class)}
+        args = tuple(
+            sorted(
+                (name, _hashable(value))
+                for name, value in vars(cli_args).items()
+                if name in names and value is not None
+            )
+        )
+    return config_class, path, mtime, config_env, env, args
+
+
+def _leaf_keys(
+    config_class: ConfigProtocol, prefix: str = ""
+) -> Iterator[str]:
+    for field in config_class.__dataclass_fields__.values():
+        if isinstance(field.type, ConfigProtocol):
+            yield from _leaf_keys(field.type, f"{prefix}{field.name}.")
+        else:
+            yield f"{prefix}{field.name}"
+
+
+def _hashable(value: Any) -> Hashable:
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _hashable(v)) for k, v in value.items()))
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+
+def as_bool(value: str) -> bool:
+    """Interpret a configuration string as a boolean"""
+    return str(value).strip().lower() not in ("", "0", "false", "no", "off")
+
+
 log = getLogger(__name__)
 
 
@@ -0,0 +1,689 @@
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+import contextlib
+import heapq
+import itertools
+import json
+import os
+import shlex
+import signal
+import socket
+import socketserver
+import threading
+import time
+from argparse import (
+    REMAINDER,
+    ArgumentParser,
+    Namespace,
+    RawDescriptionHelpFormatter,
+    _SubParsersAction,
+)
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from logging import getLogger
+from textwrap import dedent
+
+import yaml
+
+from .conf import resolved_config
+from .lib.canvas import keep_clients
+from .logconf import log_context
+
+
+log = getLogger(__name__)
+
+# finished runs kept for status
+HISTORY = 100
+
+# minute, hour, day of month, month, day of week
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+CRON_ALIASES = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+# days searched for the next run, a schedule may never match, ex: Feb 30
+CRON_HORIZON = 366 * 5
+
+
+class Cron:
+    """A cron schedule, ex: "30 2 * * 1-5" or "@daily".
+
+    Fields are minute, hour, day of month, month and day of week, 0 or 7
+    for Sunday, each a *, numbers, ranges and steps, ex: 1,15 or */10.
+    As with cron, a day matches either day field when both are given.
+    """
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        spec = CRON_ALIASES.get(expression.strip(), expression).split()
+        if len(spec) != len(CRON_FIELDS):
+            raise ValueError(f"expected 5 cron fields, got {expression!r}")
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _cron_field(text, low, high, expression)
+            for text, (low, high) in zip(spec, CRON_FIELDS)
+        )
+        self.weekdays = {day % 7 for day in weekdays}
+        self._any_day = spec[2] == "*"
+        self._any_weekday = spec[4] == "*"
+
+    def matches_day(self, day: date) -> bool:
+        weekday = (day.weekday() + 1) % 7
+        if self._any_day or self._any_weekday:
+            return day.day in self.days and weekday in self.weekdays
+        return day.day in self.days or weekday in self.weekdays
+
+    def next(self, after: datetime) -> datetime:
+        """The first minute of the schedule after `after`"""
+        t = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        end = t + timedelta(days=CRON_HORIZON)
+        while t < end:
+            if t.month not in self.months or not self.matches_day(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"cron schedule {self.expression!r} never runs")
+
+    def __repr__(self) -> str:
+        return f"Cron({self.expression!r})"
+
+
+def _cron_field(text: str, low: int, high: int, expression: str) -> Set[int]:
+    values: Set[int] = set()
+    try:
+        for part in text.split(","):
+            span, _, step = part.partition("/")
+            if span == "*":
+                start, end = low, high
+            elif "-" in span:
+                start, end = (int(n) for n in span.split("-", 1))
+            else:
+                start = end = int(span)
+                if step:
+                    end = high
+            if not low <= start <= end <= high:
+                raise ValueError
+            values.update(range(start, end + 1, int(step or 1)))
+    except ValueError:
+        raise ValueError(f"bad cron field {text!r} in {expression!r}")
+    return values
+
+
+@dataclass
+class ScheduledJob:
+    """A bat command run on a cron schedule, the highest priority first"""
+
+    name: str
+    command: List[str]
+    cron: Cron
+    priority: int = 0
+
+
+def load_schedule(path: str) -> List[ScheduledJob]:
+    """The jobs of a schedule file, ex:
+
+        jobs:
+          - name: nightly-grades
+            cron: "0 2 * * *"
+            priority: 10
+            command: report grades --account 1 -o /data/grades.csv
+
+    A command is the arguments of bat, as a string or a list.
+    """
+    with open(os.path.expanduser(path)) as f:
+        spec = yaml.safe_load(f) or {}
+    jobs = []
+    for entry in spec.get("jobs") or []:
+        command = entry["command"]
+        if isinstance(command, str):
+            command = shlex.split(command)
+        jobs.append(
+            ScheduledJob(
+                name=str(entry["name"]),
+                command=[str(arg) for arg in command],
+                cron=Cron(str(entry["cron"])),
+                priority=int(entry.get("priority", 0)),
+            )
+        )
+    if len({job.name for job in jobs}) < len(jobs):
+        raise ValueError(f"job names are not unique in {path}")
+    return jobs
+
+
+@dataclass
+class Run:
+    """A run of a bat command by the daemon"""
+
+    id: int
+    name: str
+    command: List[str]
+    priority: int = 0
+    state: str = "queued"
+    submitted: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    error: Optional[str] = None
+    done: threading.Event = field(default_factory=threading.Event)
+
+    def summary(self) -> Dict[str, Any]:
+        ret = {
+            "id": self.id,
+            "name": self.name,
+            "command": self.command,
+            "priority": self.priority,
+            "state": self.state,
+            "error": self.error,
+        }
+        if self.started is not None:
+            end = self.finished or time.time()
+            ret["seconds"] = round(end - self.started, 3)
+        return ret
+
+
+class QueueFull(RuntimeError):
+    pass
+
+
+class RunQueue:
+    """Bounded queue of runs, the highest priority first, then the oldest"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._heap: List[Tuple[int, int, Run]] = []
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, run: Run):
+        with self._cond:
+            if len(self._heap) >= self.maxsize:
+                raise QueueFull(f"{self.maxsize} runs queued already")
+            heapq.heappush(self._heap, (-run.priority, run.id, run))
+            self._cond.notify()
+
+    def get(self) -> Optional[Run]:
+        """The next run, waiting for one, or None once closed"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._heap or self._closed)
+            if self._closed:
+                return None
+            return heapq.heappop(self._heap)[2]
+
+    def runs(self) -> List[Run]:
+        with self._cond:
+            return [run for _, _, run in sorted(self._heap)]
+
+    def close(self) -> List[Run]:
+        """Wake the workers, returns the runs left queued"""
+        with self._cond:
+            self._closed = True
+            left = [run for _, _, run in sorted(self._heap)]
+            self._heap.clear()
+            self._cond.notify_all()
+        return left
+
+
+Runner = Callable[[Sequence[str]], Any]
+
+
+class Daemon:
+    """Runs bat commands on schedules, and on demand, in one process.
+
+    Runs wait in a RunQueue of `queue_size` and `workers` threads take
+    them in turn. A scheduled job is skipped while a run of it is queued
+    or running, or when the queue is full. Commands share the warm state
+    of the process: the resolved configuration, and the Canvas clients
+    kept open with their connections, response cache and rate limit.
+    """
+
+    def __init__(
+        self,
+        jobs: Sequence[ScheduledJob] = (),
+        queue_size: int = 100,
+        workers: int = 2,
+        runner: Optional[Runner] = None,
+        clock: Callable[[], datetime] = datetime.now,
+    ):
+        self.jobs = {job.name: job for job in jobs}
+        self.queue = RunQueue(queue_size)
+        self.workers = max(1, workers)
+        self.runner = runner or run_argv
+        self.clock = clock
+        self.running: Dict[int, Run] = {}
+        self.history: "deque[Run]" = deque(maxlen=HISTORY)
+        self.due: Dict[str, datetime] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def submit(
+        self,
+        command: Sequence[str],
+        name: Optional[str] = None,
+        priority: int = 0,
+    ) -> Run:
+        """Queue a run, raises QueueFull if the queue is"""
+        run = Run(
+            next(self._ids),
+            name or shlex.join(command),
+            list(command),
+            priority,
+        )
+        self.queue.put(run)
+        log.info(f"queued {run.name}, run {run.id}")
+        return run
+
+    def submit_job(self, name: str, priority: Optional[int] = None) -> Run:
+        """Queue a run of the scheduled job `name`"""
+        if (job := self.jobs.get(name)) is None:
+            raise KeyError(f"no scheduled job {name!r}")
+        if priority is None:
+            priority = job.priority
+        return self.submit(job.command, job.name, priority)
+
+    def tick(self) -> float:
+        """Queue the scheduled jobs due, returns the seconds to the next"""
+        now = self.clock()
+        for job in self.jobs.values():
+            if (due := self.due.get(job.name)) is None:
+                self.due[job.name] = job.cron.next(now)
+                continue
+            if due > now:
+                continue
+            self.due[job.name] = job.cron.next(now)
+            if self._pending(job.name):
+                log.warning(f"{job.name} still queued or running, skipped")
+                continue
+            try:
+                self.submit_job(job.name)
+            except QueueFull as err:
+                log.warning(f"{job.name} skipped: {err}")
+        if not self.due:
+            return 60.0
+        return max(0.0, (min(self.due.values()) - now).total_seconds())
+
+    def _pending(self, name: str) -> bool:
+        with self._lock:
+            running = [run.name for run in self.running.values()]
+        queued = [run.name for run in self.queue.runs()]
+        return name in running or name in queued
+
+    def start(self):
+        for n in range(self.workers):
+            self._thread(self._work, f"bat-daemon-{n}")
+        self._thread(self._schedule, "bat-daemon-schedule")
+
+    def _thread(self, target: Callable[[], None], name: str):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _schedule(self):
+        while not self._stopping.is_set():
+            # wake at least each minute, in case the clock jumps
+            self._stopping.wait(min(self.tick(), 60.0))
+
+    def _work(self):
+        while (run := self.queue.get()) is not None:
+            self.execute(run)
+
+    def execute(self, run: Run):
+        run.state, run.started = "running", time.time()
+        with self._lock:
+            self.running[run.id] = run
+        with log_context(job=run.name):
+            log.info(f"running {run.name}, run {run.id}")
+            try:
+                self.runner(run.command)
+                run.state = "ok"
+            except Exception as err:
+                run.state, run.error = "failed", repr(err)
+                log.error(f"{run.name} failed: {err!r}")
+        run.finished = time.time()
+        with self._lock:
+            del self.running[run.id]
+            self.history.append(run)
+        run.done.set()
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            running = [run.summary() for run in self.running.values()]
+            history = [run.summary() for run in self.history]
+        return {
+            "running": running,
+            "queued": [run.summary() for run in self.queue.runs()],
+            "recent": history[::-1],
+            "schedule": [
+                {
+                    "name": job.name,
+                    "cron": job.cron.expression,
+                    "priority": job.priority,
+                    "next": _isoformat(self.due.get(job.name)),
+                }
+                for job in self.jobs.values()
+            ],
+        }
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop scheduling, drop the queued runs and wait for the others"""
+        self._stopping.set()
+        for run in self.queue.close():
+            run.state = "cancelled"
+            run.done.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads.clear()
+
+
+def _isoformat(t: Optional[datetime]) -> Optional[str]:
+    return t.isoformat(timespec="minutes") if t else None
+
+
+class _ArgvParser(ArgumentParser):
+    """An ArgumentParser raising ValueError where it would print and exit,
+    the daemon's stdout and stderr are shared by all its runs"""
+
+    def _print_message(self, message: str, file=None):
+        pass
+
+    def exit(self, status: int = 0, message: Optional[str] = None):
+        raise ValueError((message or "").strip() or f"{self.prog} exited")
+
+    def error(self, message: str):
+        raise ValueError(f"{self.prog}: {message}")
+
+
+def _raising(parser: ArgumentParser) -> ArgumentParser:
+    """`parser` and its sub-command parsers, made _ArgvParsers"""
+    parser.__class__ = _ArgvParser
+    for action in parser._actions:
+        if isinstance(action, _SubParsersAction):
+            for sub in action.choices.values():
+                _raising(sub)
+    return parser
+
+
+# parsers of the commands run, built once each, and the one that finds the
+# command, as None
+_parsers: Dict[Optional[str], ArgumentParser] = {}
+_parsers_lock = threading.Lock()
+
+
+def _parser(command: Optional[str]) -> ArgumentParser:
+    from .cli import argparser
+
+    with _parsers_lock:
+        if (parser := _parsers.get(command)) is None:
+            load = () if command is None else [command]
+            parser = _parsers[command] = _raising(argparser(load=load))
+        return parser
+
+
+def parse_argv(argv: Sequence[str]) -> Namespace:
+    """bat's arguments `argv`, parsed as BATCLI would.
+
+    Raises ValueError rather than exit on bad arguments, with argparse's
+    message.
+    """
+    command = _parser(None).parse_known_args(argv)[0].command
+    return _parser(command).parse_args(argv)
+
+
+def run_argv(argv: Sequence[str]):
+    """Run the bat command of `argv`, as BATCLI would"""
+    from .cli import run_command
+
+    args = parse_argv(argv)
+    with log_context(command=args.command):
+        return run_command(args)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """One JSON request per line, each answered with a JSON line"""
+
+    server: "DaemonServer"
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                reply = self.server.reply(json.loads(line))
+            except Exception as err:
+                reply = {"error": str(err)}
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+            self.wfile.flush()
+
+
+class DaemonServer(socketserver.ThreadingUnixStreamServer):
+    """The local socket of a Daemon.
+
+    Requests are JSON objects, ex:
+        {"run": ["report", "assignments", "--course", "1"], "priority": 5}
+        {"job": "nightly-grades", "wait": false}
+        {"status": true}
+    A run is answered once it finishes unless "wait" is false, and its
+    arguments are checked before it is queued.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path: str, daemon: Daemon):
+        self.path = os.path.expanduser(path)
+        self.daemon = daemon
+        _remove_stale(self.path)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # the socket runs commands with this user's Canvas tokens, so it is
+        # created 0o600, never open to others even briefly
+        umask = os.umask(0o177)
+        try:
+            super().__init__(self.path, _Handler)
+        finally:
+            os.umask(umask)
+
+    def reply(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        if request.get("status"):
+            return self.daemon.status()
+        priority = request.get("priority")
+        if job := request.get("job"):
+            run = self.daemon.submit_job(job, priority)
+        elif command := request.get("run"):
+            if isinstance(command, str):
+                command = shlex.split(command)
+            parse_argv(command)
+            run = self.daemon.submit(command, priority=priority or 0)
+        else:
+            raise ValueError("expected run, job or status")
+        if request.get("wait", True):
+            run.done.wait()
+        return run.summary()
+
+    def server_close(self):
+        super().server_close()
+        with contextlib.suppress(OSError):
+            os.remove(self.path)
+
+
+def _remove_stale(path: str):
+    """Remove the socket of a daemon no longer running"""
+    if not os.path.exists(path):
+        return
+    with socket.socket(socket.AF_UNIX) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            os.remove(path)
+            return
+    raise RuntimeError(f"a daemon is already listening on {path}")
+
+
+def request(path: str, message: Dict[str, Any]) -> Dict[str, Any]:
+    """Send `message` to the daemon listening on `path`, returns its reply"""
+    with socket.socket(socket.AF_UNIX) as sock:
+        sock.connect(os.path.expanduser(path))
+        sock.sendall(json.dumps(message).encode() + b"\n")
+        with sock.makefile("rb") as replies:
+            reply = json.loads(replies.readline())
+    if "error" in reply and "state" not in reply:
+        raise RuntimeError(reply["error"])
+    return reply
+
+
+def daemon_cli() -> ArgumentParser:
+    daemon = ArgumentParser(
+        prog="daemon",
+        formatter_class=RawDescriptionHelpFormatter,
+        description=dedent(
+            """\
+                run bat commands on cron schedules from a long running
+                process, which keeps its configuration and Canvas
+                connections, cache and rate limits warm between runs
+
+                bat daemon run triggers a run over the daemon's socket,
+                without the start up of a new bat process.
+            """
+        ),
+    )
+    daemon.set_defaults(func=lambda _: daemon.print_help())
+
+    commands = daemon.add_subparsers(dest="daemon_command", title="commands")
+    serve = commands.add_parser(
+        "serve", help="run the scheduled jobs, and listen on the socket"
+    )
+    serve.add_argument(
+        "--schedule",
+        default=None,
+        help="YAML file of the scheduled jobs, see bat.daemon.load_schedule",
+    )
+    serve.add_argument(
+        "--queue-size",
+        dest="queue_size",
+        default=None,
+        help="runs waiting at most. default=100",
+    )
+    serve.add_argument(
+        "--job-workers",
+        dest="job_workers",
+        default=None,
+        help="runs at once. default=2",
+    )
+    _socket_argument(serve)
+    serve.set_defaults(func=_Commands.serve)
+
+    run = commands.add_parser(
+        "run", help="run a command, or a scheduled job, with the daemon"
+    )
+    run.add_argument(
+        "--job", default=None, help="the scheduled job to run, by name"
+    )
+    run.add_argument(
+        "--priority",
+        type=int,
+        default=None,
+        help="runs of a higher priority go first. default=0, or the job's",
+    )
+    run.add_argument(
+        "--no-wait",
+        dest="wait",
+        action="store_false",
+        help="return once queued rather than once done",
+    )
+    _socket_argument(run)
+    run.add_argument(
+        "argv",
+        nargs=REMAINDER,
+        help="the command to run, ex: -- report assignments --course 1",
+    )
+    run.set_defaults(func=_Commands.run)
+
+    status = commands.add_parser(
+        "status", help="the runs and schedule of the daemon, as JSON"
+    )
+    _socket_argument(status)
+    status.set_defaults(func=_Commands.status)
+
+    return daemon
+
+
+def _socket_argument(p: ArgumentParser):
+    p.add_argument(
+        "--socket",
+        default=None,
+        help="unix socket of the daemon. default=daemon.socket of the config",
+    )
+
+
+class _Commands:
+    @staticmethod
+    def serve(args: Namespace):
+        cfg = _config(args)
+        schedule = os.path.expanduser(cfg.daemon.schedule)
+        jobs = load_schedule(schedule) if os.path.exists(schedule) else []
+        if not jobs:
+            log.warning(f"no jobs scheduled in {schedule}")
+        daemon = Daemon(
+            jobs,
+            queue_size=int(cfg.daemon.queue_size),
+            workers=int(cfg.daemon.job_workers),
+        )
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        with keep_clients(), DaemonServer(cfg.daemon.socket, daemon) as server:
+            listener = threading.Thread(target=server.serve_forever)
+            listener.start()
+            daemon.start()
+            print(f"bat daemon listening on {server.path}")
+            try:
+                stop.wait()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.shutdown()
+                listener.join()
+                daemon.stop()
+
+    @staticmethod
+    def run(args: Namespace):
+        message: Dict[str, Any] = {"wait": args.wait}
+        if args.priority is not None:
+            message["priority"] = args.priority
+        argv = args.argv[1:] if args.argv[:1] == ["--"] else args.argv
+        if args.job:
+            message["job"] = args.job
+        elif argv:
+            message["run"] = argv
+        else:
+            raise RuntimeError("give a command to run, or a --job")
+        reply = request(_config(args).daemon.socket, message)
+        print(json.dumps(reply))
+        if reply.get("state") == "failed":
+            raise RuntimeError(f"{reply['name']} failed: {reply['error']}")
+
+    @staticmethod
+    def status(args: Namespace):
+        reply = request(_config(args).daemon.socket, {"status": True})
+        print(json.dumps(reply, indent=2))
+
+
+def _config(args: Namespace):
+    return resolved_config(
+        cli_args=args,
+        config_file_name=args.config_file,
+        config_env=args.config_env,
+    )
@@ -0,0 +1,332 @@
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from operator import attrgetter, itemgetter
+
+from .lib.timings import span
+
+
+Record = Dict[str, Any]
+Row = Dict[str, Any]
+
+# fields indexed as a kind of entity is loaded, those its records have
+INDEXED = ("id", "course_id", "course_section_id", "section_id", "user_id")
+
+# the fields joined on: one name for both sides, several, or a mapping of
+# the rows' fields to the entities'
+On = Union[str, Sequence[str], Mapping[str, str]]
+# the entity fields a join adds to the rows: their names, or a mapping to
+# the names in the rows
+Fields = Union[Sequence[str], Mapping[str, str]]
+
+Buckets = Dict[Hashable, List[Any]]
+
+
+class EntityStore:
+    """Canvas entities in memory, hash indexed for joins.
+
+    Each kind of entity, ex: "enrollments", is a list of records, dicts
+    or bat.records types. Loading a kind indexes it by the INDEXED fields
+    its records have, and any other index is built on first use and kept,
+    ex: by (course_id, user_id). A join looks each row's matches up in an
+    index instead of scanning the entities, so it costs one dict lookup
+    per row rather than one comparison per row and entity.
+
+        store = EntityStore()
+        store.load("enrollments", enrollments)
+        rows = store.join(
+            submissions,
+            "enrollments",
+            on=("course_id", "user_id"),
+            fields={"course_section_id": "section_id"},
+        )
+        by_section = group_by(rows, ["section_id"], missing=(None, "count"))
+    """
+
+    def __init__(self):
+        self.entities: Dict[str, List[Any]] = {}
+        self._indexes: Dict[Tuple[str, Tuple[str, ...]], Buckets] = {}
+        # kinds whose records are dicts, not bat.records types
+        self._dicts: Dict[str, bool] = {}
+
+    @classmethod
+    def from_state(
+        cls,
+        state,
+        course_ids: Sequence[str],
+        reports: Sequence[str],
+        casts: Optional[Mapping[str, Callable[[Any], Any]]] = None,
+    ) -> "EntityStore":
+        """The records of `reports` synced to a StateStore, a kind each"""
+        store = cls()
+        for report in reports:
+            store.load(report, state.records(report, course_ids), casts)
+        return store
+
+    def load(
+        self,
+        kind: str,
+        records: Iterable[Any],
+        casts: Optional[Mapping[str, Callable[[Any], Any]]] = None,
+    ) -> int:
+        """Load the entities of `kind`, in place of any loaded before.
+
+        `casts` convert fields as they load, ex: {"course_id": int}, so
+        that keys from different sources compare equal: the state store
+        keeps course ids as text. Returns the number of entities.
+        """
+        entities = self.entities[kind] = list(records)
+        for key in [key for key in self._indexes if key[0] == kind]:
+            del self._indexes[key]
+        if not entities:
+            return 0
+
+        first = entities[0]
+        self._dicts[kind] = isinstance(first, dict)
+        if self._dicts[kind]:
+            present = first.keys()
+        else:
+            present = {name for name in INDEXED if hasattr(first, name)}
+        for name, cast in (casts or {}).items():
+            if name in present:
+                _cast(entities, name, cast)
+        for name in INDEXED:
+            if name in present:
+                self.index(kind, name)
+        return len(entities)
+
+    def index(self, kind: str, *fields: str) -> Buckets:
+        """The entities of `kind` by the value of `fields`, a tuple of
+        values when there are several. None values are not indexed."""
+        key = (kind, fields)
+        if (buckets := self._indexes.get(key)) is not None:
+            return buckets
+        buckets = {}
+        entities = self.entities.get(kind, [])
+        if entities:
+            value = self._key(kind, fields)
+            for entity, k in zip(entities, map(value, entities)):
+                if k is None or (len(fields) > 1 and None in k):
+                    continue
+                if (bucket := buckets.get(k)) is None:
+                    buckets[k] = [entity]
+                else:
+                    bucket.append(entity)
+        self._indexes[key] = buckets
+        return buckets
+
+    def _key(self, kind: str, fields: Tuple[str, ...]) -> Callable:
+        if not self._dicts.get(kind, True):
+            return attrgetter(*fields)
+        if len(fields) == 1:
+            (name,) = fields
+            return lambda entity: entity.get(name)
+        return lambda entity: tuple(entity.get(name) for name in fields)
+
+    def get(self, kind: str, id: Any) -> Optional[Any]:
+        """The entity of `kind` with this id, if any"""
+        matches = self.index(kind, "id").get(id)
+        return matches[0] if matches else None
+
+    def where(self, kind: str, **equals: Any) -> List[Any]:
+        """The entities of `kind` whose fields equal `equals`, by index"""
+        fields = tuple(sorted(equals))
+        key = equals[fields[0]] if len(fields) == 1 else tuple(
+            equals[name] for name in fields
+        )
+        return list(self.index(kind, *fields).get(key, ()))
+
+    def join(
+        self,
+        rows: Iterable[Row],
+        kind: str,
+        on: On,
+        fields: Fields = (),
+        how: str = "inner",
+    ) -> Iterator[Row]:
+        """Join rows to the entities of `kind`, by index.
+
+        Each row comes out once per entity matching it `on`, as a new
+        dict with the entity's `fields` added. `how` "left" also keeps
+        the rows without a match, with None for the fields, "inner" drops
+        them.
+        """
+        if how not in ("inner", "left"):
+            raise ValueError(f"unknown join {how!r}, choose inner or left")
+        pairs = _pairs(on)
+        buckets = self.index(kind, *(entity for _, entity in pairs))
+        row_key = itemgetter(*(row for row, _ in pairs))
+        composite = len(pairs) > 1
+        selected = _pairs(fields)
+        names = [name for _, name in selected]
+        value = _value_getter(self._dicts.get(kind, True))
+        missing = dict.fromkeys(names)
+
+        for row in rows:
+            key = row_key(row)
+            if key is None or (composite and None in key):
+                matches = None
+            else:
+                matches = buckets.get(key)
+            if matches:
+                for entity in matches:
+                    joined = dict(row)
+                    for name, alias in selected:
+                        joined[alias] = value(entity, name)
+                    yield joined
+            elif how == "left":
+                yield {**row, **missing}
+
+
+def _pairs(names: Union[On, Fields]) -> List[Tuple[str, str]]:
+    if isinstance(names, str):
+        return [(names, names)]
+    if isinstance(names, Mapping):
+        return list(names.items())
+    return [(name, name) for name in names]
+
+
+def _value_getter(dicts: bool) -> Callable[[Any, str], Any]:
+    if dicts:
+        return lambda entity, name: entity.get(name)
+    return lambda entity, name: getattr(entity, name, None)
+
+
+def _cast(entities: List[Any], name: str, cast: Callable[[Any], Any]):
+    for entity in entities:
+        if isinstance(entity, dict):
+            if (value := entity.get(name)) is not None:
+                entity[name] = cast(value)
+        elif (value := getattr(entity, name)) is not None:
+            setattr(entity, name, cast(value))
+
+
+AGGREGATES: Dict[str, Callable[[List[Any]], Any]] = {
+    "count": len,
+    "count_distinct": lambda values: len(set(values)),
+    "sum": sum,
+    "min": lambda values: min(values, default=None),
+    "max": lambda values: max(values, default=None),
+    "mean": lambda values: sum(values) / len(values) if values else None,
+    "list": list,
+}
+
+
+def group_by(
+    rows: Iterable[Row],
+    by: Sequence[str],
+    **aggregates: Tuple[Optional[str], str],
+) -> List[Row]:
+    """Rows grouped by the fields `by`, with an aggregate column each.
+
+    Aggregates are (field, function) pairs, with a function of AGGREGATES,
+    ex: students=("user_id", "count_distinct"). None values are left out,
+    as in SQL, and a field None counts rows. Groups come out in the order
+    they first appear in.
+    """
+    for name, (_, function) in aggregates.items():
+        if function not in AGGREGATES:
+            raise ValueError(
+                f"unknown aggregate {function!r} for {name},"
+                f" choose from {', '.join(AGGREGATES)}"
+            )
+    columns = list(aggregates.items())
+    group_key = itemgetter(*by)
+    groups: Dict[Hashable, List[List[Any]]] = {}
+    for row in rows:
+        key = group_key(row)
+        if (values := groups.get(key)) is None:
+            values = groups[key] = [[] for _ in columns]
+        for collected, (_, (field, _)) in zip(values, columns):
+            if field is None:
+                collected.append(1)
+            elif (value := row.get(field)) is not None:
+                collected.append(value)
+
+    ret = []
+    for key, values in groups.items():
+        row = dict(zip(by, key if len(by) > 1 else (key,)))
+        for collected, (name, (_, function)) in zip(values, columns):
+            row[name] = AGGREGATES[function](collected)
+        ret.append(row)
+    return ret
+
+
+class MissingReport:
+    """Missing submissions per section, with the section's instructors.
+
+    Derived from the rows synced by the submissions and enrollments
+    reports: each missing submission is placed in the sections of its
+    student's enrollments, and a section's instructors are its teachers.
+    """
+
+    name = "missing_by_section"
+    sources = ("submissions", "enrollments")
+    columns = (
+        "course_id",
+        "section_id",
+        "missing",
+        "students",
+        "assignments",
+        "instructor_ids",
+    )
+    types = {"instructor_ids": "string"}
+    # ids as GradeReport reads them, the state store keeps course ids as text
+    casts = {"course_id": int, "user_id": int, "course_section_id": int}
+
+    def store(self, state, course_ids: Sequence[str]) -> EntityStore:
+        store = EntityStore.from_state(
+            state, course_ids, self.sources, self.casts
+        )
+        enrollments = store.entities.get("enrollments", [])
+        for kind, role in (
+            ("students", "StudentEnrollment"),
+            ("teachers", "TeacherEnrollment"),
+        ):
+            store.load(kind, (e for e in enrollments if e["type"] == role))
+        return store
+
+    def rows(self, state, course_ids: Sequence[str]) -> Iterator[Record]:
+        with span("aggregate"):
+            store = self.store(state, course_ids)
+            missing = (
+                submission
+                for submission in store.entities.get("submissions", [])
+                if submission.get("missing")
+            )
+            placed = store.join(
+                missing,
+                "students",
+                on=("course_id", "user_id"),
+                fields={"course_section_id": "section_id"},
+            )
+            groups = group_by(
+                placed,
+                ("course_id", "section_id"),
+                missing=(None, "count"),
+                students=("user_id", "count_distinct"),
+                assignments=("assignment_id", "count_distinct"),
+            )
+            for row in groups:
+                teachers = store.where(
+                    "teachers",
+                    course_id=row["course_id"],
+                    course_section_id=row["section_id"],
+                )
+                row["instructor_ids"] = (
+                    " ".join(str(t["user_id"]) for t in teachers) or None
+                )
+            groups.sort(key=itemgetter("course_id", "section_id"))
+        return iter(groups)
@@ -1,2 +0,0 @@
-def hello_world():
-    return "Hello World!"
@@ -0,0 +1,22 @@
+import sys
+from contextlib import nullcontext
+
+
+# cprofile for a deterministic profile, sampling for pyinstrument's
+PROFILERS = ("cprofile", "sampling")
+
+
+def hello_world():
+    return "Hello World!"
+
+
+def timed(name: str):
+    """bat.lib.timings.span, without importing bat.lib.timings.
+
+    Timings can only have been started once the module is imported, so
+    until then this is a no-op, and the CLI starts up without it.
+    """
+    timings = sys.modules.get("bat.lib.timings")
+    if timings is None:
+        return nullcontext()
+    return timings.span(name)
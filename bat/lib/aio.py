@@ -0,0 +1,442 @@
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TYPE_CHECKING,
+)
+
+import asyncio
+import ssl
+import time
+from logging import DEBUG, getLogger
+from urllib.parse import urlsplit
+
+from .canvas import (
+    CanvasAPIError,
+    CanvasClient,
+    Params,
+    RateLimitBackoff,
+    Response,
+    adaptive_limit,
+    is_rate_limited,
+    log_request,
+)
+from .concurrency import AsyncAdaptiveLimit
+from .decode import JsonDecoder, decoder, get_decoder
+from .paginate import Paginator, next_url
+from .timings import span
+
+
+if TYPE_CHECKING:
+    from ..records import CanvasRecord
+    from .cache import ResponseCache
+    from .loader import AsyncDataLoader
+
+
+log = getLogger(__name__)
+
+
+class AsyncConnection:
+    """One keep-alive HTTP/1.1 connection over asyncio streams"""
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        netloc: str,
+    ):
+        self.reader = reader
+        self.writer = writer
+        self.netloc = netloc
+
+    @classmethod
+    async def open(
+        cls,
+        scheme: str,
+        netloc: str,
+        tls: Optional[ssl.SSLContext] = None,
+    ) -> "AsyncConnection":
+        """Connect to netloc, over `tls`, or a default context for https"""
+        parts = urlsplit(f"//{netloc}")
+        if scheme == "https" and tls is None:
+            tls = ssl.create_default_context()
+        elif scheme != "https":
+            tls = None
+        port = parts.port or (443 if tls else 80)
+        reader, writer = await asyncio.open_connection(
+            parts.hostname, port, ssl=tls
+        )
+        return cls(reader, writer, netloc)
+
+    async def request(
+        self,
+        method: str,
+        target: str,
+        headers: Mapping[str, str],
+        body: Optional[bytes] = None,
+    ) -> Tuple[int, Dict[str, str], bytes, bool]:
+        """Send a request, returns (status, headers, body, will_close)"""
+        head = {"Host": self.netloc, **headers}
+        if body is not None:
+            head["Content-Length"] = str(len(body))
+        lines = [f"{method} {target} HTTP/1.1"]
+        lines += [f"{name}: {value}" for name, value in head.items()]
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        if body:
+            self.writer.write(body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError(f"{self.netloc} closed the connection")
+        version, status, *_ = status_line.decode("latin-1").split(" ", 2)
+        response_headers: Dict[str, str] = {}
+        while (line := await self.reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        connection = response_headers.get("connection", "").lower()
+        will_close = connection == "close" or (
+            version == "HTTP/1.0" and connection != "keep-alive"
+        )
+        if method == "HEAD" or status in ("204", "304"):
+            data = b""
+        elif "chunked" in response_headers.get("transfer-encoding", ""):
+            data = await self._read_chunked()
+        elif (length := response_headers.get("content-length")) is not None:
+            data = await self.reader.readexactly(int(length))
+        else:
+            data = await self.reader.read()
+            will_close = True
+        return int(status), response_headers, data, will_close
+
+    async def _read_chunked(self) -> bytes:
+        chunks: List[bytes] = []
+        while True:
+            size = int((await self.reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                # trailers, up to the blank line
+                while (await self.reader.readline()) not in (b"\r\n", b""):
+                    pass
+                return b"".join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readexactly(2)
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncConnectionPool:
+    """Idle keep-alive connections to a single host, most recent first"""
+
+    def __init__(
+        self,
+        scheme: str,
+        netloc: str,
+        maxsize: int,
+        tls: Optional[ssl.SSLContext] = None,
+    ):
+        self.scheme = scheme
+        self.netloc = netloc
+        self.maxsize = maxsize
+        self.tls = tls
+        self.created = 0
+        self._idle: List[AsyncConnection] = []
+
+    async def get(self) -> Tuple[AsyncConnection, bool]:
+        """Return a connection, and whether it was reused from the pool"""
+        if self._idle:
+            return self._idle.pop(), True
+        return await self.new(), False
+
+    async def new(self) -> AsyncConnection:
+        self.created += 1
+        return await AsyncConnection.open(self.scheme, self.netloc, self.tls)
+
+    def put(self, conn: AsyncConnection):
+        if len(self._idle) < self.maxsize:
+            self._idle.append(conn)
+        else:
+            conn.close()
+
+    def close(self):
+        while self._idle:
+            self._idle.pop().close()
+
+
+class AsyncCanvasClient:
+    """Canvas REST client for asyncio, the counterpart of CanvasClient.
+
+    One event loop keeps up to `concurrency` requests in flight, bounded
+    by a semaphore rather than a thread each, so hundreds of concurrent
+    requests cost little more than their sockets. Retries, rate limit
+    backoff, the adaptive `limit` and cache revalidation behave as they
+    do in CanvasClient, the cache is read and written from a worker
+    thread so its SQLite calls do not block the loop.
+    Use from a single event loop.
+    """
+
+    url = CanvasClient.url
+    same_origin = CanvasClient.same_origin
+    request_headers = CanvasClient.request_headers
+
+    def __init__(
+        self,
+        url: str,
+        token: str,
+        concurrency: int = 100,
+        timeout: float = 30.0,
+        max_retries: int = 5,
+        backoff: Optional[RateLimitBackoff] = None,
+        cache: Optional["ResponseCache"] = None,
+        lookup_batch_size: int = 100,
+        lookup_cache_size: int = 10_000,
+        limit: Optional[AsyncAdaptiveLimit] = None,
+        json_decoder: Optional[JsonDecoder] = None,
+    ):
+        self.base_url = url.rstrip("/")
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff if backoff else RateLimitBackoff()
+        self.limit = limit
+        self.cache = cache
+        self.lookup_batch_size = lookup_batch_size
+        self.lookup_cache_size = lookup_cache_size
+        self.json_decoder = json_decoder or decoder()
+        self._loaders: Dict[Tuple, "AsyncDataLoader"] = {}
+        self.headers = {
+            "Authorization": f"Bearer {token}",
+            "Accept": "application/json",
+        }
+        self._slots: Any = limit or asyncio.Semaphore(concurrency)
+        self._pools: Dict[Tuple[str, str], AsyncConnectionPool] = {}
+        # loading the CA store is slow, every connection shares the context
+        self.tls: Optional[ssl.SSLContext] = None
+        if urlsplit(self.base_url).scheme == "https":
+            self.tls = ssl.create_default_context()
+
+    @classmethod
+    def from_config(cls, cfg) -> "AsyncCanvasClient":
+        """Build a client from a bat.conf configuration"""
+        from .cache import cache_from_config
+
+        canvas = cfg.canvas
+        return cls(
+            url=canvas.url,
+            token=canvas.token,
+            concurrency=int(canvas.async_concurrency),
+            limit=adaptive_limit(
+                cfg, int(canvas.async_concurrency), AsyncAdaptiveLimit
+            ),
+            timeout=float(canvas.timeout),
+            max_retries=int(canvas.max_retries),
+            backoff=RateLimitBackoff(
+                floor=float(canvas.rate_limit_floor),
+                delay=float(canvas.backoff),
+            ),
+            cache=cache_from_config(cfg),
+            lookup_batch_size=int(canvas.lookup_batch_size),
+            lookup_cache_size=int(canvas.lookup_cache_size),
+            json_decoder=get_decoder(canvas.json_decoder),
+        )
+
+    async def get(self, path: str, params: Params = None) -> Response:
+        return await self.request("GET", path, params=params)
+
+    async def get_json(self, path: str, params: Params = None) -> Any:
+        return (await self.get(path, params=params)).json()
+
+    async def get_many(self, paths: Iterable[str]) -> List[Response]:
+        """GET every path concurrently, returns responses in input order"""
+        return await asyncio.gather(*(self.get(path) for path in paths))
+
+    def loader(
+        self, name: str, include: Sequence[str] = (), **scope: Any
+    ) -> "AsyncDataLoader":
+        """CanvasClient.loader, the lookups of every task are batched"""
+        from .loader import async_canvas_loader
+
+        key = (name, tuple(include), tuple(sorted(scope.items())))
+        if (loader := self._loaders.get(key)) is None:
+            loader = self._loaders[key] = async_canvas_loader(
+                self,
+                name,
+                include,
+                max_batch=self.lookup_batch_size,
+                cache_size=self.lookup_cache_size,
+                **scope,
+            )
+        return loader
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        params: Params = None,
+        body: Optional[bytes] = None,
+        headers: Optional[Mapping[str, str]] = None,
+    ) -> Response:
+        url = self.url(path, params)
+        send_headers = self.request_headers(url, headers)
+
+        cached = None
+        if self.cache is not None and method == "GET":
+            if cached := await asyncio.to_thread(self.cache.get, url):
+                send_headers.update(cached.validators())
+
+        for attempt in range(self.max_retries + 1):
+            if (delay := self.backoff.pending()) > 0:
+                await asyncio.sleep(delay)
+            async with self._slots:
+                with span("http"):
+                    start = time.perf_counter()
+                    response = await asyncio.wait_for(
+                        self._send(method, url, body, send_headers),
+                        self.timeout,
+                    )
+                    elapsed = time.perf_counter() - start
+            self.backoff.update(response.headers)
+            throttled = is_rate_limited(response)
+            if self.limit is not None:
+                self.limit.observe(response.headers, throttled)
+            if not throttled:
+                break
+            delay = self.backoff.penalize(attempt)
+            log.warning(
+                f"rate limited on {method} {url}, retry in {delay:.2f}s"
+            )
+
+        if log.isEnabledFor(DEBUG):
+            log_request(method, response, elapsed, self.cache, cached)
+        if response.status >= 400:
+            raise CanvasAPIError(response)
+        if cached and response.status == 304:
+            response = await asyncio.to_thread(self.cache.revalidated, cached)
+        elif self.cache is not None and method == "GET":
+            await asyncio.to_thread(self.cache.put, url, response)
+        response.decoder = self.json_decoder
+        return response
+
+    async def _send(
+        self,
+        method: str,
+        url: str,
+        body: Optional[bytes],
+        headers: Mapping[str, str],
+    ) -> Response:
+        parts = urlsplit(url)
+        target = f"{parts.path}?{parts.query}" if parts.query else parts.path
+        pool = self.pool(parts.scheme, parts.netloc)
+
+        conn, reused = await pool.get()
+        try:
+            reply = await conn.request(method, target, headers, body)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            conn.close()
+            if not reused:
+                raise
+            # the server dropped an idle keep-alive connection, try once more
+            # on a fresh one
+            log.debug(f"stale connection to {parts.netloc}, reconnecting")
+            conn = await pool.new()
+            try:
+                reply = await conn.request(method, target, headers, body)
+            except BaseException:
+                conn.close()
+                raise
+        except BaseException:
+            # ex: cancelled by the timeout mid-response
+            conn.close()
+            raise
+
+        status, response_headers, data, will_close = reply
+        if will_close:
+            conn.close()
+        else:
+            pool.put(conn)
+
+        return Response(
+            status=status, headers=response_headers, body=data, url=url
+        )
+
+    def pool(self, scheme: str, netloc: str) -> AsyncConnectionPool:
+        key = (scheme, netloc)
+        if (pool := self._pools.get(key)) is None:
+            if scheme == "https" and self.tls is None:
+                self.tls = ssl.create_default_context()
+            pool = self._pools[key] = AsyncConnectionPool(
+                scheme, netloc, self.concurrency, self.tls
+            )
+        return pool
+
+    async def close(self):
+        for pool in self._pools.values():
+            pool.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    async def __aenter__(self) -> "AsyncCanvasClient":
+        return self
+
+    async def __aexit__(self, *_):
+        await self.close()
+
+
+class AsyncPaginator(Paginator):
+    """Stream a Canvas collection with `async for` over AsyncCanvasClient.
+
+    As with Paginator, the next page is requested as soon as the current
+    one arrives, and at most two pages are held in memory.
+    """
+
+    client: AsyncCanvasClient
+
+    async def pages(self) -> AsyncIterator[Response]:
+        pending: Optional[asyncio.Task] = asyncio.ensure_future(
+            self.client.get(self.url)
+        )
+        try:
+            while pending is not None:
+                response = await pending
+                if url := next_url(response):
+                    pending = asyncio.ensure_future(self.client.get(url))
+                else:
+                    pending = None
+                yield response
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    def __iter__(self):
+        raise TypeError("AsyncPaginator is iterated with async for")
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        async for response in self.pages():
+            for record in self.records(response):
+                yield record
+
+
+def apaginate(
+    client: AsyncCanvasClient,
+    path: str,
+    params: Params = None,
+    per_page: int = 100,
+    key: Optional[str] = None,
+    record_type: Optional[Type["CanvasRecord"]] = None,
+) -> AsyncPaginator:
+    return AsyncPaginator(
+        client,
+        path,
+        params=params,
+        per_page=per_page,
+        key=key,
+        record_type=record_type,
+    )
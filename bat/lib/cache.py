@@ -0,0 +1,297 @@
+from typing import Callable, Dict, Optional
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from argparse import ArgumentParser, Namespace, RawDescriptionHelpFormatter
+from dataclasses import dataclass, replace
+from logging import getLogger
+from textwrap import dedent
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from ..conf import as_bool, resolved_config
+from .canvas import Response
+
+
+log = getLogger(__name__)
+
+CACHE_FILE = "responses.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    body BLOB NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+CREATE INDEX IF NOT EXISTS responses_stored_at ON responses (stored_at);
+"""
+
+
+def cache_key(url: str) -> str:
+    """Key a url by its location and its query, in any parameter order"""
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    normal = f"{parts.scheme}://{parts.netloc}{parts.path}?{query}"
+    return hashlib.sha256(normal.encode()).hexdigest()
+
+
+@dataclass
+class CacheEntry:
+    response: Response
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+    def validators(self) -> Dict[str, str]:
+        """Conditional request headers used to revalidate the entry"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """Persistent cache of GET responses in a SQLite file.
+
+    Only responses carrying an ETag or Last-Modified header are stored, so
+    every hit can be revalidated with a conditional request. Entries not
+    confirmed by the server within `ttl` seconds are evicted, as are the
+    least recently used entries once the cache grows past `max_size` bytes.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        ttl: float = 3600.0,
+        max_size: int = 512 * 1024**2,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.directory = os.path.expanduser(directory)
+        self.path = os.path.join(self.directory, CACHE_FILE)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._db = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        self._size = self.size()
+
+    @classmethod
+    def from_config(cls, cfg) -> "ResponseCache":
+        cache = cfg.cache
+        return cls(
+            directory=cache.directory,
+            ttl=float(cache.ttl),
+            max_size=int(cache.max_size),
+        )
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status, headers, body, etag, last_modified, stored_at"
+                " FROM responses WHERE key = ?",
+                (cache_key(url),),
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        status, headers, body, etag, last_modified, stored_at = row
+        if self._clock() - stored_at > self.ttl:
+            self.misses += 1
+            self.delete(url)
+            return None
+        return CacheEntry(
+            response=Response(status, json.loads(headers), body, url),
+            etag=etag,
+            last_modified=last_modified,
+        )
+
+    def put(self, url: str, response: Response) -> bool:
+        etag = response.headers.get("etag")
+        last_modified = response.headers.get("last-modified")
+        if response.status != 200 or not (etag or last_modified):
+            return False
+
+        now = self._clock()
+        size = len(response.body)
+        key = cache_key(url)
+        with self._lock:
+            # the entry replaced, if any, no longer counts
+            self._size -= self._entry_size(key)
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES"
+                " (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    url,
+                    response.status,
+                    json.dumps(response.headers),
+                    response.body,
+                    etag,
+                    last_modified,
+                    size,
+                    now,
+                    now,
+                ),
+            )
+            self._size += size
+        if self._size > self.max_size:
+            self.evict()
+        return True
+
+    def revalidated(self, entry: CacheEntry) -> Response:
+        """Record a 304 for `entry`, and return its cached response"""
+        now = self._clock()
+        with self._lock:
+            self._db.execute(
+                "UPDATE responses SET stored_at = ?, accessed_at = ?"
+                " WHERE key = ?",
+                (now, now, cache_key(entry.response.url)),
+            )
+            self.hits += 1
+        return replace(entry.response, from_cache=True)
+
+    def delete(self, url: str):
+        key = cache_key(url)
+        with self._lock:
+            self._size -= self._entry_size(key)
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def evict(self) -> int:
+        """Drop expired entries, then the least recently used over max_size"""
+        with self._lock:
+            expired = self._db.execute(
+                "DELETE FROM responses WHERE stored_at < ?",
+                (self._clock() - self.ttl,),
+            ).rowcount
+            size = self._total_size()
+            dropped = 0
+            if size > self.max_size:
+                rows = self._db.execute(
+                    "SELECT key, size FROM responses ORDER BY accessed_at"
+                )
+                stale = []
+                for key, entry_size in rows:
+                    if size <= self.max_size:
+                        break
+                    stale.append((key,))
+                    size -= entry_size
+                self._db.executemany(
+                    "DELETE FROM responses WHERE key = ?", stale
+                )
+                dropped = len(stale)
+            self._size = size
+        if expired or dropped:
+            log.debug(f"cache evicted {expired} expired, {dropped} over size")
+        return expired + dropped
+
+    def size(self) -> int:
+        with self._lock:
+            return self._total_size()
+
+    def _entry_size(self, key: str) -> int:
+        row = self._db.execute(
+            "SELECT size FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _total_size(self) -> int:
+        row = self._db.execute("SELECT SUM(size) FROM responses").fetchone()
+        return row[0] or 0
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            entries, size, expired = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0),"
+                " COALESCE(SUM(stored_at < ?), 0) FROM responses",
+                (self._clock() - self.ttl,),
+            ).fetchone()
+        return dict(
+            path=self.path,
+            entries=entries,
+            size=size,
+            max_size=self.max_size,
+            expired=expired,
+            ttl=self.ttl,
+        )
+
+    def clear(self) -> int:
+        with self._lock:
+            count = self._db.execute("DELETE FROM responses").rowcount
+            self._size = 0
+        self._db.execute("VACUUM")
+        return count
+
+    def close(self):
+        self._db.close()
+
+
+def cache_from_config(cfg) -> Optional[ResponseCache]:
+    """The configured ResponseCache, or None when caching is disabled"""
+    if not as_bool(cfg.cache.enabled):
+        return None
+    return ResponseCache.from_config(cfg)
+
+
+def cache_cli() -> ArgumentParser:
+    cache = ArgumentParser(
+        prog="cache",
+        formatter_class=RawDescriptionHelpFormatter,
+        description=dedent(
+            """\
+                manage the on-disk Canvas response cache
+            """
+        ),
+    )
+    cache.set_defaults(func=_Commands.stats)
+
+    commands = cache.add_subparsers(dest="cache_command", title="commands")
+    stats = commands.add_parser("stats", help="show cache size and location")
+    stats.set_defaults(func=_Commands.stats)
+    clear = commands.add_parser("clear", help="remove every cached response")
+    clear.set_defaults(func=_Commands.clear)
+
+    return cache
+
+
+class _Commands:
+    @staticmethod
+    def stats(args: Namespace):
+        cache = _open_cache(args)
+        for name, value in cache.stats().items():
+            print(f"{name}: {value}")
+        cache.close()
+
+    @staticmethod
+    def clear(args: Namespace):
+        cache = _open_cache(args)
+        print(f"removed {cache.clear()} cached responses from {cache.path}")
+        cache.close()
+
+
+def _open_cache(args: Namespace) -> ResponseCache:
+    cfg = resolved_config(
+        cli_args=args,
+        config_file_name=args.config_file,
+        config_env=args.config_env,
+    )
+    return ResponseCache.from_config(cfg)
@@ -0,0 +1,604 @@
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+    TYPE_CHECKING,
+)
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from copy import copy
+from dataclasses import dataclass, field, fields
+from http.client import HTTPConnection, HTTPSConnection, HTTPException
+from logging import DEBUG, getLogger
+from queue import Empty, Full, LifoQueue
+from urllib.parse import urlencode, urljoin, urlsplit
+
+from .concurrency import AIMD, RATE_LIMIT_REMAINING, AdaptiveLimit
+from .decode import JsonDecoder, decoder, get_decoder
+from .timings import span
+
+
+if TYPE_CHECKING:
+    from ..records import CanvasRecord
+    from .cache import ResponseCache
+    from .loader import DataLoader
+
+
+log = getLogger(__name__)
+
+
+# Canvas list parameters repeat their key, ex: include[]=email&include[]=bio
+Params = Optional[Union[Mapping[str, Any], Sequence[Tuple[str, Any]]]]
+
+# clients of from_config kept open by keep_clients, by configuration
+_kept: Optional[Dict[Tuple, "CanvasClient"]] = None
+_kept_lock = threading.Lock()
+
+
+@dataclass
+class Response:
+    status: int
+    # header names are lower-cased
+    headers: Dict[str, str]
+    body: bytes
+    url: str
+    # served from the response cache after a 304 Not Modified
+    from_cache: bool = False
+    # that of the client, the default one of bat.lib.decode if None
+    decoder: Optional[JsonDecoder] = field(
+        default=None, repr=False, compare=False
+    )
+
+    def json(self) -> Any:
+        with span("parse"):
+            return (self.decoder or decoder()).loads(self.body)
+
+    def records(self, record_type: Type["CanvasRecord"]) -> List[Any]:
+        """Decode a page straight into instances of a bat.records class"""
+        with span("parse"):
+            return (self.decoder or decoder()).records(
+                self.body, record_type
+            )
+
+
+class CanvasAPIError(RuntimeError):
+    def __init__(self, response: Response):
+        self.response = response
+        self.status = response.status
+        super().__init__(
+            f"{response.status} {response.url}: {response.body[:200]!r}"
+        )
+
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections to a single host.
+
+    Connections are handed out most-recently-used first, so a mostly idle
+    pool keeps reusing warm sockets instead of cycling through stale ones.
+    """
+
+    def __init__(self, scheme: str, netloc: str, maxsize: int, timeout: float):
+        self.scheme = scheme
+        self.netloc = netloc
+        self.timeout = timeout
+        self.created = 0
+        self._pool: LifoQueue = LifoQueue(maxsize)
+        self._lock = threading.Lock()
+
+    def get(self) -> Tuple[HTTPConnection, bool]:
+        """Return a connection, and whether it was reused from the pool"""
+        try:
+            return self._pool.get_nowait(), True
+        except Empty:
+            return self.new(), False
+
+    def new(self) -> HTTPConnection:
+        with self._lock:
+            self.created += 1
+        if self.scheme == "https":
+            return HTTPSConnection(self.netloc, timeout=self.timeout)
+        return HTTPConnection(self.netloc, timeout=self.timeout)
+
+    def put(self, conn: HTTPConnection):
+        try:
+            self._pool.put_nowait(conn)
+        except Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except Empty:
+                return
+
+
+class RateLimitBackoff:
+    """Shared pause derived from Canvas's X-Rate-Limit-Remaining header.
+
+    Canvas meters every token with a leaky bucket. Once the remaining quota
+    drops under `floor` all workers wait before their next request, longer
+    the closer the bucket is to empty, giving it time to drain.
+    """
+
+    def __init__(
+        self,
+        floor: float = 100.0,
+        delay: float = 1.0,
+        max_delay: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.floor = floor
+        self.delay = delay
+        self.max_delay = max_delay
+        self.remaining: Optional[float] = None
+        self._clock = clock
+        self._sleep = sleep
+        self._resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if (delay := self.pending()) > 0:
+            self._sleep(delay)
+
+    def pending(self) -> float:
+        """Seconds left of the current pause, ex: to sleep on an event loop"""
+        return self._resume_at - self._clock()
+
+    def update(self, headers: Mapping[str, str]) -> float:
+        """Record the remaining quota, returns the pause it caused"""
+        if (value := headers.get(RATE_LIMIT_REMAINING)) is None:
+            return 0.0
+        self.remaining = remaining = float(value)
+        if remaining >= self.floor or self.floor <= 0:
+            return 0.0
+        delay = self.delay * (1 - max(remaining, 0.0) / self.floor)
+        self._pause(delay)
+        return delay
+
+    def penalize(self, attempt: int) -> float:
+        """Exponential pause after the server rejected a request"""
+        delay = min(self.delay * 2**attempt, self.max_delay)
+        self._pause(delay)
+        return delay
+
+    def _pause(self, delay: float):
+        with self._lock:
+            self._resume_at = max(self._resume_at, self._clock() + delay)
+
+
+def endpoint(url: str) -> str:
+    """The path of a URL without its ids, ex: /api/v1/courses/:id/users"""
+    return "/".join(
+        ":id" if part.isdigit() or ":" in part else part
+        for part in urlsplit(url).path.split("/")
+    )
+
+
+def log_request(
+    method: str,
+    response: Response,
+    elapsed: float,
+    cache: Optional["ResponseCache"] = None,
+    cached: Optional[Any] = None,
+):
+    """Log a request, with its fields for bat.logconf.JsonFormatter.
+
+    `cache` is "hit" for a cached copy revalidated by the server, "miss"
+    for any other GET with a response cache.
+    """
+    if cache is None or method != "GET":
+        hit = None
+    else:
+        hit = "hit" if cached and response.status == 304 else "miss"
+    log.debug(
+        f"{method} {response.url} {response.status} {len(response.body)}B",
+        extra=dict(
+            method=method,
+            endpoint=endpoint(response.url),
+            status=response.status,
+            latency_ms=round(elapsed * 1000, 3),
+            bytes=len(response.body),
+            cache=hit,
+        ),
+    )
+
+
+def adaptive_limit(
+    cfg, maximum: int, limit: Type[AIMD] = AdaptiveLimit
+) -> Optional[Any]:
+    """The `limit` of a client, None unless canvas.adaptive_concurrency.
+
+    It starts at `maximum`, the concurrency of a client without one, and
+    only backs off under rate limit pressure.
+    """
+    from ..conf import as_bool
+
+    canvas = cfg.canvas
+    if not as_bool(canvas.adaptive_concurrency):
+        return None
+    return limit(
+        maximum,
+        minimum=int(canvas.min_concurrency),
+        floor=float(canvas.rate_limit_floor),
+        initial=maximum,
+    )
+
+
+def _client_key(cfg) -> Tuple:
+    from .. import CacheConfig, CanvasConfig
+
+    return tuple(
+        getattr(section, field.name)
+        for section, config_class in (
+            (cfg.canvas, CanvasConfig),
+            (cfg.cache, CacheConfig),
+        )
+        for field in fields(config_class)
+    )
+
+
+@contextmanager
+def keep_clients() -> Iterator[Dict[Tuple, "CanvasClient"]]:
+    """Keep the clients of CanvasClient.from_config open until exiting.
+
+    Commands run within, ex: by bat daemon, get the client already open
+    for the same configuration, with its warm connections, response
+    cache and rate limit, instead of opening one of their own.
+    """
+    global _kept
+    with _kept_lock:
+        _kept = {}
+    try:
+        yield _kept
+    finally:
+        with _kept_lock:
+            clients, _kept = list(_kept.values()), None
+        for client in clients:
+            client.kept = False
+            client.close()
+
+
+def is_rate_limited(response: Response) -> bool:
+    if response.status == 429:
+        return True
+    return response.status == 403 and b"Rate Limit Exceeded" in response.body
+
+
+class CanvasClient:
+    """Thread-safe Canvas REST client.
+
+    At most `concurrency` requests are in flight at once, and each host
+    gets a pool of that many keep-alive connections. With a `limit`, the
+    requests in flight adapt to the rate limit headers of the responses,
+    up to its maximum. GET responses are revalidated against `cache`,
+    when one is given.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        token: str,
+        concurrency: int = 4,
+        timeout: float = 30.0,
+        max_retries: int = 5,
+        backoff: Optional[RateLimitBackoff] = None,
+        cache: Optional["ResponseCache"] = None,
+        lookup_batch_size: int = 100,
+        lookup_cache_size: int = 10_000,
+        limit: Optional[AdaptiveLimit] = None,
+        json_decoder: Optional[JsonDecoder] = None,
+    ):
+        self.base_url = url.rstrip("/")
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff if backoff else RateLimitBackoff()
+        self.limit = limit
+        self.cache = cache
+        self.lookup_batch_size = lookup_batch_size
+        self.lookup_cache_size = lookup_cache_size
+        # per client, clients of different configurations may run at once
+        self.json_decoder = json_decoder or decoder()
+        self._loaders: Dict[Tuple, "DataLoader"] = {}
+        self.headers = {
+            "Authorization": f"Bearer {token}",
+            "Accept": "application/json",
+        }
+        self._slots: Any = limit or threading.BoundedSemaphore(concurrency)
+        self._pools: Dict[Tuple[str, str], ConnectionPool] = {}
+        self._pools_lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # closed by keep_clients rather than by close
+        self.kept = False
+
+    @classmethod
+    def from_config(cls, cfg) -> "CanvasClient":
+        """Build a client from a bat.conf configuration, or reuse the one
+        kept for the same configuration, see keep_clients"""
+        if _kept is None:
+            return cls._from_config(cfg)
+        key = (cls, *_client_key(cfg))
+        with _kept_lock:
+            if (client := _kept.get(key)) is None:
+                client = _kept[key] = cls._from_config(cfg)
+                client.kept = True
+                # made now, for the runs to share rather than each make one
+                client.executor
+        return client.for_run()
+
+    def for_run(self) -> "CanvasClient":
+        """This client for one run of a command, ex: in bat daemon.
+
+        It shares the connections, rate limit and response cache, and
+        memoizes its own lookups: runs at the same time do not see or
+        clear each other's DataLoaders.
+        """
+        run = copy(self)
+        run._loaders = {}
+        return run
+
+    @classmethod
+    def _from_config(cls, cfg) -> "CanvasClient":
+        from .cache import cache_from_config
+
+        canvas = cfg.canvas
+        return cls(
+            url=canvas.url,
+            token=canvas.token,
+            concurrency=int(canvas.concurrency),
+            limit=adaptive_limit(cfg, int(canvas.concurrency)),
+            timeout=float(canvas.timeout),
+            max_retries=int(canvas.max_retries),
+            backoff=RateLimitBackoff(
+                floor=float(canvas.rate_limit_floor),
+                delay=float(canvas.backoff),
+            ),
+            cache=cache_from_config(cfg),
+            lookup_batch_size=int(canvas.lookup_batch_size),
+            lookup_cache_size=int(canvas.lookup_cache_size),
+            json_decoder=get_decoder(canvas.json_decoder),
+        )
+
+    def url(self, path: str, params: Params = None) -> str:
+        if path.startswith(("http://", "https://")):
+            url = path
+        else:
+            url = f"{self.base_url}/{path.lstrip('/')}"
+        if params:
+            sep = "&" if "?" in url else "?"
+            url = f"{url}{sep}{urlencode(params, doseq=True)}"
+        return url
+
+    def same_origin(self, url: str) -> bool:
+        """Whether `url` is on the Canvas host, the only one sent the API
+        token. The same scheme and host, not a host that merely starts
+        alike, ex: canvas.test.evil.net or canvas.test@evil.net"""
+        parts, base = urlsplit(url), urlsplit(self.base_url)
+        return (parts.scheme, parts.netloc) == (base.scheme, base.netloc)
+
+    def request_headers(
+        self, url: str, headers: Optional[Mapping[str, str]] = None
+    ) -> Dict[str, str]:
+        ret = dict(self.headers)
+        if not self.same_origin(url):
+            del ret["Authorization"]
+        ret.update(headers or {})
+        return ret
+
+    def get(self, path: str, params: Params = None) -> Response:
+        return self.request("GET", path, params=params)
+
+    def get_json(self, path: str, params: Params = None) -> Any:
+        return self.get(path, params=params).json()
+
+    def get_many(self, paths: Iterable[str]) -> Iterator[Response]:
+        """GET every path concurrently, yields responses in input order"""
+        return self.executor.map(self.get, paths)
+
+    def loader(
+        self, name: str, include: Sequence[str] = (), **scope: Any
+    ) -> "DataLoader":
+        """The DataLoader of a bat.lib.loader.LOOKUPS listing for this run.
+
+        Lookups by id are batched into the listing's id filter, and
+        memoized for the life of the client, ex:
+
+            users = client.loader("users", course_id=7)
+            names = [u["name"] for u in users.load_many(user_ids)]
+        """
+        from .loader import canvas_loader
+
+        key = (name, tuple(include), tuple(sorted(scope.items())))
+        if (loader := self._loaders.get(key)) is None:
+            loader = self._loaders.setdefault(
+                key,
+                canvas_loader(
+                    self,
+                    name,
+                    include,
+                    max_batch=self.lookup_batch_size,
+                    cache_size=self.lookup_cache_size,
+                    **scope,
+                ),
+            )
+        return loader
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        params: Params = None,
+        body: Optional[bytes] = None,
+        headers: Optional[Mapping[str, str]] = None,
+    ) -> Response:
+        url = self.url(path, params)
+        send_headers = self.request_headers(url, headers)
+
+        cached = None
+        if self.cache is not None and method == "GET":
+            if cached := self.cache.get(url):
+                send_headers.update(cached.validators())
+
+        for attempt in range(self.max_retries + 1):
+            self.backoff.wait()
+            with self._slots, span("http"):
+                start = time.perf_counter()
+                response = self._send(method, url, body, send_headers)
+                elapsed = time.perf_counter() - start
+            self.backoff.update(response.headers)
+            throttled = is_rate_limited(response)
+            if self.limit is not None:
+                self.limit.observe(response.headers, throttled)
+            if not throttled:
+                break
+            delay = self.backoff.penalize(attempt)
+            log.warning(
+                f"rate limited on {method} {url}, retry in {delay:.2f}s"
+            )
+
+        if log.isEnabledFor(DEBUG):
+            log_request(method, response, elapsed, self.cache, cached)
+        if response.status >= 400:
+            raise CanvasAPIError(response)
+        if cached and response.status == 304:
+            response = self.cache.revalidated(cached)
+        elif self.cache is not None and method == "GET":
+            self.cache.put(url, response)
+        response.decoder = self.json_decoder
+        return response
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        body: Optional[bytes],
+        headers: Mapping[str, str],
+    ) -> Response:
+        parts = urlsplit(url)
+        target = f"{parts.path}?{parts.query}" if parts.query else parts.path
+        pool = self.pool(parts.scheme, parts.netloc)
+
+        conn, reused = pool.get()
+        try:
+            conn.request(method, target, body=body, headers=headers)
+            resp = conn.getresponse()
+        except (HTTPException, ConnectionError):
+            conn.close()
+            if not reused:
+                raise
+            # the server dropped an idle keep-alive connection, try once more
+            # on a fresh one
+            log.debug(f"stale connection to {parts.netloc}, reconnecting")
+            conn = pool.new()
+            conn.request(method, target, body=body, headers=headers)
+            resp = conn.getresponse()
+
+        try:
+            data = resp.read()
+        except BaseException:
+            conn.close()
+            raise
+
+        if resp.will_close:
+            conn.close()
+        else:
+            pool.put(conn)
+
+        return Response(
+            status=resp.status,
+            headers={k.lower(): v for k, v in resp.getheaders()},
+            body=data,
+            url=url,
+        )
+
+    def stream(
+        self, path: str, chunk_size: int = 1 << 16, max_redirects: int = 5
+    ) -> Iterator[bytes]:
+        """GET a file in chunks of up to `chunk_size` bytes.
+
+        For downloads too large to hold in memory, ex: account report
+        files. Redirects are followed, Canvas usually sends file downloads
+        to another host, which is never sent the API token.
+        """
+        url = self.url(path)
+        for _ in range(max_redirects + 1):
+            parts = urlsplit(url)
+            target = parts.path + (f"?{parts.query}" if parts.query else "")
+            headers = self.request_headers(url, {"Accept": "*/*"})
+            connection = HTTPSConnection
+            if parts.scheme != "https":
+                connection = HTTPConnection
+            conn = connection(
+                parts.hostname, parts.port, timeout=self.timeout
+            )
+            try:
+                with self._slots:
+                    conn.request("GET", target, headers=headers)
+                    resp = conn.getresponse()
+                if resp.status in (301, 302, 303, 307, 308):
+                    url = urljoin(url, resp.getheader("location", ""))
+                    continue
+                if resp.status >= 400:
+                    head = {k.lower(): v for k, v in resp.getheaders()}
+                    body = resp.read(1024)
+                    raise CanvasAPIError(
+                        Response(resp.status, head, body, url=url)
+                    )
+                while chunk := resp.read(chunk_size):
+                    yield chunk
+                return
+            finally:
+                conn.close()
+        raise RuntimeError(f"too many redirects downloading {path}")
+
+    def pool(self, scheme: str, netloc: str) -> ConnectionPool:
+        key = (scheme, netloc)
+        if (pool := self._pools.get(key)) is None:
+            with self._pools_lock:
+                if (pool := self._pools.get(key)) is None:
+                    pool = self._pools[key] = ConnectionPool(
+                        scheme, netloc, self.concurrency, self.timeout
+                    )
+        return pool
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._pools_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.concurrency,
+                        thread_name_prefix="canvas",
+                    )
+        return self._executor
+
+    def close(self):
+        if self.kept:
+            return
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        for pool in self._pools.values():
+            pool.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    def __enter__(self) -> "CanvasClient":
+        return self
+
+    def __exit__(self, *_):
+        self.close()
@@ -0,0 +1,183 @@
+from typing import Deque, Mapping, Optional
+
+import asyncio
+import threading
+from collections import deque
+from logging import getLogger
+
+from .timings import gauge
+
+
+log = getLogger(__name__)
+
+RATE_LIMIT_REMAINING = "x-rate-limit-remaining"
+REQUEST_COST = "x-request-cost"
+
+# weight of the latest X-Request-Cost in the running estimate
+SMOOTHING = 0.2
+
+
+def _header(headers: Mapping[str, str], name: str) -> Optional[float]:
+    try:
+        return float(headers[name])
+    except (KeyError, ValueError):
+        return None
+
+
+class AIMD:
+    """Requests in flight allowed under Canvas's rate limit.
+
+    Canvas meters each token with a leaky bucket: a request costs its
+    X-Request-Cost, the bucket drains over time, and X-Rate-Limit-Remaining
+    is the quota left. The limit starts at `initial`, `minimum` by default,
+    and while requests queue behind it grows by one per response, doubling
+    every round of `limit` responses, until the first sign of pressure. It
+    then grows by one a round, up to `maximum`.
+
+    Pressure is a quota that would drop under `floor` if every request in
+    flight cost as much as recent ones: the limit is cut to what the
+    quota can take, by half at most. A request refused for its rate halves
+    it. Responses to requests sent before a cut do not cut it again.
+    Not thread-safe, see AdaptiveLimit and AsyncAdaptiveLimit.
+    """
+
+    def __init__(
+        self,
+        maximum: int,
+        minimum: int = 1,
+        floor: float = 100.0,
+        decrease: float = 0.5,
+        initial: Optional[int] = None,
+    ):
+        self.maximum = max(1, maximum)
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.floor = floor
+        self.decrease = decrease
+        start = self.minimum if initial is None else initial
+        self.limit = float(max(self.minimum, min(start, self.maximum)))
+        self.in_flight = 0
+        self.remaining: Optional[float] = None
+        self.cost: Optional[float] = None
+        self.throttled = 0
+        self.cuts = 0
+        self._slow_start = True
+        # requests were held back by the limit since it last grew
+        self._saturated = False
+        # responses to requests sent before the last cut, still to come
+        self._hold = 0
+
+    @property
+    def allowed(self) -> int:
+        return int(self.limit)
+
+    def update(self, headers: Mapping[str, str], throttled: bool = False):
+        """Adjust the limit to the rate limit headers of a response"""
+        if (cost := _header(headers, REQUEST_COST)) is not None:
+            if self.cost is None:
+                self.cost = cost
+            else:
+                self.cost += (cost - self.cost) * SMOOTHING
+        if (remaining := _header(headers, RATE_LIMIT_REMAINING)) is not None:
+            self.remaining = remaining
+            gauge("rate_limit_remaining", remaining)
+        cut_to = None
+        if throttled:
+            self.throttled += 1
+            cut_to = self.limit * self.decrease
+        elif remaining is not None:
+            bound = (remaining - self.floor) / max(self.cost or 1.0, 1e-3)
+            if bound < self.limit:
+                cut_to = max(bound, self.limit * self.decrease)
+
+        before = self.allowed
+        if self._hold > 0:
+            self._hold -= 1
+        elif cut_to is not None:
+            self.limit = max(float(self.minimum), cut_to)
+            self._slow_start = False
+            self._hold = self.in_flight
+            self.cuts += 1
+        elif self._saturated:
+            step = 1.0 if self._slow_start else 1.0 / self.limit
+            self.limit = min(float(self.maximum), self.limit + step)
+            self._saturated = self.in_flight >= self.allowed
+        gauge("concurrency", self.limit)
+        if self.allowed != before:
+            log.debug(
+                f"concurrency {before} -> {self.allowed},"
+                f" rate limit remaining {self.remaining},"
+                f" request cost {self.cost}",
+                extra=dict(
+                    concurrency=self.allowed,
+                    rate_limit_remaining=self.remaining,
+                    request_cost=self.cost,
+                ),
+            )
+
+    def _acquired(self):
+        self.in_flight += 1
+        if self.in_flight >= self.allowed:
+            self._saturated = True
+
+
+class AdaptiveLimit(AIMD):
+    """AIMD bounding the requests of any number of threads, ex: in
+    CanvasClient. Enter for each request, and observe its response."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cond = threading.Condition()
+
+    def __enter__(self) -> "AdaptiveLimit":
+        with self._cond:
+            self._cond.wait_for(lambda: self.in_flight < self.allowed)
+            self._acquired()
+        return self
+
+    def __exit__(self, *_):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def observe(self, headers: Mapping[str, str], throttled: bool = False):
+        with self._cond:
+            self.update(headers, throttled)
+            self._cond.notify_all()
+
+
+class AsyncAdaptiveLimit(AIMD):
+    """AdaptiveLimit for the tasks of an event loop, ex: in
+    AsyncCanvasClient. Use from a single event loop."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def __aenter__(self) -> "AsyncAdaptiveLimit":
+        while self.in_flight >= self.allowed:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # pass on a wake-up it may have been given
+                self._wake()
+                raise
+        self._acquired()
+        return self
+
+    async def __aexit__(self, *_):
+        self.in_flight -= 1
+        self._wake()
+
+    def observe(self, headers: Mapping[str, str], throttled: bool = False):
+        self.update(headers, throttled)
+        self._wake()
+
+    def _wake(self):
+        free = self.allowed - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
@@ -0,0 +1,223 @@
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Type,
+    TYPE_CHECKING,
+)
+
+import json
+import re
+import sys
+
+
+if TYPE_CHECKING:
+    from ..records import CanvasRecord
+
+
+# auto picks the fastest installed of orjson, msgspec, then the stdlib's
+DECODERS = ("auto", "orjson", "msgspec", "json")
+
+_STRING = rb'"[^"\\]*(?:\\.[^"\\]*)*"'
+# the tokens delimiting the elements of a JSON array: whole objects with
+# nothing nested, most Canvas records, complete strings, whose contents
+# are skipped, the quote of a string cut short by the end of a chunk, and
+# brackets and commas
+_TOKENS = re.compile(
+    rb'\{[^][{}"]*(?:' + _STRING + rb'[^][{}"]*)*\}|'
+    + _STRING
+    + rb'|"|[][{},]',
+    re.S,
+)
+_OPEN, _CLOSE, _COMMA, _QUOTE = b"[{", b"]}", ord(","), ord('"')
+# an object up to its first "}", and the comma or bracket after it: when
+# it decodes, nothing was nested within, as a "}" closing a nested object
+# or in a string would leave it incomplete
+_FLAT = re.compile(rb"[ \t\r\n]*(\{[^}]*\})[ \t\r\n]*([,\]])")
+
+
+class JsonDecoder:
+    """Decode Canvas JSON pages, with the stdlib's json module.
+
+    records decodes a page into record classes of bat.records, and
+    iter_array the elements of an array as its bytes arrive.
+    """
+
+    name = "json"
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data)
+
+    def records(
+        self, data: bytes, record_type: Type["CanvasRecord"]
+    ) -> List["CanvasRecord"]:
+        return [record_type.from_json(r) for r in self.loads(data)]
+
+    def iter_array(self, chunks: Iterable[bytes]) -> Iterator[Any]:
+        """The elements of a JSON array read in chunks, as each completes.
+
+        Only the bytes of the elements being read are held, each is
+        decoded from bytes on its own, never the array as a whole.
+        """
+        return decode_array(chunks, self.loads)
+
+
+class OrjsonDecoder(JsonDecoder):
+    """Decodes with orjson, straight from bytes, several times faster"""
+
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+
+        self.loads = orjson.loads  # type: ignore[assignment]
+
+
+class MsgspecDecoder(JsonDecoder):
+    """Decodes with msgspec, records straight into their classes.
+
+    Typed decoding validates the fields it reads, a page with a field of
+    an unexpected type is decoded untyped and converted instead.
+    """
+
+    name = "msgspec"
+
+    def __init__(self):
+        import msgspec
+
+        self._msgspec = msgspec
+        self.loads = msgspec.json.Decoder().decode  # type: ignore
+        self._typed: Dict[type, Callable[[bytes], List[Any]]] = {}
+
+    def records(
+        self, data: bytes, record_type: Type["CanvasRecord"]
+    ) -> List["CanvasRecord"]:
+        if (decode := self._typed.get(record_type)) is None:
+            decode = self._typed[record_type] = self._msgspec.json.Decoder(
+                List[record_type]  # type: ignore[valid-type]
+            ).decode
+        try:
+            records = decode(data)
+        except self._msgspec.ValidationError:
+            return super().records(data, record_type)
+        for name in record_type.interned:
+            for record in records:
+                if isinstance(value := getattr(record, name), str):
+                    setattr(record, name, sys.intern(value))
+        return records
+
+
+_BACKENDS: Dict[str, Type[JsonDecoder]] = {
+    "orjson": OrjsonDecoder,
+    "msgspec": MsgspecDecoder,
+    "json": JsonDecoder,
+}
+
+
+def get_decoder(name: str = "auto") -> JsonDecoder:
+    """The JSON decoder `name`, one of DECODERS"""
+    if name not in DECODERS:
+        raise ValueError(
+            f"unknown JSON decoder {name!r},"
+            f" choose from {', '.join(DECODERS)}"
+        )
+    if name == "auto":
+        for backend in ("orjson", "msgspec"):
+            try:
+                return _BACKENDS[backend]()
+            except ImportError:
+                continue
+        return JsonDecoder()
+    try:
+        return _BACKENDS[name]()
+    except ImportError as err:
+        raise RuntimeError(
+            f"the {name} JSON decoder requires {name}:"
+            f" pip install 'bat-canvas[{name}]'"
+        ) from err
+
+
+_decoder: Optional[JsonDecoder] = None
+
+
+def decoder() -> JsonDecoder:
+    """The decoder of the Canvas clients not given one, see use_decoder"""
+    global _decoder
+    if _decoder is None:
+        _decoder = get_decoder()
+    return _decoder
+
+
+def use_decoder(name: str) -> JsonDecoder:
+    """Decode with `name` the responses of the clients not given a
+    decoder, those of from_config are given canvas.json_decoder's"""
+    global _decoder
+    _decoder = get_decoder(name)
+    return _decoder
+
+
+def decode_array(
+    chunks: Iterable[bytes], loads: Callable[[bytes], Any] = json.loads
+) -> Iterator[Any]:
+    """The elements of a JSON array read in chunks, decoded by `loads`.
+
+    Objects with nothing nested, most Canvas records, are decoded one
+    after the other up to their first "}". Other elements are delimited
+    token by token, then decoded.
+    """
+    buf = bytearray()
+    pos = start = depth = 0
+    tried = -1
+    started = False
+    for chunk in chunks:
+        buf += chunk
+        while True:
+            if depth == 1 and tried != start:
+                tried = start
+                while flat := _FLAT.match(buf, start):
+                    try:
+                        value = loads(buf[flat.start(1) : flat.end(1)])
+                    except ValueError:
+                        # a nested object, or a "}" in a string
+                        break
+                    yield value
+                    start = pos = tried = flat.end()
+                    if flat.group(2) == b"]":
+                        depth = 0
+                        break
+            if (match := _TOKENS.search(buf, pos)) is None:
+                pos = len(buf)
+                break
+            token = match.group()
+            if token[0] == _QUOTE and len(token) == 1:
+                # a string continued in the next chunk
+                break
+            pos = match.end()
+            if not started:
+                if token != b"[":
+                    raise ValueError("not a JSON array")
+                started = True
+                depth, start = 1, pos
+            elif token[0] == _QUOTE or len(token) > 1:
+                # a string, or a whole object
+                continue
+            elif token in _OPEN:
+                depth += 1
+            elif depth == 1 and (token[0] == _COMMA or token == b"]"):
+                if element := bytes(buf[start : match.start()]).strip():
+                    yield loads(element)
+                start = pos
+                depth -= token == b"]"
+            elif token in _CLOSE:
+                depth -= 1
+        # drop the elements already read
+        del buf[:start]
+        pos -= start
+        tried -= start
+        start = 0
+    if not started or depth:
+        raise ValueError("truncated JSON array")
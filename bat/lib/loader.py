@@ -0,0 +1,342 @@
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    TypeVar,
+    TYPE_CHECKING,
+)
+
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from itertools import islice
+
+from .canvas import Params
+
+
+if TYPE_CHECKING:
+    from .aio import AsyncCanvasClient
+    from .canvas import CanvasClient
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class _Memo(Generic[K, V]):
+    """The futures of the most recently used keys, resolved or not"""
+
+    def __init__(
+        self,
+        max_batch: int,
+        cache_size: int,
+        key: Optional[Callable[[Any], K]] = None,
+    ):
+        if max_batch < 1:
+            raise ValueError(f"max_batch must be positive, got {max_batch}")
+        self.key = key
+        self.max_batch = max_batch
+        self.cache_size = cache_size
+        self.batches = 0
+        self.hits = 0
+        self.misses = 0
+        self._cache: "OrderedDict[K, Any]" = OrderedDict()
+
+    def _normalized(self, key: Any) -> K:
+        return key if self.key is None else self.key(key)
+
+    def _cached(self, key: K) -> Optional[Any]:
+        if (future := self._cache.get(key)) is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+        return future
+
+    def _remember(self, key: K, future: Any):
+        self._cache[key] = future
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _forget(self, batch: Mapping[K, Any]):
+        """Drop a failed batch, so it is fetched again when next loaded"""
+        for key, future in batch.items():
+            if self._cache.get(key) is future:
+                del self._cache[key]
+
+    def _extras(self, found: Mapping[K, V], batch: Mapping[K, Any]):
+        """The records fetched along those asked for, ex: a whole listing"""
+        return [
+            (key, value)
+            for key, value in found.items()
+            if key not in batch and key not in self._cache
+        ]
+
+
+class DataLoader(_Memo[K, V]):
+    """Coalesce lookups by key into batched fetches, memoizing results.
+
+    `fetch` receives up to `max_batch` distinct keys and returns the
+    values found by key, the others resolve to None. Values of keys not
+    asked for are kept too. Keys queued with `defer` are fetched together
+    at the next `dispatch`, or as soon as one of them is needed, so a loop
+    of lookups costs a fetch per `max_batch` keys rather than one each.
+
+    A key looked up again shares the first lookup, whether queued, in
+    flight or resolved, for the `cache_size` most recently used keys.
+    Keys are first passed through `key` if given, ex: str for ids. A
+    failed fetch fails its keys, and is retried when they are next
+    loaded. Thread-safe, the lookups of concurrent threads are batched
+    and de-duplicated together.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[List[K]], Mapping[K, V]],
+        max_batch: int = 100,
+        cache_size: int = 10_000,
+        key: Optional[Callable[[Any], K]] = None,
+    ):
+        super().__init__(max_batch, cache_size, key)
+        self.fetch = fetch
+        self._queue: Dict[K, "Future[Optional[V]]"] = {}
+        self._lock = threading.Lock()
+
+    def defer(self, key: Any) -> "Future[Optional[V]]":
+        """Queue a lookup, the future resolves once dispatched"""
+        key = self._normalized(key)
+        with self._lock:
+            if (future := self._cached(key)) is not None:
+                return future
+            self.misses += 1
+            future = self._queue[key] = Future()
+            self._remember(key, future)
+            if len(self._queue) < self.max_batch:
+                return future
+        self.dispatch()
+        return future
+
+    def load(self, key: Any) -> Optional[V]:
+        return self.load_many([key])[0]
+
+    def load_many(self, keys: Iterable[Any]) -> List[Optional[V]]:
+        futures = [self.defer(key) for key in keys]
+        if not all(future.done() for future in futures):
+            self.dispatch()
+        return [future.result() for future in futures]
+
+    def dispatch(self):
+        """Fetch every queued key, `max_batch` at a time"""
+        while True:
+            with self._lock:
+                if not self._queue:
+                    return
+                keys = list(islice(self._queue, self.max_batch))
+                batch = {key: self._queue.pop(key) for key in keys}
+                self.batches += 1
+            try:
+                found = self.fetch(keys)
+            except Exception as err:
+                with self._lock:
+                    self._forget(batch)
+                for future in batch.values():
+                    future.set_exception(err)
+                continue
+            with self._lock:
+                for key, value in self._extras(found, batch):
+                    self._remember(key, _resolved(value))
+            for key, future in batch.items():
+                future.set_result(found.get(key))
+
+    def prime(self, key: Any, value: V):
+        with self._lock:
+            self._remember(self._normalized(key), _resolved(value))
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+def _resolved(value: Any) -> Future:
+    future: Future = Future()
+    future.set_result(value)
+    return future
+
+
+class AsyncDataLoader(_Memo[K, V]):
+    """DataLoader over a coroutine `fetch`, for asyncio tasks.
+
+    The keys loaded during one iteration of the event loop, by any number
+    of tasks, are fetched together once it ends, in batches fetched
+    concurrently. Use from a single event loop.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[List[K]], Awaitable[Mapping[K, V]]],
+        max_batch: int = 100,
+        cache_size: int = 10_000,
+        key: Optional[Callable[[Any], K]] = None,
+    ):
+        super().__init__(max_batch, cache_size, key)
+        self.fetch = fetch
+        self._queue: Dict[K, "asyncio.Future[Optional[V]]"] = {}
+        self._scheduled = False
+        self._tasks: Set[asyncio.Task] = set()
+
+    def load(self, key: Any) -> "asyncio.Future[Optional[V]]":
+        key = self._normalized(key)
+        if (future := self._cached(key)) is not None:
+            return future
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        future = self._queue[key] = loop.create_future()
+        self._remember(key, future)
+        if not self._scheduled:
+            self._scheduled = True
+            loop.call_soon(self._dispatch)
+        return future
+
+    def load_many(self, keys: Iterable[Any]) -> "asyncio.Future[List]":
+        """Load every key in this iteration, await the list of values"""
+        return asyncio.gather(*(self.load(key) for key in keys))
+
+    def _dispatch(self):
+        self._scheduled = False
+        queue, self._queue = self._queue, {}
+        keys = iter(queue)
+        while batch := {k: queue[k] for k in islice(keys, self.max_batch)}:
+            self.batches += 1
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: Dict[K, "asyncio.Future[Optional[V]]"]):
+        try:
+            found = await self.fetch(list(batch))
+        except Exception as err:
+            self._forget(batch)
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(err)
+            return
+        loop = asyncio.get_running_loop()
+        for key, value in self._extras(found, batch):
+            future = loop.create_future()
+            future.set_result(value)
+            self._remember(key, future)
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(found.get(key))
+
+    def prime(self, key: Any, value: V):
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(value)
+        self._remember(self._normalized(key), future)
+
+    def clear(self):
+        self._cache.clear()
+
+
+@dataclass(frozen=True)
+class Lookup:
+    """A Canvas listing that returns the records of a scope by id.
+
+    `path` is formatted with the scope, ex: course_id. The ids looked up
+    are sent as repeated `ids_param`, ex: user_ids[]. Listings without
+    an id filter are fetched whole, once, and serve every id in them.
+    """
+
+    path: str
+    ids_param: Optional[str] = None
+    params: Tuple[Tuple[str, str], ...] = ()
+    key: str = "id"
+
+    def query(
+        self, ids: Sequence[str], include: Sequence[str] = ()
+    ) -> List[Tuple[str, Any]]:
+        params = [*self.params, *(("include[]", i) for i in include)]
+        if self.ids_param:
+            params += [(self.ids_param, i) for i in ids]
+        return params
+
+    def keyed(self, records: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        return {str(record[self.key]): record for record in records}
+
+
+LOOKUPS: Dict[str, Lookup] = {
+    "users": Lookup(
+        "/api/v1/courses/{course_id}/users",
+        ids_param="user_ids[]",
+        params=(("enrollment_state[]", "active"),),
+    ),
+    "assignments": Lookup(
+        "/api/v1/courses/{course_id}/assignments",
+        ids_param="assignment_ids[]",
+    ),
+    "sections": Lookup("/api/v1/courses/{course_id}/sections"),
+}
+
+
+def lookup(name: str) -> Lookup:
+    if name not in LOOKUPS:
+        raise ValueError(
+            f"unknown lookup {name!r}, choose from {', '.join(LOOKUPS)}"
+        )
+    return LOOKUPS[name]
+
+
+def canvas_loader(
+    client: "CanvasClient",
+    name: str,
+    include: Sequence[str] = (),
+    max_batch: int = 100,
+    cache_size: int = 10_000,
+    **scope: Any,
+) -> DataLoader[str, Dict[str, Any]]:
+    """A DataLoader of the records of a LOOKUPS listing, by id"""
+    from .paginate import paginate
+
+    spec = lookup(name)
+    path = spec.path.format(**scope)
+
+    def fetch(ids: List[str]) -> Dict[str, Any]:
+        params: Params = spec.query(ids, include)
+        return spec.keyed(paginate(client, path, params))
+
+    return DataLoader(
+        fetch, max_batch=max_batch, cache_size=cache_size, key=str
+    )
+
+
+def async_canvas_loader(
+    client: "AsyncCanvasClient",
+    name: str,
+    include: Sequence[str] = (),
+    max_batch: int = 100,
+    cache_size: int = 10_000,
+    **scope: Any,
+) -> AsyncDataLoader[str, Dict[str, Any]]:
+    """canvas_loader, over an AsyncCanvasClient"""
+    from .aio import apaginate
+
+    spec = lookup(name)
+    path = spec.path.format(**scope)
+
+    async def fetch(ids: List[str]) -> Dict[str, Any]:
+        params: Params = spec.query(ids, include)
+        return spec.keyed([r async for r in apaginate(client, path, params)])
+
+    return AsyncDataLoader(
+        fetch, max_batch=max_batch, cache_size=cache_size, key=str
+    )
@@ -0,0 +1,244 @@
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    TYPE_CHECKING,
+)
+
+import asyncio
+import json
+import re
+import sys
+from argparse import (
+    ArgumentParser,
+    ArgumentTypeError,
+    Namespace,
+    RawDescriptionHelpFormatter,
+)
+from concurrent.futures import Future, ThreadPoolExecutor
+from logging import getLogger
+from textwrap import dedent
+
+from ..conf import resolved_config
+from .canvas import CanvasClient, Params, Response
+
+
+if TYPE_CHECKING:
+    from ..records import CanvasRecord
+
+
+log = getLogger(__name__)
+
+_LINK = re.compile(r'<([^>]*)>\s*;\s*rel="?([^",;]+)"?')
+
+
+def parse_link_header(value: Optional[str]) -> Dict[str, str]:
+    """Map each rel of a Link header to its url"""
+    if not value:
+        return {}
+    return {rel: url for url, rel in _LINK.findall(value)}
+
+
+def next_url(response: Response) -> Optional[str]:
+    return parse_link_header(response.headers.get("link")).get("next")
+
+
+class Paginator:
+    """Stream the records of a Canvas collection one page at a time.
+
+    Pages are followed through their `Link: rel=next` header. While the
+    caller consumes a page, the next one is already being fetched, so at
+    most two pages are held in memory however large the collection is.
+    Iterate with `for` or `async for`. Records are dicts, or instances of
+    `record_type`, a bat.records class, decoded straight from the page
+    when the decoder supports it. `start` is a page to start from rather
+    than the first, ex: a next link saved by an interrupted run.
+    """
+
+    def __init__(
+        self,
+        client: CanvasClient,
+        path: str,
+        params: Params = None,
+        per_page: int = 100,
+        key: Optional[str] = None,
+        record_type: Optional[Type["CanvasRecord"]] = None,
+        start: Optional[str] = None,
+    ):
+        self.client = client
+        self.key = key
+        self.record_type = record_type
+        if hasattr(params, "items"):
+            query = list(params.items())
+        else:
+            query = list(params or [])
+        if not any(name == "per_page" for name, _ in query):
+            query.append(("per_page", per_page))
+        self.url = start or client.url(path, query)
+
+    def pages(self) -> Iterator[Response]:
+        # a private worker, so paging from inside the client's own executor
+        # can never deadlock waiting on itself
+        prefetch = ThreadPoolExecutor(1, thread_name_prefix="paginate")
+        try:
+            pending: Optional[Future] = prefetch.submit(
+                self.client.get, self.url
+            )
+            while pending is not None:
+                response = pending.result()
+                if url := next_url(response):
+                    pending = prefetch.submit(self.client.get, url)
+                else:
+                    pending = None
+                yield response
+        finally:
+            prefetch.shutdown(wait=False, cancel_futures=True)
+
+    def records(self, response: Response) -> List[Any]:
+        if self.record_type is not None and not self.key:
+            return response.records(self.record_type)
+        data = response.json()
+        records = data[self.key] if self.key else data
+        if self.record_type is not None:
+            return [self.record_type.from_json(r) for r in records]
+        return records
+
+    def __iter__(self) -> Iterator[Any]:
+        for response in self.pages():
+            yield from self.records(response)
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        loop = asyncio.get_running_loop()
+        pending: Optional[asyncio.Future] = loop.run_in_executor(
+            None, self.client.get, self.url
+        )
+        while pending is not None:
+            response = await pending
+            if url := next_url(response):
+                pending = loop.run_in_executor(None, self.client.get, url)
+            else:
+                pending = None
+            for record in self.records(response):
+                yield record
+
+
+def paginate(
+    client: CanvasClient,
+    path: str,
+    params: Params = None,
+    per_page: int = 100,
+    key: Optional[str] = None,
+    record_type: Optional[Type["CanvasRecord"]] = None,
+) -> Paginator:
+    return Paginator(
+        client,
+        path,
+        params=params,
+        per_page=per_page,
+        key=key,
+        record_type=record_type,
+    )
+
+
+def stream_array(
+    client: CanvasClient, path: str, params: Params = None
+) -> Iterator[Any]:
+    """The records of a JSON array response, decoded as its bytes arrive.
+
+    For listings too large for a page, ex: with a large per_page, held
+    one record at a time rather than as a whole body. Link headers are
+    not followed.
+    """
+    stream = client.stream(client.url(path, params))
+    return client.json_decoder.iter_array(stream)
+
+
+def export_cli() -> ArgumentParser:
+    export = ArgumentParser(
+        prog="export",
+        formatter_class=RawDescriptionHelpFormatter,
+        description=dedent(
+            """\
+                stream every record of a Canvas collection to stdout
+                as JSON lines, ex:
+                    bat export /api/v1/accounts/1/courses -p state[]=available
+            """
+        ),
+    )
+    export.add_argument(
+        "path", help="API path of the collection, ex: /api/v1/courses"
+    )
+    export.add_argument(
+        "-p",
+        "--param",
+        dest="params",
+        action="append",
+        type=query_param,
+        default=[],
+        metavar="KEY=VALUE",
+        help="query parameter, may be repeated",
+    )
+    export.add_argument(
+        "--per-page",
+        dest="per_page",
+        type=int,
+        default=100,
+        help="records requested per page. default=100",
+    )
+    export.add_argument(
+        "--key",
+        default=None,
+        help="read records from this key of each page,"
+        " for endpoints that wrap their list in an object",
+    )
+    export.set_defaults(func=_Commands.export)
+
+    return export
+
+
+def query_param(value: str) -> Tuple[str, str]:
+    """Parse a KEY=VALUE argument"""
+    key, sep, param = value.partition("=")
+    if not key or not sep:
+        raise ArgumentTypeError(f"expected KEY=VALUE, got {value!r}")
+    return key, param
+
+
+class _Commands:
+    @staticmethod
+    async def export(args: Namespace):
+        from .aio import AsyncCanvasClient, apaginate
+
+        cfg = resolved_config(
+            cli_args=args,
+            config_file_name=args.config_file,
+            config_env=args.config_env,
+        )
+        async with AsyncCanvasClient.from_config(cfg) as client:
+            pages = apaginate(
+                client,
+                args.path,
+                params=args.params,
+                per_page=args.per_page,
+                key=args.key,
+            )
+            await write_json_lines_async(pages, sys.stdout)
+
+
+async def write_json_lines_async(records, out) -> int:
+    count = 0
+    try:
+        async for record in records:
+            count += 1
+            out.write(json.dumps(record))
+            out.write("\n")
+        out.flush()
+    except BrokenPipeError:
+        # the reader went away, ex: `bat export ... | head`
+        log.debug("export: stdout closed")
+    return count
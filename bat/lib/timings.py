@@ -0,0 +1,186 @@
+from typing import Any, Callable, Dict, List, Optional, TextIO
+
+import sys
+import threading
+import time
+from contextvars import ContextVar
+
+from . import PROFILERS
+
+
+class Timings:
+    """Time spent per stage, accumulated by the spans of every thread.
+
+    A span's `self` time excludes the spans nested in it, in the same
+    thread or asyncio task. Spans in other threads run alongside their
+    caller's, their totals may add up to more than the wall time. Gauges
+    are values sampled along the way, ex: the requests allowed in flight.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        # stage: [calls, total, self]
+        self.stages: Dict[str, List[float]] = {}
+        # gauge: [samples, last, min, max]
+        self.gauges: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, total: float, own: float):
+        with self._lock:
+            if (stage := self.stages.get(name)) is None:
+                stage = self.stages[name] = [0, 0.0, 0.0]
+            stage[0] += 1
+            stage[1] += total
+            stage[2] += own
+
+    def sample(self, name: str, value: float):
+        with self._lock:
+            if (stats := self.gauges.get(name)) is None:
+                self.gauges[name] = [1, value, value, value]
+                return
+            stats[0] += 1
+            stats[1] = value
+            stats[2] = min(stats[2], value)
+            stats[3] = max(stats[3], value)
+
+    def report(self) -> str:
+        wall = time.perf_counter() - self.start
+        lines = [f"{'stage':<12} {'calls':>8} {'total s':>10} {'self s':>10}"]
+        for name, (calls, total, own) in sorted(
+            self.stages.items(), key=lambda item: -item[1][2]
+        ):
+            lines.append(f"{name:<12} {calls:>8} {total:>10.3f} {own:>10.3f}")
+        lines.append(f"{'wall':<12} {'':>8} {wall:>10.3f}")
+        if self.gauges:
+            lines.append(
+                f"\n{'gauge':<20} {'samples':>8}"
+                f" {'last':>8} {'min':>8} {'max':>8}"
+            )
+            for name, (samples, last, low, high) in sorted(
+                self.gauges.items()
+            ):
+                lines.append(
+                    f"{name:<20} {samples:>8}"
+                    f" {last:>8.1f} {low:>8.1f} {high:>8.1f}"
+                )
+        return "\n".join(lines)
+
+
+class Span:
+    """Time a stage, see span"""
+
+    __slots__ = ("timings", "name", "parent", "children", "_start", "_token")
+
+    def __init__(self, timings: Timings, name: str):
+        self.timings = timings
+        self.name = name
+        self.children = 0.0
+
+    def __enter__(self) -> "Span":
+        self.parent = _current.get()
+        self._token = _current.set(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        elapsed = time.perf_counter() - self._start
+        _current.reset(self._token)
+        if self.parent is not None:
+            self.parent.children += elapsed
+        self.timings.add(self.name, elapsed, elapsed - self.children)
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+_timings: Optional[Timings] = None
+_current: ContextVar[Optional[Span]] = ContextVar("span", default=None)
+
+
+def span(name: str):
+    """Time the block within as stage `name`, ex: "http" or "write".
+
+    A shared no-op unless start_timings was called, cheap enough for the
+    hottest paths.
+    """
+    if _timings is None:
+        return _NO_SPAN
+    return Span(_timings, name)
+
+
+def gauge(name: str, value: float):
+    """Sample gauge `name`, a no-op unless start_timings was called"""
+    if _timings is not None:
+        _timings.sample(name, value)
+
+
+def start_timings() -> Timings:
+    global _timings
+    _timings = Timings()
+    return _timings
+
+
+def stop_timings(out: Optional[TextIO] = None) -> Optional[Timings]:
+    """Stop timing, and print the breakdown to `out`, stderr by default"""
+    global _timings
+    timings, _timings = _timings, None
+    if timings is not None:
+        print(timings.report(), file=out or sys.stderr)
+    return timings
+
+
+def profiled(
+    call: Callable[[], Any], path: str, profiler: str = "cprofile"
+) -> Any:
+    """Return call(), profiled, the profile is saved to `path` either way.
+
+    "cprofile" writes pstats, for python -m pstats, snakeviz or flameprof.
+    "sampling" samples the stack with pyinstrument, at a lower overhead,
+    and writes speedscope JSON, a flamegraph at https://speedscope.app.
+    Both profile the calling thread, and the asyncio tasks it runs.
+    """
+    if profiler not in PROFILERS:
+        raise ValueError(
+            f"unknown profiler {profiler!r},"
+            f" choose from {', '.join(PROFILERS)}"
+        )
+    if profiler == "sampling":
+        return _sampled(call, path)
+
+    import cProfile
+
+    prof = cProfile.Profile()
+    try:
+        return prof.runcall(call)
+    finally:
+        prof.dump_stats(path)
+        print(f"profile written to {path}", file=sys.stderr)
+
+
+def _sampled(call: Callable[[], Any], path: str) -> Any:
+    try:
+        from pyinstrument import Profiler
+        from pyinstrument.renderers import SpeedscopeRenderer
+    except ImportError as err:
+        raise RuntimeError(
+            "the sampling profiler requires pyinstrument:"
+            " pip install 'bat-canvas[profile]'"
+        ) from err
+
+    prof = Profiler(interval=0.001, async_mode="enabled")
+    prof.start()
+    try:
+        return call()
+    finally:
+        prof.stop()
+        with open(path, "w") as f:
+            f.write(prof.output(renderer=SpeedscopeRenderer()))
+        print(f"profile written to {path}", file=sys.stderr)
@@ -1,13 +1,70 @@
-from logging import getLogger, DEBUG, StreamHandler, Formatter
-from logging.config import dictConfig
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    TYPE_CHECKING,
+)
+
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging import (
+    getLogger,
+    DEBUG,
+    WARNING,
+    Filter,
+    Handler,
+    LogRecord,
+    StreamHandler,
+    Formatter,
+)
+
+
+if TYPE_CHECKING:
+    from logging.handlers import QueueListener
 
 
 log = getLogger(__name__)
 
+
+def dictConfig(config: dict):
+    """logging.config.dictConfig, which is slow to import, on first use"""
+    from logging.config import dictConfig
+
+    dictConfig(config)
+
+
 default_format = "%(asctime)s %(name)-12s %(levelname)-8s %(message)s"
 thread_format = "%(asctime)s %(threadName)-12s %(levelname)-8s %(message)s"
 default_formatter = Formatter(default_format)
 
+# a log_format, for one JSON object per record, see JsonFormatter
+JSON_FORMAT = "json"
+
+# fields a record may carry, given by log_context, or the `extra` of a call
+CONTEXT_FIELDS = (
+    "command",
+    "environment",
+    "job",
+    "course_id",
+    "method",
+    "endpoint",
+    "status",
+    "latency_ms",
+    "bytes",
+    "cache",
+    "concurrency",
+    "rate_limit_remaining",
+    "request_cost",
+)
+
 
 logging_config = dict(
     version=1,
@@ -61,9 +118,31 @@ _module_logger = dict(
 )
 
 
-def set_default_logging(log_level: str = "INFO"):
-    set_module_logger(log_level=log_level)
-    add_console_handler(log_level=log_level)
+def set_default_logging(
+    log_level: str = "INFO",
+    queue: bool = False,
+    log_file: Optional[str] = None,
+    limits: Optional[Mapping[str, float]] = None,
+    samples: Optional[Mapping[str, float]] = None,
+    log_format: Optional[str] = None,
+):
+    """Log to the console, see set_queue_logging for the queue options.
+
+    Any of `log_file`, `limits` or `samples` implies `queue`.
+    `log_format` JSON_FORMAT logs JSON lines, see JsonFormatter.
+    """
+    fmt = {} if log_format is None else {"log_format": log_format}
+    set_module_logger(log_level=log_level, **fmt)
+    if queue or log_file or limits or samples:
+        set_queue_logging(
+            log_level=log_level,
+            log_file=log_file,
+            limits=limits,
+            samples=samples,
+            **fmt,
+        )
+    else:
+        add_console_handler(log_level=log_level, **fmt)
     log.info(f"set default logging level={log_level}")
 
 
@@ -85,10 +164,14 @@ def log_conf_factory(
     log_format: str = default_format,
     thread_handler_format: str = thread_format,
 ):
+    if log_format == JSON_FORMAT:
+        f: Dict[str, Any] = {"()": f"{__name__}.JsonFormatter"}
+    else:
+        f = {"format": log_format}
     return dict(
         version=1,
         formatters={
-            "f": {"format": log_format},
+            "f": f,
             "thread_formatter": {"format": thread_handler_format},
         },
         root={"handlers": [], "level": log_level},
@@ -111,7 +194,251 @@ def add_console_handler(
     # create a console handler
     console_handler = StreamHandler()
     console_handler.setLevel(log_level)
-    console_handler.setFormatter(Formatter(log_format))
+    console_handler.setFormatter(formatter(log_format))
+    console_handler.addFilter(ContextFilter())
 
     root_logger.addHandler(console_handler)
     log.info("added console logger")
+
+
+def formatter(log_format: str = default_format) -> Formatter:
+    if log_format == JSON_FORMAT:
+        return JsonFormatter()
+    return Formatter(log_format)
+
+
+_context: ContextVar[Mapping[str, Any]] = ContextVar("log_context", default={})
+
+
+@contextmanager
+def log_context(**fields) -> Iterator[None]:
+    """Set CONTEXT_FIELDS on the records logged within, ex: the course id.
+
+    Contexts nest, and follow asyncio tasks, but not new threads.
+    """
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class ContextFilter(Filter):
+    """Copy the fields of the current log_context to each record"""
+
+    def filter(self, record: LogRecord) -> bool:
+        fields = record.__dict__
+        for name, value in _context.get().items():
+            fields.setdefault(name, value)
+        return True
+
+
+class JsonFormatter(Formatter):
+    """One JSON object per record, with any CONTEXT_FIELDS it carries.
+
+    Fields are kept as record attributes until the record is written,
+    serialized by the handler, so by the listener thread when logging
+    through a queue.
+    """
+
+    def __init__(self, fields: Sequence[str] = CONTEXT_FIELDS):
+        import json
+
+        super().__init__()
+        self.fields = tuple(fields)
+        self._dumps = json.JSONEncoder(
+            default=str, separators=(",", ":")
+        ).encode
+
+    def format(self, record: LogRecord) -> str:
+        entry = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        fields = record.__dict__
+        for name in self.fields:
+            if (value := fields.get(name)) is not None:
+                entry[name] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return self._dumps(entry)
+
+
+class RateLimitFilter(Filter):
+    """Drop records of chatty loggers past `limits` records per second.
+
+    `limits` maps logger names to their rate, shared with their children,
+    ex: {"bat.lib.canvas": 50} for per-request logs. Each logger may
+    burst up to one second's worth of records. Warnings and errors are
+    never dropped.
+    """
+
+    def __init__(
+        self,
+        limits: Mapping[str, float],
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        super().__init__()
+        self.limits = dict(limits)
+        self.dropped: Dict[str, int] = {}
+        self._clock = clock
+        self._names: Dict[str, Optional[str]] = {}
+        # logger: (tokens, last refill)
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: LogRecord) -> bool:
+        if record.levelno >= WARNING:
+            return True
+        if (name := _limited(record.name, self.limits, self._names)) is None:
+            return True
+        rate = self.limits[name]
+        with self._lock:
+            now = self._clock()
+            tokens, last = self._buckets.get(name, (rate, now))
+            tokens = min(rate, tokens + (now - last) * rate)
+            if tokens < 1:
+                self._buckets[name] = (tokens, now)
+                self.dropped[name] = self.dropped.get(name, 0) + 1
+                return False
+            self._buckets[name] = (tokens - 1, now)
+        return True
+
+
+class SampleFilter(Filter):
+    """Keep a random fraction of the records of chatty loggers.
+
+    `samples` maps logger names to the fraction of their records, and
+    their children's, kept. Warnings and errors are always kept.
+    """
+
+    def __init__(
+        self,
+        samples: Mapping[str, float],
+        rand: Optional[Callable[[], float]] = None,
+    ):
+        super().__init__()
+        self.samples = dict(samples)
+        self.dropped: Dict[str, int] = {}
+        if rand is None:
+            import random
+
+            rand = random.random
+        self._rand = rand
+        self._names: Dict[str, Optional[str]] = {}
+
+    def filter(self, record: LogRecord) -> bool:
+        if record.levelno >= WARNING:
+            return True
+        if (name := _limited(record.name, self.samples, self._names)) is None:
+            return True
+        if self._rand() < self.samples[name]:
+            return True
+        self.dropped[name] = self.dropped.get(name, 0) + 1
+        return False
+
+
+def _limited(
+    name: str,
+    limited: Mapping[str, float],
+    cache: Dict[str, Optional[str]],
+) -> Optional[str]:
+    """The closest logger in `limited` that `name` is, or is a child of"""
+    try:
+        return cache[name]
+    except KeyError:
+        pass
+    ret, parent = None, name
+    while parent:
+        if parent in limited:
+            ret = parent
+            break
+        parent = parent.rpartition(".")[0]
+    cache[name] = ret
+    return ret
+
+
+_listener: Optional["QueueListener"] = None
+_queue_handler: Optional[Handler] = None
+
+
+def set_queue_logging(
+    log_level: str = "INFO",
+    log_format: str = default_format,
+    log_file: Optional[str] = None,
+    max_bytes: int = 10 << 20,
+    backup_count: int = 5,
+    limits: Optional[Mapping[str, float]] = None,
+    samples: Optional[Mapping[str, float]] = None,
+) -> "QueueListener":
+    """Log through a queue, written to the console by a background thread.
+
+    Logging calls only format the message and put the record on a queue,
+    so threads logging every request no longer wait on each other's
+    writes to stderr. With `log_file`, records are also written to a file
+    rotated every `max_bytes`, keeping `backup_count` old files.
+    `limits` and `samples` configure a RateLimitFilter and SampleFilter,
+    applied before records are queued.
+
+    Call stop_queue_logging to flush the queue, it is also called at exit.
+    """
+    from logging.handlers import (
+        QueueHandler,
+        QueueListener,
+        RotatingFileHandler,
+    )
+    from queue import SimpleQueue
+
+    global _listener, _queue_handler
+    stop_queue_logging()
+    # once, however many times logging is set up
+    atexit.unregister(stop_queue_logging)
+    atexit.register(stop_queue_logging)
+
+    handlers = [StreamHandler()]
+    if log_file:
+        handlers.append(
+            RotatingFileHandler(
+                log_file, maxBytes=max_bytes, backupCount=backup_count
+            )
+        )
+    for handler in handlers:
+        handler.setLevel(log_level)
+        handler.setFormatter(formatter(log_format))
+
+    queue: SimpleQueue = SimpleQueue()
+    queue_handler = QueueHandler(queue)
+    queue_handler.setLevel(log_level)
+    if limits:
+        queue_handler.addFilter(RateLimitFilter(limits))
+    if samples:
+        queue_handler.addFilter(SampleFilter(samples))
+    # after the limits, no need to copy the context of records dropped
+    queue_handler.addFilter(ContextFilter())
+
+    listener = QueueListener(queue, *handlers, respect_handler_level=True)
+    listener.start()
+    getLogger().addHandler(queue_handler)
+    _listener, _queue_handler = listener, queue_handler
+    log.info(f"logging through a queue, {log_file=}")
+    return listener
+
+
+def stop_queue_logging():
+    """Write out the records queued, then stop the queue listener"""
+    global _listener, _queue_handler
+    if _listener is None or _queue_handler is None:
+        return
+    for filter in _queue_handler.filters:
+        for name, count in getattr(filter, "dropped", {}).items():
+            log.warning(f"dropped {count} records from {name}")
+
+    listener, queue_handler = _listener, _queue_handler
+    _listener = _queue_handler = None
+    getLogger().removeHandler(queue_handler)
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
@@ -0,0 +1,155 @@
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+import json
+from argparse import ArgumentParser, Namespace, RawDescriptionHelpFormatter
+from dataclasses import dataclass, field
+from textwrap import dedent
+
+
+Record = Dict[str, Any]
+
+PERCENTILES = (50, 90, 99)
+
+
+@dataclass
+class EndpointStats:
+    """The requests logged to one endpoint"""
+
+    method: str
+    endpoint: str
+    latencies: List[float] = field(default_factory=list)
+    errors: int = 0
+    bytes: int = 0
+    hits: int = 0
+    cached: int = 0
+
+    def add(self, entry: Record):
+        self.latencies.append(float(entry["latency_ms"]))
+        if int(entry.get("status") or 0) >= 400:
+            self.errors += 1
+        self.bytes += int(entry.get("bytes") or 0)
+        if cache := entry.get("cache"):
+            self.cached += 1
+            self.hits += cache == "hit"
+
+    def row(self, percentiles: Sequence[float] = PERCENTILES) -> Record:
+        latencies = sorted(self.latencies)
+        total = sum(latencies)
+        ret: Record = dict(
+            method=self.method,
+            endpoint=self.endpoint,
+            count=len(latencies),
+            errors=self.errors,
+            total_ms=round(total, 3),
+            mean_ms=round(total / len(latencies), 3),
+        )
+        for p in percentiles:
+            ret[f"p{p:g}_ms"] = round(percentile(latencies, p), 3)
+        ret["max_ms"] = latencies[-1]
+        ret["bytes"] = self.bytes
+        ret["cache_hit_rate"] = (
+            round(self.hits / self.cached, 3) if self.cached else None
+        )
+        return ret
+
+
+def percentile(ordered: Sequence[float], p: float) -> float:
+    """Linear interpolation between the closest ranks, like np.percentile"""
+    position = (len(ordered) - 1) * p / 100.0
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def entries(lines: Iterable[str]) -> Iterator[Record]:
+    """The request records of JSON log lines, others are skipped"""
+    for line in lines:
+        if not line.startswith("{"):
+            continue
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if entry.get("latency_ms") is not None and entry.get("endpoint"):
+            yield entry
+
+
+def summarize(lines: Iterable[str]) -> List[Record]:
+    """Latency percentiles per endpoint, the most total time first"""
+    stats: Dict[Tuple[str, str], EndpointStats] = {}
+    for entry in entries(lines):
+        key = (entry.get("method") or "GET", entry["endpoint"])
+        if (endpoint := stats.get(key)) is None:
+            endpoint = stats[key] = EndpointStats(*key)
+        endpoint.add(entry)
+    rows = [endpoint.row() for endpoint in stats.values()]
+    return sorted(rows, key=lambda row: -row["total_ms"])
+
+
+def logs_cli() -> ArgumentParser:
+    logs = ArgumentParser(
+        prog="logs",
+        formatter_class=RawDescriptionHelpFormatter,
+        description=dedent(
+            """\
+                analyze log files written with bat --log-json --debug
+            """
+        ),
+    )
+    logs.set_defaults(func=lambda _: logs.print_help())
+
+    commands = logs.add_subparsers(dest="logs_command", title="commands")
+    summary = commands.add_parser(
+        "summarize", help="request latency percentiles per Canvas endpoint"
+    )
+    summary.add_argument("files", nargs="+", help="JSON log files")
+    summary.add_argument(
+        "-n",
+        "--top",
+        type=int,
+        default=None,
+        help="only the endpoints with the most total request time",
+    )
+    summary.add_argument(
+        "--json",
+        action="store_true",
+        help="print a JSON object per endpoint rather than a table",
+    )
+    summary.set_defaults(func=_Commands.summarize)
+
+    return logs
+
+
+class _Commands:
+    @staticmethod
+    def summarize(args: Namespace):
+        rows = summarize(_lines(args.files))[: args.top]
+        if args.json:
+            for row in rows:
+                print(json.dumps(row))
+            return
+        print(table(rows))
+
+
+def _lines(paths: Sequence[str]) -> Iterator[str]:
+    for path in paths:
+        with open(path) as f:
+            yield from f
+
+
+def table(rows: Sequence[Record]) -> str:
+    if not rows:
+        return "no requests logged"
+    columns = list(rows[0])
+    cells = [columns] + [
+        ["-" if row[c] is None else str(row[c]) for c in columns]
+        for row in rows
+    ]
+    widths = [max(len(line[i]) for line in cells) for i in range(len(columns))]
+    return "\n".join(
+        "  ".join(
+            cell.ljust(width) if i < 2 else cell.rjust(width)
+            for i, (cell, width) in enumerate(zip(line, widths))
+        ).rstrip()
+        for line in cells
+    )
@@ -0,0 +1,232 @@
+from typing import (
+    Any,
+    ClassVar,
+    Dict,
+    Generic,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
+
+import sys
+from array import array
+from dataclasses import dataclass
+from functools import partial
+
+
+Record = Dict[str, Any]
+
+# array type codes of numeric columns: ids, floats and booleans
+INT, FLOAT, BOOL = "q", "d", "b"
+# stored for None in the integer columns of a RecordBatch, as in
+# bat.analytics; float columns store NaN, boolean columns -1
+MISSING_ID = -1
+
+_intern = sys.intern
+
+
+class CanvasRecord:
+    """Base of the compact record types of Canvas entities.
+
+    A JSON object parsed to a dict carries a hash table, and a new string
+    per value. These records keep only their fields' values, in slots,
+    and the `interned` fields, whose few distinct values repeat across
+    records, ex: workflow_state, share one string per distinct value.
+    Fields missing from the JSON are None.
+    """
+
+    __slots__ = ()
+
+    interned: ClassVar[Tuple[str, ...]] = ()
+    # array type codes of the numeric fields, for a RecordBatch
+    numeric: ClassVar[Dict[str, str]] = {}
+
+    @classmethod
+    def from_json(cls, record: Record) -> "CanvasRecord":
+        """A record from a Canvas JSON object, extra keys are dropped"""
+        values = {name: record.get(name) for name in cls.__slots__}
+        for name in cls.interned:
+            if isinstance(value := values[name], str):
+                values[name] = _intern(value)
+        return cls(**values)
+
+    def to_json(self) -> Record:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+@dataclass(slots=True)
+class User(CanvasRecord):
+    id: Optional[int] = None
+    name: Optional[str] = None
+    sortable_name: Optional[str] = None
+    login_id: Optional[str] = None
+
+    numeric = {"id": INT}
+
+
+@dataclass(slots=True)
+class Enrollment(CanvasRecord):
+    id: Optional[int] = None
+    course_id: Optional[int] = None
+    user_id: Optional[int] = None
+    course_section_id: Optional[int] = None
+    type: Optional[str] = None
+    role_id: Optional[int] = None
+    enrollment_state: Optional[str] = None
+    updated_at: Optional[str] = None
+
+    interned = ("type", "enrollment_state")
+    numeric = {
+        "id": INT,
+        "course_id": INT,
+        "user_id": INT,
+        "course_section_id": INT,
+        "role_id": INT,
+    }
+
+
+@dataclass(slots=True)
+class Assignment(CanvasRecord):
+    id: Optional[int] = None
+    course_id: Optional[int] = None
+    name: Optional[str] = None
+    points_possible: Optional[float] = None
+    due_at: Optional[str] = None
+    published: Optional[bool] = None
+    updated_at: Optional[str] = None
+
+    numeric = {
+        "id": INT,
+        "course_id": INT,
+        "points_possible": FLOAT,
+        "published": BOOL,
+    }
+
+
+@dataclass(slots=True)
+class Submission(CanvasRecord):
+    course_id: Optional[int] = None
+    assignment_id: Optional[int] = None
+    user_id: Optional[int] = None
+    workflow_state: Optional[str] = None
+    score: Optional[float] = None
+    # letter grades, or scores as text, repeat as much as states do
+    grade: Optional[str] = None
+    submitted_at: Optional[str] = None
+    graded_at: Optional[str] = None
+    late: Optional[bool] = None
+    missing: Optional[bool] = None
+
+    interned = ("workflow_state", "grade")
+    numeric = {
+        "course_id": INT,
+        "assignment_id": INT,
+        "user_id": INT,
+        "score": FLOAT,
+        "late": BOOL,
+        "missing": BOOL,
+    }
+
+
+R = TypeVar("R", bound=CanvasRecord)
+
+
+class RecordBatch(Generic[R]):
+    """Records of one type held column by column.
+
+    Numeric fields are packed in arrays, 8 bytes an id or float and 1 a
+    boolean, rather than an object each. Other fields are lists of their
+    values, interned as in the records. Records are built on access, and
+    to_numpy views the numeric columns as NumPy arrays without a copy.
+    """
+
+    def __init__(self, record_type: Type[R]):
+        self.record_type = record_type
+        self.columns: Dict[str, Union[array, List[Any]]] = {
+            name: array(record_type.numeric[name])
+            if name in record_type.numeric
+            else []
+            for name in record_type.__slots__
+        }
+
+    @classmethod
+    def from_json(
+        cls, record_type: Type[R], records: Iterable[Record]
+    ) -> "RecordBatch[R]":
+        batch = cls(record_type)
+        batch.extend(records)
+        return batch
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values())))
+
+    def append(self, record: Union[R, Record]):
+        if isinstance(record, dict):
+            get = record.get
+        else:
+            get = partial(getattr, record)
+        numeric = self.record_type.numeric
+        interned = self.record_type.interned
+        for name, column in self.columns.items():
+            value = get(name)
+            code = numeric.get(name)
+            if code is None:
+                if name in interned and isinstance(value, str):
+                    value = _intern(value)
+                column.append(value)
+            elif value is None:
+                column.append(_MISSING[code])
+            else:
+                column.append(
+                    float(value) if code == FLOAT else int(value)
+                )
+
+    def extend(self, records: Iterable[Union[R, Record]]):
+        for record in records:
+            self.append(record)
+
+    def __getitem__(self, n: int) -> R:
+        values = {}
+        for name, column in self.columns.items():
+            value = column[n]
+            code = self.record_type.numeric.get(name)
+            if code is not None and _is_missing(code, value):
+                value = None
+            elif code == BOOL:
+                value = bool(value)
+            values[name] = value
+        return self.record_type(**values)
+
+    def __iter__(self) -> Iterator[R]:
+        return (self[n] for n in range(len(self)))
+
+    def to_numpy(self) -> Dict[str, Any]:
+        """The numeric columns as NumPy arrays sharing the batch's memory"""
+        try:
+            import numpy as np
+        except ImportError as err:
+            raise RuntimeError(
+                "RecordBatch.to_numpy requires numpy:"
+                " pip install 'bat-canvas[analytics]'"
+            ) from err
+
+        dtypes = {INT: np.int64, FLOAT: np.float64, BOOL: np.int8}
+        return {
+            name: np.frombuffer(column, dtype=dtypes[column.typecode])
+            for name, column in self.columns.items()
+            if isinstance(column, array)
+        }
+
+
+_MISSING = {INT: MISSING_ID, FLOAT: float("nan"), BOOL: -1}
+
+
+def _is_missing(code: str, value: Any) -> bool:
+    if code == FLOAT:
+        return value != value
+    return value == _MISSING[code]
@@ -0,0 +1,17 @@
+from .checkpoint import Checkpoints
+from .fanout import FanOut
+from .mirror import Mirror
+from .reports import REPORTS, Report
+from .run import ReportRunner
+from .state import StateStore
+
+
+__all__ = [
+    "Checkpoints",
+    "FanOut",
+    "Mirror",
+    "REPORTS",
+    "Report",
+    "ReportRunner",
+    "StateStore",
+]
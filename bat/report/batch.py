@@ -0,0 +1,260 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import contextvars
+import json
+import os
+import time
+from argparse import ArgumentParser, Namespace, RawDescriptionHelpFormatter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from logging import getLogger
+from textwrap import dedent
+
+from ..conf import ResolvedConfig, environments, get_config
+from ..logconf import log_context
+from .cli import DERIVED, GRADES, _sync_arguments, write_report
+from .reports import REPORTS
+from .writers import WRITERS
+
+
+log = getLogger(__name__)
+
+# databases of an environment, given one each when environments share them
+DATABASES = ("state_db", "mirror_db")
+SUMMARY = "summary.json"
+
+
+def batch_cli() -> ArgumentParser:
+    batch = ArgumentParser(
+        prog="batch",
+        formatter_class=RawDescriptionHelpFormatter,
+        description=dedent(
+            """\
+                run reports for every environment of the config file at
+                once, and summarize them
+
+                Each environment gets its own Canvas connection pool and
+                rate limit, and writes to OUTPUT_DIR/<environment>/.
+                Environments sharing a state_db or mirror_db get one
+                each instead, named after the environment, ex:
+                state-prod.sqlite. --account defaults to each
+                environment's report.account_id.
+            """
+        ),
+    )
+    batch.add_argument(
+        "names",
+        nargs="+",
+        choices=sorted([*REPORTS, *DERIVED]),
+        metavar="REPORT",
+        help=f"report to run, {', '.join(sorted([*REPORTS, *DERIVED]))}",
+    )
+    batch.add_argument(
+        "--environment",
+        dest="environments",
+        action="append",
+        default=[],
+        metavar="ENV",
+        help="environment to run, may be repeated. default=all of them",
+    )
+    batch.add_argument(
+        "--parallel",
+        type=int,
+        default=None,
+        help="environments run at once. default=all of them",
+    )
+    batch.add_argument(
+        "-o",
+        "--output-dir",
+        dest="output_dir",
+        required=True,
+        help="directory of the reports, one sub-directory per environment,"
+        f" and of the {SUMMARY}",
+    )
+    batch.add_argument(
+        "-f",
+        "--format",
+        dest="output_format",
+        choices=sorted(WRITERS),
+        default=None,
+        help="output format. default=jsonl",
+    )
+    batch.add_argument(
+        "--by",
+        dest="group_by",
+        choices=["assignment", "course", "section"],
+        default="assignment",
+        help=f"grouping of the {GRADES} report statistics."
+        " default=assignment",
+    )
+    _sync_arguments(batch)
+    batch.set_defaults(func=_Commands.batch)
+
+    return batch
+
+
+@dataclass
+class BatchResult:
+    environment: str
+    report: str
+    rows: int = 0
+    seconds: float = 0.0
+    output: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BatchError(RuntimeError):
+    def __init__(self, failed: List[BatchResult]):
+        self.failed = failed
+        super().__init__(
+            f"{len(failed)} report(s) failed: "
+            + "; ".join(
+                f"{r.environment} {r.report}: {r.error}" for r in failed
+            )
+        )
+
+
+class _Commands:
+    @staticmethod
+    def batch(args: Namespace):
+        configs = environment_configs(args)
+        results = run_batch(configs, args.names, args.parallel)
+        print(summary(results))
+        # made by the environments run, but none may have
+        os.makedirs(args.output_dir, exist_ok=True)
+        with open(os.path.join(args.output_dir, SUMMARY), "w") as f:
+            json.dump([asdict(result) for result in results], f, indent=2)
+        if failed := [result for result in results if result.error]:
+            raise BatchError(failed)
+
+
+def environment_configs(
+    args: Namespace,
+) -> Dict[str, Tuple[ResolvedConfig, Namespace]]:
+    """The configuration and arguments of each environment selected.
+
+    The config file is read once. Arguments name their environment, as
+    FanOut's workers resolve their own configuration from them, and a
+    database of their own if environments share one.
+    """
+    sources = environments(args.config_file)
+    names = args.environments or list(sources)
+    if unknown := [name for name in names if name not in sources]:
+        raise RuntimeError(
+            f"no environment {', '.join(unknown)} in the config file,"
+            f" found: {', '.join(sources) or 'none'}"
+        )
+
+    def resolve(env_args: Namespace) -> ResolvedConfig:
+        source = sources[env_args.config_env]
+        return ResolvedConfig.resolve(
+            get_config(cli_args=env_args, config_file=source)
+        )
+
+    configs = {}
+    for name in names:
+        env_args = Namespace(**{**vars(args), "config_env": name})
+        configs[name] = (resolve(env_args), env_args)
+
+    changed = set()
+    for key in DATABASES:
+        users: Dict[str, List[str]] = {}
+        for name, (cfg, _) in configs.items():
+            path = os.path.expanduser(cfg[f"report.{key}"])
+            users.setdefault(path, []).append(name)
+        for path, shared in users.items():
+            if len(shared) < 2:
+                continue
+            stem, ext = os.path.splitext(path)
+            for name in shared:
+                setattr(configs[name][1], key, f"{stem}-{name}{ext}")
+                changed.add(name)
+    for name in changed:
+        env_args = configs[name][1]
+        configs[name] = (resolve(env_args), env_args)
+    return configs
+
+
+def run_batch(
+    configs: Dict[str, Tuple[ResolvedConfig, Namespace]],
+    names: Sequence[str],
+    parallel: Optional[int] = None,
+) -> List[BatchResult]:
+    """Run the reports of every environment, `parallel` at once.
+
+    An environment runs its reports one after the other. A report that
+    fails does not stop the others, its result holds the error.
+    """
+    if not configs:
+        return []
+    workers = max(1, min(parallel or len(configs), len(configs)))
+    with ThreadPoolExecutor(workers, thread_name_prefix="batch") as pool:
+        # threads start from the log context of the command
+        futures = [
+            pool.submit(
+                contextvars.copy_context().run,
+                run_environment,
+                name,
+                cfg,
+                env_args,
+                names,
+            )
+            for name, (cfg, env_args) in configs.items()
+        ]
+        return [result for future in futures for result in future.result()]
+
+
+def run_environment(
+    environment: str,
+    cfg: ResolvedConfig,
+    args: Namespace,
+    names: Sequence[str],
+) -> List[BatchResult]:
+    results = []
+    with log_context(environment=environment):
+        for name in names:
+            result = BatchResult(environment, name)
+            start = time.perf_counter()
+            try:
+                extension = WRITERS[cfg.report.output_format].extension
+                result.output = os.path.join(
+                    args.output_dir, environment, f"{name}{extension}"
+                )
+                os.makedirs(os.path.dirname(result.output), exist_ok=True)
+                report_args = Namespace(
+                    **{
+                        **vars(args),
+                        "name": name,
+                        "output": result.output,
+                        "mirror": False,
+                        "sql": None,
+                    }
+                )
+                result.rows = write_report(cfg, report_args)
+            except Exception as err:
+                log.warning(f"{environment} {name} failed: {err!r}")
+                result.error = repr(err)
+            result.seconds = time.perf_counter() - start
+            results.append(result)
+    return results
+
+
+def summary(results: Sequence[BatchResult]) -> str:
+    """The results as a table, with a line of totals"""
+    width = max([len("environment")] + [len(r.environment) for r in results])
+    lines = [
+        f"{'environment':<{width}} {'report':<12} {'rows':>10}"
+        f" {'seconds':>9}  status"
+    ]
+    for r in results:
+        lines.append(
+            f"{r.environment:<{width}} {r.report:<12} {r.rows:>10}"
+            f" {r.seconds:>9.2f}  {r.error or 'ok'}"
+        )
+    failed = sum(1 for r in results if r.error)
+    reports = f"{len(results)} reports"
+    lines.append(
+        f"{'total':<{width}} {reports:<12}"
+        f" {sum(r.rows for r in results):>10} {'':>9}  {failed} failed"
+    )
+    return "\n".join(lines)
@@ -0,0 +1,156 @@
+from typing import Any, Callable, Dict, Iterable, Iterator, Tuple
+
+import codecs
+import csv
+import time
+from dataclasses import dataclass, field
+from logging import getLogger
+from urllib.parse import urlencode
+
+from ..lib.canvas import CanvasClient
+
+
+log = getLogger(__name__)
+
+Record = Dict[str, Any]
+
+# states of a finished account report
+DONE = ("complete", "error", "deleted", "aborted")
+
+
+@dataclass(frozen=True)
+class BulkExport:
+    """A Canvas account report exporting a Report's records as CSV.
+
+    `fields` maps CSV columns to the record fields of the REST API,
+    `integers` the fields converted to int, empty values become None.
+    Only rows with a value listed in `keep` for its column are records,
+    ex: to match the filters of the REST endpoint.
+    """
+
+    report: str
+    parameters: Tuple[Tuple[str, str], ...] = ()
+    fields: Dict[str, str] = field(default_factory=dict)
+    integers: Tuple[str, ...] = ()
+    keep: Dict[str, Tuple[str, ...]] = field(default_factory=dict)
+
+    def kept(self, row: Dict[str, str]) -> bool:
+        return all(row.get(c) in values for c, values in self.keep.items())
+
+    def record(self, row: Dict[str, str]) -> Record:
+        ret: Record = {
+            name: row.get(column) or None
+            for column, name in self.fields.items()
+        }
+        for name in self.integers:
+            if ret.get(name) is not None:
+                ret[name] = int(ret[name])
+        return ret
+
+
+class BulkTimeout(RuntimeError):
+    pass
+
+
+class AccountReport:
+    """Start a Canvas account report, wait on it and stream its file.
+
+    Canvas compiles account reports in the background. Its status is
+    polled every `poll_interval` seconds, growing by half after each poll
+    up to `max_interval`, until it completes or `timeout` passes.
+    """
+
+    def __init__(
+        self,
+        client: CanvasClient,
+        account_id: str,
+        export: BulkExport,
+        poll_interval: float = 2.0,
+        max_interval: float = 30.0,
+        timeout: float = 3600.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.client = client
+        self.export = export
+        self.path = f"/api/v1/accounts/{account_id}/reports/{export.report}"
+        self.poll_interval = poll_interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self._clock = clock
+        self._sleep = sleep
+
+    def start(self) -> Record:
+        body = urlencode(self.export.parameters).encode()
+        response = self.client.request(
+            "POST",
+            self.path,
+            body=body,
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+        )
+        status = response.json()
+        log.info(f"started {self.export.report} report {status['id']}")
+        return status
+
+    def wait(self, status: Record) -> Record:
+        """Poll until the report is done, returns its final status"""
+        deadline = self._clock() + self.timeout
+        interval = self.poll_interval
+        while status.get("status") not in DONE:
+            if self._clock() + interval > deadline:
+                raise BulkTimeout(
+                    f"{self.export.report} report {status['id']}"
+                    f" not done after {self.timeout:g}s"
+                )
+            self._sleep(interval)
+            interval = min(interval * 1.5, self.max_interval)
+            status = self.client.get_json(f"{self.path}/{status['id']}")
+            log.debug(
+                f"{self.export.report} report {status['id']}:"
+                f" {status.get('status')} {status.get('progress')}%"
+            )
+        if status["status"] != "complete":
+            raise RuntimeError(
+                f"{self.export.report} report {status['id']}"
+                f" {status['status']}: {status.get('parameters')}"
+            )
+        return status
+
+    def download(self, status: Record) -> Iterator[bytes]:
+        attachment = status.get("attachment") or {}
+        url = attachment.get("url") or status.get("file_url")
+        if not url:
+            raise RuntimeError(
+                f"{self.export.report} report {status['id']} has no file"
+            )
+        return self.client.stream(url)
+
+    def rows(self) -> Iterator[Dict[str, str]]:
+        """Run the report, and stream the rows of its CSV file"""
+        return csv_rows(self.download(self.wait(self.start())))
+
+    def records(self) -> Iterator[Record]:
+        export = self.export
+        return (export.record(row) for row in self.rows() if export.kept(row))
+
+
+def csv_rows(
+    chunks: Iterable[bytes], encoding: str = "utf-8-sig"
+) -> Iterator[Dict[str, str]]:
+    """Parse CSV rows as the chunks of its file arrive.
+
+    Quoted values may span lines and chunks, only the current line is
+    buffered however large the file.
+    """
+    return csv.DictReader(_lines(chunks, encoding))
+
+
+def _lines(chunks: Iterable[bytes], encoding: str) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder(encoding)()
+    partial = ""
+    for chunk in chunks:
+        *lines, partial = (partial + decoder.decode(chunk)).split("\n")
+        for line in lines:
+            yield line + "\n"
+    if rest := partial + decoder.decode(b"", final=True):
+        yield rest
@@ -0,0 +1,238 @@
+from typing import Any, List, Optional, Sequence, Tuple
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+from datetime import timedelta
+from logging import getLogger
+
+from .reports import Cursor
+from .run import format_mark, utcnow
+
+
+log = getLogger(__name__)
+
+# an unfinished run older than this is discarded by the next one started
+RETENTION = timedelta(days=7)
+# the course id under which a job checkpoints an account-wide sync, ex: a
+# bulk export
+ACCOUNT = "*"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job TEXT PRIMARY KEY,
+    course_ids TEXT NOT NULL,
+    started_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_courses (
+    job TEXT NOT NULL,
+    report TEXT NOT NULL,
+    course_id TEXT NOT NULL,
+    since TEXT,
+    mark TEXT NOT NULL,
+    cursor TEXT NOT NULL,
+    fetched INTEGER NOT NULL DEFAULT 0,
+    done INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (job, report, course_id)
+);
+CREATE TABLE IF NOT EXISTS job_outputs (
+    job TEXT NOT NULL,
+    path TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    PRIMARY KEY (job, path)
+);
+"""
+
+_TABLES = ("jobs", "job_courses", "job_outputs")
+
+
+def job_id(**description: Any) -> str:
+    """Identify a run by what it does, ex: its reports, courses and output"""
+    data = json.dumps(description, sort_keys=True, default=str)
+    return hashlib.sha1(data.encode()).hexdigest()[:16]
+
+
+@dataclass
+class Progress:
+    """Where the sync of a course stands within a run.
+
+    `since` and `mark` are the high-water marks the course fetches from
+    and moves to, fixed when it starts so a resumed fetch is the same.
+    """
+
+    since: Optional[str]
+    mark: str
+    cursor: Cursor
+    fetched: int = 0
+    done: bool = False
+
+
+class Checkpoints:
+    """The progress of report runs, for bat report --resume.
+
+    A run, a job, checkpoints the courses it syncs as they complete, the
+    cursor of the next page of the course in progress, and the output
+    chunks written. It is kept in the state database until the run
+    finishes, a failed run is resumed from there rather than from the
+    start: finished courses are not fetched again, nor written chunks
+    rewritten.
+    """
+
+    def __init__(self, path: str, clock=utcnow, retention=RETENTION):
+        self.path = os.path.expanduser(path)
+        if directory := os.path.dirname(self.path):
+            os.makedirs(directory, exist_ok=True)
+        self.clock = clock
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            isolation_level=None,
+            timeout=30,
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    @classmethod
+    def from_config(cls, cfg) -> "Checkpoints":
+        return cls(cfg.report.state_db)
+
+    def start(self, job: str, course_ids: Sequence[str]) -> "Job":
+        """Start a run over, discarding its checkpoints and stale runs"""
+        stale = format_mark(self.clock() - self.retention)
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                jobs = [
+                    row[0]
+                    for row in self._db.execute(
+                        "SELECT job FROM jobs"
+                        " WHERE job = ? OR started_at < ?",
+                        (job, stale),
+                    )
+                ]
+                self._delete(jobs)
+                self._db.execute(
+                    "INSERT INTO jobs VALUES (?, ?, ?)",
+                    (
+                        job,
+                        json.dumps([str(c) for c in course_ids]),
+                        format_mark(self.clock()),
+                    ),
+                )
+        return self.job(job)
+
+    def resume(self, job: str) -> Optional[List[str]]:
+        """The courses of an unfinished run, None if there is none"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT course_ids FROM jobs WHERE job = ?", (job,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def job(self, job: str) -> "Job":
+        return Job(self, job)
+
+    def _delete(self, jobs: Sequence[str]):
+        for table in _TABLES:
+            self._db.executemany(
+                f"DELETE FROM {table} WHERE job = ?", [(j,) for j in jobs]
+            )
+
+    def close(self):
+        self._db.close()
+
+
+class Job:
+    """The checkpoints of one run, see Checkpoints"""
+
+    def __init__(self, checkpoints: Checkpoints, job: str):
+        self.checkpoints = checkpoints
+        self.id = job
+
+    def _execute(self, sql: str, params: Sequence = ()) -> List[Tuple]:
+        with self.checkpoints._lock:
+            db = self.checkpoints._db
+            return db.execute(sql, params).fetchall()
+
+    def progress(self, report: str, course_id: str) -> Optional[Progress]:
+        """The progress of a course, None if not started"""
+        rows = self._execute(
+            "SELECT since, mark, cursor, fetched, done FROM job_courses"
+            " WHERE job = ? AND report = ? AND course_id = ?",
+            (self.id, report, str(course_id)),
+        )
+        if not rows:
+            return None
+        since, mark, cursor, fetched, done = rows[0]
+        first, start = json.loads(cursor)
+        return Progress(since, mark, (first, start), fetched, bool(done))
+
+    def begin(
+        self, report: str, course_id: str, since: Optional[str], mark: str
+    ) -> Progress:
+        progress = Progress(since, mark, (0, None))
+        self._execute(
+            "INSERT OR REPLACE INTO job_courses"
+            " VALUES (?, ?, ?, ?, ?, ?, 0, 0)",
+            (
+                self.id,
+                report,
+                str(course_id),
+                since,
+                mark,
+                json.dumps(progress.cursor),
+            ),
+        )
+        return progress
+
+    def advance(
+        self, report: str, course_id: str, cursor: Cursor, fetched: int
+    ):
+        """Checkpoint a course once the records before `cursor` are stored"""
+        self._execute(
+            "UPDATE job_courses SET cursor = ?, fetched = ?"
+            " WHERE job = ? AND report = ? AND course_id = ?",
+            (json.dumps(cursor), fetched, self.id, report, str(course_id)),
+        )
+
+    def complete(self, report: str, course_id: str, fetched: int):
+        """Checkpoint a course as done, begun or not, ex: ACCOUNT"""
+        self._execute(
+            "INSERT INTO job_courses VALUES (?, ?, ?, NULL, '', ?, ?, 1)"
+            " ON CONFLICT (job, report, course_id)"
+            " DO UPDATE SET fetched = excluded.fetched, done = 1",
+            (self.id, report, str(course_id), "[0, null]", fetched),
+        )
+
+    def outputs(self) -> List[Tuple[str, int]]:
+        """The output files written, and their rows, in order"""
+        return [
+            (path, rows)
+            for path, rows in self._execute(
+                "SELECT path, rows FROM job_outputs WHERE job = ?"
+                " ORDER BY rowid",
+                (self.id,),
+            )
+        ]
+
+    def output(self, path: str, rows: int):
+        """Checkpoint a complete output file, ex: a csv chunk"""
+        self._execute(
+            "INSERT OR REPLACE INTO job_outputs VALUES (?, ?, ?)",
+            (self.id, path, rows),
+        )
+
+    def discard_outputs(self):
+        self._execute("DELETE FROM job_outputs WHERE job = ?", (self.id,))
+
+    def finish(self):
+        """Forget the run once it has completed"""
+        with self.checkpoints._lock:
+            with self.checkpoints._db:
+                self.checkpoints._db.execute("BEGIN")
+                self.checkpoints._delete([self.id])
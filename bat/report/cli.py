@@ -0,0 +1,400 @@
+from typing import Dict, List, Optional, Tuple
+
+import os
+from argparse import ArgumentParser, Namespace, RawDescriptionHelpFormatter
+from contextlib import ExitStack
+from itertools import islice
+from logging import getLogger
+from textwrap import dedent
+
+from ..conf import resolved_config
+from ..entities import MissingReport
+from ..lib.canvas import CanvasClient
+from .checkpoint import ACCOUNT, Checkpoints, Job, job_id
+from .fanout import FanOut, WorkerConfig
+from .mirror import SQL_REPORTS, Mirror
+from .reports import REPORTS, Report
+from .run import ReportRunner, account_course_records
+from .state import StateStore
+from .writers import WRITERS, write_rows, writer_from_config
+
+
+log = getLogger(__name__)
+
+# derived from other reports by bat.analytics, which requires numpy
+GRADES = "grades"
+# derived from other reports by bat.entities
+MISSING_BY_SECTION = "missing_by_section"
+DERIVED = (GRADES, MISSING_BY_SECTION)
+# runs the --sql query against the mirror
+QUERY = "query"
+
+
+def report_cli() -> ArgumentParser:
+    report = ArgumentParser(
+        prog="report",
+        formatter_class=RawDescriptionHelpFormatter,
+        description=dedent(
+            """\
+                generate a Canvas report, fetching only the records
+                changed since the last run of the same report
+
+                --mirror reads the reports from the local database
+                written by bat sync, without fetching anything. The SQL
+                reports always do, and query runs --sql against it.
+
+                Runs are checkpointed as they go: --resume continues a
+                failed run of the same report from the courses, pages
+                and csv chunks it had not completed.
+            """
+        ),
+    )
+    report.add_argument(
+        "name",
+        choices=sorted([*REPORTS, *DERIVED, *SQL_REPORTS, QUERY]),
+        help="report name",
+    )
+    _sync_arguments(report)
+    report.add_argument(
+        "--mirror",
+        action="store_true",
+        help="read the report from the mirror written by bat sync",
+    )
+    report.add_argument(
+        "--sql",
+        default=None,
+        help=f"SQL query of the {QUERY} report, over the mirror's tables:"
+        f" courses, {', '.join(sorted(REPORTS))}, and selected_courses,"
+        " the --course or every mirrored course",
+    )
+    report.add_argument(
+        "--by",
+        dest="group_by",
+        choices=["assignment", "course", "section"],
+        default="assignment",
+        help=f"grouping of the {GRADES} report statistics."
+        " default=assignment",
+    )
+    report.add_argument(
+        "-f",
+        "--format",
+        dest="output_format",
+        choices=sorted(WRITERS),
+        default=None,
+        help="output format. default=jsonl",
+    )
+    report.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        help="output file path, stdout if omitted."
+        " required for parquet and arrow",
+    )
+    report.set_defaults(func=_Commands.report)
+
+    return report
+
+
+def sync_cli() -> ArgumentParser:
+    sync = ArgumentParser(
+        prog="sync",
+        formatter_class=RawDescriptionHelpFormatter,
+        description=dedent(
+            """\
+                sync Canvas reports into a local database, the mirror,
+                for any number of bat report --mirror runs and SQL reports
+
+                Without --course or --account, reloads the mirror from
+                every course previously synced.
+            """
+        ),
+    )
+    sync.add_argument(
+        "--report",
+        dest="reports",
+        action="append",
+        choices=sorted(REPORTS),
+        default=[],
+        help="report to sync, may be repeated. default=all of them",
+    )
+    _sync_arguments(sync)
+    sync.set_defaults(func=_Commands.sync)
+
+    return sync
+
+
+def _sync_arguments(p: ArgumentParser):
+    p.add_argument(
+        "--course",
+        dest="course_ids",
+        action="append",
+        default=[],
+        metavar="COURSE_ID",
+        help="course to report on, may be repeated",
+    )
+    p.add_argument(
+        "--account",
+        dest="account_id",
+        default=None,
+        help="report on every course of this account."
+        " default=report.account_id of the config",
+    )
+    p.add_argument(
+        "--full",
+        action="store_true",
+        help="discard the previous output and fetch every record again",
+    )
+    p.add_argument(
+        "--resume",
+        action="store_true",
+        help="resume the last run of the same command if it failed,"
+        " over the courses it had selected",
+    )
+    p.add_argument(
+        "--source",
+        choices=["rest", "bulk"],
+        default=None,
+        help="bulk syncs the reports that have one from a Canvas account"
+        " report export, requires --account. default=rest",
+    )
+    p.add_argument(
+        "-w",
+        "--workers",
+        default=None,
+        help="sync shards of the courses in parallel. default=1",
+    )
+    p.add_argument(
+        "--executor",
+        choices=["process", "thread", "async"],
+        default=None,
+        help="run the --workers in processes, threads, or as asyncio tasks"
+        " sharing one connection pool. default=process",
+    )
+
+
+class _Commands:
+    @staticmethod
+    def report(args: Namespace):
+        cfg = resolved_config(
+            cli_args=args,
+            config_file_name=args.config_file,
+            config_env=args.config_env,
+        )
+        write_report(cfg, args)
+
+    @staticmethod
+    def sync(args: Namespace):
+        cfg = resolved_config(
+            cli_args=args,
+            config_file_name=args.config_file,
+            config_env=args.config_env,
+        )
+        reports = [REPORTS[name]() for name in args.reports or REPORTS]
+        with ExitStack() as closing:
+            state = StateStore.from_config(cfg)
+            closing.callback(state.close)
+            checkpoints = Checkpoints.from_config(cfg)
+            closing.callback(checkpoints.close)
+            mirror = Mirror.from_config(cfg)
+            closing.callback(mirror.close)
+            course_ids: Optional[List[str]] = None
+            job: Optional[Job] = None
+            if args.course_ids or _account_id(cfg):
+                _, course_ids, job = _sync(
+                    cfg, args, state, checkpoints, reports, mirror
+                )
+            for report in reports:
+                count = mirror.load(report, state, course_ids)
+                print(f"{report.name}: {count} rows mirrored")
+            mirror.expire()
+            if job is not None:
+                job.finish()
+
+
+def write_report(cfg, args: Namespace) -> int:
+    """Sync and write the report args.name, returns the rows written"""
+    if args.name in SQL_REPORTS or args.name == QUERY or args.mirror:
+        return _mirror_report(cfg, args)
+
+    derived = _derived_report(args) if args.name in DERIVED else None
+    if derived:
+        reports = [REPORTS[name]() for name in derived.sources]
+    else:
+        reports = [REPORTS[args.name]()]
+
+    with ExitStack() as closing:
+        state = StateStore.from_config(cfg)
+        closing.callback(state.close)
+        checkpoints = Checkpoints.from_config(cfg)
+        closing.callback(checkpoints.close)
+        runner, course_ids, job = _sync(
+            cfg, args, state, checkpoints, reports
+        )
+        if derived:
+            output, rows = derived, derived.rows(state, course_ids)
+        else:
+            output, rows = reports[0], runner.rows(reports[0], course_ids)
+        chunks, written = _written_chunks(job)
+        with writer_from_config(
+            cfg,
+            args.output,
+            output.columns,
+            output.types,
+            start_chunk=chunks,
+            on_chunk=job.output,
+        ) as writer:
+            written += write_rows(writer, islice(rows, written, None))
+        job.finish()
+    return written
+
+
+def _sync(
+    cfg,
+    args: Namespace,
+    state: StateStore,
+    checkpoints: Checkpoints,
+    reports: List[Report],
+    mirror: Optional[Mirror] = None,
+) -> Tuple[ReportRunner, List[str], Job]:
+    """Sync the reports of the selected courses, returns their ids.
+
+    The account's courses are also saved to the `mirror`, if given. The
+    sync is checkpointed in the job returned, to finish once the output
+    is written. With --resume, an unfinished job of the same command is
+    picked up instead, over the courses it had selected.
+    """
+    key = job_id(
+        reports=[report.name for report in reports],
+        course_ids=args.course_ids,
+        account_id=_account_id(cfg),
+        full=args.full,
+        source=cfg.report.source,
+        mirror=mirror is not None,
+        output=getattr(args, "output", None),
+        output_format=cfg.report.output_format,
+        chunk_rows=cfg.report.chunk_rows,
+        group_by=getattr(args, "group_by", None),
+    )
+    resumed = checkpoints.resume(key) if args.resume else None
+    with CanvasClient.from_config(cfg) as client:
+        if resumed is not None:
+            log.info(f"resuming the last run, {len(resumed)} courses")
+            course_ids, job = resumed, checkpoints.job(key)
+        else:
+            if args.resume:
+                log.warning("no failed run to resume, starting over")
+            course_ids = list(args.course_ids)
+            if account_id := _account_id(cfg):
+                courses = list(account_course_records(client, account_id))
+                course_ids += [str(course["id"]) for course in courses]
+                if mirror is not None:
+                    mirror.load_courses(courses)
+            job = checkpoints.start(key, course_ids)
+
+        runner = ReportRunner(client, state)
+        rest = reports
+        if cfg.report.source == "bulk":
+            rest = _sync_bulk(cfg, runner, reports, args, course_ids, job)
+        if rest and int(cfg.report.workers) > 1:
+            fanout = FanOut.from_config(cfg, WorkerConfig.from_args(args))
+            fanout.sync(
+                [report.name for report in rest],
+                course_ids,
+                full=args.full,
+                job=job.id,
+            )
+        else:
+            for report in rest:
+                runner.sync(report, course_ids, full=args.full, job=job)
+    return runner, course_ids, job
+
+
+def _account_id(cfg) -> Optional[str]:
+    """--account, or the account of the configuration if any"""
+    return cfg.get("report.account_id")
+
+
+def _written_chunks(job: Job) -> Tuple[int, int]:
+    """The output chunks a resumed job had written, and their rows"""
+    chunks = job.outputs()
+    if not all(os.path.exists(path) for path, _ in chunks):
+        log.warning("output chunks of the last run are missing, rewriting")
+        job.discard_outputs()
+        return 0, 0
+    if chunks:
+        log.info(f"{len(chunks)} output chunks already written, skipped")
+    return len(chunks), sum(rows for _, rows in chunks)
+
+
+def _mirror_report(cfg, args: Namespace) -> int:
+    """Write a report from the mirror, without fetching anything"""
+    if args.name in DERIVED:
+        raise RuntimeError(
+            f"the {args.name} report is computed from bat report's own"
+            " state, drop --mirror"
+        )
+    if args.name == QUERY and not args.sql:
+        raise RuntimeError(f"the {QUERY} report requires --sql")
+
+    mirror = Mirror.from_config(cfg)
+    try:
+        course_ids = list(args.course_ids) or None
+        types: Dict[str, str] = {}
+        if args.name in REPORTS:
+            report = REPORTS[args.name]()
+            columns = list(report.columns)
+            types = report.types
+            rows = mirror.rows(report, course_ids)
+        else:
+            sql = args.sql if args.name == QUERY else SQL_REPORTS[args.name]
+            columns, rows = mirror.query(sql, course_ids=course_ids)
+        with writer_from_config(cfg, args.output, columns, types) as writer:
+            return write_rows(writer, rows)
+    finally:
+        mirror.close()
+
+
+def _sync_bulk(
+    cfg,
+    runner: ReportRunner,
+    reports: List[Report],
+    args: Namespace,
+    course_ids: List[str],
+    job: Job,
+) -> List[Report]:
+    """Sync the reports with a bulk export, returns the others"""
+    if not _account_id(cfg):
+        log.warning("bulk exports are account reports, use --account")
+        return reports
+    rest = []
+    for report in reports:
+        if report.bulk is None:
+            log.info(f"{report.name} has no bulk export, syncing over REST")
+            rest.append(report)
+            continue
+        progress = job.progress(report.name, ACCOUNT)
+        if progress is not None and progress.done:
+            log.info(f"{report.name}: bulk export done, skipped")
+            continue
+        counts = runner.sync_bulk(
+            report,
+            _account_id(cfg),
+            course_ids,
+            poll_interval=float(cfg.report.poll_interval),
+            timeout=float(cfg.report.poll_timeout),
+        )
+        job.complete(report.name, ACCOUNT, sum(counts.values()))
+    return rest
+
+
+def _derived_report(args: Namespace):
+    if args.name == MISSING_BY_SECTION:
+        return MissingReport()
+    try:
+        from ..analytics import GradeReport
+    except ImportError as err:
+        raise RuntimeError(
+            f"the {GRADES} report requires numpy:"
+            " pip install 'bat-canvas[analytics]'"
+        ) from err
+    return GradeReport(args.group_by)
@@ -0,0 +1,331 @@
+from typing import Any, Dict, List, Optional, Sequence
+
+import asyncio
+import multiprocessing
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+    FIRST_COMPLETED,
+)
+from dataclasses import dataclass, field
+from logging import getLogger
+
+from ..conf import Namespace, ResolvedConfig, resolved_config
+from ..lib.canvas import CanvasClient
+from .checkpoint import Checkpoints
+from .reports import REPORTS
+from .run import ReportRunner
+from .state import StateStore
+
+
+log = getLogger(__name__)
+
+EXECUTORS = ("process", "thread", "async")
+
+# records fetched per report, then per course
+Counts = Dict[str, Dict[str, int]]
+
+
+@dataclass
+class WorkerConfig:
+    """What a worker needs to build its own configuration.
+
+    Workers resolve their configuration from the same sources as the
+    parent, once per process, see resolved_config.
+    """
+
+    cli_args: Dict[str, Any] = field(default_factory=dict)
+    config_file: Optional[str] = None
+    config_env: Optional[str] = None
+
+    @classmethod
+    def from_args(cls, args: Namespace) -> "WorkerConfig":
+        # only plain values, args also holds the command function
+        plain = (str, int, float, bool, list, type(None))
+        return cls(
+            cli_args={
+                k: v for k, v in vars(args).items() if isinstance(v, plain)
+            },
+            config_file=getattr(args, "config_file", None),
+            config_env=getattr(args, "config_env", None),
+        )
+
+    def load(self) -> ResolvedConfig:
+        return resolved_config(
+            cli_args=Namespace(**self.cli_args),
+            config_file_name=self.config_file,
+            config_env=self.config_env,
+        )
+
+
+@dataclass
+class Shard:
+    index: int
+    course_ids: List[str]
+    attempts: int = 0
+
+
+@dataclass
+class ShardResult:
+    """Counts of the courses synced, and the courses left on failure"""
+
+    index: int
+    counts: Counts
+    pending: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+class ShardError(RuntimeError):
+    def __init__(self, failed: Dict[int, ShardResult]):
+        self.failed = failed
+        courses = [c for r in failed.values() for c in r.pending]
+        errors = "; ".join(sorted({str(r.error) for r in failed.values()}))
+        super().__init__(
+            f"{len(failed)} shard(s) failed, courses not synced:"
+            f" {', '.join(courses)}: {errors}"
+        )
+
+
+def sync_shard(
+    worker: WorkerConfig,
+    index: int,
+    report_names: Sequence[str],
+    course_ids: Sequence[str],
+    full: bool = False,
+    job: Optional[str] = None,
+) -> ShardResult:
+    """Sync a shard of courses with a Canvas session of its own.
+
+    Courses are synced one at a time and each moves its own high-water
+    mark, so on failure the result lists the courses left to sync and a
+    retry picks up from there. Courses are checkpointed in `job`, a job
+    id, if given.
+    """
+    cfg = worker.load()
+    reports = [REPORTS[name]() for name in report_names]
+    counts: Counts = {report.name: {} for report in reports}
+    state = StateStore.from_config(cfg)
+    checkpoints = Checkpoints.from_config(cfg) if job else None
+    try:
+        with CanvasClient.from_config(cfg) as client:
+            runner = ReportRunner(client, state)
+            checkpointed = checkpoints.job(job) if checkpoints else None
+            for n, course_id in enumerate(course_ids):
+                try:
+                    for report in reports:
+                        counts[report.name][course_id] = runner.sync_course(
+                            report, course_id, full, checkpointed
+                        )
+                except Exception as err:
+                    log.warning(
+                        f"shard {index}: course {course_id} failed: {err!r}"
+                    )
+                    return ShardResult(
+                        index, counts, list(course_ids[n:]), repr(err)
+                    )
+    finally:
+        state.close()
+        if checkpoints is not None:
+            checkpoints.close()
+    return ShardResult(index, counts)
+
+
+def shards(course_ids: Sequence[str], count: int) -> List[Shard]:
+    """Split courses in up to `count` contiguous shards of near equal size"""
+    count = max(1, min(count, len(course_ids)))
+    size, extra = divmod(len(course_ids), count)
+    ret, start = [], 0
+    for index in range(count):
+        end = start + size + (index < extra)
+        if end > start:
+            ret.append(Shard(index, list(course_ids[start:end])))
+        start = end
+    return ret
+
+
+class FanOut:
+    """Sync reports over a pool of workers, each with a shard of courses.
+
+    `executor` "process" shards over a process pool, for when decoding
+    and merging records is the bottleneck, "thread" over a thread pool
+    for I/O bound syncs. "async" runs in this process instead, with
+    `workers` courses at a time sharing one AsyncCanvasClient, see
+    sync_async. A failed shard is retried up to `retries` times,
+    from its first course not synced, without disturbing the others.
+    Each worker takes several smaller shards in turn, so that one slow
+    shard does not hold up the whole report.
+    """
+
+    def __init__(
+        self,
+        worker: WorkerConfig,
+        workers: int = 4,
+        executor: str = "process",
+        retries: int = 2,
+        shards_per_worker: int = 4,
+    ):
+        if executor not in EXECUTORS:
+            raise ValueError(
+                f"unknown executor {executor!r},"
+                f" choose from {', '.join(EXECUTORS)}"
+            )
+        self.worker = worker
+        self.workers = max(1, workers)
+        self.executor = executor
+        self.retries = retries
+        self.shards_per_worker = shards_per_worker
+
+    @classmethod
+    def from_config(cls, cfg, worker: WorkerConfig) -> "FanOut":
+        report = cfg.report
+        return cls(
+            worker,
+            workers=int(report.workers),
+            executor=report.executor,
+            retries=int(report.shard_retries),
+        )
+
+    def _pool(self) -> Executor:
+        if self.executor == "thread":
+            return ThreadPoolExecutor(self.workers)
+        # spawn, the parent may hold open connections and running threads
+        return ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def sync(
+        self,
+        report_names: Sequence[str],
+        course_ids: Sequence[str],
+        full: bool = False,
+        job: Optional[str] = None,
+    ) -> Counts:
+        """Sync every course, returns the records fetched per course.
+
+        Counts are in the order of `report_names` and `course_ids`,
+        whichever order the shards completed in. Raises ShardError once
+        every other shard is done, if any shard is out of retries.
+        Courses are checkpointed in `job`, a job id, if given.
+        """
+        if self.executor == "async":
+            return asyncio.run(
+                self.sync_async(report_names, course_ids, full, job)
+            )
+        pending = shards(course_ids, self.workers * self.shards_per_worker)
+        synced: Counts = {name: {} for name in report_names}
+        failed: Dict[int, ShardResult] = {}
+
+        with self._pool() as pool:
+            running: Dict[Future, Shard] = {}
+
+            def submit(shard: Shard):
+                future = pool.submit(
+                    sync_shard,
+                    self.worker,
+                    shard.index,
+                    report_names,
+                    shard.course_ids,
+                    full,
+                    job,
+                )
+                running[future] = shard
+
+            for shard in pending:
+                submit(shard)
+
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    shard = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as err:
+                        result = ShardResult(
+                            shard.index, {}, shard.course_ids, repr(err)
+                        )
+                    for name, counts in result.counts.items():
+                        synced[name].update(counts)
+
+                    if not result.pending:
+                        continue
+                    if shard.attempts >= self.retries:
+                        failed[shard.index] = result
+                        continue
+                    log.warning(
+                        f"retrying shard {shard.index},"
+                        f" {len(result.pending)} courses: {result.error}"
+                    )
+                    # courses synced by the failed attempt are not run again
+                    submit(
+                        Shard(shard.index, result.pending, shard.attempts + 1)
+                    )
+
+        if failed:
+            raise ShardError(failed)
+        return _ordered(synced, course_ids)
+
+    async def sync_async(
+        self,
+        report_names: Sequence[str],
+        course_ids: Sequence[str],
+        full: bool = False,
+        job: Optional[str] = None,
+    ) -> Counts:
+        """sync on the running event loop, each course a shard of its own.
+
+        Requests in flight are bounded by the client's async_concurrency,
+        and the courses held in memory at once by `workers`.
+        """
+        from ..lib.aio import AsyncCanvasClient
+
+        cfg = self.worker.load()
+        reports = [REPORTS[name]() for name in report_names]
+        synced: Counts = {name: {} for name in report_names}
+        failed: Dict[int, ShardResult] = {}
+        slots = asyncio.Semaphore(self.workers)
+
+        async def sync_course(runner: ReportRunner, index: int, course_id):
+            for _ in range(self.retries + 1):
+                try:
+                    async with slots:
+                        for report in reports:
+                            count = await runner.sync_course_async(
+                                report, course_id, full, checkpointed
+                            )
+                            synced[report.name][course_id] = count
+                    return
+                except Exception as err:
+                    log.warning(f"course {course_id} failed: {err!r}")
+                    error = repr(err)
+            failed[index] = ShardResult(index, {}, [course_id], error)
+
+        state = StateStore.from_config(cfg)
+        checkpoints = Checkpoints.from_config(cfg) if job else None
+        checkpointed = checkpoints.job(job) if checkpoints else None
+        try:
+            async with AsyncCanvasClient.from_config(cfg) as client:
+                runner = ReportRunner(client, state)
+                await asyncio.gather(
+                    *(
+                        sync_course(runner, index, course_id)
+                        for index, course_id in enumerate(course_ids)
+                    )
+                )
+        finally:
+            state.close()
+            if checkpoints is not None:
+                checkpoints.close()
+
+        if failed:
+            raise ShardError(dict(sorted(failed.items())))
+        return _ordered(synced, course_ids)
+
+
+def _ordered(synced: Counts, course_ids: Sequence[str]) -> Counts:
+    return {
+        name: {c: counts[c] for c in course_ids if c in counts}
+        for name, counts in synced.items()
+    }
@@ -0,0 +1,358 @@
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from logging import getLogger
+
+from ..lib.timings import span
+from .reports import REPORTS, Record, Report
+from .run import format_mark, utcnow
+from .state import StateStore
+
+
+log = getLogger(__name__)
+
+COURSE_COLUMNS = (
+    "id",
+    "account_id",
+    "name",
+    "course_code",
+    "workflow_state",
+    "enrollment_term_id",
+)
+
+# SQLite types of the report columns that are not text, course ids are
+# text as in the state store
+_INTEGER = {
+    "id",
+    "user_id",
+    "assignment_id",
+    "course_section_id",
+}
+_REAL = {"score", "points_possible"}
+_BOOLEAN = {"late", "missing", "published"}
+# columns looked up across courses
+_INDEXED = ("user_id", "assignment_id")
+
+_COURSES = """
+CREATE TABLE IF NOT EXISTS courses (
+    id TEXT PRIMARY KEY,
+    account_id INTEGER,
+    name TEXT,
+    course_code TEXT,
+    workflow_state TEXT,
+    enrollment_term_id INTEGER
+)"""
+_SCHEMA = _COURSES + """;
+CREATE TABLE IF NOT EXISTS mirror_syncs (
+    entity TEXT NOT NULL,
+    course_id TEXT NOT NULL,
+    synced_at TEXT NOT NULL,
+    PRIMARY KEY (entity, course_id)
+);
+CREATE TEMP TABLE IF NOT EXISTS selected_courses (
+    course_id TEXT PRIMARY KEY
+);
+"""
+
+# Reports computed from the mirror in SQL, over the selected_courses
+SQL_REPORTS: Dict[str, str] = {
+    "course_summary": """
+        SELECT c.course_id,
+            (SELECT COUNT(*) FROM enrollments e
+             WHERE e.course_id = c.course_id
+             AND e.type = 'StudentEnrollment') AS students,
+            (SELECT COUNT(*) FROM assignments a
+             WHERE a.course_id = c.course_id) AS assignments,
+            COUNT(s.key) AS submissions,
+            COUNT(s.score) AS graded,
+            AVG(s.score) AS mean_score,
+            AVG(s.late) AS late_rate,
+            AVG(s.missing) AS missing_rate
+        FROM selected_courses c
+        LEFT JOIN submissions s ON s.course_id = c.course_id
+        GROUP BY c.course_id
+        ORDER BY c.course_id
+    """,
+    "student_summary": """
+        SELECT s.course_id, s.user_id,
+            COUNT(*) AS submissions,
+            COUNT(s.score) AS graded,
+            SUM(s.missing) AS missing,
+            SUM(s.late) AS late,
+            100.0 * SUM(s.score) / SUM(
+                CASE WHEN s.score IS NOT NULL THEN a.points_possible END
+            ) AS percent
+        FROM submissions s
+        JOIN selected_courses USING (course_id)
+        LEFT JOIN assignments a
+            ON a.course_id = s.course_id AND a.id = s.assignment_id
+        GROUP BY s.course_id, s.user_id
+        ORDER BY s.course_id, s.user_id
+    """,
+    "missing": """
+        SELECT s.course_id, s.user_id, s.assignment_id,
+            a.name AS assignment, a.due_at
+        FROM submissions s
+        JOIN selected_courses USING (course_id)
+        LEFT JOIN assignments a
+            ON a.course_id = s.course_id AND a.id = s.assignment_id
+        WHERE s.missing
+        ORDER BY s.course_id, s.user_id, a.due_at
+    """,
+}
+
+
+def column_type(column: str) -> str:
+    if column in _INTEGER or column in _BOOLEAN:
+        return "INTEGER"
+    if column in _REAL:
+        return "REAL"
+    return "TEXT"
+
+
+def table_schema(report: Report) -> str:
+    columns = [c for c in report.columns if c != "course_id"]
+    definitions = ",\n    ".join(f"{c} {column_type(c)}" for c in columns)
+    indexes = "".join(
+        f"CREATE INDEX IF NOT EXISTS {report.name}_{c}"
+        f" ON {report.name} ({c});\n"
+        for c in _INDEXED
+        if c in columns
+    )
+    return (
+        f"CREATE TABLE IF NOT EXISTS {report.name} (\n"
+        "    course_id TEXT NOT NULL,\n"
+        "    key TEXT NOT NULL,\n"
+        f"    {definitions},\n"
+        "    PRIMARY KEY (course_id, key)\n"
+        ");\n"
+    ) + indexes
+
+
+class Mirror:
+    """Canvas entities in typed, indexed tables of a local SQLite file.
+
+    bat sync syncs reports into the StateStore, then loads the rows of
+    the courses synced into a table per report, with a column per report
+    column. Reports then run as SQL queries against the mirror, with no
+    request to Canvas. Course ids are text, as the store keys them, in
+    every table, courses.id included. Rows of courses not synced for
+    `retention_days` are dropped, 0 keeps them forever.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        retention_days: float = 30,
+        clock: Callable[[], datetime] = utcnow,
+    ):
+        self.path = os.path.expanduser(path)
+        if directory := os.path.dirname(self.path):
+            os.makedirs(directory, exist_ok=True)
+        self.retention_days = retention_days
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._migrate()
+        self._db.executescript(_SCHEMA)
+        for report in REPORTS.values():
+            self._db.executescript(table_schema(report()))
+
+    def _migrate(self):
+        """Mirrors made before course ids were text in every table"""
+        types = {
+            name: kind
+            for _, name, kind, *_ in self._db.execute(
+                "PRAGMA table_info(courses)"
+            )
+        }
+        if types.get("id") != "INTEGER":
+            return
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.execute("ALTER TABLE courses RENAME TO courses_old")
+            self._db.execute(_COURSES)
+            self._db.execute(
+                "INSERT INTO courses SELECT CAST(id AS TEXT), account_id,"
+                " name, course_code, workflow_state, enrollment_term_id"
+                " FROM courses_old"
+            )
+            self._db.execute("DROP TABLE courses_old")
+
+    @classmethod
+    def from_config(cls, cfg) -> "Mirror":
+        return cls(
+            cfg.report.mirror_db,
+            retention_days=float(cfg.report.mirror_retention_days),
+        )
+
+    def load(
+        self,
+        report: Report,
+        state: StateStore,
+        course_ids: Optional[Sequence[str]] = None,
+    ) -> int:
+        """Replace the rows of `course_ids` with those of the state store.
+
+        Every course of the report in the store by default. Rows are
+        copied and typed by SQLite, in a single transaction, without
+        going through Python objects.
+        """
+        columns = [c for c in report.columns if c != "course_id"]
+        extract = ", ".join(
+            f"json_extract(data, '$.{c}')" for c in columns
+        )
+        with self._lock, span("store"):
+            self._db.execute("ATTACH DATABASE ? AS state", (state.path,))
+            try:
+                with self._db:
+                    self._db.execute("BEGIN")
+                    if course_ids is None:
+                        course_ids = [
+                            row[0]
+                            for row in self._db.execute(
+                                "SELECT DISTINCT course_id FROM state.rows"
+                                " WHERE report = ?",
+                                (report.name,),
+                            )
+                        ]
+                    self._select(course_ids)
+                    self._db.execute(
+                        f"DELETE FROM {report.name} WHERE course_id IN"
+                        " (SELECT course_id FROM selected_courses)"
+                    )
+                    inserted = self._db.execute(
+                        f"INSERT INTO {report.name}"
+                        f" (course_id, key, {', '.join(columns)})"
+                        f" SELECT course_id, key, {extract}"
+                        " FROM state.rows WHERE report = ? AND course_id IN"
+                        " (SELECT course_id FROM selected_courses)",
+                        (report.name,),
+                    ).rowcount
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO mirror_syncs"
+                        " SELECT ?, course_id, ? FROM selected_courses",
+                        (report.name, format_mark(self.clock())),
+                    )
+            finally:
+                self._db.execute("DETACH DATABASE state")
+        log.debug(
+            f"mirrored {inserted} {report.name} rows"
+            f" of {len(course_ids)} courses"
+        )
+        return inserted
+
+    def load_courses(self, courses: Iterable[Record]) -> int:
+        rows = [
+            (str(c["id"]), *(c.get(k) for k in COURSE_COLUMNS[1:]))
+            for c in courses
+        ]
+        marks = ", ".join("?" * len(COURSE_COLUMNS))
+        with self._lock, self._db:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                f"INSERT OR REPLACE INTO courses VALUES ({marks})", rows
+            )
+        return len(rows)
+
+    def expire(self) -> int:
+        """Drop the rows of courses synced longer than the retention ago,
+        returns the number of (report, course) pairs dropped"""
+        if not self.retention_days:
+            return 0
+        cutoff = format_mark(
+            self.clock() - timedelta(days=self.retention_days)
+        )
+        with self._lock, self._db:
+            self._db.execute("BEGIN")
+            expired = self._db.execute(
+                "SELECT entity, course_id FROM mirror_syncs"
+                " WHERE synced_at < ?",
+                (cutoff,),
+            ).fetchall()
+            for entity, course_id in expired:
+                self._db.execute(
+                    f"DELETE FROM {entity} WHERE course_id = ?", (course_id,)
+                )
+            self._db.execute(
+                "DELETE FROM mirror_syncs WHERE synced_at < ?", (cutoff,)
+            )
+        if expired:
+            log.info(f"expired {len(expired)} mirrored report courses")
+        return len(expired)
+
+    def rows(
+        self, report: Report, course_ids: Optional[Sequence[str]] = None
+    ) -> Iterator[Record]:
+        """A report's rows from the mirror, ordered by course and key"""
+        rows = self.query(
+            f"SELECT {', '.join(report.columns)} FROM {report.name}"
+            " JOIN selected_courses USING (course_id)"
+            " ORDER BY course_id, key",
+            course_ids=course_ids,
+        )[1]
+        booleans = [c for c in report.columns if c in _BOOLEAN]
+        for row in rows:
+            for column in booleans:
+                if row[column] is not None:
+                    row[column] = bool(row[column])
+            yield row
+
+    def query(
+        self,
+        sql: str,
+        params: Sequence[Any] = (),
+        course_ids: Optional[Sequence[str]] = None,
+    ) -> Tuple[List[str], Iterator[Record]]:
+        """Run a query, returns its column names and a stream of its rows.
+
+        The selected_courses table holds `course_ids`, every mirrored
+        course by default, for the query to join on.
+        """
+        with self._lock:
+            if course_ids is None:
+                course_ids = [
+                    row[0]
+                    for row in self._db.execute(
+                        "SELECT DISTINCT course_id FROM mirror_syncs"
+                    )
+                ]
+            self._select(course_ids)
+            cursor = self._db.cursor()
+            cursor.execute(sql, params)
+        columns = [d[0] for d in cursor.description or ()]
+        return columns, (dict(zip(columns, row)) for row in cursor)
+
+    def courses(self) -> Dict[str, int]:
+        """Courses mirrored per report"""
+        return dict(
+            self._db.execute(
+                "SELECT entity, COUNT(*) FROM mirror_syncs GROUP BY entity"
+            ).fetchall()
+        )
+
+    def _select(self, course_ids: Sequence[str]):
+        self._db.execute("DELETE FROM selected_courses")
+        self._db.executemany(
+            "INSERT OR IGNORE INTO selected_courses VALUES (?)",
+            [(str(c),) for c in course_ids],
+        )
+
+    def close(self):
+        self._db.close()
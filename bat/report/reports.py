@@ -0,0 +1,196 @@
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    TYPE_CHECKING,
+)
+
+from ..lib.canvas import CanvasClient, Params
+from ..lib.paginate import Paginator, next_url, paginate
+from .bulk import BulkExport
+
+
+if TYPE_CHECKING:
+    from ..lib.aio import AsyncCanvasClient
+
+
+Record = Dict[str, Any]
+# where a fetch stands: the query it is at, and the next page of it, None
+# for its first
+Cursor = Tuple[int, Optional[str]]
+
+
+class Report:
+    """A per-course Canvas collection, fetched incrementally.
+
+    `since_params` name the API filters that limit a listing to records
+    changed after a point in time, ex: graded_since. Each filter is queried
+    on its own and the results merged, so a record changed in any way the
+    filters cover is picked up. Reports without filters re-fetch the whole
+    collection, and it replaces the previous output.
+
+    Reports with a `bulk` export may instead be synced for a whole account
+    from a Canvas account report, see ReportRunner.sync_bulk. Their keys
+    must then be derived from fields both sources provide.
+    """
+
+    name: str
+    path: str
+    params: Tuple[Tuple[str, str], ...] = ()
+    since_params: Tuple[str, ...] = ()
+    columns: Tuple[str, ...] = ("id",)
+    # Arrow type aliases for columnar output, where inference could guess
+    # wrong, ex: a score that is a whole number in the first rows
+    types: Dict[str, str] = {}
+    bulk: Optional[BulkExport] = None
+
+    def key(self, record: Record) -> str:
+        return str(record["id"])
+
+    def full(self, since: Optional[str]) -> bool:
+        """Whether a fetch from `since` returns the whole collection"""
+        return since is None or not self.since_params
+
+    def queries(self, since: Optional[str]) -> List[Params]:
+        """The queries of a fetch, one per since-filter"""
+        if self.full(since):
+            return [list(self.params)]
+        return [[*self.params, (name, since)] for name in self.since_params]
+
+    def fetch(
+        self, client: CanvasClient, course_id: str, since: Optional[str]
+    ) -> Iterator[Record]:
+        path = self.path.format(course_id=course_id)
+        for params in self.queries(since):
+            yield from paginate(client, path, params)
+
+    def fetch_pages(
+        self,
+        client: CanvasClient,
+        course_id: str,
+        since: Optional[str],
+        cursor: Cursor = (0, None),
+    ) -> Iterator[Tuple[List[Record], Cursor]]:
+        """fetch, a page at a time, from `cursor`.
+
+        Each page comes with the cursor of the page after it, the fetch
+        resumes from there. Canvas next links are opaque bookmarks, so a
+        cursor stays valid across runs.
+        """
+        path = self.path.format(course_id=course_id)
+        queries = self.queries(since)
+        first, start = cursor
+        for n in range(first, len(queries)):
+            pages = Paginator(
+                client, path, queries[n], start=start if n == first else None
+            )
+            for response in pages.pages():
+                url = next_url(response)
+                after = (n, url) if url else (n + 1, None)
+                yield pages.records(response), after
+
+    async def afetch(
+        self, client: "AsyncCanvasClient", course_id: str, since: Optional[str]
+    ) -> AsyncIterator[Record]:
+        """fetch, over an AsyncCanvasClient"""
+        from ..lib.aio import apaginate
+
+        path = self.path.format(course_id=course_id)
+        for params in self.queries(since):
+            async for record in apaginate(client, path, params):
+                yield record
+
+    def row(self, record: Record) -> Record:
+        """Flatten a record to the report's output columns"""
+        return {column: record.get(column) for column in self.columns}
+
+
+class Submissions(Report):
+    name = "submissions"
+    path = "/api/v1/courses/{course_id}/students/submissions"
+    params = (("student_ids[]", "all"),)
+    since_params = ("submitted_since", "graded_since")
+    columns = (
+        "course_id",
+        "assignment_id",
+        "user_id",
+        "workflow_state",
+        "score",
+        "grade",
+        "submitted_at",
+        "graded_at",
+        "late",
+        "missing",
+    )
+    types = {"score": "float64", "grade": "string"}
+
+    def key(self, record: Record) -> str:
+        return f"{record['assignment_id']}:{record['user_id']}"
+
+
+class Enrollments(Report):
+    """Enrollments of a course, re-fetched in full on every run.
+
+    Canvas's list-enrollments endpoint has no filter by time of change,
+    so there is no incremental fetch. The bulk export is the cheaper way
+    to sync a whole account.
+    """
+
+    name = "enrollments"
+    path = "/api/v1/courses/{course_id}/enrollments"
+    params = (("state[]", "active"), ("state[]", "completed"))
+    columns = (
+        "course_id",
+        "id",
+        "user_id",
+        "course_section_id",
+        "type",
+        "enrollment_state",
+        "updated_at",
+    )
+    # the enrollments of the provisioning report carry no enrollment id
+    bulk = BulkExport(
+        report="provisioning_csv",
+        parameters=(("parameters[enrollments]", "true"),),
+        fields={
+            "canvas_course_id": "course_id",
+            "canvas_user_id": "user_id",
+            "canvas_section_id": "course_section_id",
+            "role_id": "role_id",
+            "base_role_type": "type",
+            "status": "enrollment_state",
+        },
+        integers=("course_id", "user_id", "course_section_id", "role_id"),
+        keep={"status": ("active", "completed")},
+    )
+
+    def key(self, record: Record) -> str:
+        return (
+            f"{record['course_section_id']}:{record['user_id']}"
+            f":{record.get('role_id') or record.get('type')}"
+        )
+
+
+class Assignments(Report):
+    name = "assignments"
+    path = "/api/v1/courses/{course_id}/assignments"
+    columns = (
+        "course_id",
+        "id",
+        "name",
+        "points_possible",
+        "due_at",
+        "published",
+        "updated_at",
+    )
+    types = {"points_possible": "float64"}
+
+
+REPORTS: Dict[str, Type[Report]] = {
+    report.name: report for report in (Submissions, Enrollments, Assignments)
+}
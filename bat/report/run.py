@@ -0,0 +1,263 @@
+from typing import (
+    Callable,
+    Dict,
+    Iterator,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+    TYPE_CHECKING,
+)
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+from logging import getLogger
+
+from ..lib.canvas import CanvasClient
+from ..logconf import log_context
+from ..lib.paginate import paginate
+from .bulk import AccountReport
+from .reports import Record, Report
+from .state import StateStore
+
+
+if TYPE_CHECKING:
+    from ..lib.aio import AsyncCanvasClient
+    from .checkpoint import Job, Progress
+
+
+log = getLogger(__name__)
+
+# how far behind the start of a sync its high-water mark is set, covering
+# clock skew with the Canvas servers and records written during the sync
+OVERLAP = timedelta(minutes=5)
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def format_mark(when: datetime) -> str:
+    return when.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class ReportRunner:
+    """Sync reports course by course from their last high-water mark.
+
+    With an AsyncCanvasClient, courses are synced with sync_course_async.
+    Given a `job`, see bat.report.checkpoint, a course checkpoints each
+    page once stored, and a course the job completed is skipped.
+    """
+
+    def __init__(
+        self,
+        client: Union[CanvasClient, "AsyncCanvasClient"],
+        state: StateStore,
+        clock: Callable[[], datetime] = utcnow,
+        overlap: timedelta = OVERLAP,
+    ):
+        self.client = client
+        self.state = state
+        self.clock = clock
+        self.overlap = overlap
+
+    def sync(
+        self,
+        report: Report,
+        course_ids: Sequence[str],
+        full: bool = False,
+        job: Optional["Job"] = None,
+    ) -> Dict[str, int]:
+        """Sync every course, returns the records fetched per course"""
+        return {
+            course_id: self.sync_course(report, course_id, full, job)
+            for course_id in course_ids
+        }
+
+    def sync_course(
+        self,
+        report: Report,
+        course_id: str,
+        full: bool = False,
+        job: Optional["Job"] = None,
+    ) -> int:
+        if job is not None:
+            return self._sync_checkpointed(report, course_id, full, job)
+        since, mark = self._start(report, course_id, full)
+
+        def keyed():
+            for record in report.fetch(self.client, course_id, since):
+                yield self._keyed(report, course_id, record)
+
+        with log_context(course_id=course_id):
+            count = self._save(report, since)(
+                report.name, course_id, keyed(), mark
+            )
+            self._done(report, course_id, since, count)
+        return count
+
+    def _sync_checkpointed(
+        self, report: Report, course_id: str, full: bool, job: "Job"
+    ) -> int:
+        progress = self._progress(report, course_id, full, job)
+        if progress.done:
+            return progress.fetched
+        fetched = progress.fetched
+        # a full fetch is staged, pages and all, and swapped in once done
+        full = report.full(progress.since)
+        store = self.state.stage if full else self.state.store
+        with log_context(course_id=course_id):
+            for records, cursor in report.fetch_pages(
+                self.client, course_id, progress.since, progress.cursor
+            ):
+                fetched += store(
+                    report.name,
+                    course_id,
+                    [self._keyed(report, course_id, r) for r in records],
+                )
+                job.advance(report.name, course_id, cursor, fetched)
+            if full:
+                self.state.swap(report.name, course_id, progress.mark)
+            else:
+                self.state.set_mark(report.name, course_id, progress.mark)
+            job.complete(report.name, course_id, fetched)
+            self._done(report, course_id, progress.since, fetched)
+        return fetched
+
+    def _progress(
+        self, report: Report, course_id: str, full: bool, job: "Job"
+    ) -> "Progress":
+        """The course's progress in `job`, starting it if need be"""
+        progress = job.progress(report.name, course_id)
+        if progress is None:
+            # rows staged by a job that did not complete
+            self.state.unstage(report.name, course_id)
+            return job.begin(
+                report.name, course_id, *self._start(report, course_id, full)
+            )
+        if progress.done:
+            log.info(f"{report.name}: course {course_id} done, skipped")
+        return progress
+
+    async def sync_course_async(
+        self,
+        report: Report,
+        course_id: str,
+        full: bool = False,
+        job: Optional["Job"] = None,
+    ) -> int:
+        """sync_course over an AsyncCanvasClient.
+
+        The course's records are gathered before they are merged, the
+        store is written from a worker thread not to block the event loop.
+        With a `job`, a course not completed is fetched again whole, from
+        the high-water mark it started from.
+        """
+        if job is None:
+            since, mark = self._start(report, course_id, full)
+        else:
+            progress = self._progress(report, course_id, full, job)
+            if progress.done:
+                return progress.fetched
+            since, mark = progress.since, progress.mark
+        with log_context(course_id=course_id):
+            records = [
+                self._keyed(report, course_id, record)
+                async for record in report.afetch(
+                    self.client, course_id, since
+                )
+            ]
+            count = await asyncio.get_running_loop().run_in_executor(
+                None,
+                self._save(report, since),
+                report.name,
+                course_id,
+                records,
+                mark,
+            )
+            if job is not None:
+                job.complete(report.name, course_id, count)
+            self._done(report, course_id, since, count)
+        return count
+
+    def _start(
+        self, report: Report, course_id: str, full: bool
+    ) -> Tuple[Optional[str], str]:
+        """The high-water mark to fetch from, and the one to set after"""
+        if full:
+            self.state.reset(report.name, course_id)
+        since = self.state.mark(report.name, course_id)
+        return since, format_mark(self.clock() - self.overlap)
+
+    def _save(
+        self, report: Report, since: Optional[str]
+    ) -> Callable[..., int]:
+        """How a fetch is stored: merged over the course's rows, or in
+        their place when it is the whole collection"""
+        if report.full(since):
+            return self.state.replace_course
+        return self.state.merge
+
+    @staticmethod
+    def _keyed(
+        report: Report, course_id: str, record: Record
+    ) -> Tuple[str, Record]:
+        record.setdefault("course_id", course_id)
+        return report.key(record), record
+
+    @staticmethod
+    def _done(
+        report: Report, course_id: str, since: Optional[str], count: int
+    ):
+        log.info(
+            f"{report.name}: course {course_id}"
+            f" fetched {count} records since {since or 'the start'}"
+        )
+
+    def sync_bulk(
+        self,
+        report: Report,
+        account_id: str,
+        course_ids: Optional[Sequence[str]] = None,
+        **options,
+    ) -> Dict[str, int]:
+        """Sync a whole account at once from the report's bulk export.
+
+        An account report is a full snapshot, it replaces the rows of
+        every course it covers, or of just `course_ids` when given.
+        `options` are passed on to AccountReport, ex: timeout. Returns the
+        records stored per course.
+        """
+        if report.bulk is None:
+            raise ValueError(f"{report.name} has no bulk export")
+        mark = format_mark(self.clock() - self.overlap)
+        account = AccountReport(
+            self.client, account_id, report.bulk, **options
+        )
+        wanted = {str(c) for c in course_ids} if course_ids else None
+
+        def keyed():
+            for record in account.records():
+                course_id = str(record["course_id"])
+                if wanted is None or course_id in wanted:
+                    yield course_id, report.key(record), record
+
+        counts = self.state.replace(report.name, keyed(), mark, course_ids)
+        log.info(
+            f"{report.name}: account {account_id} bulk export,"
+            f" {sum(counts.values())} records in {len(counts)} courses"
+        )
+        return counts
+
+    def rows(
+        self, report: Report, course_ids: Sequence[str]
+    ) -> Iterator[Record]:
+        """The merged output of a report, as flat rows"""
+        for record in self.state.records(report.name, course_ids):
+            yield report.row(record)
+
+
+def account_course_records(
+    client: CanvasClient, account_id: str
+) -> Iterator[Record]:
+    return paginate(client, f"/api/v1/accounts/{account_id}/courses")
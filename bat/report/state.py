@@ -0,0 +1,299 @@
+from typing import Any, Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+import json
+import os
+import sqlite3
+import threading
+from logging import getLogger
+
+from ..lib.timings import span
+
+
+log = getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sync_marks (
+    report TEXT NOT NULL,
+    course_id TEXT NOT NULL,
+    synced_at TEXT NOT NULL,
+    PRIMARY KEY (report, course_id)
+);
+CREATE TABLE IF NOT EXISTS rows (
+    report TEXT NOT NULL,
+    course_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (report, course_id, key)
+);
+"""
+
+
+class StateStore:
+    """Report sync points and merged report rows, in a local SQLite file.
+
+    Each (report, course) pair remembers the time of its last successful
+    sync, its high-water mark. Rows fetched since that mark are upserted
+    over the previous output, and the mark only moves once all of them
+    are stored. A full fetch instead replaces the course's rows, so that
+    records deleted in Canvas leave the output.
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.expanduser(path)
+        if directory := os.path.dirname(self.path):
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # fan-out workers each open the store, wait out their writes
+        self._db = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            isolation_level=None,
+            timeout=30,
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    @classmethod
+    def from_config(cls, cfg) -> "StateStore":
+        return cls(cfg.report.state_db)
+
+    def mark(self, report: str, course_id: str) -> Optional[str]:
+        """The high-water mark of the last sync, None if never synced"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT synced_at FROM sync_marks"
+                " WHERE report = ? AND course_id = ?",
+                (report, str(course_id)),
+            ).fetchone()
+        return row[0] if row else None
+
+    def merge(
+        self,
+        report: str,
+        course_id: str,
+        records: Iterable[Tuple[str, Dict[str, Any]]],
+        mark: str,
+        batch_size: int = 500,
+    ) -> int:
+        """Upsert (key, record) pairs, then move the high-water mark.
+
+        `records` is consumed as a stream and written in batches, so the
+        store is not locked while the next batch is fetched. Upserts are
+        idempotent: if the stream fails the mark stays put, and the next
+        run fetches and merges the same records again.
+        """
+        count = self.store(report, course_id, records, batch_size)
+        self.set_mark(report, course_id, mark)
+        log.debug(f"merged {count} {report} rows for course {course_id}")
+        return count
+
+    def store(
+        self,
+        report: str,
+        course_id: str,
+        records: Iterable[Tuple[str, Dict[str, Any]]],
+        batch_size: int = 500,
+    ) -> int:
+        """Upsert (key, record) pairs, leaving the high-water mark put"""
+        course_id = str(course_id)
+        count = 0
+        for batch in _batches(records, batch_size):
+            with self._lock, span("store"):
+                with self._db:
+                    self._db.execute("BEGIN")
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO rows VALUES (?, ?, ?, ?)",
+                        [
+                            (report, course_id, key, json.dumps(record))
+                            for key, record in batch
+                        ],
+                    )
+            count += len(batch)
+        return count
+
+    def replace_course(
+        self,
+        report: str,
+        course_id: str,
+        records: Iterable[Tuple[str, Dict[str, Any]]],
+        mark: str,
+        batch_size: int = 500,
+    ) -> int:
+        """Replace the rows of a course with (key, record) pairs, then move
+        the high-water mark.
+
+        For full fetches: rows the fetch no longer returns are dropped.
+        The records are staged as they stream in and only swapped in once
+        all of them are, so if the stream fails the previous rows stay.
+        """
+        self.unstage(report, course_id)
+        self.stage(report, course_id, records, batch_size)
+        count = self.swap(report, course_id, mark)
+        log.debug(f"replaced {count} {report} rows for course {course_id}")
+        return count
+
+    def stage(
+        self,
+        report: str,
+        course_id: str,
+        records: Iterable[Tuple[str, Dict[str, Any]]],
+        batch_size: int = 500,
+    ) -> int:
+        """Store (key, record) pairs aside, until swap replaces the
+        course's rows with them. Staged rows are kept across runs, so a
+        checkpointed fetch may resume staging."""
+        return self.store(_staged(report), course_id, records, batch_size)
+
+    def unstage(self, report: str, course_id: str):
+        """Drop the rows staged for a course"""
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM rows WHERE report = ? AND course_id = ?",
+                (_staged(report), str(course_id)),
+            )
+
+    def swap(self, report: str, course_id: str, mark: str) -> int:
+        """Replace the rows of a course with those staged, and move its
+        high-water mark, in a single transaction. Returns the rows."""
+        course_id = str(course_id)
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.execute(
+                    "DELETE FROM rows WHERE report = ? AND course_id = ?",
+                    (report, course_id),
+                )
+                count = self._db.execute(
+                    "UPDATE rows SET report = ?"
+                    " WHERE report = ? AND course_id = ?",
+                    (report, _staged(report), course_id),
+                ).rowcount
+                self._db.execute(
+                    "INSERT OR REPLACE INTO sync_marks VALUES (?, ?, ?)",
+                    (report, course_id, mark),
+                )
+        return count
+
+    def set_mark(self, report: str, course_id: str, mark: str):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sync_marks VALUES (?, ?, ?)",
+                (report, str(course_id), mark),
+            )
+
+    def replace(
+        self,
+        report: str,
+        records: Iterable[Tuple[str, str, Dict[str, Any]]],
+        mark: str,
+        course_ids: Optional[Sequence[str]] = None,
+        batch_size: int = 500,
+    ) -> Dict[str, int]:
+        """Replace the rows of every course in a full snapshot.
+
+        `records` are (course_id, key, record) tuples in any order, ex: an
+        account report. They are staged in a temporary table as they
+        stream in, then swapped in for the previous rows of their courses
+        and of `course_ids`, and the courses' marks moved, in a single
+        transaction. Returns the rows stored per course.
+        """
+        with self._lock:
+            self._db.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS staged"
+                " (course_id TEXT, key TEXT, data TEXT,"
+                " PRIMARY KEY (course_id, key))"
+            )
+            self._db.execute("DELETE FROM staged")
+        for batch in _batches(records, batch_size):
+            with self._lock, span("store"):
+                with self._db:
+                    self._db.execute("BEGIN")
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO staged VALUES (?, ?, ?)",
+                        [
+                            (str(course_id), key, json.dumps(record))
+                            for course_id, key, record in batch
+                        ],
+                    )
+
+        with self._lock:
+            counts = dict(
+                self._db.execute(
+                    "SELECT course_id, COUNT(*) FROM staged"
+                    " GROUP BY course_id ORDER BY course_id"
+                ).fetchall()
+            )
+            for course_id in course_ids or ():
+                counts.setdefault(str(course_id), 0)
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.executemany(
+                    "DELETE FROM rows WHERE report = ? AND course_id = ?",
+                    [(report, course_id) for course_id in counts],
+                )
+                self._db.execute(
+                    "INSERT INTO rows SELECT ?, course_id, key, data"
+                    " FROM staged",
+                    (report,),
+                )
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO sync_marks VALUES (?, ?, ?)",
+                    [(report, course_id, mark) for course_id in counts],
+                )
+            self._db.execute("DELETE FROM staged")
+        log.debug(f"replaced {report} rows of {len(counts)} courses")
+        return counts
+
+    def records(
+        self, report: str, course_ids: Optional[Sequence[str]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Stream the merged rows of a report, ordered by course and key"""
+        query = "SELECT data FROM rows WHERE report = ?"
+        params: list = [report]
+        if course_ids is not None:
+            marks = ", ".join("?" * len(course_ids))
+            query += f" AND course_id IN ({marks})"
+            params += [str(c) for c in course_ids]
+        query += " ORDER BY course_id, key"
+
+        # a dedicated cursor, so the caller may write to the store meanwhile
+        cursor = self._db.cursor()
+        for (data,) in cursor.execute(query, params):
+            yield json.loads(data)
+
+    def reset(self, report: str, course_id: Optional[str] = None):
+        """Forget the rows and mark of a report, forcing a full sync"""
+        where, params = "report = ?", [report]
+        if course_id is not None:
+            where += " AND course_id = ?"
+            params.append(str(course_id))
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.execute(f"DELETE FROM rows WHERE {where}", params)
+                self._db.execute(
+                    f"DELETE FROM rows WHERE {where}",
+                    [_staged(report), *params[1:]],
+                )
+                self._db.execute(
+                    f"DELETE FROM sync_marks WHERE {where}", params
+                )
+
+    def close(self):
+        self._db.close()
+
+
+def _staged(report: str) -> str:
+    """The report name rows are staged under, see StateStore.stage"""
+    return f"{report}~staged"
+
+
+def _batches(items: Iterable, size: int) -> Iterator[list]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
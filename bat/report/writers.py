@@ -0,0 +1,376 @@
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Type,
+)
+
+import csv
+import json
+import os
+import sys
+from abc import ABC, abstractmethod
+from itertools import islice
+from logging import getLogger
+
+from ..lib.timings import span
+
+
+log = getLogger(__name__)
+
+Row = Dict[str, Any]
+
+
+class Writer(ABC):
+    """Streams batches of report rows to an output.
+
+    Writers never hold more than one batch, or one row group for the
+    columnar formats, in memory. `path` None writes to stdout where the
+    format allows it. `close` returns the files written.
+    """
+
+    extension = ""
+
+    def __init__(self, path: Optional[str], columns: Sequence[str]):
+        self.path = path
+        self.columns = list(columns)
+        self.rows = 0
+
+    @abstractmethod
+    def write_batch(self, rows: Sequence[Row]):
+        """Write the rows, and count them in `rows`"""
+
+    def close(self) -> List[str]:
+        return [self.path] if self.path else []
+
+    def __enter__(self) -> "Writer":
+        return self
+
+    def __exit__(self, exc_type, *_):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def abort(self):
+        """Release the output after a failure, see close"""
+        self.close()
+
+
+class JsonLinesWriter(Writer):
+    extension = ".jsonl"
+
+    def __init__(self, path: Optional[str], columns: Sequence[str]):
+        super().__init__(path, columns)
+        self._out: IO[str] = open(path, "w") if path else sys.stdout
+
+    def write_batch(self, rows: Sequence[Row]):
+        self._out.write("".join(json.dumps(row) + "\n" for row in rows))
+        self.rows += len(rows)
+
+    def close(self) -> List[str]:
+        if self._out is sys.stdout:
+            self._out.flush()
+        else:
+            self._out.close()
+        return super().close()
+
+
+class CsvWriter(Writer):
+    """CSV, split in files of `chunk_rows` rows each when writing to a path.
+
+    Chunks are named after the path, ex: grades-00000.csv, grades-00001.csv
+    and each starts with the header row. Numbering starts at `start_chunk`,
+    ex: after the chunks of an interrupted run, and `on_chunk` is called
+    with the path and rows of each file once complete: as the next chunk
+    starts, and for the last one on close. A writer aborted by a failure
+    leaves its last chunk unreported.
+    """
+
+    extension = ".csv"
+
+    def __init__(
+        self,
+        path: Optional[str],
+        columns: Sequence[str],
+        chunk_rows: int = 0,
+        start_chunk: int = 0,
+        on_chunk: Optional[Callable[[str, int], None]] = None,
+    ):
+        super().__init__(path, columns)
+        self.chunk_rows = chunk_rows if path else 0
+        self.start_chunk = start_chunk
+        self.on_chunk = on_chunk
+        self.files: List[str] = []
+        self._file: Optional[IO[str]] = None
+        self._csv: Any = None
+        self._chunk_remaining = 0
+        self._chunk_written = 0
+        if not path:
+            self._start(sys.stdout)
+
+    def _start(self, out: IO[str]):
+        self._csv = csv.DictWriter(
+            out, fieldnames=self.columns, extrasaction="ignore"
+        )
+        self._csv.writeheader()
+
+    def _end_chunk(self, complete: bool = True):
+        self._file.close()
+        self._file = None
+        if complete and self.on_chunk is not None:
+            self.on_chunk(self.files[-1], self._chunk_written)
+
+    def _next_chunk(self):
+        if self._file is not None:
+            self._end_chunk()
+        if self.chunk_rows:
+            stem, ext = os.path.splitext(self.path)
+            n = self.start_chunk + len(self.files)
+            path = f"{stem}-{n:05d}{ext or self.extension}"
+        else:
+            path = self.path
+        self.files.append(path)
+        self._file = open(path, "w", newline="")
+        self._start(self._file)
+        self._chunk_remaining = self.chunk_rows
+        self._chunk_written = 0
+
+    def write_batch(self, rows: Sequence[Row]):
+        if not self.path:
+            self._csv.writerows(rows)
+            self.rows += len(rows)
+            return
+
+        start = 0
+        while start < len(rows):
+            if self._file is None or (
+                self.chunk_rows and self._chunk_remaining <= 0
+            ):
+                self._next_chunk()
+            if self.chunk_rows:
+                end = start + self._chunk_remaining
+            else:
+                end = len(rows)
+            self._write(rows[start:end])
+            start = end
+
+    def _write(self, rows: List[Row]):
+        self._csv.writerows(rows)
+        self.rows += len(rows)
+        self._chunk_remaining -= len(rows)
+        self._chunk_written += len(rows)
+
+    def close(self) -> List[str]:
+        if not self.path:
+            sys.stdout.flush()
+            return []
+        if not self.files:
+            # no rows at all, still leave a file with the header
+            self._next_chunk()
+        if self._file is not None:
+            self._end_chunk()
+        return list(self.files)
+
+    def abort(self):
+        if self._file is not None:
+            self._end_chunk(complete=False)
+        elif not self.path:
+            sys.stdout.flush()
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise RuntimeError(
+            "columnar output requires pyarrow:"
+            " pip install 'bat-canvas[arrow]'"
+        )
+    return pyarrow
+
+
+class _ArrowWriter(Writer):
+    """Buffers rows into Arrow record batches of `row_group_size` rows.
+
+    Column `types` are Arrow type aliases, ex: {"score": "float64"}. Other
+    column types are inferred from the first group, columns entirely null
+    in it are written as strings since their type is unknown.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str],
+        columns: Sequence[str],
+        row_group_size: int = 65536,
+        types: Optional[Dict[str, str]] = None,
+    ):
+        if not path:
+            raise ValueError(f"{self.extension} output requires a path")
+        super().__init__(path, columns)
+        self.pa = _pyarrow()
+        self.row_group_size = row_group_size
+        self.types = dict(types or {})
+        self.schema = None
+        self._as_text: List[str] = []
+        self._buffer: List[Row] = []
+        self._sink: Any = None
+
+    def write_batch(self, rows: Sequence[Row]):
+        self._buffer.extend(rows)
+        while len(self._buffer) >= self.row_group_size:
+            group = self._buffer[: self.row_group_size]
+            del self._buffer[: self.row_group_size]
+            self._write_group(group)
+
+    def _write_group(self, rows: List[Row]):
+        pa = self.pa
+        if self.schema is None:
+            sample = pa.Table.from_pylist(rows).schema
+            fields = []
+            for column in self.columns:
+                if column in self.types:
+                    kind = pa.type_for_alias(self.types[column])
+                elif column in sample.names:
+                    kind = sample.field(column).type
+                else:
+                    kind = pa.null()
+                if pa.types.is_null(kind):
+                    self._as_text.append(column)
+                    kind = pa.string()
+                fields.append(pa.field(column, kind))
+            self.schema = pa.schema(fields)
+            self._sink = self._open(self.schema)
+        if self._as_text:
+            rows = [_stringify(row, self._as_text) for row in rows]
+        table = pa.Table.from_pylist(rows, schema=self.schema)
+        self._write_table(table)
+        self.rows += len(rows)
+
+    @abstractmethod
+    def _open(self, schema):
+        """The sink of the output, opened with the schema"""
+
+    @abstractmethod
+    def _write_table(self, table):
+        """Write an Arrow table of one row group to the sink"""
+
+    def close(self) -> List[str]:
+        if self._buffer or self.schema is None:
+            self._write_group(self._buffer)
+            self._buffer = []
+        if self._sink is not None:
+            self._sink.close()
+            self._sink = None
+        return super().close()
+
+    def abort(self):
+        """Drop the pending rows and the file: closed, a partial file would
+        read as a complete report"""
+        self._buffer = []
+        if self._sink is not None:
+            self._sink.close()
+            self._sink = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _stringify(row: Row, columns: Sequence[str]) -> Row:
+    row = dict(row)
+    for column in columns:
+        if (value := row.get(column)) is not None:
+            row[column] = str(value)
+    return row
+
+
+class ParquetWriter(_ArrowWriter):
+    extension = ".parquet"
+
+    def _open(self, schema):
+        return self.pa.parquet.ParquetWriter(self.path, schema)
+
+    def _write_table(self, table):
+        self._sink.write_table(table, row_group_size=self.row_group_size)
+
+
+class ArrowWriter(_ArrowWriter):
+    """Arrow IPC file format, readable with pyarrow.ipc.open_file"""
+
+    extension = ".arrow"
+
+    def _open(self, schema):
+        return self.pa.ipc.new_file(self.path, schema)
+
+    def _write_table(self, table):
+        self._sink.write_table(table, max_chunksize=self.row_group_size)
+
+
+WRITERS: Dict[str, Type[Writer]] = {
+    "jsonl": JsonLinesWriter,
+    "csv": CsvWriter,
+    "parquet": ParquetWriter,
+    "arrow": ArrowWriter,
+}
+
+
+def get_writer(
+    output_format: str,
+    path: Optional[str],
+    columns: Sequence[str],
+    chunk_rows: int = 0,
+    row_group_size: int = 65536,
+    types: Optional[Dict[str, str]] = None,
+    **chunks: Any,
+) -> Writer:
+    """`chunks` are CsvWriter's start_chunk and on_chunk, or ignored"""
+    if output_format not in WRITERS:
+        raise ValueError(
+            f"unknown output format {output_format!r},"
+            f" choose from {', '.join(WRITERS)}"
+        )
+    if output_format == "csv":
+        return CsvWriter(path, columns, chunk_rows=chunk_rows, **chunks)
+    if output_format in ("parquet", "arrow"):
+        return WRITERS[output_format](
+            path, columns, row_group_size=row_group_size, types=types
+        )
+    return WRITERS[output_format](path, columns)
+
+
+def writer_from_config(
+    cfg,
+    path: Optional[str],
+    columns: Sequence[str],
+    types: Optional[Dict[str, str]] = None,
+    **chunks: Any,
+) -> Writer:
+    report = cfg.report
+    return get_writer(
+        report.output_format,
+        path,
+        columns,
+        chunk_rows=int(report.chunk_rows),
+        row_group_size=int(report.row_group_size),
+        types=types,
+        **chunks,
+    )
+
+
+def write_rows(
+    writer: Writer, rows: Iterable[Row], batch_size: int = 1000
+) -> int:
+    """Stream rows to `writer` in batches, returns the number written"""
+    rows = iter(rows)
+    count = 0
+    while batch := list(islice(rows, batch_size)):
+        with span("write"):
+            writer.write_batch(batch)
+        count += len(batch)
+    return count
@@ -0,0 +1,161 @@
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import AsyncMock, Mock
+
+import asyncio
+import ssl
+import threading
+import time
+from tempfile import TemporaryDirectory
+
+from ..lib.aio import AsyncCanvasClient, AsyncConnection, apaginate
+from ..lib.cache import ResponseCache
+from ..lib.canvas import CanvasAPIError, RateLimitBackoff
+from .fake_canvas import FakeCanvas, json_reply, paginated
+
+
+SRC = "bat.lib.aio"
+
+
+class AsyncConnectionTests(IsolatedAsyncioTestCase):
+
+    async def exchange(t, reply: bytes, method="GET"):
+        reader = asyncio.StreamReader()
+        reader.feed_data(reply)
+        reader.feed_eof()
+        writer = Mock(asyncio.StreamWriter, drain=AsyncMock())
+        conn = AsyncConnection(reader, writer, "canvas.test")
+        ret = await conn.request(method, "/x?a=1", {"Accept": "*/*"})
+        sent = b"".join(c.args[0] for c in writer.write.call_args_list)
+        return ret, sent
+
+    async def test_content_length(t):
+        (status, headers, body, close), sent = await t.exchange(
+            b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nLink: <u>\r\n\r\n[]"
+        )
+        t.assertEqual((status, body, close), (200, b"[]", False))
+        t.assertEqual(headers["link"], "<u>")
+        t.assertTrue(sent.startswith(b"GET /x?a=1 HTTP/1.1\r\n"))
+        t.assertIn(b"Host: canvas.test\r\n", sent)
+
+    async def test_chunked(t):
+        (status, _, body, close), _ = await t.exchange(
+            b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+            b"3\r\n[1,\r\n2;ext=1\r\n2]\r\n0\r\n\r\n"
+        )
+        t.assertEqual(body, b"[1,2]")
+        t.assertFalse(close)
+
+    async def test_close_delimited(t):
+        (_, _, body, close), _ = await t.exchange(
+            b"HTTP/1.0 200 OK\r\n\r\nuntil eof"
+        )
+        t.assertEqual((body, close), (b"until eof", True))
+
+    async def test_closed(t):
+        with t.assertRaises(ConnectionResetError):
+            await t.exchange(b"")
+
+
+class AsyncCanvasClientTests(IsolatedAsyncioTestCase):
+
+    def setUp(t):
+        t.server = FakeCanvas(
+            routes={
+                "/api/v1/courses": lambda h: json_reply([{"id": 1}]),
+                "/api/v1/items": paginated([{"id": n} for n in range(25)]),
+                "/missing": lambda h: json_reply({}, 404),
+            }
+        )
+        t.addCleanup(t.server.close)
+
+    async def test_get_json_keep_alive(t):
+        async with AsyncCanvasClient(t.server.url, "token") as client:
+            for _ in range(3):
+                ret = await client.get_json("/api/v1/courses")
+            t.assertEqual(ret, [{"id": 1}])
+            t.assertEqual(
+                client.pool("http", t.server.url[len("http://"):]).created, 1
+            )
+        t.assertEqual(len(t.server.connections), 1)
+
+    async def test_error(t):
+        async with AsyncCanvasClient(t.server.url, "token") as client:
+            with t.assertRaises(CanvasAPIError) as ctx:
+                await client.get("/missing")
+        t.assertEqual(ctx.exception.status, 404)
+
+    async def test_paginate(t):
+        async with AsyncCanvasClient(t.server.url, "token") as client:
+            pages = apaginate(client, "/api/v1/items", per_page=10)
+            ret = [record async for record in pages]
+        t.assertEqual(ret, [{"id": n} for n in range(25)])
+        t.assertEqual(len(t.server.requests), 3)
+        with t.assertRaises(TypeError):
+            list(pages)
+
+    async def test_rate_limited(t):
+        replies = [
+            json_reply("403 Forbidden (Rate Limit Exceeded)", 403),
+            json_reply({"ok": True}, X_Rate_Limit_Remaining="650.0"),
+        ]
+        t.server.routes["/self"] = lambda h: replies.pop(0)
+        client = AsyncCanvasClient(
+            t.server.url, "token", backoff=RateLimitBackoff(delay=0.01)
+        )
+        async with client:
+            t.assertEqual(await client.get_json("/self"), {"ok": True})
+        t.assertEqual(client.backoff.remaining, 650)
+
+    async def test_bounded_concurrency(t):
+        """hundreds of requests from one thread, at most `concurrency`"""
+        t.server.latency = 0.05
+        async with AsyncCanvasClient(
+            t.server.url, "token", concurrency=50
+        ) as client:
+            start = time.perf_counter()
+            responses = await client.get_many(["/api/v1/courses"] * 200)
+            elapsed = time.perf_counter() - start
+
+        t.assertEqual(len(responses), 200)
+        t.assertLessEqual(t.server.max_in_flight, 50)
+        t.assertGreater(t.server.max_in_flight, 8)
+        # 200 requests at 50ms each: 10s serially, ~0.2s with 50 in flight
+        t.assertLess(elapsed, 2.0)
+
+    async def test_cache_off_the_loop(t):
+        t.server.routes["/etag"] = lambda h: (
+            (304, {"ETag": '"v1"'}, b"")
+            if h.headers.get("If-None-Match") == '"v1"'
+            else json_reply({"ok": True}, ETag='"v1"')
+        )
+        loop_thread = threading.get_ident()
+        threads = []
+        with TemporaryDirectory() as tmp:
+            cache = ResponseCache(tmp)
+            for name in ("get", "put", "revalidated"):
+                method = getattr(cache, name)
+
+                def called(*args, method=method):
+                    threads.append(threading.get_ident())
+                    return method(*args)
+
+                setattr(cache, name, called)
+            async with AsyncCanvasClient(
+                t.server.url, "token", cache=cache
+            ) as client:
+                await client.get("/etag")
+                ret = await client.get("/etag")
+        t.assertTrue(ret.from_cache)
+        # get, put, then get and revalidated
+        t.assertEqual(len(threads), 4)
+        t.assertNotIn(loop_thread, threads)
+
+    def test_shared_tls_context(t):
+        client = AsyncCanvasClient("https://canvas.test", "token")
+        t.assertIsInstance(client.tls, ssl.SSLContext)
+        pools = [
+            client.pool("https", "canvas.test"),
+            client.pool("https", "files.canvas.test"),
+        ]
+        t.assertEqual([pool.tls for pool in pools], [client.tls] * 2)
+        t.assertIsNone(AsyncCanvasClient("http://canvas.test", "t").tls)
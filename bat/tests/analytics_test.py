@@ -0,0 +1,224 @@
+from unittest import TestCase, skipUnless
+
+import random
+import statistics
+import time
+from collections import defaultdict
+from tempfile import TemporaryDirectory
+
+from ..report import StateStore
+
+try:
+    import numpy as np
+
+    from ..analytics import (
+        GRADE_EDGES,
+        GradeReport,
+        SubmissionColumns,
+        grade_stats,
+        stats_rows,
+    )
+except ImportError:
+    np = None
+
+
+SRC = "bat.analytics"
+
+
+def synthetic_submissions(count, courses=20, assignments=25, seed=7):
+    rand = random.Random(seed)
+    for n in range(count):
+        graded = rand.random() > 0.1
+        yield dict(
+            course_id=n % courses,
+            assignment_id=(n // courses) % assignments,
+            user_id=n,
+            score=round(rand.uniform(0, 10), 1) if graded else None,
+            late=rand.random() < 0.15,
+            missing=not graded and rand.random() < 0.5,
+        )
+
+
+def naive_grade_stats(records, points_possible):
+    """Per-assignment statistics, one Python loop over submission dicts"""
+    groups = defaultdict(list)
+    for r in records:
+        groups[(r["course_id"], r["assignment_id"])].append(r)
+
+    ret = {}
+    for key, subs in sorted(groups.items()):
+        scores = sorted(s["score"] for s in subs if s["score"] is not None)
+        buckets = [0] * (len(GRADE_EDGES) + 1)
+        for score in scores:
+            percent = score / points_possible[key] * 100
+            buckets[sum(percent >= edge for edge in GRADE_EDGES)] += 1
+        ret[key] = dict(
+            count=len(subs),
+            graded=len(scores),
+            mean=statistics.fmean(scores) if scores else None,
+            p50=statistics.median(scores) if scores else None,
+            missing_rate=sum(s["missing"] for s in subs) / len(subs),
+            late_rate=sum(s["late"] for s in subs) / len(subs),
+            buckets=buckets,
+        )
+    return ret
+
+
+@skipUnless(np, "requires numpy")
+class GradeStatsTests(TestCase):
+
+    def test_small(t):
+        records = [
+            dict(course_id=1, assignment_id=1, user_id=1, score=10.0),
+            dict(course_id=1, assignment_id=1, user_id=2, score=6.5),
+            dict(course_id=1, assignment_id=1, user_id=3, score=None,
+                 missing=True),
+            dict(course_id=1, assignment_id=1, user_id=4, score=8.0,
+                 late=True),
+            dict(course_id=1, assignment_id=2, user_id=1, score=None),
+        ]
+        columns = SubmissionColumns.from_records(
+            records,
+            points_possible={(1, 1): 10.0},
+            sections={(1, 1): 5, (1, 2): 5},
+        )
+        t.assertEqual(columns.section_id.tolist(), [5, 5, -1, -1, 5])
+
+        rows = list(stats_rows(grade_stats(columns)))
+
+        t.assertEqual(len(rows), 2)
+        first, second = rows
+        t.assertEqual(first["assignment_id"], 1)
+        t.assertEqual(first["count"], 4)
+        t.assertEqual(first["graded"], 3)
+        t.assertAlmostEqual(first["mean"], 24.5 / 3)
+        t.assertEqual((first["min"], first["p50"], first["max"]), (6.5, 8, 10))
+        t.assertEqual(first["p25"], np.percentile([6.5, 8, 10], 25))
+        t.assertEqual(first["missing_rate"], 0.25)
+        t.assertEqual(first["late_rate"], 0.25)
+        t.assertEqual(
+            [first[b] for b in ("grade_f", "grade_d", "grade_b", "grade_a")],
+            [0, 1, 1, 1],
+        )
+        # no graded submissions
+        t.assertIsNone(second["mean"])
+        t.assertIsNone(second["p90"])
+        t.assertEqual(second["grade_a"], 0)
+
+    def test_by_section(t):
+        records = [
+            dict(course_id=1, assignment_id=1, user_id=u, score=u)
+            for u in range(4)
+        ]
+        columns = SubmissionColumns.from_records(
+            records, sections={(1, 0): 10, (1, 1): 10, (1, 2): 11}
+        )
+        stats = grade_stats(
+            columns, by=("course_id", "section_id", "assignment_id")
+        )
+        t.assertEqual(stats["section_id"].tolist(), [-1, 10, 11])
+        t.assertEqual(stats["count"].tolist(), [1, 2, 1])
+        t.assertEqual(stats["mean"].tolist(), [3.0, 0.5, 2.0])
+
+    def test_empty(t):
+        columns = SubmissionColumns.from_records([])
+        t.assertEqual(list(stats_rows(grade_stats(columns))), [])
+
+    def test_matches_naive_loop(t):
+        records = list(synthetic_submissions(5000))
+        points = {(c, a): 10.0 for c in range(20) for a in range(25)}
+
+        expected = naive_grade_stats(records, points)
+        columns = SubmissionColumns.from_records(records, points)
+        rows = list(stats_rows(grade_stats(columns)))
+
+        t.assertEqual(len(rows), len(expected))
+        for row in rows:
+            want = expected[(row["course_id"], row["assignment_id"])]
+            t.assertEqual(row["count"], want["count"])
+            t.assertEqual(row["graded"], want["graded"])
+            t.assertAlmostEqual(row["mean"], want["mean"])
+            t.assertAlmostEqual(row["p50"], want["p50"])
+            t.assertAlmostEqual(row["missing_rate"], want["missing_rate"])
+            t.assertAlmostEqual(row["late_rate"], want["late_rate"])
+            t.assertEqual(
+                [row[f"grade_{g}"] for g in "fdcba"], want["buckets"]
+            )
+
+
+@skipUnless(np, "requires numpy")
+class GradeStatsBenchmark(TestCase):
+
+    def test_vectorized_beats_naive_loop(t):
+        """200k synthetic submissions, 500 assignments
+
+        Column loading is a one time cost, shared by every grouping of
+        the same submissions, so only the statistics are compared.
+        """
+        records = list(synthetic_submissions(200_000))
+        points = {(c, a): 10.0 for c in range(20) for a in range(25)}
+
+        start = time.perf_counter()
+        naive_grade_stats(records, points)
+        naive = time.perf_counter() - start
+
+        start = time.perf_counter()
+        columns = SubmissionColumns.from_records(records, points)
+        loaded = time.perf_counter()
+        grade_stats(columns)
+        vectorized = time.perf_counter() - loaded
+        load = loaded - start
+
+        print(
+            f"\ngrade stats, {len(records)} submissions:"
+            f" naive loop {naive:.3f}s,"
+            f" vectorized {vectorized:.3f}s + {load:.3f}s column load"
+        )
+        t.assertLess(vectorized * 3, naive)
+
+
+@skipUnless(np, "requires numpy")
+class GradeReportTests(TestCase):
+
+    def test_rows(t):
+        with TemporaryDirectory() as tmp:
+            state = StateStore(f"{tmp}/state.sqlite")
+            state.merge(
+                "submissions",
+                "3",
+                [
+                    ("1:1", dict(course_id="3", assignment_id=1, user_id=1,
+                                 score=9)),
+                    ("1:2", dict(course_id="3", assignment_id=1, user_id=2,
+                                 score=4)),
+                ],
+                "m",
+            )
+            state.merge(
+                "assignments",
+                "3",
+                [("1", dict(course_id="3", id=1, points_possible=10))],
+                "m",
+            )
+            state.merge(
+                "enrollments",
+                "3",
+                [
+                    ("7", dict(course_id="3", id=7, user_id=1,
+                               course_section_id=40)),
+                    ("8", dict(course_id="3", id=8, user_id=2,
+                               course_section_id=41)),
+                ],
+                "m",
+            )
+
+            report = GradeReport("section")
+            rows = list(report.rows(state, ["3"]))
+            state.close()
+
+        t.assertEqual([r["section_id"] for r in rows], [40, 41])
+        t.assertEqual([r["grade_a"] for r in rows], [1, 0])
+        t.assertEqual([r["grade_f"] for r in rows], [0, 1])
+        t.assertEqual(list(rows[0]), report.columns)
+        t.assertEqual(report.types["mean"], "float64")
+        t.assertNotIn("count", report.types)
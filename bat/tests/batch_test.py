@@ -0,0 +1,171 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+import io
+import json
+import os
+from tempfile import TemporaryDirectory
+
+from ..cli import argparser
+from ..conf import environments, get_config
+from ..report.batch import BatchError, environment_configs
+from .fake_canvas import FakeCanvas, json_reply, paginated
+
+
+SRC = "bat.report.batch"
+
+CONFIG_YAML = """
+default: east
+
+east:
+    bat:
+        canvas:
+            url: {east}
+            token: east-token
+west:
+    bat:
+        canvas:
+            url: {west}
+            token: west-token
+        report:
+            account_id: "2"
+            state_db: {tmp}/west.sqlite
+"""
+
+
+def assignments(*ids):
+    return paginated([{"id": n, "name": f"a{n}"} for n in ids])
+
+
+class BatchTests(TestCase):
+
+    def setUp(t):
+        tmp = TemporaryDirectory()
+        t.addCleanup(tmp.cleanup)
+        t.tmp = tmp.name
+        t.east = FakeCanvas(
+            {"/api/v1/courses/1/assignments": assignments(1, 2, 3)}
+        )
+        t.addCleanup(t.east.close)
+        # the same course id, another Canvas
+        t.west = FakeCanvas(
+            {
+                "/api/v1/accounts/2/courses": paginated([{"id": 3}]),
+                "/api/v1/courses/1/assignments": assignments(7),
+                "/api/v1/courses/3/assignments": assignments(8),
+            }
+        )
+        t.addCleanup(t.west.close)
+        t.config = f"{t.tmp}/config.yaml"
+        with open(t.config, "w") as f:
+            f.write(
+                CONFIG_YAML.format(
+                    east=t.east.url, west=t.west.url, tmp=t.tmp
+                )
+            )
+
+    def parse(t, *argv):
+        args = argparser().parse_args(
+            ["-c", t.config, "batch", *argv, "-o", f"{t.tmp}/out"]
+        )
+        args.enabled = "false"
+        args.state_db = f"{t.tmp}/state.sqlite"
+        args.mirror_db = f"{t.tmp}/mirror.sqlite"
+        return args
+
+    def run_command(t, *argv):
+        args = t.parse(*argv)
+        with patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            args.func(args)
+        return stdout.getvalue()
+
+    def read(t, env, name):
+        with open(f"{t.tmp}/out/{env}/{name}") as f:
+            return [json.loads(line) for line in f]
+
+    def test_batch(t):
+        out = t.run_command("assignments", "--course", "1")
+
+        east = t.read("east", "assignments.jsonl")
+        t.assertEqual([r["id"] for r in east], [1, 2, 3])
+        # west also reports on the courses of its account
+        west = t.read("west", "assignments.jsonl")
+        t.assertEqual([r["id"] for r in west], [7, 8])
+        lines = out.splitlines()
+        t.assertEqual(lines[0].split()[:2], ["environment", "report"])
+        t.assertEqual(lines[1].split()[:3], ["east", "assignments", "3"])
+        t.assertEqual(lines[2].split()[:3], ["west", "assignments", "2"])
+        t.assertEqual(lines[-1].split()[-2:], ["0", "failed"])
+
+        with open(f"{t.tmp}/out/summary.json") as f:
+            summary = json.load(f)
+        t.assertEqual(
+            [(r["environment"], r["rows"], r["error"]) for r in summary],
+            [("east", 3, None), ("west", 2, None)],
+        )
+
+    def test_databases(t):
+        configs = environment_configs(t.parse("assignments"))
+        east, west = configs["east"][0], configs["west"][0]
+        # shared by every environment, one each instead
+        t.assertEqual(east.report.state_db, f"{t.tmp}/state-east.sqlite")
+        t.assertEqual(west.report.state_db, f"{t.tmp}/state-west.sqlite")
+        t.assertEqual(west.report.mirror_db, f"{t.tmp}/mirror-west.sqlite")
+        t.assertEqual(west.canvas.token, "west-token")
+        t.assertIsNone(east.get("report.account_id"))
+        t.assertEqual(west.report.account_id, "2")
+        t.assertEqual(configs["west"][1].config_env, "west")
+
+    def test_environment(t):
+        t.run_command("assignments", "--environment", "west")
+        t.assertEqual(t.east.requests, [])
+        t.assertFalse(os.path.exists(f"{t.tmp}/out/east"))
+
+        with t.assertRaisesRegex(RuntimeError, "no environment north"):
+            t.run_command("assignments", "--environment", "north")
+
+    def test_failure(t):
+        t.west.routes["/api/v1/courses/1/assignments"] = lambda _: (
+            json_reply({"errors": [{"message": "down"}]}, 500)
+        )
+        with t.assertLogs(SRC, "WARNING"):
+            with t.assertRaises(BatchError) as caught:
+                t.run_command("assignments", "--course", "1")
+        t.assertEqual(
+            [(r.environment, r.report) for r in caught.exception.failed],
+            [("west", "assignments")],
+        )
+        # the other environment is not held up
+        t.assertEqual(len(t.read("east", "assignments.jsonl")), 3)
+
+
+    def test_no_environments(t):
+        with open(t.config, "w") as f:
+            f.write("default: east\n")
+        t.run_command("assignments")
+        with open(f"{t.tmp}/out/summary.json") as f:
+            t.assertEqual(json.load(f), [])
+
+
+class EnvironmentsTests(TestCase):
+
+    def test_environments(t):
+        with TemporaryDirectory() as tmp:
+            path = f"{tmp}/config.yaml"
+            with open(path, "w") as f:
+                f.write(
+                    CONFIG_YAML.format(
+                        east="http://e", west="http://w", tmp=tmp
+                    )
+                )
+            sources = environments(path)
+            t.assertEqual(list(sources), ["east", "west"])
+            west, east = sources["west"], sources["east"]
+            t.assertEqual(
+                west.get("report.state_db", "bat"), f"{tmp}/west.sqlite"
+            )
+            t.assertIsNone(east.get("bat.report.state_db"))
+            t.assertIsNone(east.get("url.x", "bat.canvas"))
+            cfg = get_config(config_file=sources["west"])
+            t.assertEqual(cfg.canvas.url, "http://w")
+            t.assertEqual(cfg.report.account_id, "2")
@@ -0,0 +1,245 @@
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+import io
+import json
+from datetime import datetime, timezone
+from tempfile import TemporaryDirectory
+
+from ..cli import argparser
+from ..lib.canvas import CanvasAPIError, CanvasClient
+from ..report import REPORTS, ReportRunner, StateStore
+from ..report.bulk import AccountReport, BulkExport, BulkTimeout, csv_rows
+from ..report.cli import _Commands
+from .fake_canvas import FakeCanvas, json_reply, paginated
+
+
+SRC = "bat.report.bulk"
+
+ENROLLMENTS_CSV = (
+    "\ufeffcanvas_course_id,course_id,canvas_user_id,user_id,role,role_id,"
+    "canvas_section_id,section_id,status,base_role_type\n"
+    "7,C7,100,U100,student,3,70,S70,active,StudentEnrollment\n"
+    "7,C7,101,U101,student,3,70,S70,deleted,StudentEnrollment\n"
+    "7,C7,102,U102,teacher,4,71,S71,completed,TeacherEnrollment\n"
+    "8,C8,100,U100,student,3,80,S80,active,StudentEnrollment\n"
+).encode()
+
+
+class CsvRowsTests(TestCase):
+
+    def test_chunks(t):
+        data = 'id,name\r\n1,"Zoë\nline two, quoted"\r\n2,Émile\r\n'.encode()
+        chunks = [data[n : n + 3] for n in range(0, len(data), 3)]
+
+        rows = list(csv_rows(iter(chunks)))
+
+        t.assertEqual(
+            rows,
+            [
+                {"id": "1", "name": "Zoë\nline two, quoted"},
+                {"id": "2", "name": "Émile"},
+            ],
+        )
+
+    def test_no_trailing_newline(t):
+        rows = list(csv_rows([b"\xef\xbb\xbfa,b\n1,", b"2"]))
+        t.assertEqual(rows, [{"a": "1", "b": "2"}])
+
+    def test_record(t):
+        export = REPORTS["enrollments"].bulk
+        rows = list(csv_rows([ENROLLMENTS_CSV]))
+        t.assertEqual(
+            export.record(rows[0]),
+            dict(
+                course_id=7,
+                user_id=100,
+                course_section_id=70,
+                role_id=3,
+                type="StudentEnrollment",
+                enrollment_state="active",
+            ),
+        )
+        t.assertEqual(
+            [export.kept(row) for row in rows], [True, False, True, True]
+        )
+
+
+class FakeAccountReports:
+    """The lifecycle of a Canvas account report: created, running, done.
+
+    The finished file redirects to a second server, like Canvas sends
+    downloads to its file storage.
+    """
+
+    def __init__(self, test: TestCase, data: bytes, polls: int = 2):
+        self.storage = FakeCanvas({"/enrollments.csv": self.file(data)})
+        test.addCleanup(self.storage.close)
+        self.polls = polls
+        self.started = []
+        self.headers = []
+        path = "/api/v1/accounts/1/reports/provisioning_csv"
+        self.server = FakeCanvas(
+            {
+                path: self.start,
+                f"{path}/9": self.status,
+                "/files/9/download": lambda h: (
+                    302,
+                    {"Location": f"{self.storage.url}/enrollments.csv"},
+                    b"",
+                ),
+                "/api/v1/accounts/1/courses": paginated(
+                    [{"id": 7}, {"id": 8}, {"id": 9}]
+                ),
+            }
+        )
+        test.addCleanup(self.server.close)
+
+    def file(self, data):
+        def route(handler):
+            self.headers.append(dict(handler.headers))
+            return 200, {"Content-Type": "text/csv"}, data
+
+        return route
+
+    def start(self, handler):
+        self.started.append((handler.command, handler.request_body))
+        return json_reply({"id": 9, "status": "created", "progress": 0})
+
+    def status(self, handler):
+        self.polls -= 1
+        if self.polls > 0:
+            return json_reply({"id": 9, "status": "running", "progress": 50})
+        return json_reply(
+            {
+                "id": 9,
+                "status": "complete",
+                "progress": 100,
+                "attachment": {"url": f"{self.server.url}/files/9/download"},
+            }
+        )
+
+
+class AccountReportTests(TestCase):
+
+    def setUp(t):
+        t.fake = FakeAccountReports(t, ENROLLMENTS_CSV)
+        t.client = CanvasClient(t.fake.server.url, "token")
+        t.addCleanup(t.client.close)
+        t.sleep = Mock()
+        t.export = REPORTS["enrollments"].bulk
+
+    def test_lifecycle(t):
+        report = AccountReport(t.client, "1", t.export, sleep=t.sleep)
+        records = list(report.records())
+
+        t.assertEqual([r["user_id"] for r in records], [100, 102, 100])
+        t.assertEqual(
+            t.fake.started, [("POST", b"parameters%5Benrollments%5D=true")]
+        )
+        # backing off between polls
+        t.assertEqual([c.args[0] for c in t.sleep.call_args_list], [2.0, 3.0])
+        # the token stays with Canvas
+        t.assertNotIn("Authorization", t.fake.headers[0])
+
+    def test_lookalike_redirect(t):
+        # starts like the Canvas url, but is the storage server's
+        canvas = t.fake.server.url.split("//")[1]
+        storage = t.fake.storage.url.split("//")[1]
+        t.fake.server.routes["/files/9/download"] = lambda h: (
+            302,
+            {"Location": f"http://{canvas}@{storage}/enrollments.csv"},
+            b"",
+        )
+        report = AccountReport(t.client, "1", t.export, sleep=t.sleep)
+        t.assertEqual(len(list(report.records())), 3)
+        t.assertNotIn("Authorization", t.fake.headers[0])
+
+    def test_timeout(t):
+        t.fake.polls = 100
+        clock = Mock(side_effect=[0, 0, 20, 40])
+        report = AccountReport(
+            t.client,
+            "1",
+            t.export,
+            poll_interval=10,
+            max_interval=10,
+            timeout=35,
+            clock=clock,
+            sleep=t.sleep,
+        )
+        with t.assertRaises(BulkTimeout):
+            list(report.records())
+        t.assertEqual(t.sleep.call_count, 2)
+
+    def test_failed(t):
+        t.fake.server.routes[
+            "/api/v1/accounts/1/reports/provisioning_csv/9"
+        ] = lambda h: json_reply({"id": 9, "status": "error"})
+        report = AccountReport(t.client, "1", t.export, sleep=t.sleep)
+        with t.assertRaises(RuntimeError):
+            report.wait(report.start())
+
+    def test_missing_file(t):
+        report = AccountReport(t.client, "1", BulkExport("x"))
+        with t.assertRaises(CanvasAPIError):
+            list(report.download({"id": 1, "file_url": "/nope"}))
+
+
+class SyncBulkTests(TestCase):
+
+    def setUp(t):
+        tmp = TemporaryDirectory()
+        t.addCleanup(tmp.cleanup)
+        t.state_db = f"{tmp.name}/state.sqlite"
+        t.state = StateStore(t.state_db)
+        t.addCleanup(t.state.close)
+        t.fake = FakeAccountReports(t, ENROLLMENTS_CSV)
+        t.client = CanvasClient(t.fake.server.url, "token")
+        t.addCleanup(t.client.close)
+        now = datetime(2024, 2, 1, tzinfo=timezone.utc)
+        t.runner = ReportRunner(t.client, t.state, clock=lambda: now)
+        t.report = REPORTS["enrollments"]()
+
+    def test_replaces_courses(t):
+        t.state.merge("enrollments", "7", [("stale", {"id": 1})], "m0")
+        t.state.merge("enrollments", "9", [("stale", {"id": 2})], "m0")
+
+        counts = t.runner.sync_bulk(
+            t.report, "1", ["7", "8", "9"], sleep=Mock()
+        )
+
+        t.assertEqual(counts, {"7": 2, "8": 1, "9": 0})
+        rows = list(t.runner.rows(t.report, ["7"]))
+        t.assertEqual([r["user_id"] for r in rows], [100, 102])
+        t.assertEqual(list(t.state.records("enrollments", ["9"])), [])
+        t.assertEqual(
+            t.state.mark("enrollments", "8"), "2024-01-31T23:55:00Z"
+        )
+
+    def test_course_filter(t):
+        counts = t.runner.sync_bulk(t.report, "1", ["8"], sleep=Mock())
+        t.assertEqual(counts, {"8": 1})
+        t.assertIsNone(t.state.mark("enrollments", "7"))
+
+    def test_no_bulk_export(t):
+        with t.assertRaises(ValueError):
+            t.runner.sync_bulk(REPORTS["assignments"](), "1")
+
+    def test_command(t):
+        args = argparser().parse_args(
+            ["report", "enrollments", "--account", "1", "--source", "bulk"]
+        )
+        args.url, args.token = t.fake.server.url, "token"
+        args.enabled = "false"
+        args.state_db = t.state_db
+        args.poll_interval = "0.01"
+        with patch("sys.stdout", new_callable=io.StringIO) as out:
+            _Commands.report(args)
+
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        t.assertEqual(
+            [(r["course_id"], r["user_id"]) for r in rows],
+            [(7, 100), (7, 102), (8, 100)],
+        )
+        t.assertEqual(len(t.fake.started), 1)
@@ -0,0 +1,205 @@
+from unittest import TestCase
+from unittest.mock import patch, Mock
+
+import io
+from tempfile import TemporaryDirectory
+
+from ..cli import argparser
+from ..lib.cache import (
+    ResponseCache,
+    cache_key,
+    _Commands,
+)
+from ..lib.canvas import CanvasClient, Response
+from .fake_canvas import FakeCanvas, json_reply
+
+
+SRC = "bat.lib.cache"
+
+
+def etag_route(data, etag='"v1"'):
+    """Reply 304 Not Modified when the client already holds `etag`"""
+
+    def route(handler):
+        if handler.headers.get("If-None-Match") == etag:
+            return 304, {"ETag": etag}, b""
+        return json_reply(data, ETag=etag)
+
+    return route
+
+
+class CacheKeyTests(TestCase):
+
+    def test_query_order(t):
+        t.assertEqual(
+            cache_key("https://c.test/api?a=1&b=2"),
+            cache_key("https://c.test/api?b=2&a=1"),
+        )
+        t.assertNotEqual(
+            cache_key("https://c.test/api?a=1"),
+            cache_key("https://c.test/api?a=2"),
+        )
+
+
+class ResponseCacheTests(TestCase):
+
+    def setUp(t):
+        tmp = TemporaryDirectory()
+        t.addCleanup(tmp.cleanup)
+        t.directory = tmp.name
+        t.clock = Mock(return_value=1000.0)
+        t.cache = ResponseCache(
+            t.directory, ttl=60, max_size=100, clock=t.clock
+        )
+        t.addCleanup(t.cache.close)
+
+    def response(t, url, body=b"x" * 10, **headers):
+        headers = {k.replace("_", "-"): v for k, v in headers.items()}
+        return Response(200, headers, body, url)
+
+    def test_put_get(t):
+        url = "https://c.test/api/v1/courses?page=1"
+        t.assertTrue(t.cache.put(url, t.response(url, etag='"a"')))
+
+        entry = t.cache.get(url)
+        t.assertEqual(entry.response.body, b"x" * 10)
+        t.assertEqual(entry.validators(), {"If-None-Match": '"a"'})
+
+    def test_persistent(t):
+        url = "https://c.test/a"
+        t.cache.put(url, t.response(url, last_modified="Mon, 1 Jan 2024"))
+        t.cache.close()
+
+        cache = ResponseCache(t.directory, ttl=60, clock=t.clock)
+        t.addCleanup(cache.close)
+        t.assertEqual(
+            cache.get(url).validators(),
+            {"If-Modified-Since": "Mon, 1 Jan 2024"},
+        )
+
+    def test_requires_validator(t):
+        url = "https://c.test/a"
+        t.assertFalse(t.cache.put(url, t.response(url)))
+        t.assertIsNone(t.cache.get(url))
+
+    def test_ttl(t):
+        url = "https://c.test/a"
+        t.cache.put(url, t.response(url, etag="e"))
+
+        t.clock.return_value = 1061.0
+        t.assertIsNone(t.cache.get(url))
+        t.assertEqual(t.cache.stats()["entries"], 0)
+
+    def test_revalidated_extends_ttl(t):
+        url = "https://c.test/a"
+        t.cache.put(url, t.response(url, etag="e"))
+
+        t.clock.return_value = 1050.0
+        ret = t.cache.revalidated(t.cache.get(url))
+        t.assertTrue(ret.from_cache)
+
+        t.clock.return_value = 1100.0
+        t.assertIsNotNone(t.cache.get(url))
+
+    def test_evict_least_recently_used(t):
+        urls = [f"https://c.test/{n}" for n in range(4)]
+        for n, url in enumerate(urls[:3]):
+            t.clock.return_value = 1000.0 + n
+            t.cache.put(url, t.response(url, body=b"x" * 30, etag="e"))
+        t.clock.return_value = 1010.0
+        t.cache.revalidated(t.cache.get(urls[0]))
+
+        # 4 * 30 bytes > 100, so the least recently used entry is dropped
+        t.cache.put(urls[3], t.response(urls[3], body=b"x" * 30, etag="e"))
+        t.assertIsNone(t.cache.get(urls[1]))
+        for url in (urls[0], urls[2], urls[3]):
+            t.assertIsNotNone(t.cache.get(url))
+        t.assertEqual(t.cache.size(), 90)
+
+    def test_replace_counts_once(t):
+        urls = [f"https://c.test/{n}" for n in range(3)]
+        for url in urls:
+            t.cache.put(url, t.response(url, body=b"x" * 30, etag="e"))
+        # refreshed entries replace theirs, nothing is over max_size
+        with patch.object(t.cache, "evict") as evict:
+            for _ in range(3):
+                t.cache.put(
+                    urls[0], t.response(urls[0], body=b"x" * 30, etag="f")
+                )
+        evict.assert_not_called()
+        t.assertEqual(t.cache._size, 90)
+        for url in urls:
+            t.assertIsNotNone(t.cache.get(url))
+
+        t.cache.delete(urls[1])
+        t.assertEqual(t.cache._size, 60)
+
+    def test_stats_clear(t):
+        url = "https://c.test/a"
+        t.cache.put(url, t.response(url, etag="e"))
+
+        stats = t.cache.stats()
+        t.assertEqual(stats["entries"], 1)
+        t.assertEqual(stats["size"], 10)
+        t.assertEqual(t.cache.clear(), 1)
+        t.assertEqual(t.cache.stats()["entries"], 0)
+
+
+class ClientCacheTests(TestCase):
+
+    def setUp(t):
+        tmp = TemporaryDirectory()
+        t.addCleanup(tmp.cleanup)
+        t.server = FakeCanvas(routes={"/api/v1/courses": etag_route([1])})
+        t.addCleanup(t.server.close)
+        t.client = CanvasClient(
+            t.server.url, "token", cache=ResponseCache(tmp.name)
+        )
+        t.addCleanup(t.client.close)
+
+    def test_conditional_request(t):
+        first = t.client.get("/api/v1/courses", {"per_page": 10})
+        second = t.client.get("/api/v1/courses", {"per_page": 10})
+
+        t.assertFalse(first.from_cache)
+        t.assertTrue(second.from_cache)
+        t.assertEqual(second.status, 200)
+        t.assertEqual(second.json(), [1])
+        t.assertEqual(t.client.cache.hits, 1)
+        t.assertEqual(len(t.server.requests), 2)
+
+    def test_changed(t):
+        t.client.get("/api/v1/courses")
+        t.server.routes["/api/v1/courses"] = etag_route([2], etag='"v2"')
+
+        ret = t.client.get("/api/v1/courses")
+
+        t.assertFalse(ret.from_cache)
+        t.assertEqual(ret.json(), [2])
+        t.assertEqual(t.client.get("/api/v1/courses").json(), [2])
+        t.assertEqual(t.client.cache.hits, 1)
+
+
+class CacheCommandTests(TestCase):
+
+    def test_stats_clear(t):
+        with TemporaryDirectory() as directory:
+            cache = ResponseCache(directory)
+            url = "https://c.test/a"
+            cache.put(url, Response(200, {"etag": "e"}, b"abc", url))
+            cache.close()
+
+            for cmd, expected in [
+                ("stats", "entries: 1"),
+                ("clear", "removed 1 cached responses"),
+                ("stats", "entries: 0"),
+            ]:
+                args = argparser().parse_args(["cache", cmd])
+                args.directory = directory
+                with patch("sys.stdout", new_callable=io.StringIO) as out:
+                    args.func(args)
+                t.assertIn(expected, out.getvalue())
+
+    def test_default_stats(t):
+        args = argparser().parse_args(["cache"])
+        t.assertIs(args.func, _Commands.stats)
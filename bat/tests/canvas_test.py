@@ -0,0 +1,222 @@
+from unittest import TestCase
+from unittest.mock import Mock
+
+import time
+from tempfile import TemporaryDirectory
+
+from ..conf import get_config, Namespace
+from ..lib.canvas import (
+    CanvasAPIError,
+    CanvasClient,
+    RateLimitBackoff,
+    endpoint,
+    keep_clients,
+)
+from .fake_canvas import FakeCanvas, json_reply
+
+
+SRC = "bat.lib.canvas"
+
+
+class CanvasClientTests(TestCase):
+
+    def setUp(t):
+        t.server = FakeCanvas(
+            routes={"/api/v1/courses": lambda h: json_reply([{"id": 1}])}
+        )
+        t.addCleanup(t.server.close)
+
+    def test_from_config(t):
+        tmp = TemporaryDirectory()
+        t.addCleanup(tmp.cleanup)
+        cli_args = Namespace(
+            url=t.server.url,
+            token="secret",
+            concurrency="2",
+            directory=tmp.name,
+        )
+        cfg = get_config(cli_args=cli_args)
+
+        with CanvasClient.from_config(cfg) as client:
+            t.assertEqual(client.base_url, t.server.url)
+            t.assertEqual(client.headers["Authorization"], "Bearer secret")
+            t.assertEqual(client.concurrency, 2)
+            t.assertEqual(client.cache.directory, tmp.name)
+            t.assertEqual(client.get_json("/api/v1/courses"), [{"id": 1}])
+
+        cli_args.enabled = "false"
+        client = CanvasClient.from_config(get_config(cli_args=cli_args))
+        t.assertIsNone(client.cache)
+
+    def test_kept_runs(t):
+        cfg = get_config(
+            cli_args=Namespace(url=t.server.url, token="t", enabled="false")
+        )
+        with keep_clients() as kept:
+            first = CanvasClient.from_config(cfg)
+            users = first.loader("users", course_id=1)
+            second = CanvasClient.from_config(cfg)
+            (client,) = kept.values()
+            # one client's connections, each run its own lookups
+            t.assertIsNot(first, second)
+            t.assertIs(first._pools, client._pools)
+            t.assertIs(first.executor, second.executor)
+            t.assertIs(first.loader("users", course_id=1), users)
+            t.assertEqual(second._loaders, {})
+            first.close()
+            t.assertIsNotNone(client._executor)
+        t.assertIsNone(client._executor)
+
+    def test_request_log(t):
+        with CanvasClient(t.server.url, "token") as client:
+            with t.assertLogs(SRC, "DEBUG") as logs:
+                client.get("/api/v1/courses")
+
+        record = logs.records[-1]
+        t.assertEqual(record.endpoint, "/api/v1/courses")
+        t.assertEqual((record.method, record.status), ("GET", 200))
+        t.assertEqual(record.bytes, len(b'[{"id": 1}]'))
+        t.assertGreater(record.latency_ms, 0)
+        t.assertIsNone(record.cache)
+
+    def test_endpoint(t):
+        t.assertEqual(
+            endpoint("https://c.test/api/v1/courses/12/users?page=2"),
+            "/api/v1/courses/:id/users",
+        )
+        t.assertEqual(
+            endpoint("/api/v1/courses/sis_course_id:A1/assignments"),
+            "/api/v1/courses/:id/assignments",
+        )
+
+    def test_url(t):
+        client = CanvasClient("https://canvas.test/", "token")
+        params = [("include[]", "a"), ("per_page", 5)]
+        t.assertEqual(
+            client.url("api/v1/courses", params),
+            "https://canvas.test/api/v1/courses?include%5B%5D=a&per_page=5",
+        )
+        t.assertEqual(
+            client.url("https://other.test/x?page=2", {"per_page": 5}),
+            "https://other.test/x?page=2&per_page=5",
+        )
+
+    def test_token_origin(t):
+        seen = []
+
+        def route(handler):
+            seen.append(handler.headers.get("Authorization"))
+            return json_reply([])
+
+        other = FakeCanvas(routes={"/api/v1/courses": route})
+        t.addCleanup(other.close)
+        t.server.routes["/api/v1/users"] = route
+        with CanvasClient(t.server.url, "token") as client:
+            client.get("/api/v1/users")
+            # ex: the next page of a Link header, on another host
+            client.get(f"{other.url}/api/v1/courses")
+        t.assertEqual(seen, ["Bearer token", None])
+
+    def test_keep_alive(t):
+        """sequential requests reuse a single pooled connection"""
+        with CanvasClient(t.server.url, "token") as client:
+            for _ in range(10):
+                client.get("/api/v1/courses")
+
+            pool = client.pool("http", t.server.url.split("//")[1])
+            t.assertEqual(pool.created, 1)
+        t.assertEqual(len(t.server.connections), 1)
+
+    def test_error_status(t):
+        client = CanvasClient(t.server.url, "token")
+        with t.assertRaises(CanvasAPIError) as ctx:
+            client.get("/api/v1/missing")
+        t.assertEqual(ctx.exception.status, 404)
+
+
+class ConcurrencyTests(TestCase):
+
+    def setUp(t):
+        t.server = FakeCanvas(
+            routes={"/api/v1/courses": lambda h: json_reply([])},
+            latency=0.05,
+        )
+        t.addCleanup(t.server.close)
+
+    def elapsed(t, concurrency: int, requests: int = 16) -> float:
+        paths = ["/api/v1/courses"] * requests
+        with CanvasClient(t.server.url, "t", concurrency=concurrency) as c:
+            start = time.perf_counter()
+            responses = list(c.get_many(paths))
+            elapsed = time.perf_counter() - start
+        t.assertEqual(len(responses), requests)
+        return elapsed
+
+    def test_throughput_scales_with_concurrency(t):
+        serial = t.elapsed(concurrency=1)
+        t.assertEqual(t.server.max_in_flight, 1)
+
+        t.server.max_in_flight = 0
+        parallel = t.elapsed(concurrency=8)
+        t.assertLessEqual(t.server.max_in_flight, 8)
+
+        # 16 requests at 50ms each: ~0.8s serially, ~0.1s with 8 in flight
+        t.assertGreater(serial / parallel, 3)
+
+
+class RateLimitTests(TestCase):
+
+    def test_backoff_from_remaining_header(t):
+        clock = Mock(return_value=100.0)
+        sleep = Mock()
+        backoff = RateLimitBackoff(
+            floor=100, delay=2.0, clock=clock, sleep=sleep
+        )
+
+        t.assertEqual(backoff.update({"x-rate-limit-remaining": "700"}), 0)
+        backoff.wait()
+        sleep.assert_not_called()
+
+        t.assertEqual(backoff.update({"x-rate-limit-remaining": "25"}), 1.5)
+        t.assertEqual(backoff.remaining, 25)
+        backoff.wait()
+        sleep.assert_called_with(1.5)
+
+    def test_penalize(t):
+        backoff = RateLimitBackoff(delay=1.0, max_delay=5.0, sleep=Mock())
+        t.assertEqual(
+            [backoff.penalize(n) for n in range(5)], [1, 2, 4, 5, 5]
+        )
+
+    def test_retry_when_rate_limited(t):
+        replies = [
+            json_reply("403 Forbidden (Rate Limit Exceeded)", 403),
+            json_reply("403 Forbidden (Rate Limit Exceeded)", 403),
+            json_reply({"ok": True}, X_Rate_Limit_Remaining="650.0"),
+        ]
+        routes = {"/api/v1/users/self": lambda h: replies.pop(0)}
+        sleep = Mock()
+
+        with FakeCanvas(routes) as server:
+            client = CanvasClient(
+                server.url, "t", backoff=RateLimitBackoff(sleep=sleep)
+            )
+            ret = client.get_json("/api/v1/users/self")
+
+        t.assertEqual(ret, {"ok": True})
+        t.assertEqual(len(server.requests), 3)
+        t.assertEqual(sleep.call_count, 2)
+        t.assertEqual(client.backoff.remaining, 650)
+
+    def test_retries_exhausted(t):
+        routes = {"/x": lambda h: json_reply("Rate Limit Exceeded", 403)}
+        with FakeCanvas(routes) as server:
+            client = CanvasClient(
+                server.url,
+                "t",
+                max_retries=2,
+                backoff=RateLimitBackoff(sleep=Mock()),
+            )
+            with t.assertRaises(CanvasAPIError):
+                client.get("/x")
+        t.assertEqual(len(server.requests), 3)
@@ -0,0 +1,240 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+import csv
+import io
+from datetime import datetime, timedelta, timezone
+from tempfile import TemporaryDirectory
+from urllib.parse import parse_qs, urlsplit
+
+from ..cli import argparser
+from ..lib.canvas import CanvasAPIError, CanvasClient
+from ..report import REPORTS, ReportRunner, StateStore
+from ..report.checkpoint import RETENTION, Checkpoints, job_id
+from ..report.writers import CsvWriter
+from .fake_canvas import FakeCanvas, json_reply, paginated
+
+
+SRC = "bat.report.checkpoint"
+
+
+def failing(route, page: int, failures: list):
+    """`route`, failing its `page` while `failures` is not empty"""
+
+    def wrapper(handler):
+        query = parse_qs(urlsplit(handler.path).query)
+        if failures and query.get("page", ["1"])[0] == str(page):
+            failures.pop()
+            return json_reply({"errors": [{"message": "failed"}]}, 503)
+        return route(handler)
+
+    return wrapper
+
+
+class CheckpointsTests(TestCase):
+
+    def setUp(t):
+        tmp = TemporaryDirectory()
+        t.addCleanup(tmp.cleanup)
+        t.now = datetime(2024, 5, 6, tzinfo=timezone.utc)
+        t.checkpoints = Checkpoints(
+            f"{tmp.name}/state.sqlite", clock=lambda: t.now
+        )
+        t.addCleanup(t.checkpoints.close)
+
+    def test_job(t):
+        t.assertIsNone(t.checkpoints.resume("j"))
+        job = t.checkpoints.start("j", ["1", 2])
+        t.assertEqual(t.checkpoints.resume("j"), ["1", "2"])
+
+        t.assertIsNone(job.progress("r", "1"))
+        job.begin("r", "1", None, "2024-05-06T00:00:00Z")
+        job.advance("r", "1", (1, "http://canvas/next"), 100)
+        progress = job.progress("r", "1")
+        t.assertEqual(progress.cursor, (1, "http://canvas/next"))
+        t.assertEqual((progress.fetched, progress.done), (100, False))
+        job.complete("r", "1", 150)
+        t.assertTrue(job.progress("r", "1").done)
+        job.complete("r", "*", 10)
+        t.assertEqual(job.progress("r", "*").fetched, 10)
+
+        job.output("out-00000.csv", 5)
+        job.output("out-00001.csv", 5)
+        t.assertEqual(
+            job.outputs(), [("out-00000.csv", 5), ("out-00001.csv", 5)]
+        )
+
+        job.finish()
+        t.assertIsNone(t.checkpoints.resume("j"))
+        t.assertIsNone(job.progress("r", "1"))
+        t.assertEqual(job.outputs(), [])
+
+    def test_start_over(t):
+        job = t.checkpoints.start("j", ["1"])
+        job.complete("r", "1", 1)
+        t.checkpoints.start("old", ["1"])
+        t.now += RETENTION + timedelta(days=1)
+
+        job = t.checkpoints.start("j", ["2"])
+        t.assertIsNone(job.progress("r", "1"))
+        t.assertEqual(t.checkpoints.resume("j"), ["2"])
+        t.assertIsNone(t.checkpoints.resume("old"))
+
+    def test_job_id(t):
+        t.assertEqual(job_id(a=1, b=[2]), job_id(b=[2], a=1))
+        t.assertNotEqual(job_id(a=1), job_id(a=2))
+
+
+class ResumeTests(TestCase):
+
+    def setUp(t):
+        tmp = TemporaryDirectory()
+        t.addCleanup(tmp.cleanup)
+        t.state = StateStore(f"{tmp.name}/state.sqlite")
+        t.addCleanup(t.state.close)
+        t.checkpoints = Checkpoints(f"{tmp.name}/state.sqlite")
+        t.addCleanup(t.checkpoints.close)
+
+        t.failures = [True]
+        assignments = [{"id": n, "name": f"a{n}"} for n in range(250)]
+        t.server = FakeCanvas(
+            routes={
+                "/api/v1/courses/7/assignments": failing(
+                    paginated(assignments), 3, t.failures
+                ),
+                "/api/v1/courses/8/assignments": paginated([{"id": 1}]),
+            }
+        )
+        t.addCleanup(t.server.close)
+        t.client = CanvasClient(t.server.url, "token")
+        t.addCleanup(t.client.close)
+        t.runner = ReportRunner(t.client, t.state)
+        t.report = REPORTS["assignments"]()
+
+    def test_resume_course(t):
+        job = t.checkpoints.start("j", ["8", "7"])
+        with t.assertRaises(CanvasAPIError):
+            t.runner.sync(t.report, ["8", "7"], job=job)
+        t.assertIsNone(t.state.mark("assignments", "7"))
+        progress = job.progress("assignments", "7")
+        t.assertEqual(progress.fetched, 200)
+        t.assertIn("page=3", progress.cursor[1])
+
+        t.server.requests.clear()
+        counts = t.runner.sync(t.report, ["8", "7"], job=job)
+        t.assertEqual(counts, {"8": 1, "7": 250})
+        # only the page that failed is fetched again
+        t.assertEqual(len(t.server.requests), 1)
+        t.assertIn("page=3", t.server.requests[0])
+        t.assertEqual(len(list(t.runner.rows(t.report, ["7"]))), 250)
+        t.assertEqual(t.state.mark("assignments", "7"), progress.mark)
+        t.assertTrue(job.progress("assignments", "7").done)
+
+
+class ResumeCommandTests(TestCase):
+
+    def setUp(t):
+        tmp = TemporaryDirectory()
+        t.addCleanup(tmp.cleanup)
+        t.tmp = tmp.name
+        t.failures = [True]
+        routes = {
+            f"/api/v1/courses/{c}/assignments": paginated(
+                [{"id": c * 10 + n, "name": f"a{n}"} for n in range(3)]
+            )
+            for c in (1, 2, 3)
+        }
+        routes["/api/v1/courses/2/assignments"] = failing(
+            routes["/api/v1/courses/2/assignments"], 1, t.failures
+        )
+        t.server = FakeCanvas(routes)
+        t.addCleanup(t.server.close)
+
+    def run_command(t, *argv):
+        args = argparser().parse_args(
+            ["report", "assignments", "-f", "csv", "-o", f"{t.tmp}/out.csv"]
+            + ["--course", "1", "--course", "2", "--course", "3", *argv]
+        )
+        args.url, args.token = t.server.url, "token"
+        args.enabled = "false"
+        args.state_db = f"{t.tmp}/state.sqlite"
+        args.chunk_rows = "2"
+        with patch("sys.stdout", new_callable=io.StringIO):
+            args.func(args)
+
+    def chunk(t, n):
+        with open(f"{t.tmp}/out-{n:05d}.csv") as f:
+            return f.read()
+
+    def ids(t, *chunks):
+        return [
+            int(row["id"])
+            for n in chunks
+            for row in csv.DictReader(io.StringIO(t.chunk(n)))
+        ]
+
+    def test_resume(t):
+        with t.assertRaises(CanvasAPIError):
+            t.run_command()
+        t.server.requests.clear()
+        t.run_command("--resume")
+        courses = sorted({r.split("/")[4] for r in t.server.requests})
+        t.assertEqual(courses, ["2", "3"])
+        t.assertEqual(
+            t.ids(0, 1, 2, 3, 4), [10, 11, 12, 20, 21, 22, 30, 31, 32]
+        )
+
+        # a finished run is not resumed
+        t.server.requests.clear()
+        t.run_command("--resume")
+        t.assertEqual(len(t.server.requests), 3)
+
+    def test_failed_run_closes(t):
+        t.failures.clear()
+        closes = [
+            patch.object(cls, "close", autospec=True, side_effect=cls.close)
+            for cls in (StateStore, Checkpoints)
+        ]
+        with closes[0] as state, closes[1] as checkpoints:
+            with patch.object(
+                CsvWriter, "abort", autospec=True, side_effect=CsvWriter.abort
+            ) as abort:
+                with patch.object(
+                    CsvWriter, "_write", side_effect=OSError("disk full")
+                ):
+                    with t.assertRaises(OSError):
+                        t.run_command()
+        state.assert_called_once()
+        checkpoints.assert_called_once()
+        abort.assert_called_once()
+
+    def test_resume_output(t):
+        t.failures.clear()
+        write = CsvWriter._write
+        calls = []
+
+        def fail_second(writer, rows):
+            calls.append(rows)
+            if len(calls) == 2:
+                raise OSError("disk full")
+            write(writer, rows)
+
+        with patch.object(CsvWriter, "_write", fail_second):
+            with t.assertRaises(OSError):
+                t.run_command()
+        first = t.chunk(0)
+
+        t.server.requests.clear()
+        with patch(f"{SRC}.Job.output", autospec=True) as output:
+            t.run_command("--resume")
+        t.assertEqual(t.server.requests, [])
+        # the chunk written is kept, the others follow on from it
+        t.assertEqual(t.chunk(0), first)
+        t.assertEqual(
+            t.ids(0, 1, 2, 3, 4), [10, 11, 12, 20, 21, 22, 30, 31, 32]
+        )
+        t.assertEqual(
+            [call.args[1:] for call in output.call_args_list],
+            [(f"{t.tmp}/out-{n:05d}.csv", 2) for n in (1, 2, 3)]
+            + [(f"{t.tmp}/out-00004.csv", 1)],
+        )
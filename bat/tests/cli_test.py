@@ -1,6 +1,10 @@
 from unittest import TestCase
 from unittest.mock import patch, Mock
 
+import asyncio
+import subprocess
+import sys
+
 from ..cli import (
     argparser,
     BATCLI,
@@ -8,6 +12,7 @@ from ..cli import (
     Commands,
     logging,
     argparser,
+    selected_command,
 )
 
 from logging import getLogger
@@ -22,6 +27,30 @@ class ArgparserTests(TestCase):
     def test_argparser(t):
         argparser()
 
+    def test_selected_command(t):
+        t.assertEqual(selected_command(["report", "--help"]), "report")
+        t.assertEqual(selected_command(["-c", "report", "hello"]), "hello")
+        t.assertIsNone(selected_command([]))
+
+    def test_lazy_commands(t):
+        """commands not loaded take any arguments, without a parser"""
+        args = argparser(load=()).parse_args(["report", "x", "--full"])
+        t.assertEqual(args.command_args, ["x", "--full"])
+
+        args = argparser(load=["report"]).parse_args(["report", "grades"])
+        t.assertEqual(args.name, "grades")
+
+    def test_lazy_timings(t):
+        """bat.lib.timings is imported for --timings and --profile only"""
+        code = (
+            "import sys, bat.cli, bat.conf;"
+            " print('bat.lib.timings' in sys.modules)"
+        )
+        out = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True
+        )
+        t.assertEqual(out.stdout.strip(), "False", out.stderr)
+
 
 class BATCLITests(TestCase):
     exit: callable
@@ -93,6 +122,26 @@ class BATCLITests(TestCase):
 
         t.validate_commands(commands)
 
+    @patch(f"{SRC}.argparser", wraps=argparser)
+    def test_coroutine_command(t, argparser: Mock):
+        """coroutine commands are run to completion on an event loop"""
+        ran = []
+
+        async def command(args: Namespace):
+            await asyncio.sleep(0)
+            ran.append(args.command)
+
+        parser = argparser()
+        args = parser.parse_args(["hello"])
+        args.func = command
+        parser.parse_args = Mock(parser.parse_args, return_value=args)
+        argparser.return_value = parser
+
+        BATCLI(["hello"])
+
+        t.assertEqual(ran, ["hello"])
+        t.exit.assert_called_with(0)
+
 
 class NestedNameSpaceTests(TestCase):
 
@@ -0,0 +1,197 @@
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+import asyncio
+import io
+
+from ..conf import get_config, Namespace
+from ..lib.aio import AsyncCanvasClient
+from ..lib.canvas import CanvasClient, RateLimitBackoff
+from ..lib.concurrency import AIMD, AdaptiveLimit, AsyncAdaptiveLimit
+from ..lib.timings import start_timings, stop_timings
+from .fake_canvas import RateLimitBucket, SyntheticCanvas
+
+
+SRC = "bat.lib.concurrency"
+
+
+def headers(remaining: float, cost: float = 1.0):
+    return {
+        "x-rate-limit-remaining": str(remaining),
+        "x-request-cost": str(cost),
+    }
+
+
+class AIMDTests(TestCase):
+
+    def saturate(t, aimd: AIMD):
+        while aimd.in_flight < aimd.allowed:
+            aimd._acquired()
+
+    def test_slow_start(t):
+        aimd = AIMD(maximum=10)
+        t.assertEqual(aimd.allowed, 1)
+        aimd.update(headers(700))
+        t.assertEqual(aimd.allowed, 1, "not grown unless held back")
+        for allowed in (2, 3, 4):
+            t.saturate(aimd)
+            aimd.update(headers(700))
+            t.assertEqual(aimd.allowed, allowed)
+
+        aimd.limit = 9.5
+        t.saturate(aimd)
+        aimd.update(headers(700))
+        aimd.update(headers(700))
+        t.assertEqual(aimd.limit, 10)
+
+    def test_pressure(t):
+        aimd = AIMD(maximum=32, floor=100)
+        aimd.limit, aimd.in_flight = 16.0, 16
+        # 12 more requests at a cost of 10 would leave 100
+        aimd.update(headers(220, cost=10))
+        t.assertEqual(aimd.limit, 12)
+        t.assertEqual(aimd.cuts, 1)
+
+        # the responses to the 16 in flight do not cut it again
+        for _ in range(16):
+            aimd.update(headers(50, cost=10))
+        t.assertEqual(aimd.limit, 12)
+        # halved at most
+        aimd.update(headers(50, cost=10))
+        t.assertEqual(aimd.limit, 6)
+
+        # additive increase, by one a round, after the first cut
+        aimd.in_flight, aimd._hold = 0, 0
+        for _ in range(6):
+            t.saturate(aimd)
+            aimd.update(headers(700, cost=10))
+        t.assertAlmostEqual(aimd.limit, 7, delta=0.1)
+
+    def test_throttled(t):
+        aimd = AIMD(maximum=32, minimum=2)
+        aimd.limit = 10.0
+        aimd.update({}, throttled=True)
+        t.assertEqual((aimd.limit, aimd.throttled), (5, 1))
+        aimd.update({}, throttled=True)
+        aimd.update({}, throttled=True)
+        t.assertEqual(aimd.limit, 2)
+
+    def test_cost(t):
+        aimd = AIMD(maximum=4)
+        aimd.update(headers(700, cost=10))
+        aimd.update(headers(700, cost=20))
+        t.assertEqual(aimd.cost, 12)
+        aimd.update({"x-request-cost": "n/a"})
+        t.assertEqual((aimd.cost, aimd.remaining), (12, 700))
+
+    def test_observability(t):
+        aimd = AIMD(maximum=4)
+        timings = start_timings()
+        t.addCleanup(stop_timings, io.StringIO())
+        t.saturate(aimd)
+        with t.assertLogs(SRC, "DEBUG") as logs:
+            aimd.update(headers(650, cost=2))
+        record = logs.records[-1]
+        t.assertEqual(record.concurrency, 2)
+        t.assertEqual(record.rate_limit_remaining, 650)
+        t.assertEqual(record.request_cost, 2)
+        t.assertEqual(timings.gauges["concurrency"], [1, 2, 2, 2])
+        t.assertEqual(timings.gauges["rate_limit_remaining"][1], 650)
+
+
+def bucket_server() -> SyntheticCanvas:
+    """Canvas drained at 200 requests a second, bursts of 20"""
+    bucket = RateLimitBucket(capacity=40, leak_rate=400, cost=2)
+    return SyntheticCanvas(rate_limit=bucket, latency=0.01)
+
+
+PATHS = ["/api/v1/courses/1"] * 150
+
+
+class AdaptiveLimitTests(TestCase):
+
+    def fetch(t, limit=None):
+        with bucket_server() as server:
+            with CanvasClient(
+                server.url,
+                "token",
+                concurrency=32,
+                max_retries=50,
+                backoff=RateLimitBackoff(floor=0, delay=0.01),
+                limit=limit,
+            ) as client:
+                responses = list(client.get_many(PATHS))
+        t.assertEqual({r.status for r in responses}, {200})
+        return server
+
+    def test_rate_limit(t):
+        with t.assertLogs("bat.lib.canvas", "WARNING"):
+            fixed = t.fetch()
+        limit = AdaptiveLimit(32, floor=10)
+        adaptive = t.fetch(limit)
+
+        t.assertEqual(fixed.max_in_flight, 32)
+        # stays just under the limit rather than tripping it
+        t.assertLess(
+            adaptive.rate_limit.refused, fixed.rate_limit.refused / 5
+        )
+        t.assertLess(adaptive.max_in_flight, 32)
+        t.assertGreater(limit.cuts, 0)
+        t.assertEqual(limit.in_flight, 0)
+
+    def test_from_config(t):
+        cfg = get_config(
+            cli_args=Namespace(
+                url="http://canvas", token="t", concurrency="8"
+            )
+        )
+        with CanvasClient.from_config(cfg) as client:
+            t.assertIsInstance(client.limit, AdaptiveLimit)
+            t.assertEqual(client.limit.maximum, 8)
+            t.assertEqual(client.limit.floor, 100)
+            # as many in flight as without it, until the rate limit bites
+            t.assertEqual(client.limit.allowed, 8)
+
+        cfg = get_config(
+            cli_args=Namespace(
+                url="http://canvas", token="t", adaptive_concurrency="false"
+            )
+        )
+        with CanvasClient.from_config(cfg) as client:
+            t.assertIsNone(client.limit)
+
+
+class AsyncAdaptiveLimitTests(IsolatedAsyncioTestCase):
+
+    async def test_rate_limit(t):
+        limit = AsyncAdaptiveLimit(100, floor=10)
+        with bucket_server() as server:
+            async with AsyncCanvasClient(
+                server.url,
+                "token",
+                max_retries=50,
+                backoff=RateLimitBackoff(floor=0, delay=0.01),
+                limit=limit,
+            ) as client:
+                responses = await client.get_many(PATHS)
+
+        t.assertEqual({r.status for r in responses}, {200})
+        t.assertLess(server.rate_limit.refused, 40)
+        t.assertLess(server.max_in_flight, 50)
+        t.assertEqual(limit.in_flight, 0)
+
+    async def test_cancelled(t):
+        limit = AsyncAdaptiveLimit(1)
+
+        async def hold():
+            async with limit:
+                await asyncio.sleep(0.01)
+
+        first = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        waiting = asyncio.ensure_future(hold())
+        last = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await asyncio.gather(first, last)
+        t.assertTrue(waiting.cancelled())
+        t.assertEqual(limit.in_flight, 0)
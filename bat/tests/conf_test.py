@@ -1,13 +1,20 @@
 from unittest import TestCase
 from unittest.mock import patch
 
+import os
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from tempfile import TemporaryDirectory
 
 import yaml
 
 from ..conf import (
+    clear_resolved_config,
     get_config,
     Namespace,
+    resolved_config,
 )
 
 
@@ -127,3 +134,90 @@ class Test_get_config(TestCase):
         conf = get_config(t.GlobalConfig)
         with t.assertRaises(AttributeError):
             conf._sir_not_appearing_in_this_film
+
+
+class ResolvedConfigTests(TestCase):
+
+    def setUp(t):
+        clear_resolved_config()
+        t.addCleanup(clear_resolved_config)
+        tmp = TemporaryDirectory()
+        t.addCleanup(tmp.cleanup)
+        t.config_file = f'{tmp.name}/config.yaml'
+        t.write_config('file_url')
+
+    def write_config(t, url, mtime=None):
+        with open(t.config_file, 'w') as f:
+            f.write(
+                'default: test\n'
+                f'test:\n  bat:\n    canvas:\n      url: {url}\n'
+            )
+        if mtime:
+            os.utime(t.config_file, ns=(mtime, mtime))
+
+    def resolve(t, **cli_args):
+        return resolved_config(
+            cli_args=Namespace(**cli_args), config_file_name=t.config_file
+        )
+
+    def test_lookups(t):
+        cfg = t.resolve(token='cli_token')
+
+        t.assertEqual(cfg.canvas.url, 'file_url')
+        t.assertEqual(cfg.canvas.token, 'cli_token')
+        t.assertEqual(cfg['canvas.token'], 'cli_token')
+        t.assertEqual(cfg.cache.ttl, '3600')
+        t.assertEqual(cfg.get('canvas.nope', 'default'), 'default')
+        t.assertIn(('canvas.url', 'file_url'), list(cfg.canvas.items()))
+        with t.assertRaises(AttributeError):
+            cfg.opt1
+        with t.assertRaises(AttributeError):
+            cfg.canvas.url = 'changed'
+
+    def test_memoized(t):
+        cfg = t.resolve(token='a', func=print)
+
+        t.assertIs(t.resolve(token='a'), cfg)
+        t.assertIsNot(t.resolve(token='b'), cfg)
+        with patch.dict(os.environ, {'BAT_CANVAS_TIMEOUT': '5'}):
+            t.assertEqual(t.resolve(token='a').canvas.timeout, '5')
+
+    def test_file_change(t):
+        t.write_config('file_url', mtime=1_000_000_000)
+        t.assertEqual(t.resolve().canvas.url, 'file_url')
+
+        t.write_config('new_url', mtime=2_000_000_000)
+        t.assertEqual(t.resolve().canvas.url, 'new_url')
+
+    def test_pickle(t):
+        cfg = t.resolve(token='a')
+        copy = pickle.loads(pickle.dumps(cfg))
+        t.assertEqual(copy.canvas.url, 'file_url')
+        t.assertEqual(dict(copy.items()), dict(cfg.items()))
+
+    def test_threads(t):
+        with ThreadPoolExecutor(8) as pool:
+            configs = list(pool.map(lambda _: t.resolve(token='a'), range(8)))
+        t.assertEqual({c.canvas.token for c in configs}, {'a'})
+
+    def test_lookup_benchmark(t):
+        '''lookups against the batconf Configuration they replace'''
+        args = Namespace(token='cli_token')
+        cfg = get_config(cli_args=args, config_file_name=t.config_file)
+        snapshot = t.resolve(token='cli_token')
+        count = 10_000
+
+        def lookups(cfg):
+            start = time.perf_counter()
+            for _ in range(count):
+                cfg.canvas.url
+                cfg.canvas.token
+                cfg.report.workers
+            return (time.perf_counter() - start) / (count * 3)
+
+        configuration, resolved = lookups(cfg), lookups(snapshot)
+        print(
+            f'\nconfig lookup: Configuration {configuration * 1e9:.0f}ns,'
+            f' ResolvedConfig {resolved * 1e9:.0f}ns'
+        )
+        t.assertLess(resolved * 5, configuration)
@@ -0,0 +1,333 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+import io
+import json
+import os
+import stat
+import threading
+import time
+from datetime import datetime, timedelta
+from tempfile import TemporaryDirectory
+
+from ..daemon import (
+    Cron,
+    Daemon,
+    DaemonServer,
+    QueueFull,
+    Run,
+    RunQueue,
+    ScheduledJob,
+    load_schedule,
+    parse_argv,
+    request,
+)
+from ..lib.canvas import CanvasClient, keep_clients
+from .fake_canvas import FakeCanvas, paginated
+
+
+SRC = "bat.daemon"
+
+# a Monday
+MONDAY = datetime(2024, 5, 6, 12, 34, 56)
+
+
+class CronTests(TestCase):
+
+    def test_next(t):
+        t.assertEqual(
+            Cron("*/15 * * * *").next(MONDAY), datetime(2024, 5, 6, 12, 45)
+        )
+        t.assertEqual(
+            Cron("@daily").next(MONDAY), datetime(2024, 5, 7, 0, 0)
+        )
+        t.assertEqual(
+            Cron("@hourly").next(datetime(2024, 12, 31, 23, 0)),
+            datetime(2025, 1, 1, 0, 0),
+        )
+        # weekdays only, friday night to monday
+        friday = datetime(2024, 5, 10, 3, 0)
+        t.assertEqual(
+            Cron("30 2 * * 1-5").next(friday), datetime(2024, 5, 13, 2, 30)
+        )
+        t.assertEqual(
+            Cron("0 9 * * 7").next(MONDAY), datetime(2024, 5, 12, 9, 0)
+        )
+        t.assertEqual(
+            Cron("0 0 1,15 */3 *").next(MONDAY), datetime(2024, 7, 1, 0, 0)
+        )
+
+    def test_day_fields(t):
+        # the 20th, or any Sunday, as cron does
+        cron = Cron("0 0 20 * 0")
+        t.assertEqual(cron.next(MONDAY), datetime(2024, 5, 12, 0, 0))
+        t.assertEqual(
+            cron.next(datetime(2024, 5, 19, 1, 0)), datetime(2024, 5, 20)
+        )
+
+    def test_invalid(t):
+        for expression in (
+            "* * * *",
+            "60 * * * *",
+            "a * * * *",
+            "5-1 * * * *",
+        ):
+            with t.assertRaises(ValueError, msg=expression):
+                Cron(expression)
+        with t.assertRaisesRegex(ValueError, "never runs"):
+            Cron("0 0 30 2 *").next(MONDAY)
+
+
+class ScheduleTests(TestCase):
+
+    def test_load_schedule(t):
+        with TemporaryDirectory() as tmp:
+            path = f"{tmp}/schedule.yaml"
+            with open(path, "w") as f:
+                f.write(
+                    "jobs:\n"
+                    "  - name: grades\n"
+                    "    cron: '0 2 * * *'\n"
+                    "    priority: 10\n"
+                    "    command: report grades -o '/data/grades x.csv'\n"
+                    "  - name: hello\n"
+                    "    cron: '@hourly'\n"
+                    "    command: [hello]\n"
+                )
+            grades, hello = load_schedule(path)
+        t.assertEqual(
+            grades.command, ["report", "grades", "-o", "/data/grades x.csv"]
+        )
+        t.assertEqual(grades.priority, 10)
+        t.assertEqual(grades.cron.expression, "0 2 * * *")
+        t.assertEqual((hello.command, hello.priority), (["hello"], 0))
+
+
+class RunQueueTests(TestCase):
+
+    def test_priority(t):
+        queue = RunQueue(3)
+        for id, priority in ((1, 0), (2, 5), (3, 0)):
+            queue.put(Run(id, f"r{id}", [], priority))
+        with t.assertRaises(QueueFull):
+            queue.put(Run(4, "r4", []))
+        t.assertEqual([queue.get().id for _ in range(2)], [2, 1])
+        t.assertEqual([run.id for run in queue.close()], [3])
+        t.assertIsNone(queue.get())
+
+
+class DaemonTests(TestCase):
+
+    def setUp(t):
+        t.now = MONDAY
+        t.ran = []
+        t.release = threading.Event()
+        t.release.set()
+
+    def daemon(t, *jobs, **kwargs):
+        def runner(argv):
+            t.ran.append(argv)
+            t.release.wait(5)
+            if argv == ["fail"]:
+                raise RuntimeError("boom")
+
+        daemon = Daemon(jobs, runner=runner, clock=lambda: t.now, **kwargs)
+        t.addCleanup(daemon.stop, 5)
+        return daemon
+
+    def test_tick(t):
+        daemon = t.daemon(
+            ScheduledJob("a", ["a"], Cron("*/15 * * * *")),
+            ScheduledJob("b", ["b"], Cron("0 13 * * *"), priority=1),
+        )
+        t.assertEqual(daemon.tick(), 10 * 60 + 4)
+        t.assertEqual(daemon.queue.runs(), [])
+
+        t.now = datetime(2024, 5, 6, 13, 0, 30)
+        daemon.tick()
+        t.assertEqual(
+            [run.name for run in daemon.queue.runs()], ["b", "a"]
+        )
+        t.assertEqual(daemon.due["a"], datetime(2024, 5, 6, 13, 15))
+        t.assertEqual(daemon.due["b"], datetime(2024, 5, 7, 13, 0))
+
+        # not queued again while the last run is pending
+        t.now = datetime(2024, 5, 6, 13, 15)
+        with t.assertLogs(SRC, "WARNING"):
+            daemon.tick()
+        t.assertEqual(len(daemon.queue.runs()), 2)
+
+    def test_queue_full(t):
+        daemon = t.daemon(
+            ScheduledJob("a", ["a"], Cron("* * * * *")), queue_size=1
+        )
+        daemon.submit(["other"])
+        daemon.tick()
+        t.now += timedelta(minutes=1)
+        with t.assertLogs(SRC, "WARNING") as logs:
+            daemon.tick()
+        t.assertIn("a skipped", logs.output[0])
+        with t.assertRaises(QueueFull):
+            daemon.submit_job("a")
+
+    def test_runs(t):
+        daemon = t.daemon(
+            ScheduledJob("a", ["a"], Cron("@daily")), workers=1
+        )
+        t.release.clear()
+        first = daemon.submit(["first"])
+        daemon.start()
+        while not daemon.running:
+            time.sleep(0.001)
+        low = daemon.submit(["low"])
+        job = daemon.submit_job("a", priority=3)
+        with t.assertLogs(SRC, "ERROR"):
+            failed = daemon.submit(["fail"], priority=1)
+            t.assertEqual(
+                [run["name"] for run in daemon.status()["queued"]],
+                ["a", "fail", "low"],
+            )
+            t.release.set()
+            low.done.wait(5)
+        t.assertEqual(t.ran, [["first"], ["a"], ["fail"], ["low"]])
+        t.assertEqual((first.state, job.state, low.state), ("ok",) * 3)
+        t.assertEqual(failed.state, "failed")
+        t.assertIn("boom", failed.error)
+
+        status = daemon.status()
+        t.assertEqual(status["running"], [])
+        t.assertEqual(status["recent"][0]["name"], "low")
+        t.assertEqual(status["schedule"][0]["next"], "2024-05-07T00:00")
+
+    def test_stop(t):
+        daemon = t.daemon(workers=1)
+        t.release.clear()
+        daemon.start()
+        running = daemon.submit(["running"])
+        queued = daemon.submit(["queued"])
+        while not daemon.running:
+            time.sleep(0.001)
+        threading.Timer(0.05, t.release.set).start()
+        daemon.stop(5)
+        t.assertEqual((running.state, queued.state), ("ok", "cancelled"))
+        t.assertEqual(t.ran, [["running"]])
+
+
+CONFIG_YAML = """
+default: test
+test:
+    bat:
+        canvas:
+            url: {url}
+            token: token
+        cache:
+            enabled: "false"
+        report:
+            state_db: {tmp}/state.sqlite
+"""
+
+
+class ServerTests(TestCase):
+
+    def setUp(t):
+        tmp = TemporaryDirectory()
+        t.addCleanup(tmp.cleanup)
+        t.tmp = tmp.name
+        t.canvas = FakeCanvas(
+            {"/api/v1/courses/1/assignments": paginated([{"id": 1}])}
+        )
+        t.addCleanup(t.canvas.close)
+        with open(f"{t.tmp}/config.yaml", "w") as f:
+            f.write(CONFIG_YAML.format(url=t.canvas.url, tmp=t.tmp))
+
+        t.daemon = Daemon(workers=2)
+        t.socket = f"{t.tmp}/bat.sock"
+        kept = keep_clients()
+        t.kept = kept.__enter__()
+        t.addCleanup(kept.__exit__, None, None, None)
+        t.server = DaemonServer(t.socket, t.daemon)
+        listener = threading.Thread(target=t.server.serve_forever)
+        listener.start()
+        t.daemon.start()
+        t.addCleanup(t.server.server_close)
+        t.addCleanup(listener.join)
+        t.addCleanup(t.server.shutdown)
+        t.addCleanup(t.daemon.stop, 5)
+
+    def report(t, n):
+        return [
+            "-c",
+            f"{t.tmp}/config.yaml",
+            "report",
+            "assignments",
+            "--course",
+            "1",
+            "-o",
+            f"{t.tmp}/out{n}.jsonl",
+        ]
+
+    def test_run(t):
+        for n in range(2):
+            reply = request(t.socket, {"run": t.report(n)})
+            t.assertEqual(reply["state"], "ok", reply)
+            with open(f"{t.tmp}/out{n}.jsonl") as f:
+                t.assertEqual(json.loads(f.read())["id"], 1)
+        # both runs shared the client kept open
+        (client,) = t.kept.values()
+        t.assertIsInstance(client, CanvasClient)
+        t.assertTrue(client.kept)
+
+        start = time.perf_counter()
+        with patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            reply = request(t.socket, {"run": "hello"})
+        elapsed = time.perf_counter() - start
+        print(f"\nad-hoc run over the socket: {elapsed * 1000:.1f}ms")
+        t.assertEqual(reply["state"], "ok")
+        t.assertIn("Hello", stdout.getvalue())
+        t.assertLess(elapsed, 1.0)
+
+    def test_no_wait(t):
+        reply = request(t.socket, {"run": t.report(0), "wait": False})
+        t.assertEqual(reply["state"], "queued")
+        status = request(t.socket, {"status": True})
+        t.assertEqual(
+            {run["id"] for run in status["queued"] + status["running"]}
+            | {run["id"] for run in status["recent"]},
+            {reply["id"]},
+        )
+
+    def test_errors(t):
+        with t.assertRaisesRegex(RuntimeError, "invalid choice"):
+            request(t.socket, {"run": ["report", "nope"]})
+        with t.assertRaisesRegex(RuntimeError, "no scheduled job"):
+            request(t.socket, {"job": "nope"})
+        with t.assertRaisesRegex(RuntimeError, "expected run"):
+            request(t.socket, {})
+        t.assertEqual(t.daemon.queue.runs(), [])
+
+    def test_private(t):
+        t.assertEqual(stat.S_IMODE(os.stat(t.socket).st_mode), 0o600)
+
+    def test_one_daemon(t):
+        with t.assertRaisesRegex(RuntimeError, "already listening"):
+            DaemonServer(t.socket, t.daemon)
+
+
+class ParseArgvTests(TestCase):
+
+    def test_parse_argv(t):
+        args = parse_argv(["-e", "prod", "report", "assignments"])
+        t.assertEqual((args.config_env, args.name), ("prod", "assignments"))
+        with t.assertRaisesRegex(ValueError, "invalid choice"):
+            parse_argv(["report", "nope"])
+
+    def test_no_output(t):
+        # runs share the daemon's stderr, nothing is written or swapped
+        with patch("sys.stderr", new_callable=io.StringIO) as stderr, patch(
+            "sys.stdout", new_callable=io.StringIO
+        ) as stdout:
+            with t.assertRaisesRegex(ValueError, "cache_command: invalid"):
+                parse_argv(["cache", "nope"])
+            with t.assertRaisesRegex(ValueError, "report exited"):
+                parse_argv(["report", "assignments", "--help"])
+        t.assertEqual((stderr.getvalue(), stdout.getvalue()), ("", ""))
@@ -0,0 +1,178 @@
+from unittest import TestCase, skipUnless
+
+import importlib.util
+import json
+from tempfile import TemporaryDirectory
+
+from ..conf import get_config, Namespace
+from ..lib import decode
+from ..lib.canvas import CanvasClient
+from ..lib.decode import (
+    DECODERS,
+    JsonDecoder,
+    decoder,
+    get_decoder,
+    decode_array,
+    use_decoder,
+)
+from ..lib.paginate import paginate, stream_array
+from ..records import Submission
+from .fake_canvas import (
+    FakeCanvas,
+    Scale,
+    SyntheticCanvas,
+    json_reply,
+    submissions,
+)
+
+
+SRC = "bat.lib.decode"
+
+INSTALLED = [
+    name
+    for name in DECODERS[1:]
+    if name == "json" or importlib.util.find_spec(name)
+]
+
+ARRAY = [
+    {"a": 'x"}],[\\', "b": [1, {"c": None}], "n": 1.5},
+    3,
+    "s,]",
+    [],
+    {},
+    {"s": "{", "t": 2},
+    None,
+]
+
+
+def chunked(data: bytes, size: int):
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+class DecodeArrayTests(TestCase):
+
+    def test_chunks(t):
+        data = json.dumps(ARRAY).encode()
+        for size in (1, 2, 3, 7, 64, len(data)):
+            with t.subTest(size=size):
+                t.assertEqual(list(decode_array(chunked(data, size))), ARRAY)
+
+    def test_empty(t):
+        t.assertEqual(list(decode_array([b" [ ", b"] "])), [])
+        t.assertEqual(list(decode_array([b"[1 ,2]"])), [1, 2])
+
+    def test_invalid(t):
+        for data in (b"", b"[1,", b'{"a": [1]}', b'"[1]"'):
+            with t.subTest(data=data), t.assertRaises(ValueError):
+                list(decode_array([data]))
+
+
+class DecoderTests(TestCase):
+
+    def setUp(t):
+        t.addCleanup(setattr, decode, "_decoder", decode._decoder)
+
+    def test_backends(t):
+        page = json.dumps(submissions(Scale(students=5), 1)).encode()
+        records = [Submission.from_json(r) for r in json.loads(page)]
+        for name in INSTALLED:
+            with t.subTest(name=name):
+                backend = get_decoder(name)
+                t.assertEqual(backend.name, name)
+                t.assertEqual(backend.loads(page), json.loads(page))
+                t.assertEqual(backend.records(page, Submission), records)
+                t.assertEqual(
+                    list(backend.iter_array(chunked(page, 100))),
+                    json.loads(page),
+                )
+
+    @skipUnless("msgspec" in INSTALLED, "requires msgspec")
+    def test_typed(t):
+        backend = get_decoder("msgspec")
+        page = json.dumps(
+            [{"workflow_state": "grad" + "ed", "score": 9}]
+        ).encode()
+        (record,) = backend.records(page, Submission)
+        t.assertIs(record.workflow_state, "graded")
+        t.assertEqual(record.score, 9.0)
+        # a course id as text fails validation, the page is converted
+        page = json.dumps([{"course_id": "7"}]).encode()
+        t.assertEqual(
+            backend.records(page, Submission), [Submission(course_id="7")]
+        )
+
+    def test_select(t):
+        t.assertIsInstance(get_decoder(), JsonDecoder)
+        t.assertEqual(use_decoder("json").name, "json")
+        t.assertEqual(decoder().name, "json")
+        with t.assertRaises(ValueError):
+            get_decoder("simplejson")
+
+    def test_missing(t):
+        missing = [name for name in DECODERS[1:] if name not in INSTALLED]
+        for name in missing:
+            with t.subTest(name=name), t.assertRaises(RuntimeError):
+                get_decoder(name)
+
+    def test_from_config(t):
+        tmp = TemporaryDirectory()
+        t.addCleanup(tmp.cleanup)
+        cfg = get_config(
+            cli_args=Namespace(
+                url="http://canvas",
+                token="token",
+                json_decoder="json",
+                directory=tmp.name,
+            )
+        )
+        default = decoder()
+        with CanvasClient.from_config(cfg) as client:
+            t.assertEqual(client.json_decoder.name, "json")
+            # the client's own, the default is left to other clients
+            t.assertIs(decoder(), default)
+
+        routes = {"/api/v1/courses": lambda h: json_reply([{"id": 1}])}
+        with FakeCanvas(routes) as server:
+            with CanvasClient(
+                server.url, "token", json_decoder=get_decoder("json")
+            ) as client:
+                response = client.get("/api/v1/courses")
+                t.assertIs(response.decoder, client.json_decoder)
+                t.assertEqual(response.json(), [{"id": 1}])
+
+
+class PaginateTests(TestCase):
+
+    def setUp(t):
+        t.scale = Scale(students=30, assignments=3)
+        t.server = SyntheticCanvas(
+            t.scale,
+            routes={
+                "/api/v1/big": lambda h: json_reply(
+                    submissions(t.scale, 1)
+                )
+            },
+        )
+        t.addCleanup(t.server.close)
+        t.client = CanvasClient(t.server.url, "token")
+        t.addCleanup(t.client.close)
+
+    def test_record_type(t):
+        records = list(
+            paginate(
+                t.client,
+                "/api/v1/courses/1/students/submissions",
+                per_page=25,
+                record_type=Submission,
+            )
+        )
+        t.assertEqual(
+            records,
+            [Submission.from_json(r) for r in submissions(t.scale, 1)],
+        )
+
+    def test_stream_array(t):
+        t.assertEqual(
+            list(stream_array(t.client, "/api/v1/big")),
+            submissions(t.scale, 1),
+        )
@@ -0,0 +1,254 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+import io
+import json
+from tempfile import TemporaryDirectory
+
+from ..cli import argparser
+from ..entities import EntityStore, MissingReport, group_by
+from ..records import Enrollment
+from ..report import StateStore
+from ..report.cli import _Commands
+from .fake_canvas import (
+    Scale,
+    SyntheticCanvas,
+    enrollments,
+    sections,
+    submissions,
+)
+
+
+SRC = "bat.entities"
+
+SCALE = Scale(courses=2, sections=2, students=6, teachers=1, assignments=3)
+
+
+def store():
+    ret = EntityStore()
+    ret.load("enrollments", enrollments(SCALE, 1) + enrollments(SCALE, 2))
+    ret.load("sections", sections(SCALE, 1) + sections(SCALE, 2))
+    return ret
+
+
+class EntityStoreTests(TestCase):
+
+    def test_indexes(t):
+        s = store()
+        # built on load, for the fields the records have
+        t.assertEqual(
+            sorted(key[1] for key in s._indexes if key[0] == "sections"),
+            [("course_id",), ("id",)],
+        )
+        by_course = s.index("enrollments", "course_id")
+        t.assertEqual(len(by_course[1]), 7)
+        t.assertIs(s.index("enrollments", "course_id"), by_course)
+
+        t.assertEqual(s.get("sections", 101)["name"], "Section 1")
+        t.assertIsNone(s.get("sections", 999))
+        teacher = s.where(
+            "enrollments", course_id=2, type="TeacherEnrollment"
+        )
+        t.assertEqual([e["user_id"] for e in teacher], [10_000_002])
+
+        # loading again replaces the kind, and its indexes
+        s.load("sections", [dict(id=1, course_id=None)])
+        t.assertEqual(s.index("sections", "course_id"), {})
+        t.assertEqual(s.where("sections", id=1), [dict(id=1, course_id=None)])
+
+    def test_casts(t):
+        s = EntityStore()
+        s.load("rows", [dict(id="1", course_id="3"), dict(id="2")],
+               casts={"course_id": int, "name": str})
+        t.assertEqual(s.entities["rows"][0]["course_id"], 3)
+        t.assertEqual(list(s.index("rows", "course_id")), [3])
+
+    def test_records(t):
+        s = EntityStore()
+        s.load("enrollments", map(Enrollment.from_json, enrollments(SCALE, 1)))
+        (teacher,) = s.where("enrollments", type="TeacherEnrollment")
+        t.assertEqual(teacher.user_id, 10_000_001)
+        rows = list(
+            s.join(
+                [{"user": teacher.user_id}],
+                "enrollments",
+                on={"user": "user_id"},
+                fields=("course_section_id",),
+            )
+        )
+        t.assertEqual(rows, [{"user": 10_000_001, "course_section_id": 101}])
+
+    def test_join(t):
+        s = store()
+        rows = [
+            dict(course_id=1, section_id=101),
+            dict(course_id=1, section_id=None),
+            dict(course_id=1, section_id=999),
+        ]
+        joined = list(
+            s.join(
+                rows,
+                "sections",
+                on={"section_id": "id"},
+                fields={"name": "section"},
+            )
+        )
+        t.assertEqual(
+            joined, [dict(course_id=1, section_id=101, section="Section 1")]
+        )
+        # the rows are left as they were
+        t.assertNotIn("section", rows[0])
+
+        left = list(
+            s.join(
+                rows, "sections", on={"section_id": "id"}, fields=("name",),
+                how="left",
+            )
+        )
+        t.assertEqual(
+            [row["name"] for row in left], ["Section 1", None, None]
+        )
+        with t.assertRaisesRegex(ValueError, "unknown join"):
+            list(s.join(rows, "sections", on="id", how="outer"))
+
+    def test_join_many(t):
+        s = store()
+        # a row per matching entity, on a composite key
+        joined = list(
+            s.join(
+                [dict(course_id=2, course_section_id=201)],
+                "enrollments",
+                on=("course_id", "course_section_id"),
+                fields=("user_id", "type"),
+            )
+        )
+        t.assertEqual(len(joined), 4)
+        t.assertEqual(
+            {row["user_id"] for row in joined},
+            {
+                e["user_id"]
+                for e in enrollments(SCALE, 2)
+                if e["course_section_id"] == 201
+            },
+        )
+        # an unknown kind matches nothing
+        t.assertEqual(list(s.join(joined, "users", on="user_id")), [])
+
+
+class GroupByTests(TestCase):
+
+    def test_group_by(t):
+        rows = [
+            dict(section=1, user=1, score=4.0),
+            dict(section=2, user=2, score=None),
+            dict(section=1, user=1, score=8.0),
+            dict(section=1, user=3, score=6.0),
+        ]
+        t.assertEqual(
+            group_by(
+                rows,
+                ["section"],
+                count=(None, "count"),
+                scored=("score", "count"),
+                users=("user", "count_distinct"),
+                total=("score", "sum"),
+                low=("score", "min"),
+                high=("score", "max"),
+                mean=("score", "mean"),
+                scores=("score", "list"),
+            ),
+            [
+                dict(section=1, count=3, scored=3, users=2, total=18.0,
+                     low=4.0, high=8.0, mean=6.0, scores=[4.0, 8.0, 6.0]),
+                dict(section=2, count=1, scored=0, users=1, total=0,
+                     low=None, high=None, mean=None, scores=[]),
+            ],
+        )
+        t.assertEqual(
+            group_by(rows, ("section", "user"), n=(None, "count"))[0],
+            dict(section=1, user=1, n=2),
+        )
+        with t.assertRaisesRegex(ValueError, "unknown aggregate 'median'"):
+            group_by(rows, ["section"], m=("score", "median"))
+
+
+class MissingReportTests(TestCase):
+
+    def setUp(t):
+        tmp = TemporaryDirectory()
+        t.addCleanup(tmp.cleanup)
+        t.tmp = tmp.name
+        t.state = StateStore(f"{t.tmp}/state.sqlite")
+        t.addCleanup(t.state.close)
+        for course_id in (1, 2):
+            for report, records in (
+                ("enrollments", enrollments(SCALE, course_id)),
+                ("submissions", submissions(SCALE, course_id)),
+            ):
+                # as the report run stores them, course ids as text
+                t.state.merge(
+                    report,
+                    str(course_id),
+                    [
+                        (str(r["id"]), {**r, "course_id": str(course_id)})
+                        for r in records
+                    ],
+                    "m",
+                )
+
+    def expected(t):
+        sections = {
+            (e["course_id"], e["user_id"]): e["course_section_id"]
+            for course_id in (1, 2)
+            for e in enrollments(SCALE, course_id)
+        }
+        missing = {}
+        for course_id in (1, 2):
+            for s in submissions(SCALE, course_id):
+                if s["missing"]:
+                    key = (course_id, sections[course_id, s["user_id"]])
+                    missing[key] = missing.get(key, 0) + 1
+        return missing
+
+    def test_rows(t):
+        rows = list(MissingReport().rows(t.state, ["1", "2"]))
+        t.assertEqual(
+            {(r["course_id"], r["section_id"]): r["missing"] for r in rows},
+            t.expected(),
+        )
+        t.assertEqual(list(rows[0]), list(MissingReport.columns))
+        for row in rows:
+            (teacher,) = [
+                e
+                for e in enrollments(SCALE, row["course_id"])
+                if e["type"] == "TeacherEnrollment"
+            ]
+            t.assertEqual(
+                row["instructor_ids"],
+                str(teacher["user_id"])
+                if teacher["course_section_id"] == row["section_id"]
+                else None,
+            )
+            t.assertLessEqual(row["students"], row["missing"])
+
+    def test_report(t):
+        with SyntheticCanvas(SCALE) as srv:
+            args = argparser().parse_args(
+                ["report", "missing_by_section"]
+                + ["--course", "1", "--course", "2"]
+            )
+            args.url, args.token = srv.url, "token"
+            args.enabled = "false"
+            args.state_db = f"{t.tmp}/command.sqlite"
+            with patch("sys.stdout", new_callable=io.StringIO) as out:
+                _Commands.report(args)
+
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        t.assertEqual(
+            {(r["course_id"], r["section_id"]): r["missing"] for r in rows},
+            t.expected(),
+        )
+
+        args.mirror = True
+        with t.assertRaisesRegex(RuntimeError, "drop --mirror"):
+            _Commands.report(args)
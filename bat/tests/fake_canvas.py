@@ -0,0 +1,602 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import json
+import random
+import re
+import threading
+import time
+from argparse import ArgumentParser
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+
+# (status, headers, body)
+Reply = Tuple[int, Dict[str, str], bytes]
+Route = Callable[["FakeCanvasHandler"], Reply]
+
+
+class RateLimitBucket:
+    """Canvas's leaky bucket rate limit, per server rather than per token.
+
+    Each request fills the bucket by `cost`, which leaks `leak_rate` per
+    second. A request that would overflow `capacity` is refused, as
+    Canvas does with a 403 Rate Limit Exceeded.
+    """
+
+    def __init__(
+        self,
+        capacity: float = 700.0,
+        leak_rate: float = 10.0,
+        cost: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.capacity = capacity
+        self.leak_rate = leak_rate
+        self.cost = cost
+        self.level = 0.0
+        self.refused = 0
+        self._clock = clock
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def take(self) -> Tuple[bool, float]:
+        """Meter a request, returns whether it is allowed, and the quota
+        remaining, the X-Rate-Limit-Remaining header"""
+        with self._lock:
+            now = self._clock()
+            self.level = max(
+                0.0, self.level - (now - self._last) * self.leak_rate
+            )
+            self._last = now
+            if self.level + self.cost > self.capacity:
+                self.refused += 1
+                return False, self.capacity - self.level
+            self.level += self.cost
+            return True, self.capacity - self.level
+
+
+class FakeCanvas:
+    """Local stand-in for a Canvas instance, serving on 127.0.0.1.
+
+    `routes` maps a request path (without the query) to a callable that
+    receives the handler and returns a (status, headers, body) reply.
+    Unknown paths answer 404.
+
+    Each request waits `latency` seconds plus up to `jitter` more, and
+    is metered by `rate_limit` if given. A share `error_rate` of the
+    requests fail with `error_status`. Jitter and errors are drawn from a
+    random generator seeded with `seed`, reproducible for a sequential
+    client.
+    """
+
+    def __init__(
+        self,
+        routes: Optional[Dict[str, Route]] = None,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        rate_limit: Optional[RateLimitBucket] = None,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        seed: int = 0,
+        port: int = 0,
+    ):
+        self.routes: Dict[str, Route] = dict(routes or {})
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests: List[str] = []
+        self.connections: set = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+
+        self.server = _Server(("127.0.0.1", port), _handler_class(self))
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, args=(0.05,), daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "FakeCanvas":
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def handle(self, handler: "FakeCanvasHandler") -> Reply:
+        with self._lock:
+            self.requests.append(handler.path)
+            self.connections.add(handler.client_address)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            delay = self.latency + self.jitter * self._random.random()
+            failed = self._random.random() < self.error_rate
+        try:
+            if delay:
+                time.sleep(delay)
+            headers = {}
+            if self.rate_limit is not None:
+                allowed, remaining = self.rate_limit.take()
+                headers["X-Rate-Limit-Remaining"] = f"{remaining:.1f}"
+                headers["X-Request-Cost"] = f"{self.rate_limit.cost:g}"
+                if not allowed:
+                    return _with_headers(
+                        json_reply("403 Forbidden (Rate Limit Exceeded)", 403),
+                        headers,
+                    )
+            if failed:
+                with self._lock:
+                    self.errors += 1
+                return json_reply(
+                    {"errors": [{"message": "injected error"}]},
+                    self.error_status,
+                )
+            route = self.route(urlsplit(handler.path).path)
+            if route is None:
+                reply = json_reply({"errors": [{"message": "not found"}]}, 404)
+            else:
+                reply = route(handler)
+            return _with_headers(reply, headers)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def route(self, path: str) -> Optional[Route]:
+        return self.routes.get(path)
+
+
+def json_reply(data, status: int = 200, **headers: str) -> Reply:
+    head = {"Content-Type": "application/json"}
+    head.update({k.replace("_", "-"): v for k, v in headers.items()})
+    return status, head, json.dumps(data).encode()
+
+
+def _with_headers(reply: Reply, headers: Dict[str, str]) -> Reply:
+    status, head, body = reply
+    return status, {**head, **headers}, body
+
+
+def paginated(records: Sequence, default_per_page: int = 10) -> Route:
+    """Route serving `records` in pages linked with Link: rel=next"""
+
+    def route(handler: "FakeCanvasHandler") -> Reply:
+        return page_reply(handler, records, default_per_page)
+
+    return route
+
+
+def page_reply(
+    handler: "FakeCanvasHandler",
+    records: Sequence,
+    default_per_page: int = 10,
+) -> Reply:
+    """The page of `records` requested, with a Link header to the next"""
+    parts = urlsplit(handler.path)
+    query = parse_qs(parts.query)
+    page = int(query.get("page", ["1"])[0])
+    per_page = int(query.get("per_page", [default_per_page])[0])
+    start = (page - 1) * per_page
+    headers = {}
+    if start + per_page < len(records):
+        query.update(page=[str(page + 1)], per_page=[str(per_page)])
+        host, port = handler.server.server_address[:2]
+        next_url = (
+            f"http://{host}:{port}{parts.path}"
+            f"?{urlencode(query, doseq=True)}"
+        )
+        headers["Link"] = f'<{next_url}>; rel="next"'
+    return json_reply(records[start : start + per_page], **headers)
+
+
+class FakeCanvasHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # buffer the reply so headers and body go out in one segment
+    wbufsize = -1
+    disable_nagle_algorithm = True
+    canvas: FakeCanvas
+
+    def do_GET(self):
+        self.reply(*self.canvas.handle(self))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.request_body = self.rfile.read(length)
+        self.reply(*self.canvas.handle(self))
+
+    def reply(self, status: int, headers: Dict[str, str], body: bytes):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    # room for asyncio clients opening a hundred connections at once
+    request_queue_size = 256
+
+
+def _handler_class(canvas: FakeCanvas):
+    return type("Handler", (FakeCanvasHandler,), {"canvas": canvas})
+
+
+# Synthetic Canvas data
+
+
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+@dataclass(frozen=True)
+class Scale:
+    """How much synthetic data a SyntheticCanvas serves.
+
+    Counts are per account for courses, and per course for the others.
+    Students are drawn from a population shared by every course, so most
+    take several courses, as they would in an institution.
+    """
+
+    accounts: int = 1
+    courses: int = 10
+    sections: int = 2
+    students: int = 30
+    teachers: int = 1
+    assignments: int = 10
+
+    @property
+    def total_courses(self) -> int:
+        return self.accounts * self.courses
+
+    @property
+    def population(self) -> int:
+        """Distinct students across every course"""
+        size = max(self.students, self.total_courses * self.students // 4)
+        # the stride picking a course's students must not divide it
+        return size + 1 if size % _STRIDE == 0 else size
+
+
+# a prime, spreads the students of a course over the population
+_STRIDE = 7919
+# user ids of teachers start past those of students
+_TEACHERS = 10_000_000
+
+
+def _bits(*values: int) -> int:
+    """Cheap, deterministic, well spread pseudo-random bits"""
+    h = 0x811C9DC5
+    for value in values:
+        h = ((h ^ value) * 0x01000193) & 0xFFFFFFFF
+        h ^= h >> 15
+    return h
+
+
+def _timestamp(*values: int) -> str:
+    when = EPOCH + timedelta(seconds=_bits(*values) % (180 * 86400))
+    return when.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+@lru_cache(maxsize=4096)
+def course(scale: Scale, course_id: int) -> Dict[str, Any]:
+    return dict(
+        id=course_id,
+        name=f"Course {course_id}",
+        course_code=f"C{course_id:05d}",
+        account_id=(course_id - 1) // scale.courses + 1,
+        enrollment_term_id=1,
+        workflow_state="available",
+        total_students=scale.students,
+    )
+
+
+def student_ids(scale: Scale, course_id: int) -> List[int]:
+    population = scale.population
+    return [
+        (course_id * scale.students + n * _STRIDE) % population + 1
+        for n in range(scale.students)
+    ]
+
+
+def section_id(scale: Scale, course_id: int, n: int) -> int:
+    return course_id * 100 + n % scale.sections + 1
+
+
+@lru_cache(maxsize=256)
+def enrollments(scale: Scale, course_id: int) -> List[Dict[str, Any]]:
+    ret = []
+    users = [
+        (user_id, "StudentEnrollment", 3)
+        for user_id in student_ids(scale, course_id)
+    ]
+    users += [
+        (_TEACHERS + course_id * scale.teachers + n, "TeacherEnrollment", 4)
+        for n in range(scale.teachers)
+    ]
+    for n, (user_id, kind, role_id) in enumerate(users):
+        ret.append(
+            dict(
+                id=course_id * 100_000 + n + 1,
+                course_id=course_id,
+                user_id=user_id,
+                course_section_id=section_id(scale, course_id, n),
+                type=kind,
+                role_id=role_id,
+                enrollment_state="active",
+                updated_at=_timestamp(course_id, user_id),
+            )
+        )
+    return ret
+
+
+@lru_cache(maxsize=256)
+def assignments(scale: Scale, course_id: int) -> List[Dict[str, Any]]:
+    return [
+        dict(
+            id=course_id * 1000 + n + 1,
+            course_id=course_id,
+            name=f"Assignment {n + 1}",
+            points_possible=float(10 * (1 + _bits(course_id, n) % 10)),
+            due_at=_timestamp(course_id, n, 1),
+            updated_at=_timestamp(course_id, n, 2),
+        )
+        for n in range(scale.assignments)
+    ]
+
+
+@lru_cache(maxsize=64)
+def submissions(scale: Scale, course_id: int) -> List[Dict[str, Any]]:
+    ret = []
+    for assignment in assignments(scale, course_id):
+        points = assignment["points_possible"]
+        for user_id in student_ids(scale, course_id):
+            bits = _bits(assignment["id"], user_id)
+            submitted = bits % 10 != 0
+            graded = submitted and (bits >> 4) % 10 != 0
+            ret.append(
+                dict(
+                    id=assignment["id"] * scale.population + user_id,
+                    assignment_id=assignment["id"],
+                    user_id=user_id,
+                    course_id=course_id,
+                    workflow_state=(
+                        "graded"
+                        if graded
+                        else "submitted" if submitted else "unsubmitted"
+                    ),
+                    score=(
+                        round(points * ((bits >> 8) % 101) / 100, 1)
+                        if graded
+                        else None
+                    ),
+                    grade=None,
+                    submitted_at=(
+                        _timestamp(assignment["id"], user_id)
+                        if submitted
+                        else None
+                    ),
+                    graded_at=(
+                        _timestamp(assignment["id"], user_id, 1)
+                        if graded
+                        else None
+                    ),
+                    late=submitted and (bits >> 16) % 100 < 15,
+                    missing=not submitted,
+                )
+            )
+    return ret
+
+
+def user(scale: Scale, user_id: int) -> Dict[str, Any]:
+    return dict(
+        id=user_id,
+        name=f"User {user_id}",
+        sortable_name=f"{user_id}, User",
+        login_id=f"user{user_id}",
+    )
+
+
+def course_users(scale: Scale, course_id: int) -> List[Dict[str, Any]]:
+    return [
+        user(scale, e["user_id"]) for e in enrollments(scale, course_id)
+    ]
+
+
+def sections(scale: Scale, course_id: int) -> List[Dict[str, Any]]:
+    return [
+        dict(
+            id=section_id(scale, course_id, n),
+            course_id=course_id,
+            name=f"Section {n + 1}",
+        )
+        for n in range(scale.sections)
+    ]
+
+
+# the filters of a listing limiting it to the records changed since
+SINCE = {
+    "students/submissions": {
+        "submitted_since": "submitted_at",
+        "graded_since": "graded_at",
+    },
+}
+# the filters of a listing limiting it to records by id
+IDS = {"users": "user_ids[]", "assignments": "assignment_ids[]"}
+
+_PATHS = re.compile(
+    r"^/api/v1/(?:"
+    r"accounts/(?P<account>\d+)/courses"
+    r"|courses/(?P<course>\d+)(?:/(?P<listing>.+))?"
+    r"|users/(?P<user>\d+)"
+    r")$"
+)
+
+
+class SyntheticCanvas(FakeCanvas):
+    """FakeCanvas serving deterministic synthetic data at any `scale`.
+
+    Serves accounts/:id/courses, courses/:id, and the enrollments,
+    assignments, students/submissions, users and sections of each
+    course, paginated with Link headers, and users/:id. Records are
+    generated as requested, the same on every run. Other keyword
+    arguments are those of FakeCanvas, `routes` take precedence.
+    """
+
+    def __init__(self, scale: Scale = Scale(), **options):
+        super().__init__(**options)
+        self.scale = scale
+
+    @classmethod
+    def from_profile(cls, name: str, **options) -> "SyntheticCanvas":
+        profile = PROFILES[name]
+        return cls(**{**profile.options(), **options})
+
+    def course_ids(self, account_id: int) -> List[int]:
+        first = (account_id - 1) * self.scale.courses + 1
+        return list(range(first, first + self.scale.courses))
+
+    def route(self, path: str) -> Optional[Route]:
+        if (route := super().route(path)) is not None:
+            return route
+        if (match := _PATHS.match(path)) is None:
+            return None
+        account, course_id, listing, user_id = match.groups()
+        scale = self.scale
+
+        if account is not None:
+            if not 1 <= int(account) <= scale.accounts:
+                return None
+            courses = [
+                course(scale, c) for c in self.course_ids(int(account))
+            ]
+            return lambda handler: page_reply(handler, courses)
+
+        if user_id is not None:
+            return lambda handler: json_reply(user(scale, int(user_id)))
+
+        cid = int(course_id)
+        if not 1 <= cid <= scale.total_courses:
+            return None
+        if listing is None:
+            return lambda handler: json_reply(course(scale, cid))
+        listings = {
+            "enrollments": enrollments,
+            "assignments": assignments,
+            "students/submissions": submissions,
+            "users": course_users,
+            "sections": sections,
+        }
+        if listing not in listings:
+            return None
+        records = listings[listing](scale, cid)
+        filters = SINCE.get(listing, {})
+        ids = IDS.get(listing)
+
+        def route(handler: FakeCanvasHandler) -> Reply:
+            query = parse_qs(urlsplit(handler.path).query)
+            selected = records
+            if ids and ids in query:
+                wanted = {int(i) for i in query[ids]}
+                selected = [r for r in selected if r["id"] in wanted]
+            for name, field_name in filters.items():
+                if since := query.get(name, [None])[0]:
+                    selected = [
+                        r for r in selected if (r[field_name] or "") >= since
+                    ]
+            return page_reply(handler, selected)
+
+        return route
+
+
+@dataclass(frozen=True)
+class LoadProfile:
+    """A scale, and the network conditions to serve it under"""
+
+    scale: Scale
+    latency: float = 0.0
+    jitter: float = 0.0
+    rate_limit: Optional[Dict[str, float]] = field(default=None, hash=False)
+    error_rate: float = 0.0
+
+    def options(self) -> Dict[str, Any]:
+        return dict(
+            scale=self.scale,
+            latency=self.latency,
+            jitter=self.jitter,
+            rate_limit=(
+                RateLimitBucket(**self.rate_limit)
+                if self.rate_limit is not None
+                else None
+            ),
+            error_rate=self.error_rate,
+        )
+
+
+PROFILES: Dict[str, LoadProfile] = {
+    # unit tests and CI, no waiting
+    "ci": LoadProfile(Scale(courses=5, students=20, assignments=5)),
+    # a department: 40k submissions, 50-100ms per request, rate limited
+    "realistic": LoadProfile(
+        Scale(courses=100, students=40, assignments=10),
+        latency=0.05,
+        jitter=0.05,
+        rate_limit=dict(capacity=700.0, leak_rate=10.0),
+    ),
+    # an institution: 200k enrollments, 2M submissions
+    "large": LoadProfile(
+        Scale(accounts=4, courses=1000, students=50, assignments=10)
+    ),
+    # 2% of requests fail
+    "flaky": LoadProfile(
+        Scale(courses=20, students=30, assignments=10),
+        latency=0.01,
+        jitter=0.02,
+        error_rate=0.02,
+    ),
+}
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    """Serve a SyntheticCanvas, ex: to point bat at with --url"""
+    p = ArgumentParser(
+        prog="python -m bat.tests.fake_canvas",
+        description="serve synthetic Canvas data for load tests",
+    )
+    p.add_argument("--profile", choices=sorted(PROFILES), default="ci")
+    p.add_argument("--port", type=int, default=8000)
+    args = p.parse_args(argv)
+
+    canvas = SyntheticCanvas.from_profile(args.profile, port=args.port)
+    scale = canvas.scale
+    print(
+        f"serving the {args.profile} profile on {canvas.url}:"
+        f" {scale.accounts} accounts, {scale.total_courses} courses,"
+        f" {scale.total_courses * scale.students * scale.assignments}"
+        " submissions. ctrl-c to stop",
+        flush=True,
+    )
+    try:
+        canvas._thread.join()
+    except KeyboardInterrupt:
+        canvas.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+from unittest import TestCase
+
+import time
+from tempfile import TemporaryDirectory
+
+from ..lib.canvas import CanvasAPIError, CanvasClient, RateLimitBackoff
+from ..lib.paginate import paginate
+from ..report import REPORTS, ReportRunner, StateStore
+from .fake_canvas import (
+    PROFILES,
+    RateLimitBucket,
+    Scale,
+    SyntheticCanvas,
+    json_reply,
+)
+
+
+SRC = "bat.tests.fake_canvas"
+
+
+class SyntheticCanvasTests(TestCase):
+
+    def setUp(t):
+        t.scale = Scale(accounts=2, courses=3, students=12, assignments=4)
+        t.server = SyntheticCanvas(t.scale)
+        t.addCleanup(t.server.close)
+        t.client = CanvasClient(t.server.url, "token")
+        t.addCleanup(t.client.close)
+
+    def test_courses(t):
+        courses = list(paginate(t.client, "/api/v1/accounts/2/courses"))
+        t.assertEqual([c["id"] for c in courses], [4, 5, 6])
+        t.assertEqual(courses[0]["account_id"], 2)
+        t.assertEqual(t.client.get_json("/api/v1/courses/4"), courses[0])
+
+        with t.assertRaises(CanvasAPIError) as err:
+            t.client.get("/api/v1/courses/7")
+        t.assertEqual(err.exception.status, 404)
+
+    def test_enrollments(t):
+        records = list(
+            paginate(t.client, "/api/v1/courses/1/enrollments", per_page=5)
+        )
+        students = [r for r in records if r["type"] == "StudentEnrollment"]
+        t.assertEqual(len(students), 12)
+        t.assertEqual(len(records), 13)
+        t.assertEqual(len({r["user_id"] for r in students}), 12)
+        t.assertEqual({r["course_section_id"] for r in records}, {101, 102})
+
+        # students are shared between courses
+        other = paginate(t.client, "/api/v1/courses/2/enrollments")
+        t.assertTrue(
+            {r["user_id"] for r in students} & {r["user_id"] for r in other}
+        )
+
+    def test_deterministic(t):
+        path = "/api/v1/courses/3/students/submissions"
+        records = list(paginate(t.client, path))
+        t.assertEqual(len(records), 12 * 4)
+        t.assertEqual(len({r["id"] for r in records}), 12 * 4)
+
+        with SyntheticCanvas(t.scale) as other:
+            with CanvasClient(other.url, "token") as client:
+                t.assertEqual(list(paginate(client, path)), records)
+
+    def test_since(t):
+        path = "/api/v1/courses/1/students/submissions"
+        records = list(paginate(t.client, path))
+        since = sorted(r["graded_at"] for r in records if r["graded_at"])[10]
+
+        graded = list(paginate(t.client, path, {"graded_since": since}))
+
+        t.assertTrue(graded)
+        t.assertTrue(all(r["graded_at"] >= since for r in graded))
+        t.assertLess(len(graded), len(records))
+
+    def test_user(t):
+        t.assertEqual(
+            t.client.get_json("/api/v1/users/42")["login_id"], "user42"
+        )
+
+    def test_routes_first(t):
+        t.server.routes["/api/v1/courses/1"] = lambda h: json_reply("mine")
+        t.assertEqual(t.client.get_json("/api/v1/courses/1"), "mine")
+
+    def test_report(t):
+        with TemporaryDirectory() as tmp:
+            state = StateStore(f"{tmp}/state.sqlite")
+            runner = ReportRunner(t.client, state)
+            counts = runner.sync(REPORTS["submissions"](), ["1", "2"])
+            state.close()
+        t.assertEqual(counts, {"1": 48, "2": 48})
+
+    def test_profiles(t):
+        for name, profile in PROFILES.items():
+            with t.subTest(name):
+                options = profile.options()
+                t.assertIs(options["scale"], profile.scale)
+        with SyntheticCanvas.from_profile("flaky", latency=0) as server:
+            t.assertEqual(server.latency, 0)
+            t.assertEqual(server.error_rate, 0.02)
+
+
+class NetworkConditionsTests(TestCase):
+
+    def test_rate_limit_bucket(t):
+        now = [0.0]
+        bucket = RateLimitBucket(
+            capacity=3, leak_rate=1, cost=1, clock=lambda: now[0]
+        )
+        t.assertEqual(
+            [bucket.take() for _ in range(4)],
+            [(True, 2), (True, 1), (True, 0), (False, 0)],
+        )
+        now[0] = 1.5
+        t.assertEqual(bucket.take(), (True, 0.5))
+        t.assertEqual(bucket.refused, 1)
+
+    def test_rate_limited_client_recovers(t):
+        bucket = RateLimitBucket(capacity=5, leak_rate=200)
+        with SyntheticCanvas(rate_limit=bucket) as server:
+            backoff = RateLimitBackoff(floor=0, delay=0.01)
+            with CanvasClient(
+                server.url, "token", concurrency=8, backoff=backoff
+            ) as client:
+                paths = [f"/api/v1/courses/{n % 10 + 1}" for n in range(40)]
+                responses = list(client.get_many(paths))
+
+        t.assertEqual([r.status for r in responses], [200] * 40)
+        t.assertIn("x-rate-limit-remaining", responses[0].headers)
+        t.assertGreater(bucket.refused, 0)
+
+    def test_latency_and_jitter(t):
+        with SyntheticCanvas(latency=0.02, jitter=0.02) as server:
+            with CanvasClient(server.url, "token") as client:
+                start = time.perf_counter()
+                for _ in range(5):
+                    client.get("/api/v1/courses/1")
+                elapsed = time.perf_counter() - start
+        t.assertGreater(elapsed, 5 * 0.02)
+        t.assertLess(elapsed, 5 * 0.04 + 0.5)
+
+    def test_errors(t):
+        def failures(seed):
+            with SyntheticCanvas(error_rate=0.3, seed=seed) as server:
+                with CanvasClient(server.url, "token") as client:
+                    ret = []
+                    for _ in range(20):
+                        try:
+                            client.get("/api/v1/courses/1")
+                            ret.append(False)
+                        except CanvasAPIError as err:
+                            t.assertEqual(err.status, 503)
+                            ret.append(True)
+                    t.assertEqual(server.errors, sum(ret))
+                    return ret
+
+        first = failures(seed=1)
+        t.assertTrue(0 < sum(first) < 20)
+        t.assertEqual(failures(seed=1), first)
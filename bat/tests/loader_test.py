@@ -0,0 +1,159 @@
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ..lib.aio import AsyncCanvasClient
+from ..lib.canvas import CanvasClient
+from ..lib.loader import AsyncDataLoader, DataLoader
+from .fake_canvas import Scale, SyntheticCanvas, student_ids
+
+
+SRC = "bat.lib.loader"
+
+
+class DataLoaderTests(TestCase):
+
+    def setUp(t):
+        t.fetched = []
+
+    def fetch(t, keys):
+        t.fetched.append(keys)
+        return {key: key * 10 for key in keys if key >= 0}
+
+    def test_batches(t):
+        loader = DataLoader(t.fetch, max_batch=3)
+        futures = [loader.defer(key) for key in (1, 2, 1, 3, 4, -1)]
+        t.assertEqual(t.fetched, [[1, 2, 3]])
+        loader.dispatch()
+        t.assertEqual(t.fetched, [[1, 2, 3], [4, -1]])
+        t.assertEqual(
+            [f.result() for f in futures], [10, 20, 10, 30, 40, None]
+        )
+        t.assertEqual((loader.batches, loader.hits, loader.misses), (2, 1, 5))
+
+    def test_memoized(t):
+        loader = DataLoader(t.fetch, cache_size=2, key=int)
+        t.assertEqual(loader.load_many(["1", 2, 3]), [10, 20, 30])
+        t.assertEqual(loader.load_many([3, 2, 1]), [30, 20, 10])
+        # 1 was the least recently used of 3 keys kept in 2 slots
+        t.assertEqual(t.fetched, [[1, 2, 3], [1]])
+
+        loader.prime(5, 0)
+        t.assertEqual(loader.load(5), 0)
+        loader.clear()
+        t.assertEqual(loader.load(5), 50)
+
+    def test_extras(t):
+        loader = DataLoader(lambda keys: {1: "a", 2: "b"})
+        t.assertEqual(loader.load(1), "a")
+        t.assertEqual(loader.load(2), "b")
+        t.assertEqual(loader.batches, 1)
+
+    def test_failure(t):
+        fail = [True, False]
+
+        def fetch(keys):
+            if fail.pop(0):
+                raise OSError("down")
+            return {key: key for key in keys}
+
+        loader = DataLoader(fetch)
+        with t.assertRaises(OSError):
+            loader.load(1)
+        t.assertEqual(loader.load_many([1]), [1])
+
+    def test_threads(t):
+        release = threading.Event()
+
+        def fetch(keys):
+            release.wait(5)
+            return t.fetch(keys)
+
+        loader = DataLoader(fetch)
+        with ThreadPoolExecutor(8) as pool:
+            futures = [pool.submit(loader.load, n % 4) for n in range(32)]
+            release.set()
+            results = [f.result() for f in futures]
+        t.assertEqual(results, [n % 4 * 10 for n in range(32)])
+        fetched = sorted(key for keys in t.fetched for key in keys)
+        t.assertEqual(fetched, [0, 1, 2, 3])
+
+
+class AsyncDataLoaderTests(IsolatedAsyncioTestCase):
+
+    async def test_tick(t):
+        fetched = []
+
+        async def fetch(keys):
+            fetched.append(keys)
+            await asyncio.sleep(0)
+            return {key: -key for key in keys}
+
+        loader = AsyncDataLoader(fetch, max_batch=2)
+        results = await asyncio.gather(
+            *(loader.load(key) for key in (1, 2, 3, 1)),
+            loader.load_many([2, 3, 4]),
+        )
+        t.assertEqual(results, [-1, -2, -3, -1, [-2, -3, -4]])
+        t.assertEqual(fetched, [[1, 2], [3, 4]])
+        t.assertEqual(await loader.load(4), -4)
+        t.assertEqual(loader.batches, 2)
+
+    async def test_failure(t):
+        async def fetch(keys):
+            raise OSError("down")
+
+        loader = AsyncDataLoader(fetch)
+        with t.assertRaises(OSError):
+            await loader.load(1)
+        t.assertEqual(len(loader._cache), 0)
+
+
+class CanvasLoaderTests(TestCase):
+
+    def setUp(t):
+        t.scale = Scale(courses=2, students=250)
+        t.server = SyntheticCanvas(t.scale)
+        t.addCleanup(t.server.close)
+        t.client = CanvasClient(t.server.url, "token", lookup_batch_size=50)
+        t.addCleanup(t.client.close)
+
+    def test_users(t):
+        ids = student_ids(t.scale, 1)[:120]
+        users = t.client.loader("users", course_id=1)
+        t.assertIs(users, t.client.loader("users", course_id=1))
+        records = users.load_many(ids + [str(i) for i in ids])
+        t.assertEqual([r["id"] for r in records], ids + ids)
+        # 3 batches of at most 50 ids, rather than 240 requests
+        t.assertEqual(len(t.server.requests), 3)
+        t.assertIn("user_ids%5B%5D=", t.server.requests[0])
+
+    def test_sections(t):
+        sections = t.client.loader("sections", course_id=2)
+        t.assertEqual(sections.load(201)["name"], "Section 1")
+        t.assertEqual(sections.load(202)["name"], "Section 2")
+        t.assertIsNone(sections.load(999))
+        t.assertEqual(len(t.server.requests), 2)
+
+    def test_unknown(t):
+        with t.assertRaises(ValueError):
+            t.client.loader("groups", course_id=1)
+
+
+class AsyncCanvasLoaderTests(IsolatedAsyncioTestCase):
+
+    async def test_assignments(t):
+        with SyntheticCanvas(Scale(courses=1)) as server:
+            async with AsyncCanvasClient(server.url, "token") as client:
+                assignments = client.loader("assignments", course_id=1)
+                names = await asyncio.gather(
+                    *(assignments.load(1000 + n) for n in (1, 2, 2, 3))
+                )
+            requests = list(server.requests)
+        t.assertEqual(
+            [a["name"] for a in names],
+            ["Assignment 1", "Assignment 2", "Assignment 2", "Assignment 3"],
+        )
+        t.assertEqual(len(requests), 1)
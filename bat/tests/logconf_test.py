@@ -1,6 +1,14 @@
 from unittest import TestCase
 from unittest.mock import patch, Mock
 
+import io
+import json
+import logging
+import threading
+import time
+from logging.handlers import QueueHandler
+from tempfile import TemporaryDirectory
+
 from ..logconf import (
     set_default_logging,
     default_format,
@@ -8,6 +16,14 @@ from ..logconf import (
     set_module_logger,
     log_conf_factory,
     add_console_handler,
+    set_queue_logging,
+    stop_queue_logging,
+    RateLimitFilter,
+    SampleFilter,
+    JSON_FORMAT,
+    ContextFilter,
+    JsonFormatter,
+    log_context,
 )
 
 
@@ -88,6 +104,30 @@ class LogConfTests(TestCase):
             f"set default logging level={t.default_log_level}"
         )
 
+    @patch(f"{SRC}.set_queue_logging")
+    @patch(f"{SRC}.add_console_handler")
+    @patch(f"{SRC}.set_module_logger")
+    def test_set_default_logging_queue(
+        t,
+        set_module_logger: Mock,
+        add_console_handler: Mock,
+        set_queue_logging: Mock,
+    ):
+        set_default_logging(
+            log_level=t.log_level,
+            log_file=t.file_name,
+            limits={"bat.lib": 10.0},
+        )
+
+        set_module_logger.assert_called_with(log_level=t.log_level)
+        add_console_handler.assert_not_called()
+        set_queue_logging.assert_called_with(
+            log_level=t.log_level,
+            log_file=t.file_name,
+            limits={"bat.lib": 10.0},
+            samples=None,
+        )
+
     @patch(f"{SRC}.dictConfig")
     @patch(f"{SRC}.log_conf_factory")
     def test_set_module_logger_defaults(
@@ -128,6 +168,12 @@ class LogConfTests(TestCase):
         ret = log_conf_factory()
         t.assertEqual(ret, t.default_conf_dict)
 
+    def test_log_conf_factory_json(t):
+        ret = log_conf_factory(log_format=JSON_FORMAT)
+        t.assertEqual(
+            ret["formatters"]["f"], {"()": "bat.logconf.JsonFormatter"}
+        )
+
     def test_log_conf_factory(t):
         ret = log_conf_factory(
             log_level=t.log_level,
@@ -186,3 +232,186 @@ class LogConfTests(TestCase):
         root = t.getLogger.return_value
         root.addHandler.assert_called_with(sh)
         t.log.info.assert_called_with("added console logger")
+
+
+def record(name, level=logging.DEBUG):
+    return logging.LogRecord(name, level, __file__, 1, "msg", None, None)
+
+
+class FilterTests(TestCase):
+
+    def test_rate_limit(t):
+        now = [0.0]
+        limit = RateLimitFilter({"bat.lib": 2}, clock=lambda: now[0])
+
+        kept = [limit.filter(record("bat.lib.canvas")) for _ in range(4)]
+        t.assertEqual(kept, [True, True, False, False])
+        t.assertTrue(limit.filter(record("bat.lib", logging.WARNING)))
+        t.assertTrue(limit.filter(record("bat.library")))
+        t.assertTrue(limit.filter(record("bat")))
+
+        now[0] = 0.5
+        t.assertTrue(limit.filter(record("bat.lib.aio")))
+        t.assertFalse(limit.filter(record("bat.lib.aio")))
+        t.assertEqual(limit.dropped, {"bat.lib": 3})
+
+    def test_sample(t):
+        rand = iter([0.05, 0.5, 0.09])
+        sample = SampleFilter({"bat.lib": 0.1}, rand=lambda: next(rand))
+
+        kept = [sample.filter(record("bat.lib.canvas")) for _ in range(3)]
+        t.assertEqual(kept, [True, False, True])
+        t.assertTrue(sample.filter(record("bat.lib", logging.ERROR)))
+        t.assertTrue(sample.filter(record("bat.report")))
+        t.assertEqual(sample.dropped, {"bat.lib": 1})
+
+
+class JsonFormatterTests(TestCase):
+
+    def test_format(t):
+        rec = record("bat.lib.canvas")
+        rec.msg, rec.args = "GET %s", ("/x",)
+        rec.endpoint = "/api/v1/courses/:id"
+        rec.latency_ms = 12.5
+        rec.cache = None
+        with log_context(command="report", course_id="7"):
+            ContextFilter().filter(rec)
+
+        entry = json.loads(JsonFormatter().format(rec))
+
+        t.assertEqual(entry["message"], "GET /x")
+        t.assertEqual(entry["level"], "DEBUG")
+        t.assertEqual(entry["logger"], "bat.lib.canvas")
+        t.assertEqual(entry["endpoint"], "/api/v1/courses/:id")
+        t.assertEqual(entry["latency_ms"], 12.5)
+        t.assertEqual((entry["command"], entry["course_id"]), ("report", "7"))
+        t.assertNotIn("cache", entry)
+
+    def test_log_context(t):
+        with log_context(command="report"):
+            with log_context(course_id="1"):
+                inner = record("bat")
+                ContextFilter().filter(inner)
+            outer = record("bat")
+            ContextFilter().filter(outer)
+        outside = record("bat")
+        ContextFilter().filter(outside)
+
+        t.assertEqual((inner.command, inner.course_id), ("report", "1"))
+        t.assertEqual(outer.command, "report")
+        t.assertFalse(hasattr(outer, "course_id"))
+        t.assertFalse(hasattr(outside, "command"))
+
+    def test_extra_wins(t):
+        rec = record("bat")
+        rec.course_id = "given"
+        with log_context(course_id="context"):
+            ContextFilter().filter(rec)
+        t.assertEqual(rec.course_id, "given")
+
+
+class SlowStream(io.StringIO):
+    """A stream each write blocks on, like a terminal or a busy pipe"""
+
+    def write(self, s):
+        time.sleep(0.00002)
+        return super().write(s)
+
+
+class QueueLoggingTests(TestCase):
+
+    def setUp(t):
+        t.logger = logging.getLogger("bat.tests.queue")
+        t.logger.setLevel(logging.DEBUG)
+        t.addCleanup(t.logger.setLevel, logging.NOTSET)
+        root = logging.getLogger()
+        t.addCleanup(root.setLevel, root.level)
+        root.setLevel(logging.DEBUG)
+        t.addCleanup(stop_queue_logging)
+
+    def test_log_file(t):
+        with TemporaryDirectory() as tmp:
+            set_queue_logging(
+                log_level="DEBUG",
+                log_file=f"{tmp}/bat.log",
+                limits={"bat.tests.queue.requests": 1},
+            )
+            for n in range(3):
+                t.logger.info(f"record {n}")
+                t.logger.getChild("requests").debug(f"request {n}")
+            stop_queue_logging()
+            stop_queue_logging()
+
+            with open(f"{tmp}/bat.log") as f:
+                lines = f.read().splitlines()
+
+        messages = [line.split(None, 4)[-1] for line in lines]
+        t.assertIn("record 0", messages)
+        t.assertIn("record 2", messages)
+        t.assertIn("request 0", messages)
+        t.assertNotIn("request 1", messages)
+        # the summary of dropped records is the last line written
+        t.assertEqual(
+            messages[-1], "dropped 2 records from bat.tests.queue.requests"
+        )
+        t.assertFalse(
+            any(
+                isinstance(h, QueueHandler)
+                for h in logging.getLogger().handlers
+            )
+        )
+
+
+class QueueLoggingBenchmark(TestCase):
+
+    def caller_latency(t, logger, threads=4, records=500):
+        """Mean seconds a logging call takes, logging from `threads`"""
+        times = []
+
+        def work():
+            for n in range(records):
+                start = time.perf_counter()
+                logger.debug("GET %s %d %dB", "/api/v1/courses", 200, n)
+                times.append(time.perf_counter() - start)
+
+        workers = [threading.Thread(target=work) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return sum(times) / len(times)
+
+    def test_queue_beats_stream_handler(t):
+        logger = logging.getLogger("bat.tests.benchmark")
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+        t.addCleanup(setattr, logger, "propagate", True)
+        t.addCleanup(logger.setLevel, logging.NOTSET)
+
+        handler = logging.StreamHandler(SlowStream())
+        handler.setFormatter(logging.Formatter(default_format))
+        logger.addHandler(handler)
+        stream = t.caller_latency(logger)
+        logger.removeHandler(handler)
+
+        # only the queue handler, not the test runner's log capture
+        root = logging.getLogger()
+        t.addCleanup(setattr, root, "handlers", root.handlers)
+        root.handlers = []
+        with patch(
+            f"{SRC}.StreamHandler",
+            lambda: logging.StreamHandler(SlowStream()),
+        ):
+            set_queue_logging(log_level="DEBUG")
+        logger.propagate = True
+        queued = t.caller_latency(logger)
+        start = time.perf_counter()
+        stop_queue_logging()
+        drain = time.perf_counter() - start
+
+        print(
+            f"\nlogging call, 4 threads to a slow stream:"
+            f" StreamHandler {stream * 1e6:.1f}us,"
+            f" queue {queued * 1e6:.1f}us, {drain:.3f}s to drain"
+        )
+        t.assertLess(queued * 3, stream)
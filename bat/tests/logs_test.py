@@ -0,0 +1,88 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+import io
+import json
+from tempfile import TemporaryDirectory
+
+from ..cli import argparser
+from ..logs import percentile, summarize, table
+
+
+SRC = "bat.logs"
+
+
+def request_line(endpoint, latency_ms, status=200, cache=None, **fields):
+    return json.dumps(
+        dict(
+            ts=1.0,
+            level="DEBUG",
+            logger="bat.lib.canvas",
+            message="GET ...",
+            method="GET",
+            endpoint=endpoint,
+            status=status,
+            latency_ms=latency_ms,
+            bytes=100,
+            cache=cache,
+            **fields,
+        )
+    )
+
+
+class SummarizeTests(TestCase):
+
+    def setUp(t):
+        t.lines = [
+            *(
+                request_line("/api/v1/courses/:id/users", ms)
+                for ms in range(1, 101)
+            ),
+            request_line("/api/v1/courses", 5, cache="hit"),
+            request_line("/api/v1/courses", 15, status=404, cache="miss"),
+            '{"level": "INFO", "message": "no request"}',
+            "2024-01-01 00:00:00 bat INFO     a text line",
+            "{not json",
+        ]
+
+    def test_summarize(t):
+        users, courses = summarize(t.lines)
+
+        t.assertEqual(users["endpoint"], "/api/v1/courses/:id/users")
+        t.assertEqual(users["count"], 100)
+        t.assertEqual(users["p50_ms"], 50.5)
+        t.assertEqual(users["p99_ms"], 99.01)
+        t.assertEqual(users["max_ms"], 100.0)
+        t.assertEqual(users["total_ms"], 5050)
+        t.assertIsNone(users["cache_hit_rate"])
+
+        t.assertEqual(courses["count"], 2)
+        t.assertEqual(courses["errors"], 1)
+        t.assertEqual(courses["mean_ms"], 10)
+        t.assertEqual(courses["bytes"], 200)
+        t.assertEqual(courses["cache_hit_rate"], 0.5)
+
+    def test_percentile(t):
+        t.assertEqual(percentile([3.0], 90), 3.0)
+        t.assertEqual(percentile([1.0, 2.0, 3.0, 4.0], 25), 1.75)
+
+    def test_table(t):
+        lines = table(summarize(t.lines)).splitlines()
+        t.assertEqual(len(lines), 3)
+        t.assertTrue(lines[0].startswith("method  endpoint"))
+        t.assertEqual(table([]), "no requests logged")
+
+    @patch("sys.stdout", new_callable=io.StringIO)
+    def test_cli(t, stdout):
+        with TemporaryDirectory() as tmp:
+            with open(f"{tmp}/bat.log", "w") as f:
+                f.write("\n".join(t.lines))
+            args = argparser().parse_args(
+                ["logs", "summarize", f"{tmp}/bat.log", "--json", "-n", "1"]
+            )
+            args.func(args)
+
+        rows = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        t.assertEqual(
+            [r["endpoint"] for r in rows], ["/api/v1/courses/:id/users"]
+        )
@@ -0,0 +1,225 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+import io
+import json
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from tempfile import TemporaryDirectory
+
+from ..cli import argparser
+from ..report import REPORTS, StateStore
+from ..report.mirror import SQL_REPORTS, Mirror
+from .fake_canvas import Scale, SyntheticCanvas
+
+
+SRC = "bat.report.mirror"
+
+SUBMISSIONS = [
+    dict(assignment_id=1, user_id=10, score=8.0, late=True, missing=False),
+    dict(assignment_id=2, user_id=10, score=None, late=False, missing=True),
+    dict(assignment_id=1, user_id=11, score=6.5, late=False, missing=False),
+]
+ASSIGNMENTS = [
+    dict(id=1, name="essay", points_possible=10, due_at="2024-02-01"),
+    dict(id=2, name="quiz", points_possible=5, due_at="2024-01-01"),
+]
+
+
+class MirrorTests(TestCase):
+
+    def setUp(t):
+        tmp = TemporaryDirectory()
+        t.addCleanup(tmp.cleanup)
+        t.now = datetime(2024, 5, 6, tzinfo=timezone.utc)
+        t.state = StateStore(f"{tmp.name}/state.sqlite")
+        t.addCleanup(t.state.close)
+        t.mirror = Mirror(f"{tmp.name}/mirror.sqlite", clock=lambda: t.now)
+        t.addCleanup(t.mirror.close)
+        t.submissions = REPORTS["submissions"]()
+        t.assignments = REPORTS["assignments"]()
+        for course_id in ("7", "8"):
+            t.merge(t.submissions, course_id, SUBMISSIONS)
+            t.merge(t.assignments, course_id, ASSIGNMENTS)
+
+    def merge(t, report, course_id, records):
+        keyed = [
+            (report.key(r), {**r, "course_id": course_id}) for r in records
+        ]
+        t.state.merge(report.name, course_id, keyed, "2024-05-06T00:00:00Z")
+
+    def test_load(t):
+        t.assertEqual(t.mirror.load(t.submissions, t.state), 6)
+        rows = list(t.mirror.rows(t.submissions, ["7"]))
+        t.assertEqual(
+            rows,
+            [
+                t.submissions.row({**SUBMISSIONS[n], "course_id": "7"})
+                for n in (0, 2, 1)
+            ],
+        )
+        t.assertIs(rows[0]["late"], True)
+        t.assertEqual(t.mirror.courses(), {"submissions": 2})
+
+    def test_reload(t):
+        t.mirror.load(t.submissions, t.state)
+        t.state.reset("submissions", "7")
+        t.merge(t.submissions, "7", SUBMISSIONS[:1])
+        t.assertEqual(t.mirror.load(t.submissions, t.state, ["7"]), 1)
+        t.assertEqual(len(list(t.mirror.rows(t.submissions, ["7"]))), 1)
+        t.assertEqual(len(list(t.mirror.rows(t.submissions))), 4)
+
+    def test_expire(t):
+        t.mirror.load(t.submissions, t.state, ["7"])
+        t.now += timedelta(days=20)
+        t.mirror.load(t.submissions, t.state, ["8"])
+        t.now += timedelta(days=15)
+        t.assertEqual(t.mirror.expire(), 1)
+        t.assertEqual(t.mirror.courses(), {"submissions": 1})
+        rows = list(t.mirror.rows(t.submissions))
+        t.assertEqual({r["course_id"] for r in rows}, {"8"})
+
+        t.mirror.retention_days = 0
+        t.now += timedelta(days=365)
+        t.assertEqual(t.mirror.expire(), 0)
+
+    def test_sql_reports(t):
+        t.mirror.load(t.submissions, t.state)
+        t.mirror.load(t.assignments, t.state)
+
+        columns, rows = t.mirror.query(
+            SQL_REPORTS["missing"], course_ids=["8"]
+        )
+        t.assertEqual(columns[:3], ["course_id", "user_id", "assignment_id"])
+        t.assertEqual(
+            [(r["course_id"], r["user_id"], r["assignment"]) for r in rows],
+            [("8", 10, "quiz")],
+        )
+
+        _, rows = t.mirror.query(SQL_REPORTS["student_summary"])
+        students = {(r["course_id"], r["user_id"]): r for r in rows}
+        t.assertEqual(len(students), 4)
+        t.assertEqual(students["7", 10]["percent"], 80.0)
+        t.assertEqual(students["7", 10]["missing"], 1)
+
+        _, rows = t.mirror.query(
+            "SELECT COUNT(*) AS n FROM submissions WHERE score > ?", [7]
+        )
+        t.assertEqual(list(rows), [{"n": 2}])
+
+
+    def test_courses(t):
+        t.mirror.load(t.submissions, t.state)
+        t.mirror.load_courses([dict(id=7, name="Biology", account_id=1)])
+        _, rows = t.mirror.query(
+            "SELECT typeof(c.id) AS id, COUNT(*) AS n FROM courses c"
+            " JOIN submissions s ON s.course_id = c.id"
+        )
+        t.assertEqual(list(rows), [{"id": "text", "n": 3}])
+
+    def test_migrate(t):
+        path = t.mirror.path
+        t.mirror.close()
+        db = sqlite3.connect(path)
+        db.executescript(
+            "DROP TABLE courses;"
+            "CREATE TABLE courses (id INTEGER PRIMARY KEY, account_id"
+            " INTEGER, name TEXT, course_code TEXT, workflow_state TEXT,"
+            " enrollment_term_id INTEGER);"
+            "INSERT INTO courses (id, name) VALUES (7, 'Biology');"
+        )
+        db.close()
+        t.mirror = Mirror(path)
+        t.addCleanup(t.mirror.close)
+        _, rows = t.mirror.query("SELECT id, name FROM courses")
+        t.assertEqual(list(rows), [{"id": "7", "name": "Biology"}])
+
+
+class SyncCommandTests(TestCase):
+
+    def setUp(t):
+        tmp = TemporaryDirectory()
+        t.addCleanup(tmp.cleanup)
+        t.tmp = tmp.name
+        t.server = SyntheticCanvas(Scale(courses=3, students=5))
+        t.addCleanup(t.server.close)
+
+    def run_command(t, *argv):
+        args = argparser().parse_args(list(argv))
+        args.url, args.token = t.server.url, "token"
+        args.enabled = "false"
+        args.state_db = f"{t.tmp}/state.sqlite"
+        args.mirror_db = f"{t.tmp}/mirror.sqlite"
+        with patch("sys.stdout", new_callable=io.StringIO) as out:
+            args.func(args)
+        return out.getvalue().splitlines()
+
+    def test_sync(t):
+        lines = t.run_command("sync", "--account", "1")
+        t.assertEqual(
+            lines,
+            [
+                "submissions: 150 rows mirrored",
+                "enrollments: 18 rows mirrored",
+                "assignments: 30 rows mirrored",
+            ],
+        )
+
+        requests = len(t.server.requests)
+        mirrored = t.run_command("report", "assignments", "--mirror")
+        summary = [
+            json.loads(line)
+            for line in t.run_command("report", "course_summary")
+        ]
+        t.assertEqual(
+            [
+                (r["course_id"], r["students"], r["submissions"])
+                for r in summary
+            ],
+            [("1", 5, 50), ("2", 5, 50), ("3", 5, 50)],
+        )
+        rows = t.run_command(
+            "report",
+            "query",
+            "--course",
+            "2",
+            "--sql",
+            "SELECT name FROM courses"
+            " JOIN selected_courses ON courses.id = course_id",
+        )
+        t.assertEqual(len(rows), 1)
+        t.assertEqual(len(t.server.requests), requests)
+
+        fetched = t.run_command("report", "assignments", "--account", "1")
+        t.assertEqual(
+            [json.loads(line) for line in mirrored],
+            [
+                {**row, "course_id": str(row["course_id"])}
+                for row in map(json.loads, fetched)
+            ],
+        )
+
+    def test_reload(t):
+        t.run_command("sync", "--course", "1", "--report", "assignments")
+        requests = len(t.server.requests)
+        lines = t.run_command("sync", "--report", "assignments")
+        t.assertEqual(lines, ["assignments: 10 rows mirrored"])
+        t.assertEqual(len(t.server.requests), requests)
+
+    def test_failed_sync_closes(t):
+        closes = [
+            patch.object(
+                cls, "close", autospec=True, side_effect=cls.close
+            )
+            for cls in (StateStore, Mirror)
+        ]
+        with closes[0] as state_close, closes[1] as mirror_close:
+            with patch.object(Mirror, "load", side_effect=OSError("full")):
+                with t.assertRaisesRegex(OSError, "full"):
+                    t.run_command("sync", "--course", "1")
+        state_close.assert_called_once()
+        mirror_close.assert_called_once()
+
+    def test_query_requires_sql(t):
+        with t.assertRaises(RuntimeError):
+            t.run_command("report", "query")
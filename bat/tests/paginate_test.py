@@ -0,0 +1,142 @@
+from unittest import TestCase
+from unittest.mock import patch, Mock
+
+import asyncio
+import io
+import json
+import time
+
+from ..cli import argparser
+from ..lib.canvas import CanvasClient
+from ..lib.paginate import (
+    paginate,
+    parse_link_header,
+    write_json_lines_async,
+    _Commands,
+)
+from .fake_canvas import FakeCanvas, json_reply, paginated
+
+
+SRC = "bat.lib.paginate"
+
+RECORDS = [{"id": n} for n in range(25)]
+
+
+class ParseLinkHeaderTests(TestCase):
+
+    def test_parse_link_header(t):
+        header = (
+            '<https://c.test/api/v1/courses?page=2&per_page=10>; rel="next",'
+            ' <https://c.test/api/v1/courses?page=1&per_page=10>;'
+            ' rel="first", <https://c.test/api/v1/courses?page=3>; rel="last"'
+        )
+        t.assertEqual(
+            parse_link_header(header),
+            {
+                "next": "https://c.test/api/v1/courses?page=2&per_page=10",
+                "first": "https://c.test/api/v1/courses?page=1&per_page=10",
+                "last": "https://c.test/api/v1/courses?page=3",
+            },
+        )
+
+    def test_empty(t):
+        t.assertEqual(parse_link_header(None), {})
+        t.assertEqual(parse_link_header(""), {})
+
+
+class PaginatorTests(TestCase):
+
+    def setUp(t):
+        t.server = FakeCanvas(routes={"/api/v1/items": paginated(RECORDS)})
+        t.addCleanup(t.server.close)
+        t.client = CanvasClient(t.server.url, "token")
+        t.addCleanup(t.client.close)
+
+    def test_iter(t):
+        ret = list(paginate(t.client, "/api/v1/items", per_page=10))
+
+        t.assertEqual(ret, RECORDS)
+        t.assertEqual(len(t.server.requests), 3)
+        t.assertIn("per_page=10", t.server.requests[0])
+
+    def test_params(t):
+        pages = paginate(t.client, "/api/v1/items", {"per_page": 5})
+        t.assertEqual(list(pages), RECORDS)
+        t.assertEqual(len(t.server.requests), 5)
+
+    def test_prefetch_is_bounded(t):
+        """the next page is fetched early, but never more than one ahead"""
+        records = iter(paginate(t.client, "/api/v1/items", per_page=5))
+        t.assertEqual(next(records), {"id": 0})
+
+        time.sleep(0.1)
+        t.assertEqual(len(t.server.requests), 2)
+
+        for _ in range(5):
+            next(records)
+        time.sleep(0.1)
+        t.assertEqual(len(t.server.requests), 3)
+
+        records.close()
+
+    def test_async_iter(t):
+        async def collect():
+            pages = paginate(t.client, "/api/v1/items", per_page=10)
+            return [record async for record in pages]
+
+        t.assertEqual(asyncio.run(collect()), RECORDS)
+
+    def test_key(t):
+        t.server.routes["/wrapped"] = lambda h: json_reply(
+            {"reports": [1, 2]}, Link=f'<{t.server.url}/page2>; rel="next"'
+        )
+        t.server.routes["/page2"] = lambda h: json_reply({"reports": [3]})
+
+        ret = list(paginate(t.client, "/wrapped", key="reports"))
+
+        t.assertEqual(ret, [1, 2, 3])
+
+
+class ExportCommandTests(TestCase):
+
+    def test_export(t):
+        with FakeCanvas(routes={"/api/v1/items": paginated(RECORDS)}) as srv:
+            args = argparser().parse_args(
+                [
+                    "export",
+                    "/api/v1/items",
+                    "-p",
+                    "include[]=total",
+                    "--per-page",
+                    "7",
+                ]
+            )
+            args.url, args.token = srv.url, "token"
+            args.enabled = "false"
+            with patch(f"{SRC}.sys.stdout", new_callable=io.StringIO) as out:
+                asyncio.run(_Commands.export(args))
+
+        lines = out.getvalue().splitlines()
+        t.assertEqual([json.loads(line) for line in lines], RECORDS)
+        t.assertIn("include%5B%5D=total", srv.requests[0])
+        t.assertEqual(len(srv.requests), 4)
+
+    def test_bad_param(t):
+        with patch("sys.stderr", new_callable=io.StringIO) as err:
+            with t.assertRaises(SystemExit):
+                argparser().parse_args(
+                    ["export", "/api/v1/items", "-p", "include[]"]
+                )
+        t.assertIn("--param: expected KEY=VALUE, got 'include[]'",
+                   err.getvalue())
+
+    def test_write_json_lines_closed_pipe(t):
+        out = Mock(io.StringIO)
+        out.write.side_effect = BrokenPipeError()
+
+        async def records():
+            yield {"id": 1}
+
+        t.assertEqual(
+            asyncio.run(write_json_lines_async(records(), out)), 1
+        )
@@ -0,0 +1,93 @@
+from unittest import TestCase
+
+import json
+import math
+from dataclasses import asdict
+
+from ..records import (
+    MISSING_ID,
+    Assignment,
+    Enrollment,
+    RecordBatch,
+    Submission,
+    User,
+)
+from .fake_canvas import Scale, assignments, enrollments, submissions
+
+
+SRC = "bat.records"
+
+SCALE = Scale(students=20, assignments=5)
+
+
+class RecordTests(TestCase):
+
+    def test_from_json(t):
+        record = submissions(SCALE, 1)[0]
+        submission = Submission.from_json(record)
+        t.assertEqual(
+            submission.to_json(),
+            {k: v for k, v in record.items() if k != "id"},
+        )
+        t.assertEqual(asdict(submission), submission.to_json())
+        t.assertFalse(hasattr(submission, "__dict__"))
+        with t.assertRaises(AttributeError):
+            submission.extra = 1
+
+    def test_interned(t):
+        parsed = [
+            json.loads(json.dumps(e)) for e in enrollments(SCALE, 1)[:2]
+        ]
+        a, b = (Enrollment.from_json(e) for e in parsed)
+        t.assertIsNot(parsed[0]["type"], parsed[1]["type"])
+        t.assertIs(a.type, b.type)
+        t.assertIs(a.enrollment_state, b.enrollment_state)
+
+    def test_missing_fields(t):
+        user = User.from_json({"id": 1, "name": "Ann"})
+        t.assertEqual(user, User(1, "Ann", None, None))
+
+
+class RecordBatchTests(TestCase):
+
+    def test_round_trip(t):
+        records = submissions(SCALE, 2)
+        batch = RecordBatch.from_json(Submission, records)
+        t.assertEqual(len(batch), len(records))
+        t.assertEqual(list(batch), [Submission.from_json(r) for r in records])
+        t.assertEqual(batch.columns["score"].typecode, "d")
+        t.assertIsInstance(batch.columns["workflow_state"], list)
+
+    def test_missing(t):
+        batch = RecordBatch(Assignment)
+        batch.append(
+            Assignment.from_json({**assignments(SCALE, 1)[0], "published": 0})
+        )
+        batch.append({"name": "draft", "published": None})
+        t.assertEqual(batch.columns["id"][1], MISSING_ID)
+        t.assertTrue(math.isnan(batch.columns["points_possible"][1]))
+        t.assertEqual(
+            batch[1], Assignment(None, None, "draft", None, None, None, None)
+        )
+        t.assertIs(batch[0].published, False)
+
+    def test_to_numpy(t):
+        batch = RecordBatch.from_json(Submission, submissions(SCALE, 1))
+        columns = batch.to_numpy()
+        t.assertEqual(
+            set(columns),
+            {
+                "course_id",
+                "assignment_id",
+                "user_id",
+                "score",
+                "late",
+                "missing",
+            },
+        )
+        t.assertEqual(
+            columns["user_id"].tolist(), list(batch.columns["user_id"])
+        )
+        # a view of the batch's memory, not a copy
+        batch.columns["user_id"][0] = 42
+        t.assertEqual(columns["user_id"][0], 42)
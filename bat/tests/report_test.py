@@ -0,0 +1,382 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+import io
+import json
+from datetime import datetime, timezone
+from tempfile import TemporaryDirectory
+from urllib.parse import parse_qs, urlsplit
+
+from ..cli import argparser
+from ..conf import get_config, Namespace
+from ..lib.canvas import CanvasClient
+from ..report import REPORTS, ReportRunner, StateStore
+from ..report.checkpoint import Checkpoints
+from ..report.fanout import FanOut, ShardError, WorkerConfig, shards
+from ..report.run import format_mark
+from ..report.cli import _Commands
+from .fake_canvas import FakeCanvas, json_reply, paginated
+
+
+SRC = "bat.report"
+
+
+def submissions_route(submissions):
+    """Serve submissions, honoring the submitted_since/graded_since filters"""
+
+    def route(handler):
+        query = parse_qs(urlsplit(handler.path).query)
+        records = submissions
+        for name, field in [
+            ("submitted_since", "submitted_at"),
+            ("graded_since", "graded_at"),
+        ]:
+            if since := query.get(name, [None])[0]:
+                records = [r for r in records if (r[field] or "") >= since]
+        return paginated(records)(handler)
+
+    return route
+
+
+def submission(assignment_id, user_id, score, when="2024-01-01T00:00:00Z"):
+    return dict(
+        assignment_id=assignment_id,
+        user_id=user_id,
+        score=score,
+        workflow_state="graded",
+        submitted_at=when,
+        graded_at=when,
+    )
+
+
+class StateStoreTests(TestCase):
+
+    def setUp(t):
+        tmp = TemporaryDirectory()
+        t.addCleanup(tmp.cleanup)
+        t.state = StateStore(f"{tmp.name}/nested/state.sqlite")
+        t.addCleanup(t.state.close)
+
+    def test_merge(t):
+        t.assertIsNone(t.state.mark("r", "1"))
+
+        t.state.merge("r", "1", [("a", {"v": 1}), ("b", {"v": 2})], "m1")
+        t.state.merge("r", "1", [("b", {"v": 3}), ("c", {"v": 4})], "m2")
+        t.state.merge("r", "2", [("a", {"v": 5})], "m3")
+
+        t.assertEqual(t.state.mark("r", "1"), "m2")
+        t.assertEqual(
+            list(t.state.records("r", ["1"])),
+            [{"v": 1}, {"v": 3}, {"v": 4}],
+        )
+        t.assertEqual(len(list(t.state.records("r"))), 4)
+
+    def test_failed_merge_keeps_mark(t):
+        t.state.merge("r", "1", [("a", {"v": 1})], "m1")
+
+        def broken():
+            yield "a", {"v": 2}
+            raise ConnectionError()
+
+        with t.assertRaises(ConnectionError):
+            t.state.merge("r", "1", broken(), "m2", batch_size=1)
+        t.assertEqual(t.state.mark("r", "1"), "m1")
+
+    def test_replace_course(t):
+        t.state.merge("r", "1", [("a", {"v": 1}), ("b", {"v": 2})], "m1")
+        t.state.merge("r", "2", [("a", {"v": 5})], "m1")
+
+        def broken():
+            yield "c", {"v": 3}
+            raise ConnectionError()
+
+        # the previous rows stay until the whole fetch is stored
+        with t.assertRaises(ConnectionError):
+            t.state.replace_course("r", "1", broken(), "m2", batch_size=1)
+        t.assertEqual(len(list(t.state.records("r", ["1"]))), 2)
+        t.assertEqual(t.state.mark("r", "1"), "m1")
+
+        t.assertEqual(
+            t.state.replace_course("r", "1", [("c", {"v": 3})], "m2"), 1
+        )
+        t.assertEqual(list(t.state.records("r", ["1"])), [{"v": 3}])
+        t.assertEqual(list(t.state.records("r", ["2"])), [{"v": 5}])
+        t.assertEqual(t.state.mark("r", "1"), "m2")
+
+    def test_reset(t):
+        t.state.merge("r", "1", [("a", {"v": 1})], "m1")
+        t.state.merge("r", "2", [("a", {"v": 1})], "m1")
+
+        t.state.reset("r", "1")
+
+        t.assertIsNone(t.state.mark("r", "1"))
+        t.assertEqual(t.state.mark("r", "2"), "m1")
+        t.assertEqual(list(t.state.records("r", ["1"])), [])
+
+
+class ReportRunnerTests(TestCase):
+
+    def setUp(t):
+        tmp = TemporaryDirectory()
+        t.addCleanup(tmp.cleanup)
+        t.state = StateStore(f"{tmp.name}/state.sqlite")
+        t.addCleanup(t.state.close)
+
+        t.submissions = [
+            submission(a, u, 50) for a in (1, 2) for u in range(10)
+        ]
+        t.server = FakeCanvas(
+            routes={
+                "/api/v1/courses/7/students/submissions": submissions_route(
+                    t.submissions
+                )
+            }
+        )
+        t.addCleanup(t.server.close)
+        t.client = CanvasClient(t.server.url, "token")
+        t.addCleanup(t.client.close)
+
+        t.now = datetime(2024, 2, 1, tzinfo=timezone.utc)
+        t.runner = ReportRunner(t.client, t.state, clock=lambda: t.now)
+        t.report = REPORTS["submissions"]()
+
+    def test_incremental(t):
+        t.assertEqual(t.runner.sync(t.report, ["7"]), {"7": 20})
+        mark = "2024-01-31T23:55:00Z"
+        t.assertEqual(t.state.mark("submissions", "7"), mark)
+
+        # one regrade since the last run
+        t.submissions[3] = submission(1, 3, 95, when="2024-02-01T10:00:00Z")
+        t.now = datetime(2024, 2, 2, tzinfo=timezone.utc)
+        t.server.requests.clear()
+
+        # fetched once through each since-filter
+        t.assertEqual(t.runner.sync(t.report, ["7"]), {"7": 2})
+        since = "2024-01-31T23%3A55%3A00Z"
+        t.assertIn(f"submitted_since={since}", t.server.requests[0])
+        t.assertIn(f"graded_since={since}", t.server.requests[1])
+
+        rows = list(t.runner.rows(t.report, ["7"]))
+        t.assertEqual(len(rows), 20)
+        t.assertEqual(
+            [r["score"] for r in rows if r["user_id"] == 3],
+            [95, 50],
+        )
+        t.assertEqual(rows[0]["course_id"], "7")
+        t.assertEqual(list(rows[0]), list(t.report.columns))
+
+    def test_full(t):
+        t.runner.sync(t.report, ["7"])
+        t.assertEqual(t.runner.sync(t.report, ["7"], full=True), {"7": 20})
+
+    def test_enrollments_refetched(t):
+        # Canvas has no filter by time of change for enrollments
+        report = REPORTS["enrollments"]()
+        t.assertEqual(
+            report.queries("2024-01-31T23:55:00Z"), [list(report.params)]
+        )
+
+    def test_removed_upstream(t):
+        report = REPORTS["enrollments"]()
+        enrollments = []
+        t.server.routes["/api/v1/courses/7/enrollments"] = paginated(
+            enrollments
+        )
+        checkpoints = Checkpoints(t.state.path)
+        t.addCleanup(checkpoints.close)
+
+        for job in (None, checkpoints.start("j", ["7"])):
+            enrollments[:] = [
+                dict(id=n, user_id=n, course_section_id=70, type="Student")
+                for n in range(5)
+            ]
+            t.assertEqual(t.runner.sync(report, ["7"], job=job), {"7": 5})
+            # dropped from the course in Canvas
+            del enrollments[1:4]
+            if job is not None:
+                job = checkpoints.start("j", ["7"])
+            t.assertEqual(t.runner.sync(report, ["7"], job=job), {"7": 2})
+            t.assertEqual(
+                [row["user_id"] for row in t.runner.rows(report, ["7"])],
+                [0, 4],
+            )
+
+    def test_format_mark(t):
+        t.assertEqual(
+            format_mark(datetime(2024, 5, 6, 7, 8, 9, tzinfo=timezone.utc)),
+            "2024-05-06T07:08:09Z",
+        )
+
+
+class FanOutTests(TestCase):
+
+    def setUp(t):
+        tmp = TemporaryDirectory()
+        t.addCleanup(tmp.cleanup)
+        t.state_db = f"{tmp.name}/state.sqlite"
+
+        t.failures = {}
+        t.courses = [str(c) for c in range(1, 9)]
+        routes = {
+            f"/api/v1/courses/{c}/assignments": t.assignments_route(c)
+            for c in t.courses
+        }
+        t.server = FakeCanvas(routes)
+        t.addCleanup(t.server.close)
+        t.worker = WorkerConfig(
+            cli_args=dict(
+                url=t.server.url,
+                token="token",
+                enabled="false",
+                state_db=t.state_db,
+            )
+        )
+
+    def assignments_route(t, course_id):
+        records = [{"id": n} for n in range(int(course_id))]
+
+        def route(handler):
+            if t.failures.get(course_id, 0) > 0:
+                t.failures[course_id] -= 1
+                return json_reply({"errors": []}, 500)
+            return paginated(records)(handler)
+
+        return route
+
+    def requested(t, course_id):
+        prefix = f"/api/v1/courses/{course_id}/"
+        return len([r for r in t.server.requests if r.startswith(prefix)])
+
+    def test_shards(t):
+        t.assertEqual(
+            [s.course_ids for s in shards(["1", "2", "3", "4", "5"], 3)],
+            [["1", "2"], ["3", "4"], ["5"]],
+        )
+        t.assertEqual(len(shards(["1"], 8)), 1)
+        t.assertEqual(shards([], 8), [])
+
+    def test_threads(t):
+        fanout = FanOut(t.worker, workers=3, executor="thread")
+        counts = fanout.sync(["assignments"], list(reversed(t.courses)))
+
+        # in the order given, not the order shards completed in
+        t.assertEqual(list(counts["assignments"]), list(reversed(t.courses)))
+        t.assertEqual(counts["assignments"]["8"], 8)
+        state = StateStore(t.state_db)
+        t.addCleanup(state.close)
+        t.assertEqual(len(list(state.records("assignments"))), 36)
+
+    def test_retry_resumes_shard(t):
+        t.failures["4"] = 1
+        fanout = FanOut(
+            t.worker, workers=2, executor="thread", shards_per_worker=1
+        )
+        counts = fanout.sync(["assignments"], t.courses)
+
+        t.assertEqual(counts["assignments"]["4"], 4)
+        # courses 3 and 4 synced before the failure are not fetched again
+        t.assertEqual(
+            [t.requested(c) for c in t.courses], [1, 1, 1, 2, 1, 1, 1, 1]
+        )
+
+    def test_failed_shard(t):
+        t.failures["2"] = 10
+        fanout = FanOut(
+            t.worker,
+            workers=2,
+            executor="thread",
+            retries=1,
+            shards_per_worker=1,
+        )
+        with t.assertRaises(ShardError) as ctx:
+            fanout.sync(["assignments"], t.courses)
+
+        t.assertEqual(list(ctx.exception.failed), [0])
+        t.assertEqual(ctx.exception.failed[0].pending, ["2", "3", "4"])
+        t.assertEqual(t.requested("2"), 2)
+        # the other shard is synced regardless
+        state = StateStore(t.state_db)
+        t.addCleanup(state.close)
+        t.assertIsNotNone(state.mark("assignments", "1"))
+        t.assertIsNotNone(state.mark("assignments", "8"))
+        t.assertIsNone(state.mark("assignments", "3"))
+
+    def test_async(t):
+        t.failures["5"] = 1
+        fanout = FanOut(t.worker, workers=3, executor="async")
+        counts = fanout.sync(["assignments"], t.courses)
+
+        t.assertEqual(list(counts["assignments"]), t.courses)
+        t.assertEqual(counts["assignments"]["5"], 5)
+        # only the failed course is fetched again
+        t.assertEqual(
+            [t.requested(c) for c in t.courses], [1, 1, 1, 1, 2, 1, 1, 1]
+        )
+
+    def test_async_failed(t):
+        t.failures["2"] = 10
+        fanout = FanOut(t.worker, workers=3, executor="async", retries=1)
+        with t.assertRaises(ShardError) as ctx:
+            fanout.sync(["assignments"], t.courses)
+        t.assertEqual(ctx.exception.failed[1].pending, ["2"])
+        t.assertEqual(t.requested("2"), 2)
+
+    def test_processes(t):
+        fanout = FanOut(t.worker, workers=2, executor="process")
+        counts = fanout.sync(["assignments"], t.courses[:4])
+        t.assertEqual(
+            counts, {"assignments": {"1": 1, "2": 2, "3": 3, "4": 4}}
+        )
+
+    def test_from_config(t):
+        cfg = get_config(
+            cli_args=Namespace(workers="6", executor="thread"),
+        )
+        fanout = FanOut.from_config(cfg, t.worker)
+        t.assertEqual((fanout.workers, fanout.executor), (6, "thread"))
+        t.assertEqual(fanout.retries, 2)
+        with t.assertRaises(ValueError):
+            FanOut(t.worker, executor="fiber")
+
+
+class ReportCommandTests(TestCase):
+
+    def test_report(t):
+        routes = {
+            "/api/v1/accounts/1/courses": paginated([{"id": 7}]),
+            "/api/v1/courses/7/assignments": paginated(
+                [{"id": 2, "name": "quiz"}, {"id": 1, "name": "essay"}]
+            ),
+        }
+        with FakeCanvas(routes) as srv, TemporaryDirectory() as tmp:
+            args = argparser().parse_args(
+                ["report", "assignments", "--account", "1"]
+            )
+            args.url, args.token = srv.url, "token"
+            args.enabled = "false"
+            args.state_db = f"{tmp}/state.sqlite"
+            with patch("sys.stdout", new_callable=io.StringIO) as out:
+                _Commands.report(args)
+
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        t.assertEqual([r["name"] for r in rows], ["essay", "quiz"])
+        t.assertEqual(rows[0]["course_id"], "7")
+
+    def test_workers(t):
+        routes = {
+            f"/api/v1/courses/{c}/assignments": paginated([{"id": c}])
+            for c in (1, 2, 3)
+        }
+        with FakeCanvas(routes) as srv, TemporaryDirectory() as tmp:
+            args = argparser().parse_args(
+                ["report", "assignments", "-w", "2", "--executor", "thread"]
+                + ["--course", "3", "--course", "1", "--course", "2"]
+            )
+            args.url, args.token = srv.url, "token"
+            args.enabled = "false"
+            args.state_db = f"{tmp}/state.sqlite"
+            with patch("sys.stdout", new_callable=io.StringIO) as out:
+                _Commands.report(args)
+
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        t.assertEqual([r["id"] for r in rows], [1, 2, 3])
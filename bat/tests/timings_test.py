@@ -0,0 +1,158 @@
+from unittest import IsolatedAsyncioTestCase, TestCase, skipIf
+from unittest.mock import patch
+
+import asyncio
+import io
+import pstats
+import time
+from tempfile import TemporaryDirectory
+
+from ..cli import BATCLI
+from ..lib.timings import (
+    gauge,
+    profiled,
+    span,
+    start_timings,
+    stop_timings,
+)
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+
+SRC = "bat.lib.timings"
+
+
+class SpanTests(TestCase):
+
+    def setUp(t):
+        t.addCleanup(stop_timings, io.StringIO())
+
+    def test_off(t):
+        t.assertIs(span("a"), span("b"))
+        with span("a"):
+            pass
+        t.assertIsNone(stop_timings(io.StringIO()))
+
+    def test_nested(t):
+        timings = start_timings()
+        with span("write"):
+            for _ in range(2):
+                with span("http"):
+                    time.sleep(0.01)
+
+        calls, total, own = timings.stages["write"]
+        t.assertEqual(calls, 1)
+        t.assertLess(own, 0.01)
+        t.assertGreaterEqual(total, 0.02)
+        calls, total, own = timings.stages["http"]
+        t.assertEqual(calls, 2)
+        t.assertEqual(total, own)
+
+        out = io.StringIO()
+        t.assertIs(stop_timings(out), timings)
+        lines = out.getvalue().splitlines()
+        t.assertEqual(lines[0], "stage           calls    total s     self s")
+        t.assertEqual(
+            [line.split()[0] for line in lines[1:]], ["http", "write", "wall"]
+        )
+
+    def test_gauge(t):
+        gauge("concurrency", 4)
+        timings = start_timings()
+        for value in (4, 8, 2, 6):
+            gauge("concurrency", value)
+        t.assertEqual(timings.gauges["concurrency"], [4, 6, 2, 8])
+
+        out = io.StringIO()
+        stop_timings(out)
+        lines = out.getvalue().splitlines()
+        t.assertEqual(
+            lines[-2].split(), ["gauge", "samples", "last", "min", "max"]
+        )
+        t.assertEqual(
+            lines[-1].split(), ["concurrency", "4", "6.0", "2.0", "8.0"]
+        )
+
+    def test_overhead_when_off(t):
+        n = 100_000
+        start = time.perf_counter()
+        for _ in range(n):
+            with span("http"):
+                pass
+        per_span = (time.perf_counter() - start) / n
+        print(f"\nspan, timings off: {per_span * 1e9:.0f}ns")
+        t.assertLess(per_span, 2e-6)
+
+
+class AsyncSpanTests(IsolatedAsyncioTestCase):
+
+    async def test_tasks(t):
+        """concurrent tasks nest their spans in their own parents"""
+        timings = start_timings()
+        t.addCleanup(stop_timings, io.StringIO())
+
+        async def course():
+            with span("course"):
+                with span("http"):
+                    await asyncio.sleep(0.01)
+
+        await asyncio.gather(course(), course())
+
+        calls, total, own = timings.stages["course"]
+        t.assertEqual(calls, 2)
+        t.assertLess(own, 0.005)
+
+
+class ProfileTests(TestCase):
+
+    def test_cprofile(t):
+        with TemporaryDirectory() as tmp:
+            with patch("sys.stderr", new_callable=io.StringIO):
+                ret = profiled(lambda: sum(range(10)), f"{tmp}/bat.prof")
+            stats = pstats.Stats(f"{tmp}/bat.prof")
+
+        t.assertEqual(ret, 45)
+        t.assertTrue(
+            any(name == "<lambda>" for _, _, name in stats.stats)
+        )
+
+    @skipIf(pyinstrument, "pyinstrument is installed")
+    def test_sampling_requires_pyinstrument(t):
+        with t.assertRaisesRegex(RuntimeError, "pyinstrument"):
+            profiled(lambda: None, "bat.json", "sampling")
+
+    def test_unknown_profiler(t):
+        with t.assertRaises(ValueError):
+            profiled(lambda: None, "bat.prof", "perf")
+
+
+class CLITests(TestCase):
+
+    def setUp(t):
+        patcher = patch("bat.cli.exit", autospec=True)
+        t.exit = patcher.start()
+        t.addCleanup(patcher.stop)
+
+    @patch("sys.stderr", new_callable=io.StringIO)
+    def test_timings(t, stderr):
+        with patch("sys.stdout", new_callable=io.StringIO):
+            BATCLI(["--timings", "hello"])
+
+        stages = [line.split()[0] for line in stderr.getvalue().splitlines()]
+        t.assertIn("command", stages)
+        t.assertEqual(stages[-1], "wall")
+        t.exit.assert_called_with(0)
+
+    @patch("sys.stderr", new_callable=io.StringIO)
+    def test_profile(t, stderr):
+        with TemporaryDirectory() as tmp:
+            with patch("sys.stdout", new_callable=io.StringIO):
+                BATCLI(["--profile", f"{tmp}/hello.prof", "hello"])
+            stats = pstats.Stats(f"{tmp}/hello.prof")
+
+        t.assertTrue(any(name == "hello" for _, _, name in stats.stats))
+        t.assertIn("profile written to", stderr.getvalue())
+        t.exit.assert_called_with(0)
@@ -0,0 +1,222 @@
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
+
+import csv
+import io
+import json
+import os
+from tempfile import TemporaryDirectory
+
+from ..conf import get_config, Namespace
+from ..report.writers import (
+    CsvWriter,
+    JsonLinesWriter,
+    Writer,
+    get_writer,
+    write_rows,
+    writer_from_config,
+)
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+SRC = "bat.report.writers"
+
+COLUMNS = ["id", "name", "score"]
+
+
+def rows(count, start=0):
+    return (
+        {"id": n, "name": f"user {n}", "score": n % 7}
+        for n in range(start, start + count)
+    )
+
+
+class JsonLinesWriterTests(TestCase):
+
+    def test_stdout(t):
+        with patch("sys.stdout", new_callable=io.StringIO) as out:
+            with JsonLinesWriter(None, COLUMNS) as writer:
+                t.assertEqual(write_rows(writer, rows(3), batch_size=2), 3)
+
+        lines = out.getvalue().splitlines()
+        t.assertEqual(
+            json.loads(lines[2]), {"id": 2, "name": "user 2", "score": 2}
+        )
+
+    def test_file(t):
+        with TemporaryDirectory() as tmp:
+            path = f"{tmp}/out.jsonl"
+            with JsonLinesWriter(path, COLUMNS) as writer:
+                write_rows(writer, rows(5))
+            t.assertEqual(writer.close(), [path])
+            with open(path) as f:
+                t.assertEqual(len(f.readlines()), 5)
+
+
+class CsvWriterTests(TestCase):
+
+    def setUp(t):
+        tmp = TemporaryDirectory()
+        t.addCleanup(tmp.cleanup)
+        t.tmp = tmp.name
+
+    def read(t, path):
+        with open(path, newline="") as f:
+            return list(csv.DictReader(f))
+
+    def test_chunked(t):
+        writer = CsvWriter(f"{t.tmp}/grades.csv", COLUMNS, chunk_rows=4)
+        write_rows(writer, rows(10), batch_size=3)
+        files = writer.close()
+
+        t.assertEqual(
+            [os.path.basename(f) for f in files],
+            ["grades-00000.csv", "grades-00001.csv", "grades-00002.csv"],
+        )
+        chunks = [t.read(f) for f in files]
+        t.assertEqual([len(c) for c in chunks], [4, 4, 2])
+        t.assertEqual(
+            chunks[2][1], {"id": "9", "name": "user 9", "score": "2"}
+        )
+
+    def test_on_chunk(t):
+        chunks = []
+        writer = CsvWriter(
+            f"{t.tmp}/grades.csv",
+            COLUMNS,
+            chunk_rows=4,
+            on_chunk=lambda *chunk: chunks.append(chunk),
+        )
+        write_rows(writer, rows(10), batch_size=3)
+        files = writer.close()
+        # every file once complete, the last one on close
+        t.assertEqual(chunks, list(zip(files, [4, 4, 2])))
+
+        chunks.clear()
+        with t.assertRaises(OSError):
+            with CsvWriter(
+                f"{t.tmp}/failed.csv",
+                COLUMNS,
+                chunk_rows=4,
+                on_chunk=lambda *chunk: chunks.append(chunk),
+            ) as writer:
+                write_rows(writer, rows(6))
+                raise OSError("disk full")
+        # the chunk cut short by the failure is not reported
+        t.assertEqual(chunks, [(f"{t.tmp}/failed-00000.csv", 4)])
+        t.assertIsNone(writer._file)
+
+    def test_single_file(t):
+        path = f"{t.tmp}/grades.csv"
+        with CsvWriter(path, COLUMNS) as writer:
+            write_rows(writer, rows(10), batch_size=3)
+        t.assertEqual(writer.files, [path])
+        t.assertEqual(len(t.read(path)), 10)
+
+    def test_empty(t):
+        files = CsvWriter(f"{t.tmp}/grades.csv", COLUMNS, chunk_rows=5).close()
+        t.assertEqual(files, [f"{t.tmp}/grades-00000.csv"])
+        with open(files[0]) as f:
+            t.assertEqual(f.read().strip(), "id,name,score")
+
+    def test_stdout(t):
+        with patch("sys.stdout", new_callable=io.StringIO) as out:
+            with CsvWriter(None, COLUMNS, chunk_rows=2) as writer:
+                writer.write_batch(list(rows(3)))
+        t.assertEqual(len(out.getvalue().splitlines()), 4)
+
+
+@skipUnless(pyarrow, "requires pyarrow")
+class ColumnarWriterTests(TestCase):
+
+    def setUp(t):
+        tmp = TemporaryDirectory()
+        t.addCleanup(tmp.cleanup)
+        t.tmp = tmp.name
+
+    def test_parquet_row_groups(t):
+        path = f"{t.tmp}/grades.parquet"
+        writer = get_writer("parquet", path, COLUMNS, row_group_size=4)
+        write_rows(writer, rows(10), batch_size=3)
+        writer.close()
+
+        parquet = pyarrow.parquet.ParquetFile(path)
+        t.assertEqual(parquet.metadata.num_rows, 10)
+        t.assertEqual(parquet.metadata.num_row_groups, 3)
+        t.assertEqual(parquet.read().column("name")[9].as_py(), "user 9")
+
+    def test_types(t):
+        path = f"{t.tmp}/grades.parquet"
+        data = [
+            {"id": 1, "name": None, "score": 10},
+            {"id": 2, "name": 5, "score": 9.5},
+        ]
+        writer = get_writer(
+            "parquet",
+            path,
+            COLUMNS,
+            row_group_size=1,
+            types={"score": "float64"},
+        )
+        write_rows(writer, data)
+        writer.close()
+
+        table = pyarrow.parquet.read_table(path)
+        t.assertEqual(table.column("score").to_pylist(), [10.0, 9.5])
+        # all null in the first group, so written as text
+        t.assertEqual(table.column("name").to_pylist(), [None, "5"])
+
+    def test_arrow(t):
+        path = f"{t.tmp}/grades.arrow"
+        with get_writer("arrow", path, COLUMNS, row_group_size=4) as writer:
+            write_rows(writer, rows(10))
+
+        reader = pyarrow.ipc.open_file(path)
+        t.assertEqual(reader.num_record_batches, 3)
+        t.assertEqual(reader.read_all().num_rows, 10)
+
+    def test_failed(t):
+        for kind in ("parquet", "arrow"):
+            path = f"{t.tmp}/grades.{kind}"
+            with t.assertRaises(ConnectionError):
+                with get_writer(kind, path, COLUMNS, row_group_size=4) as w:
+                    write_rows(w, rows(6))
+                    raise ConnectionError()
+            # no partial report left to pass for the whole one
+            t.assertFalse(os.path.exists(path))
+
+    def test_requires_path(t):
+        with t.assertRaises(ValueError):
+            get_writer("parquet", None, COLUMNS)
+
+
+class GetWriterTests(TestCase):
+
+    def test_abstract(t):
+        with t.assertRaisesRegex(TypeError, "abstract .*write_batch"):
+            Writer(None, COLUMNS)
+
+    def test_unknown_format(t):
+        with t.assertRaises(ValueError):
+            get_writer("xlsx", None, COLUMNS)
+
+    @patch(f"{SRC}.get_writer", autospec=True)
+    def test_writer_from_config(t, get_writer):
+        cfg = get_config(
+            cli_args=Namespace(output_format="csv", chunk_rows="10")
+        )
+        writer_from_config(cfg, "out.csv", COLUMNS)
+        get_writer.assert_called_with(
+            "csv",
+            "out.csv",
+            COLUMNS,
+            chunk_rows=10,
+            row_group_size=65536,
+            types=None,
+        )
@@ -0,0 +1,186 @@
+"""Benchmarks of the bat pipeline, run with: python -m benchmarks
+
+Benchmarks are functions of the bench_*.py modules decorated with
+@benchmark. Each receives a Run, and times the body of its loop:
+
+    @benchmark(sizes=SIZES)
+    def paginate(run: Run, size: int):
+        server = ...  # setup, not timed
+        for _ in run:
+            records = list(...)
+        run.items = size
+
+Results are saved as JSON, and compared to a baseline to flag the
+benchmarks that got slower, see compare.
+"""
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+import os
+import platform
+import statistics
+import subprocess
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+
+# synthetic records per run of the benchmarks that scale
+SIZES = (1_000, 100_000, 1_000_000)
+QUICK_SIZES = (1_000,)
+
+Result = Dict[str, Any]
+
+
+class Run:
+    """Time each iteration of the loop over it.
+
+    Iterates `repeat` times, or fewer once `budget` seconds are spent,
+    but at least once. Set `items` to the records processed per
+    iteration, for a throughput, and add other measures to `metrics`,
+    ex: bytes per record.
+    """
+
+    def __init__(self, repeat: int = 5, budget: float = 10.0):
+        self.repeat = repeat
+        self.budget = budget
+        self.times: List[float] = []
+        self.items: Optional[int] = None
+        self.metrics: Dict[str, float] = {}
+
+    def __iter__(self) -> Iterator[int]:
+        spent = 0.0
+        for n in range(self.repeat):
+            start = time.perf_counter()
+            yield n
+            elapsed = time.perf_counter() - start
+            self.times.append(elapsed)
+            spent += elapsed
+            if spent > self.budget:
+                break
+
+    def result(self) -> Result:
+        median = statistics.median(self.times)
+        ret: Result = dict(
+            runs=len(self.times),
+            min=min(self.times),
+            median=median,
+            mean=statistics.fmean(self.times),
+        )
+        if self.items:
+            ret["items"] = self.items
+            ret["per_second"] = self.items / median
+        ret.update(self.metrics)
+        return ret
+
+
+@dataclass
+class Benchmark:
+    name: str
+    func: Callable[..., None]
+    sizes: Sequence[Optional[int]] = (None,)
+    repeat: int = 5
+
+    def id(self, size: Optional[int]) -> str:
+        return self.name if size is None else f"{self.name}[{size}]"
+
+    def params(self, sizes: Optional[Sequence[int]] = None) -> List:
+        if self.sizes == (None,) or sizes is None:
+            return list(self.sizes)
+        return [size for size in self.sizes if size in sizes]
+
+    def run(self, size: Optional[int]) -> Result:
+        # one pass of the biggest sizes is plenty
+        repeat = self.repeat if (size or 0) < 1_000_000 else 1
+        run = Run(repeat=repeat)
+        if size is None:
+            self.func(run)
+        else:
+            self.func(run, size)
+        return run.result()
+
+
+BENCHMARKS: Dict[str, Benchmark] = {}
+
+
+def benchmark(sizes: Sequence[Optional[int]] = (None,), repeat: int = 5):
+    """Register a benchmark, run for each of `sizes` if given"""
+
+    def register(func: Callable[..., None]) -> Callable[..., None]:
+        module = func.__module__.rpartition(".")[2]
+        name = f"{module.replace('bench_', '', 1)}.{func.__name__}"
+        BENCHMARKS[name] = Benchmark(name, func, tuple(sizes), repeat)
+        return func
+
+    return register
+
+
+def run(
+    names: Optional[Sequence[str]] = None,
+    sizes: Optional[Sequence[int]] = None,
+    report: Callable[[str, Result], None] = lambda name, result: None,
+) -> Dict[str, Any]:
+    """Run the benchmarks matching any of `names`, all of them by default"""
+    results: Dict[str, Result] = {}
+    for bench in BENCHMARKS.values():
+        for size in bench.params(sizes):
+            name = bench.id(size)
+            if names and not any(pattern in name for pattern in names):
+                continue
+            results[name] = bench.run(size)
+            report(name, results[name])
+    return dict(machine=machine(), results=results)
+
+
+def machine() -> Dict[str, Any]:
+    return dict(
+        created=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        commit=_commit(),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        cpus=os.cpu_count(),
+    )
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(__file__),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@dataclass
+class Comparison:
+    name: str
+    baseline: float
+    current: float
+    threshold: float
+    regressed: bool = field(init=False)
+
+    def __post_init__(self):
+        self.regressed = self.ratio > 1 + self.threshold
+
+    @property
+    def ratio(self) -> float:
+        return self.current / self.baseline
+
+
+def compare(
+    results: Dict[str, Any], baseline: Dict[str, Any], threshold: float = 0.2
+) -> List[Comparison]:
+    """Compare the median times of the benchmarks run in both.
+
+    A benchmark regressed if it is more than `threshold` slower, 0.2 for
+    20%. Only runs on the same machine are comparable.
+    """
+    base = baseline["results"]
+    return [
+        Comparison(name, base[name]["median"], result["median"], threshold)
+        for name, result in results["results"].items()
+        if name in base
+    ]
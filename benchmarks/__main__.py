@@ -0,0 +1,107 @@
+from typing import List, Optional, Sequence
+
+import importlib
+import json
+import pkgutil
+import sys
+from argparse import ArgumentParser
+
+from . import QUICK_SIZES, Comparison, Result, compare, run
+
+
+STATISTICS = ("runs", "min", "median", "mean", "items", "per_second")
+
+
+def argparser() -> ArgumentParser:
+    p = ArgumentParser(
+        prog="python -m benchmarks",
+        description="benchmark the bat pipeline, and compare to a baseline",
+    )
+    p.add_argument(
+        "-k",
+        dest="names",
+        action="append",
+        default=[],
+        metavar="NAME",
+        help="only the benchmarks whose name contains NAME, may be repeated",
+    )
+    p.add_argument(
+        "--quick",
+        action="store_true",
+        help=f"only the smallest size, {QUICK_SIZES[0]} records",
+    )
+    p.add_argument(
+        "--sizes",
+        type=lambda value: [int(size) for size in value.split(",")],
+        default=None,
+        help="comma separated record counts, ex: 1000,100000",
+    )
+    p.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        help="save the results as JSON to this path",
+    )
+    p.add_argument(
+        "--baseline",
+        default=None,
+        help="results JSON to compare with, exits 1 on a regression",
+    )
+    p.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="slowdown flagged as a regression. default=0.2, for 20%%",
+    )
+    return p
+
+
+def load_benchmarks():
+    from . import __path__ as path
+
+    for module in pkgutil.iter_modules(path):
+        if module.name.startswith("bench_"):
+            importlib.import_module(f"{__package__}.{module.name}")
+
+
+def print_result(name: str, result: Result):
+    line = f"{name:<40} {result['median'] * 1000:>12.3f}ms"
+    if per_second := result.get("per_second"):
+        line += f" {per_second:>14,.0f}/s"
+    for metric in set(result) - set(STATISTICS):
+        line += f" {metric}={result[metric]:,.1f}"
+    print(line, flush=True)
+
+
+def print_comparisons(comparisons: Sequence[Comparison]):
+    for c in comparisons:
+        flag = "REGRESSED" if c.regressed else ""
+        print(
+            f"{c.name:<40} {c.baseline * 1000:>12.3f}ms"
+            f" -> {c.current * 1000:>12.3f}ms {c.ratio:>6.2f}x {flag}"
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = argparser().parse_args(argv)
+    load_benchmarks()
+    sizes = QUICK_SIZES if args.quick else args.sizes
+    results = run(args.names, sizes, report=print_result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        comparisons = compare(results, baseline, args.threshold)
+        print(f"\ncompared to {args.baseline}:")
+        print_comparisons(comparisons)
+        if any(c.regressed for c in comparisons):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,16 @@
+import subprocess
+import sys
+
+from . import Run, benchmark
+
+
+@benchmark()
+def cold_start(run: Run):
+    """`bat hello` in a new interpreter, imports included"""
+    command = [
+        sys.executable,
+        "-c",
+        "from bat.cli import BATCLI; BATCLI(['hello'])",
+    ]
+    for _ in run:
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
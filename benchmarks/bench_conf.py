@@ -0,0 +1,67 @@
+import os
+from tempfile import TemporaryDirectory
+
+from bat.conf import (
+    Namespace,
+    clear_resolved_config,
+    get_config,
+    resolved_config,
+)
+
+from . import Run, benchmark
+
+
+CONFIG = """
+default: bench
+
+bench:
+    bat:
+        canvas:
+            url: https://canvas.test
+            token: secret
+        report:
+            workers: "4"
+"""
+
+LOOKUPS = 1000
+
+
+def config_file(tmp: str) -> str:
+    path = os.path.join(tmp, "config.yaml")
+    with open(path, "w") as f:
+        f.write(CONFIG)
+    return path
+
+
+def lookups(cfg):
+    for _ in range(LOOKUPS):
+        cfg.canvas.url
+        cfg.canvas.concurrency
+        cfg.report.workers
+
+
+@benchmark()
+def get_config_lookups(run: Run):
+    """get_config, then LOOKUPS rounds of three configuration values"""
+    with TemporaryDirectory() as tmp:
+        path = config_file(tmp)
+        for _ in run:
+            cfg = get_config(
+                cli_args=Namespace(timeout="10"), config_file_name=path
+            )
+            lookups(cfg)
+    run.items = LOOKUPS * 3
+
+
+@benchmark()
+def resolved_config_lookups(run: Run):
+    """resolved_config, resolved each time, then the same lookups"""
+    with TemporaryDirectory() as tmp:
+        path = config_file(tmp)
+        for _ in run:
+            clear_resolved_config()
+            cfg = resolved_config(
+                cli_args=Namespace(timeout="10"), config_file_name=path
+            )
+            lookups(cfg)
+    run.items = LOOKUPS * 3
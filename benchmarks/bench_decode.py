@@ -0,0 +1,59 @@
+import importlib.util
+import json
+from typing import List
+
+from bat.lib.decode import DECODERS, get_decoder
+from bat.records import Submission
+from bat.tests.fake_canvas import Scale, submissions
+
+from . import SIZES, Run, benchmark
+
+
+PER_PAGE = 100
+
+
+def pages(size: int) -> List[bytes]:
+    """`size` submissions as Canvas would serve them, 100 a page"""
+    students = PER_PAGE
+    scale = Scale(students=students, assignments=-(-size // students))
+    records = submissions(scale, 1)[:size]
+    return [
+        json.dumps(records[n : n + PER_PAGE]).encode()
+        for n in range(0, size, PER_PAGE)
+    ]
+
+
+def register(name: str):
+    """The benchmarks of decoder `name`"""
+
+    def loads(run: Run, size: int):
+        backend, data = get_decoder(name), pages(size)
+        for _ in run:
+            for page in data:
+                backend.loads(page)
+        run.items = size
+
+    def records(run: Run, size: int):
+        backend, data = get_decoder(name), pages(size)
+        for _ in run:
+            for page in data:
+                backend.records(page, Submission)
+        run.items = size
+
+    def iter_array(run: Run, size: int):
+        backend, data = get_decoder(name), pages(size)
+        for _ in run:
+            for page in data:
+                chunks = [page[: 1 << 14], page[1 << 14 :]]
+                for _ in backend.iter_array(chunks):
+                    pass
+        run.items = size
+
+    for func in (loads, records, iter_array):
+        func.__name__ = f"{name}_{func.__name__}"
+        benchmark(sizes=SIZES)(func)
+
+
+for name in DECODERS[1:]:
+    if name == "json" or importlib.util.find_spec(name):
+        register(name)
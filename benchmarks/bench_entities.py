@@ -0,0 +1,155 @@
+from typing import Any, Dict, List
+
+from bat.entities import EntityStore, group_by
+from bat.tests.fake_canvas import (
+    Scale,
+    course_users,
+    enrollments,
+    sections,
+    submissions,
+)
+
+from . import Run, benchmark
+
+
+Entities = Dict[str, List[Dict[str, Any]]]
+
+
+def entities(size: int) -> Entities:
+    """`size` enrollments, a hundred a course, with the submissions of
+    two assignments, the sections and the users of their courses"""
+    scale = Scale(
+        courses=max(1, size // 100),
+        students=99,
+        teachers=1,
+        sections=4,
+        assignments=2,
+    )
+    ret: Entities = {
+        "enrollments": [],
+        "submissions": [],
+        "sections": [],
+        "users": [],
+    }
+    users = {}
+    for course_id in range(1, scale.total_courses + 1):
+        ret["enrollments"] += enrollments(scale, course_id)
+        ret["submissions"] += submissions(scale, course_id)
+        ret["sections"] += sections(scale, course_id)
+        users.update((u["id"], u) for u in course_users(scale, course_id))
+    ret["users"] = list(users.values())
+    return ret
+
+
+def missing_by_section(store: EntityStore) -> List[Dict[str, Any]]:
+    """Missing submissions per section, named, with the instructor"""
+    missing = (s for s in store.entities["submissions"] if s["missing"])
+    placed = store.join(
+        missing,
+        "students",
+        on=("course_id", "user_id"),
+        fields={"course_section_id": "section_id"},
+    )
+    rows = group_by(
+        placed,
+        ("course_id", "section_id"),
+        missing=(None, "count"),
+        students=("user_id", "count_distinct"),
+    )
+    rows = store.join(
+        rows, "sections", on={"section_id": "id"}, fields={"name": "section"}
+    )
+    rows = store.join(
+        rows,
+        "teachers",
+        on={"course_id": "course_id", "section_id": "course_section_id"},
+        fields=("user_id",),
+        how="left",
+    )
+    return list(
+        store.join(
+            rows,
+            "users",
+            on={"user_id": "id"},
+            fields={"name": "instructor"},
+            how="left",
+        )
+    )
+
+
+def load(data: Entities) -> EntityStore:
+    store = EntityStore()
+    for kind, records in data.items():
+        store.load(kind, records)
+    for kind, role in (
+        ("students", "StudentEnrollment"),
+        ("teachers", "TeacherEnrollment"),
+    ):
+        store.load(
+            kind, (e for e in data["enrollments"] if e["type"] == role)
+        )
+    return store
+
+
+@benchmark(sizes=(1_000, 100_000, 250_000))
+def indexed_join(run: Run, size: int):
+    """Load and index the entities, then join and group them"""
+    data = entities(size)
+    for _ in run:
+        rows = missing_by_section(load(data))
+    run.items = size
+    run.metrics["sections"] = len(rows)
+
+
+@benchmark(sizes=(1_000,))
+def nested_loop_join(run: Run, size: int):
+    """The same report with a scan of the entities for each row, as
+    before the store. Quadratic, so only at the smallest size"""
+    data = entities(size)
+    for _ in run:
+        groups: Dict[Any, Dict[str, Any]] = {}
+        for s in data["submissions"]:
+            if not s["missing"]:
+                continue
+            for e in data["enrollments"]:
+                if (
+                    e["type"] == "StudentEnrollment"
+                    and e["course_id"] == s["course_id"]
+                    and e["user_id"] == s["user_id"]
+                ):
+                    key = (s["course_id"], e["course_section_id"])
+                    group = groups.setdefault(
+                        key, {"missing": 0, "students": set()}
+                    )
+                    group["missing"] += 1
+                    group["students"].add(s["user_id"])
+        rows = []
+        for (course_id, section_id), group in groups.items():
+            section = next(
+                x for x in data["sections"] if x["id"] == section_id
+            )
+            teacher = next(
+                (
+                    e
+                    for e in data["enrollments"]
+                    if e["type"] == "TeacherEnrollment"
+                    and e["course_id"] == course_id
+                    and e["course_section_id"] == section_id
+                ),
+                None,
+            )
+            instructor = teacher and next(
+                u for u in data["users"] if u["id"] == teacher["user_id"]
+            )
+            rows.append(
+                dict(
+                    course_id=course_id,
+                    section_id=section_id,
+                    missing=group["missing"],
+                    students=len(group["students"]),
+                    section=section["name"],
+                    instructor=instructor and instructor["name"],
+                )
+            )
+    run.items = size
+    run.metrics["sections"] = len(rows)
@@ -0,0 +1,48 @@
+import io
+import os
+from contextlib import redirect_stdout
+from tempfile import TemporaryDirectory
+
+from bat.cli import argparser
+from bat.report.cli import _Commands
+from bat.tests.fake_canvas import Scale, SyntheticCanvas
+
+from . import Run, benchmark
+
+
+SCALE = Scale(courses=50, students=40, assignments=10)
+
+
+def account_report(run: Run, *options: str):
+    """bat report submissions for every course of an account.
+
+    Each request takes 10 to 20ms, as it would over a network.
+    """
+    with SyntheticCanvas(SCALE, latency=0.01, jitter=0.01) as server:
+        with TemporaryDirectory() as tmp:
+            args = argparser().parse_args(
+                ["report", "submissions", "--account", "1", "--full"]
+                + ["-o", os.path.join(tmp, "submissions.jsonl"), *options]
+            )
+            args.url, args.token = server.url, "token"
+            args.enabled = "false"
+            args.state_db = os.path.join(tmp, "state.sqlite")
+            for _ in run:
+                with redirect_stdout(io.StringIO()):
+                    _Commands.report(args)
+    run.items = SCALE.total_courses * SCALE.students * SCALE.assignments
+
+
+@benchmark(repeat=3)
+def account_report_serial(run: Run):
+    account_report(run)
+
+
+@benchmark(repeat=3)
+def account_report_threads(run: Run):
+    account_report(run, "-w", "8", "--executor", "thread")
+
+
+@benchmark(repeat=3)
+def account_report_async(run: Run):
+    account_report(run, "-w", "8", "--executor", "async")
@@ -0,0 +1,33 @@
+from bat.lib.canvas import CanvasClient
+from bat.lib.loader import canvas_loader
+from bat.tests.fake_canvas import Scale, SyntheticCanvas, submissions
+
+from . import Run, benchmark
+
+
+SCALE = Scale(courses=1, students=50, assignments=4)
+# the user of every submission of a course, an N+1 lookup pattern
+USER_IDS = [s["user_id"] for s in submissions(SCALE, 1)]
+
+
+@benchmark(repeat=3)
+def user_per_request(run: Run):
+    """A GET users/:id per submission, 5ms each"""
+    with SyntheticCanvas(SCALE, latency=0.005) as server:
+        with CanvasClient(server.url, "token") as client:
+            for _ in run:
+                for user_id in USER_IDS:
+                    client.get_json(f"/api/v1/users/{user_id}")
+    run.items = len(USER_IDS)
+
+
+@benchmark(repeat=3)
+def user_loader(run: Run):
+    """The same lookups, batched and de-duplicated by a fresh loader"""
+    with SyntheticCanvas(SCALE, latency=0.005) as server:
+        with CanvasClient(server.url, "token") as client:
+            for _ in run:
+                canvas_loader(client, "users", course_id=1).load_many(
+                    USER_IDS
+                )
+    run.items = len(USER_IDS)
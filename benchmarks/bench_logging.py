@@ -0,0 +1,64 @@
+import logging
+import os
+
+from bat import logconf
+
+from . import Run, benchmark
+
+
+RECORDS = 20_000
+
+
+def log_records(logger: logging.Logger):
+    for n in range(RECORDS):
+        logger.debug(
+            "GET %s %d",
+            "/api/v1/courses",
+            200,
+            extra=dict(endpoint="/api/v1/courses", status=200, bytes=n),
+        )
+
+
+def throughput(run: Run, handler: logging.Handler):
+    logger = logging.getLogger("benchmarks.logging")
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    logger.addHandler(handler)
+    try:
+        for _ in run:
+            log_records(logger)
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+    run.items = RECORDS
+
+
+def devnull_handler(log_format: str = logconf.default_format):
+    handler = logging.StreamHandler(open(os.devnull, "w"))
+    handler.setFormatter(logconf.formatter(log_format))
+    return handler
+
+
+@benchmark()
+def stream_handler(run: Run):
+    throughput(run, devnull_handler())
+
+
+@benchmark()
+def json_formatter(run: Run):
+    throughput(run, devnull_handler(logconf.JSON_FORMAT))
+
+
+@benchmark()
+def queue_handler(run: Run):
+    """Records put on the queue, written to /dev/null by the listener"""
+    from logging.handlers import QueueHandler, QueueListener
+    from queue import SimpleQueue
+
+    queue: SimpleQueue = SimpleQueue()
+    listener = QueueListener(queue, devnull_handler())
+    listener.start()
+    try:
+        throughput(run, QueueHandler(queue))
+    finally:
+        listener.stop()
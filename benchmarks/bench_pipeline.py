@@ -0,0 +1,59 @@
+import asyncio
+import io
+import os
+from contextlib import redirect_stdout
+from tempfile import TemporaryDirectory
+
+from bat.cli import argparser
+from bat.lib.aio import AsyncCanvasClient, apaginate
+from bat.lib.canvas import CanvasClient
+from bat.lib.paginate import paginate
+from bat.report.cli import _Commands
+from bat.tests.fake_canvas import FakeCanvas
+
+from . import SIZES, Run, benchmark
+from .synthetic import COURSE_ID, SUBMISSIONS, synthetic
+
+
+@benchmark(sizes=SIZES)
+def paginate_records(run: Run, size: int):
+    """Stream every submission of a course, 100 per page"""
+    with FakeCanvas({SUBMISSIONS: synthetic(size)}) as server:
+        with CanvasClient(server.url, "token") as client:
+            for _ in run:
+                count = sum(1 for _ in paginate(client, SUBMISSIONS))
+    assert count == size, count
+    run.items = size
+
+
+@benchmark(sizes=SIZES)
+def apaginate_records(run: Run, size: int):
+    """paginate_records, over AsyncCanvasClient"""
+
+    async def stream(url: str) -> int:
+        async with AsyncCanvasClient(url, "token") as client:
+            return sum([1 async for _ in apaginate(client, SUBMISSIONS)])
+
+    with FakeCanvas({SUBMISSIONS: synthetic(size)}) as server:
+        for _ in run:
+            count = asyncio.run(stream(server.url))
+    assert count == size, count
+    run.items = size
+
+
+@benchmark(sizes=SIZES)
+def submissions_report(run: Run, size: int):
+    """bat report submissions, a full sync then written as JSON lines"""
+    with FakeCanvas({SUBMISSIONS: synthetic(size)}) as server:
+        with TemporaryDirectory() as tmp:
+            args = argparser().parse_args(
+                ["report", "submissions", "--course", str(COURSE_ID)]
+                + ["--full", "-o", os.path.join(tmp, "submissions.jsonl")]
+            )
+            args.url, args.token = server.url, "token"
+            args.enabled = "false"
+            args.state_db = os.path.join(tmp, "state.sqlite")
+            for _ in run:
+                with redirect_stdout(io.StringIO()):
+                    _Commands.report(args)
+    run.items = size
@@ -0,0 +1,61 @@
+import json
+import tracemalloc
+from typing import Any, Callable, List
+
+from bat.records import RecordBatch, Submission
+from bat.tests.fake_canvas import Scale, submissions
+
+from . import Run, benchmark
+
+
+def payloads(size: int) -> List[str]:
+    """`size` submissions as JSON, parsed anew by each benchmark as they
+    would be from Canvas responses, so no string is shared by accident"""
+    students = 100
+    scale = Scale(students=students, assignments=-(-size // students))
+    return [json.dumps(s) for s in submissions(scale, 1)[:size]]
+
+
+def held(run: Run, size: int, load: Callable[[List[str]], Any]):
+    """Time `load`, and measure the memory its result holds per record"""
+    lines = payloads(size)
+    for _ in run:
+        load(lines)
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        loaded = load(lines)
+        run.metrics["bytes_per_record"] = (
+            tracemalloc.get_traced_memory()[0] - before
+        ) / size
+    finally:
+        tracemalloc.stop()
+    del loaded
+    run.items = size
+
+
+@benchmark(sizes=(1_000, 100_000))
+def submission_dicts(run: Run, size: int):
+    held(run, size, lambda lines: [json.loads(line) for line in lines])
+
+
+@benchmark(sizes=(1_000, 100_000))
+def submission_records(run: Run, size: int):
+    held(
+        run,
+        size,
+        lambda lines: [
+            Submission.from_json(json.loads(line)) for line in lines
+        ],
+    )
+
+
+@benchmark(sizes=(1_000, 100_000))
+def submission_batch(run: Run, size: int):
+    held(
+        run,
+        size,
+        lambda lines: RecordBatch.from_json(
+            Submission, (json.loads(line) for line in lines)
+        ),
+    )
@@ -0,0 +1,56 @@
+"""Synthetic Canvas records, served page by page from a FakeCanvas"""
+from typing import Any, Dict, List
+
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from bat.tests.fake_canvas import FakeCanvasHandler, Reply, Route, json_reply
+
+
+COURSE_ID = 1
+SUBMISSIONS = f"/api/v1/courses/{COURSE_ID}/students/submissions"
+
+
+def submission(n: int) -> Dict[str, Any]:
+    """The n-th submission, the same on every call"""
+    # cheap and well spread pseudo-random bits
+    bits = (n * 2654435761) & 0xFFFFFFFF
+    graded = bits % 10 != 0
+    return dict(
+        id=n,
+        assignment_id=n % 500,
+        user_id=n // 500,
+        workflow_state="graded" if graded else "submitted",
+        score=(bits >> 8) % 101 / 10 if graded else None,
+        grade=None,
+        submitted_at="2024-01-01T00:00:00Z",
+        graded_at="2024-01-02T00:00:00Z" if graded else None,
+        late=(bits >> 16) % 100 < 15,
+        missing=False,
+    )
+
+
+def submissions(start: int, stop: int) -> List[Dict[str, Any]]:
+    return [submission(n) for n in range(start, stop)]
+
+
+def synthetic(count: int) -> Route:
+    """Serve `count` submissions, generated as each page is requested"""
+
+    def route(handler: FakeCanvasHandler) -> Reply:
+        parts = urlsplit(handler.path)
+        query = parse_qs(parts.query)
+        page = int(query.get("page", ["1"])[0])
+        per_page = int(query.get("per_page", ["10"])[0])
+        start = (page - 1) * per_page
+        stop = min(start + per_page, count)
+        headers = {}
+        if stop < count:
+            query.update(page=[str(page + 1)], per_page=[str(per_page)])
+            host, port = handler.server.server_address[:2]
+            headers["Link"] = (
+                f"<http://{host}:{port}{parts.path}"
+                f'?{urlencode(query, doseq=True)}>; rel="next"'
+            )
+        return json_reply(submissions(start, stop), **headers)
+
+    return route
@@ -0,0 +1,56 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+import io
+import json
+from tempfile import TemporaryDirectory
+
+from benchmarks import compare
+from benchmarks.__main__ import main
+
+
+def results(**medians):
+    return dict(
+        machine={},
+        results={name: dict(median=m) for name, m in medians.items()},
+    )
+
+
+class BenchmarksTests(TestCase):
+
+    def test_compare(t):
+        baseline = results(a=1.0, b=1.0, gone=1.0)
+        current = results(a=1.1, b=1.5, new=1.0)
+
+        comparisons = {c.name: c for c in compare(current, baseline, 0.2)}
+
+        t.assertEqual(sorted(comparisons), ["a", "b"])
+        t.assertFalse(comparisons["a"].regressed)
+        t.assertTrue(comparisons["b"].regressed)
+        t.assertEqual(comparisons["b"].ratio, 1.5)
+
+    @patch("sys.stdout", new_callable=io.StringIO)
+    def test_main(t, stdout):
+        with TemporaryDirectory() as tmp:
+            output = f"{tmp}/results.json"
+            code = main(["--quick", "-k", "conf.", "-o", output])
+            with open(output) as f:
+                saved = json.load(f)
+
+            t.assertEqual(code, 0)
+            t.assertEqual(
+                sorted(saved["results"]),
+                ["conf.get_config_lookups", "conf.resolved_config_lookups"],
+            )
+            t.assertIn("python", saved["machine"])
+
+            # a baseline far faster than any machine flags a regression
+            for result in saved["results"].values():
+                result["median"] /= 1000
+            with open(f"{tmp}/baseline.json", "w") as f:
+                json.dump(saved, f)
+            baseline = f"{tmp}/baseline.json"
+            code = main(["--quick", "-k", "conf.", "--baseline", baseline])
+
+        t.assertEqual(code, 1)
+        t.assertIn("REGRESSED", stdout.getvalue())
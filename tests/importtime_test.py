@@ -0,0 +1,45 @@
+from unittest import TestCase
+
+import subprocess
+import sys
+
+
+# microseconds `import bat.cli` may take, several times what it takes now
+BUDGET = 150_000
+
+# only imported when a command that needs them runs
+LAZY = [
+    "batconf",
+    "bat.conf",
+    "bat.lib.canvas",
+    "bat.report",
+    "asyncio",
+    "sqlite3",
+    "logging.config",
+]
+
+
+def import_times(module: str) -> dict:
+    """Cumulative import time in microseconds of each module imported"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.decode().splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+class ImportTimeTests(TestCase):
+
+    def test_cli_startup(t):
+        runs = [import_times("bat.cli") for _ in range(3)]
+
+        t.assertEqual([m for m in LAZY if m in runs[0]], [])
+        best = min(run["bat.cli"] for run in runs)
+        t.assertLess(best, BUDGET, f"import bat.cli took {best}us")